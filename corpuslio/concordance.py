@@ -0,0 +1,335 @@
+"""Lazy concordance lines.
+
+Concordance producers turn hit positions into batches: a batch holds
+the context windows of up to BATCH_SIZE hits, read in one step (one
+slice of a token list, or one fancy-indexed read of a token stream
+per attribute), and every hit is a ConcordanceLine: a slotted view of
+one row of its batch. Fields such as 'left' or 'right_pairs' are only
+joined into strings when they are read, e.g. by a template or a
+serializer, so a large result set keeps a few integers per hit instead
+of a dict of strings and token lists.
+
+ConcordanceLines is the list of a result set: a Sequence over its
+batches that creates line views when they are indexed or iterated, so
+a paginator or a page slice only formats the lines it shows.
+
+ConcordanceLine is a read-only Mapping with item assignment for extra
+fields (stored in the batch), so code written for the former dicts
+(``line['keyword']``, ``line.get('lemma')``, ``dict(line)``,
+``{{ line.left }}``) keeps working; ``dict(line)`` formats all fields,
+e.g. for JSON.
+
+Example:
+    >>> batch = StreamBatch(segment, 0, positions, context_size=5)
+    >>> for line in batch.lines():
+    ...     print(line['left'], '|', line['keyword'], '|', line['right'])
+    >>> lines = ConcordanceLines([batch])
+    >>> page = lines[100:150]
+"""
+from collections.abc import Mapping, Sequence
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+import numpy as np
+
+# Hits per context batch
+BATCH_SIZE = 1024
+
+
+class ConcordanceBatch:
+    """Context windows of a batch of hits, formatted per row on demand.
+
+    Subclasses list their fields in ``fields``: name -> function(batch, row).
+    Fields assigned to a line are kept in ``extra`` (row -> dict).
+    """
+
+    fields: Dict[str, Callable[['ConcordanceBatch', int], Any]] = {}
+
+    def __init__(self, size: int):
+        self.size = size
+        self.extra: Dict[int, Dict[str, Any]] = {}
+
+    def value(self, row: int, key: str) -> Any:
+        """Field of a row.
+
+        Raises:
+            KeyError: If the batch has no such field
+        """
+        extra = self.extra.get(row)
+        if extra is not None and key in extra:
+            return extra[key]
+        try:
+            field = self.fields[key]
+        except KeyError:
+            raise KeyError(key) from None
+        return field(self, row)
+
+    def set(self, row: int, key: str, value: Any):
+        """Assign an extra field of a row."""
+        self.extra.setdefault(row, {})[key] = value
+
+    def keys(self, row: int) -> Iterator[str]:
+        """Field names of a row (batch fields, then extra fields)."""
+        yield from self.fields
+        extra = self.extra.get(row)
+        if extra:
+            yield from (key for key in extra if key not in self.fields)
+
+    def lines(self) -> Iterator['ConcordanceLine']:
+        """Lines of all rows, in batch order."""
+        for row in range(self.size):
+            yield ConcordanceLine(self, row)
+
+
+class MergedBatch(ConcordanceBatch):
+    """Rows of other batches in a given order, e.g. a sorted page over segments.
+
+    Two integer arrays map every row to its batch and row there.
+    """
+
+    def __init__(self, batches: List[ConcordanceBatch], parts: np.ndarray, rows: np.ndarray):
+        """Initialize batch.
+
+        Args:
+            batches: Batches holding the rows
+            parts: Batch of every row (index into batches)
+            rows: Row of every row in its batch
+        """
+        super().__init__(len(rows))
+        self.batches = batches
+        self.parts = np.asarray(parts, dtype=np.int32)
+        self.rows = np.asarray(rows, dtype=np.int32)
+
+    def _source(self, row: int) -> Tuple[ConcordanceBatch, int]:
+        return self.batches[int(self.parts[row])], int(self.rows[row])
+
+    def value(self, row: int, key: str) -> Any:
+        batch, source_row = self._source(row)
+        return batch.value(source_row, key)
+
+    def set(self, row: int, key: str, value: Any):
+        batch, source_row = self._source(row)
+        batch.set(source_row, key, value)
+
+    def keys(self, row: int) -> Iterator[str]:
+        batch, source_row = self._source(row)
+        return batch.keys(source_row)
+
+
+class ConcordanceLine(Mapping):
+    """One concordance hit: a view of a row of a ConcordanceBatch."""
+
+    __slots__ = ('_batch', '_row')
+
+    def __init__(self, batch: ConcordanceBatch, row: int):
+        self._batch = batch
+        self._row = row
+
+    def __getitem__(self, key: str) -> Any:
+        return self._batch.value(self._row, key)
+
+    def __setitem__(self, key: str, value: Any):
+        self._batch.set(self._row, key, value)
+
+    def __iter__(self) -> Iterator[str]:
+        return self._batch.keys(self._row)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f'ConcordanceLine({dict(self)!r})'
+
+
+class ConcordanceLines(Sequence):
+    """Lines of a list of batches, created when indexed or iterated.
+
+    Slicing returns a list of lines. Lines of the same row share their
+    extra fields, so ``lines[0]['document'] = name`` is kept.
+    """
+
+    def __init__(self, batches: Iterable[ConcordanceBatch] = ()):
+        self.batches = [batch for batch in batches if batch.size]
+        self._starts = np.cumsum([0] + [batch.size for batch in self.batches])
+
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[ConcordanceLine, List[ConcordanceLine]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('concordance line index out of range')
+        part = int(np.searchsorted(self._starts, index, side='right')) - 1
+        return ConcordanceLine(self.batches[part], index - int(self._starts[part]))
+
+    def __iter__(self) -> Iterator[ConcordanceLine]:
+        for batch in self.batches:
+            yield from batch.lines()
+
+    def __repr__(self) -> str:
+        return f'ConcordanceLines({len(self)} lines)'
+
+
+def iter_lines(batches: Iterable[ConcordanceBatch]) -> Iterator[ConcordanceLine]:
+    """Lines of a stream of batches, in order."""
+    for batch in batches:
+        yield from batch.lines()
+
+
+def batched(items: Iterable, size: int = BATCH_SIZE) -> Iterator[List]:
+    """Consecutive lists of up to size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class TokenBatch(ConcordanceBatch):
+    """Hits in an in-memory token list (dicts with 'word', 'lemma', 'pos').
+
+    Only the window bounds are stored per hit; windows are slices of the
+    shared token list taken when a field is read.
+    """
+
+    def __init__(
+        self,
+        tokens: List[Dict[str, Any]],
+        starts: Iterable[int],
+        ends: Iterable[int],
+        context_size: int
+    ):
+        """Initialize batch.
+
+        Args:
+            tokens: Token list the hits are in
+            starts: First token of every hit
+            ends: End (exclusive) of every hit
+            context_size: Tokens of context on each side
+        """
+        self.tokens = tokens
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.left_starts = np.maximum(self.starts - context_size, 0)
+        self.right_ends = np.minimum(self.ends + context_size, len(tokens))
+        super().__init__(len(self.starts))
+
+    def left(self, row: int) -> List[Dict[str, Any]]:
+        return self.tokens[int(self.left_starts[row]):int(self.starts[row])]
+
+    def match(self, row: int) -> List[Dict[str, Any]]:
+        return self.tokens[int(self.starts[row]):int(self.ends[row])]
+
+    def right(self, row: int) -> List[Dict[str, Any]]:
+        return self.tokens[int(self.ends[row]):int(self.right_ends[row])]
+
+    @staticmethod
+    def words(tokens: List[Dict[str, Any]]) -> str:
+        return ' '.join(t.get('word', '') for t in tokens)
+
+    @staticmethod
+    def pairs(tokens: List[Dict[str, Any]]) -> List[str]:
+        return [f"{t.get('word', '')};{t.get('pos', '')}" for t in tokens]
+
+
+class StreamBatch(ConcordanceBatch):
+    """Hits in one segment of a positional index, context clipped to sentences.
+
+    The form IDs of all context windows are read from the memory-mapped
+    stream in one fancy-indexed read (a hits x (2 * context + 1) matrix);
+    lemma, POS and further attributes are read for the hit positions
+    only. Per hit the batch keeps the window IDs and a few small
+    integers (context lengths, sentence and document numbers); values
+    are looked up in the lexicons when a field is read.
+    """
+
+    def __init__(
+        self,
+        segment,
+        base: int,
+        positions: np.ndarray,
+        context_size: int,
+        extra_attributes: Iterable[str] = ()
+    ):
+        """Initialize batch.
+
+        Args:
+            segment: Opened CorpusIndex holding the positions
+            base: Global position of the segment start
+            positions: Hit positions local to the segment (any order)
+            context_size: Tokens of context on each side
+            extra_attributes: Further attributes read at the hits (e.g. 'xpos')
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        extra_attributes = tuple(extra_attributes)
+        super().__init__(len(positions))
+        self.base = base
+        self.positions = positions
+        self.context_size = context_size
+
+        sentences = segment.structure('s')
+        texts = segment.structure('text')
+        sent_numbers, sent_starts, sent_ends = sentences.bounds(positions)
+        doc_numbers, doc_starts, _ = texts.bounds(positions)
+        length_type = np.min_scalar_type(context_size + 1)
+        self.left_lengths = (positions - np.maximum(sent_starts, positions - context_size)).astype(length_type)
+        self.right_lengths = (np.minimum(sent_ends, positions + context_size + 1) - positions - 1).astype(length_type)
+        self.sentence_values = sentences.values
+        self.sentence_numbers = np.asarray(sent_numbers, dtype=np.int32)
+        self.sentence_indexes = (sent_numbers - sentences.find_all(doc_starts) + 1).astype(np.int32)
+        documents, document_rows = np.unique(doc_numbers, return_inverse=True)
+        self.filenames = texts.attribute_values(documents, 'filename')
+        self.document_rows = document_rows.astype(np.int32).ravel()
+
+        forms = segment.attribute('form')
+        self.form_values = forms.lexicon.values
+        if len(positions):
+            window = positions[:, None] + np.arange(-context_size, context_size + 1)
+            self.window_ids = np.asarray(forms.stream[np.clip(window, 0, len(forms) - 1)])
+        else:
+            self.window_ids = np.zeros((0, 2 * context_size + 1), dtype=np.int32)
+        self.attributes = {}
+        for name in ('lemma', 'upos', *extra_attributes):
+            attribute = segment.attribute(name)
+            self.attributes[name] = (attribute.lexicon.values, np.asarray(attribute.stream[positions]))
+        if extra_attributes:
+            self.fields = {**self.fields, **{name: _attribute_field(name) for name in extra_attributes}}
+
+    def _forms(self, row: int, start: int, end: int) -> str:
+        values = self.form_values
+        return ' '.join(values[i] for i in self.window_ids[row, start:end].tolist())
+
+    def left(self, row: int) -> str:
+        return self._forms(row, self.context_size - int(self.left_lengths[row]), self.context_size)
+
+    def right(self, row: int) -> str:
+        return self._forms(row, self.context_size + 1, self.context_size + 1 + int(self.right_lengths[row]))
+
+    def keyword(self, row: int) -> str:
+        return self.form_values[int(self.window_ids[row, self.context_size])]
+
+    def attribute(self, row: int, name: str) -> str:
+        values, ids = self.attributes[name]
+        return values[int(ids[row])]
+
+    fields = {
+        'left': lambda batch, row: batch.left(row),
+        'keyword': lambda batch, row: batch.keyword(row),
+        'right': lambda batch, row: batch.right(row),
+        'document': lambda batch, row: batch.filenames[batch.document_rows[row]],
+        'sentence_id': lambda batch, row: batch.sentence_values[batch.sentence_numbers[row]].item(),
+        'sentence_index': lambda batch, row: int(batch.sentence_indexes[row]),
+        'token_id': lambda batch, row: None,
+        'position': lambda batch, row: batch.base + int(batch.positions[row]),
+        'lemma': lambda batch, row: batch.attribute(row, 'lemma'),
+        'pos': lambda batch, row: batch.attribute(row, 'upos'),
+    }
+
+
+def _attribute_field(name: str) -> Callable[[StreamBatch, int], str]:
+    return lambda batch, row: batch.attribute(row, name)
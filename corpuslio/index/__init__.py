@@ -0,0 +1,118 @@
+"""Positional corpus index (CWB-style).
+
+Stores each positional attribute as a memory-mapped array of lexicon IDs
+over global corpus positions, with a sorted lexicon and a reverse index,
+so that token lookup is O(1) and term lookup does not scan the corpus.
+Posting lists are delta-encoded and bit-packed in blocks with skip
+pointers (see postings.py).
+
+Available classes:
+- CorpusIndex: Open and query a built index
+- IndexBuilder: Build an index from documents/sentences/tokens
+- PatternExecutor: Positional-join search for token sequence patterns
+- QueryPlanner: Cost-based plans with explain()
+- ShardedExecutor: Run queries on document-range shards in a process pool
+- SegmentedIndex / SegmentStore: Incremental segments with tiered merging
+- Bitmap: Compressed document sets for subcorpus filters
+- FrequencyCounter / FrequencyTable: Vectorized frequency distributions
+- NgramCounter / NgramTable: Exact n-gram counts with packed keys
+- NgramTables: Persisted per-segment n-gram tables (build_ngram_tables)
+- CollocationFinder / CollocationTable: Window collocations with association measures
+- KeynessTable: Keyness of a focus against a reference frequency list (compare)
+- DispersionCounter / DispersionTable: Range, Juilland's D, DP and ARF from document x term matrices
+- DocumentVectors: TF-IDF/PPMI document vectors, top-k similar documents, N-way comparison
+- ConcordanceSorter: Sort all hits by context positions (L1, R2+R1, ...) via collated lexicon ranks
+- sample_hits: Seeded uniform samples of concordance hits
+- encode_cursor / decode_cursor: Opaque resumable cursors for paged results
+- CorpusSketch: Mergeable HyperLogLog/Count-Min/Space-Saving sketches for approximate overviews
+"""
+
+from .builder import IndexBuilder
+from .corpus import ATTRIBUTE_ALIASES, DEFAULT_ATTRIBUTES, STRUCTURE_ATTRIBUTES, CorpusIndex
+from .executor import PatternExecutor
+from .planner import Predicate, QueryPlan, QueryPlanner
+from .parallel import ShardedExecutor, partition
+from .segments import SegmentedIndex, SegmentStore
+from .bitmap import Bitmap
+from .frequency import FrequencyCounter, FrequencyTable
+from .ngrams import (
+    NgramCounter, NgramTable, NgramTables, build_missing_ngram_tables, build_ngram_tables
+)
+from .collocation import MEASURES, CollocationFinder, CollocationTable, association_scores, count_collocates
+from .dispersion import (
+    DISPERSION_MEASURES, CountMatrix, DispersionCounter, DispersionTable, build_count_matrices, dispersion_scores,
+    reduced_frequencies,
+)
+from .similarity import WEIGHTINGS, DocumentVectors, sparse_product
+from .sorting import ConcordanceSorter, collation_ranks, parse_sort, sample_hits
+from .cursor import decode_cursor, encode_cursor, fingerprint
+from .sketches import CorpusSketch, CountMinSketch, HyperLogLog, SpaceSaving, hash_strings
+from .keyness import KEYNESS_MEASURES, KeynessTable, compare, keyness_scores
+from .lexicon import Lexicon
+from .postings import BLOCK_SIZE, PostingList, decode_blocks, encode_postings, intersect
+from .attribute import PositionalAttribute
+from .structure import StructuralAttribute, in_regions
+
+__all__ = [
+    'CorpusIndex',
+    'IndexBuilder',
+    'PatternExecutor',
+    'QueryPlanner',
+    'QueryPlan',
+    'Predicate',
+    'ShardedExecutor',
+    'partition',
+    'SegmentedIndex',
+    'SegmentStore',
+    'Bitmap',
+    'FrequencyCounter',
+    'FrequencyTable',
+    'NgramCounter',
+    'NgramTable',
+    'NgramTables',
+    'build_ngram_tables',
+    'build_missing_ngram_tables',
+    'CollocationFinder',
+    'CollocationTable',
+    'association_scores',
+    'count_collocates',
+    'MEASURES',
+    'KeynessTable',
+    'compare',
+    'keyness_scores',
+    'KEYNESS_MEASURES',
+    'CountMatrix',
+    'DispersionCounter',
+    'DispersionTable',
+    'build_count_matrices',
+    'dispersion_scores',
+    'reduced_frequencies',
+    'DISPERSION_MEASURES',
+    'DocumentVectors',
+    'sparse_product',
+    'WEIGHTINGS',
+    'ConcordanceSorter',
+    'collation_ranks',
+    'parse_sort',
+    'sample_hits',
+    'encode_cursor',
+    'decode_cursor',
+    'fingerprint',
+    'CorpusSketch',
+    'HyperLogLog',
+    'CountMinSketch',
+    'SpaceSaving',
+    'hash_strings',
+    'Lexicon',
+    'PositionalAttribute',
+    'PostingList',
+    'encode_postings',
+    'decode_blocks',
+    'intersect',
+    'BLOCK_SIZE',
+    'StructuralAttribute',
+    'in_regions',
+    'ATTRIBUTE_ALIASES',
+    'DEFAULT_ATTRIBUTES',
+    'STRUCTURE_ATTRIBUTES',
+]
@@ -0,0 +1,130 @@
+"""Positional attributes: integer-encoded token streams with reverse index.
+
+Each attribute (form, lemma, upos, ...) is stored as:
+
+- ``<name>.corpus.npy``  int32 lexicon ID per corpus position (memory-mapped)
+- ``<name>.lexicon``     sorted distinct values, one per line
+- ``<name>.freq.npy``    int64 frequency per lexicon ID
+- ``<name>.docfreq.npy`` int64 number of documents per lexicon ID
+- compressed posting lists per lexicon ID (see postings.py)
+"""
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .lexicon import Lexicon
+from .postings import PostingList, decode_blocks
+from .structure import in_regions
+
+
+class PositionalAttribute:
+    """Memory-mapped token stream of a single positional attribute."""
+
+    def __init__(self, path: Path, name: str):
+        """Open attribute files.
+
+        Args:
+            path: Index directory
+            name: Attribute name (e.g. 'form', 'lemma')
+        """
+        self.path = Path(path)
+        self.name = name
+        self.stream = np.load(self.path / f'{name}.corpus.npy', mmap_mode='r')
+        self.lexicon = Lexicon(
+            Lexicon.read_values(self.path / f'{name}.lexicon'),
+            np.load(self.path / f'{name}.freq.npy'),
+            np.load(self.path / f'{name}.docfreq.npy')
+        )
+        self._postings = np.load(self.path / f'{name}.postings.npy', mmap_mode='r')
+        self._blocks = np.load(self.path / f'{name}.blocks.npy', mmap_mode='r')
+        self._block_index = np.load(self.path / f'{name}.blockidx.npy', mmap_mode='r')
+        # (starts, ends) of deleted documents, set by CorpusIndex
+        self.deleted_ranges: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self.stream)
+
+    def id_at(self, position: int) -> int:
+        """Lexicon ID at a corpus position (O(1))."""
+        return int(self.stream[position])
+
+    def value_at(self, position: int) -> str:
+        """Attribute value at a corpus position (O(1))."""
+        return self.lexicon[int(self.stream[position])]
+
+    def values(self, start: int, end: int) -> List[str]:
+        """Attribute values for positions in [start, end)."""
+        values = self.lexicon.values
+        return [values[i] for i in self.stream[start:end].tolist()]
+
+    def frequency(self, lex_id: int) -> int:
+        """Corpus frequency of a lexicon ID."""
+        return int(self.lexicon.frequencies[lex_id])
+
+    def block_count(self, lex_ids: np.ndarray) -> int:
+        """Number of posting blocks of the given lexicon IDs."""
+        lex_ids = np.asarray(lex_ids, dtype=np.int64)
+        return int((np.asarray(self._block_index[lex_ids + 1]) - np.asarray(self._block_index[lex_ids])).sum())
+
+    def postings(self, lex_id: int) -> PostingList:
+        """Compressed posting list of a lexicon ID."""
+        return PostingList(
+            self._postings, self._blocks,
+            self._block_index[lex_id], self._block_index[lex_id + 1]
+        )
+
+    def positions(self, lex_id: int) -> np.ndarray:
+        """Sorted corpus positions of a lexicon ID."""
+        return self.positions_for_ids([lex_id])
+
+    def positions_for_ids(
+        self,
+        lex_ids: np.ndarray,
+        span: Optional[Tuple[int, int]] = None
+    ) -> np.ndarray:
+        """Sorted union of the corpus positions of several lexicon IDs.
+
+        Positions in deleted documents are masked out.
+
+        Args:
+            lex_ids: Lexicon IDs
+            span: Only positions in [start, end); blocks outside the span
+                  are skipped without decoding (None = whole corpus)
+        """
+        lex_ids = np.asarray(lex_ids, dtype=np.int64)
+        if len(lex_ids) == 0:
+            return np.empty(0, dtype=np.int32)
+        starts = np.asarray(self._block_index[lex_ids])
+        counts = np.asarray(self._block_index[lex_ids + 1]) - starts
+        # Block IDs of all lists, without a Python loop over the lists
+        block_ids = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+        if span is not None:
+            # A block ends before the next block of its list starts
+            firsts = np.asarray(self._blocks['first'][block_ids], dtype=np.int64)
+            next_firsts = np.empty_like(firsts)
+            next_firsts[:-1] = firsts[1:]
+            next_firsts[np.cumsum(counts)[counts > 0] - 1] = np.iinfo(np.int64).max
+            block_ids = block_ids[(firsts < span[1]) & (next_firsts > span[0])]
+
+        positions = decode_blocks(self._postings, self._blocks, block_ids)
+        if span is not None:
+            positions = positions[(positions >= span[0]) & (positions < span[1])]
+        if self.deleted_ranges is not None:
+            positions = positions[~in_regions(positions, *self.deleted_ranges)]
+        if len(lex_ids) > 1:
+            positions.sort()
+        return positions
+
+    def contains(self, lex_ids: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        """Membership mask: which of the sorted positions carry one of lex_ids.
+
+        A single ID is checked against its posting list (skip pointers,
+        only candidate blocks decoded); several IDs (regex matches) are
+        checked against the token stream.
+        """
+        positions = np.asarray(positions)
+        if len(lex_ids) == 1:
+            return self.postings(int(lex_ids[0])).contains(positions)
+        return np.isin(self.stream[positions], lex_ids)
@@ -0,0 +1,220 @@
+"""Compressed integer sets for document (subcorpus) filters.
+
+Roaring-style layout on NumPy arrays: values are split by their high 16
+bits into chunks; a chunk with few values is a sorted uint16 array, a
+dense chunk is a 65536-bit bitmap (1024 uint64 words). Set operations
+run chunk by chunk on whole arrays (np.intersect1d/union1d on sparse
+chunks, word-wise &, |, & ~ on dense ones), and membership of many
+values (``contains``) is one vectorized lookup per chunk.
+
+Example:
+    >>> novels = Bitmap.from_ids(novel_ids)
+    >>> subcorpus = (novels | stories) - Bitmap.from_ids(excluded_ids)
+    >>> mask = subcorpus.contains(text_document_ids)
+"""
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+WORDS = CHUNK_SIZE // 64
+
+# Chunks with more values than this are stored as bitmaps
+MAX_ARRAY_SIZE = 4096
+
+_BIT = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+
+
+def _to_words(container: np.ndarray) -> np.ndarray:
+    if container.dtype == np.uint64:
+        return container
+    words = np.zeros(WORDS, dtype=np.uint64)
+    values = container.astype(np.int64)
+    np.bitwise_or.at(words, values >> 6, _BIT[values & 63])
+    return words
+
+
+def _to_values(container: np.ndarray) -> np.ndarray:
+    if container.dtype == np.uint16:
+        return container
+    bits = np.unpackbits(container.view(np.uint8), bitorder='little')
+    return np.flatnonzero(bits).astype(np.uint16)
+
+
+def _normalize(container: np.ndarray) -> np.ndarray:
+    """Store a chunk in its smaller form (None when empty)."""
+    if container.dtype == np.uint64:
+        count = int(np.unpackbits(container.view(np.uint8)).sum())
+        if count > MAX_ARRAY_SIZE:
+            return container
+        container = _to_values(container)
+    return container if len(container) else None
+
+
+class Bitmap:
+    """Immutable compressed set of non-negative integers (< 2**48)."""
+
+    __slots__ = ('keys', 'containers')
+
+    def __init__(self, keys: Iterable[int] = (), containers: Iterable[np.ndarray] = ()):
+        """Create from chunk keys and containers (use the from_* constructors)."""
+        self.keys = np.asarray(list(keys), dtype=np.int64)
+        self.containers: List[np.ndarray] = list(containers)
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int]) -> 'Bitmap':
+        """Build from any iterable or array of integers."""
+        if isinstance(ids, np.ndarray):
+            values = np.unique(ids.astype(np.int64))
+        else:
+            values = np.unique(np.fromiter((int(i) for i in ids), dtype=np.int64))
+        if len(values) and values[0] < 0:
+            raise ValueError("Bitmap values must be non-negative")
+        highs = values >> CHUNK_BITS
+        keys, starts = np.unique(highs, return_index=True)
+        bounds = np.append(starts, len(values))
+        containers = []
+        for n in range(len(keys)):
+            low = (values[bounds[n]:bounds[n + 1]] & (CHUNK_SIZE - 1)).astype(np.uint16)
+            containers.append(_to_words(low) if len(low) > MAX_ARRAY_SIZE else low)
+        return cls(keys.tolist(), containers)
+
+    @classmethod
+    def from_ranges(cls, starts: Iterable[int], ends: Iterable[int]) -> 'Bitmap':
+        """Build from half-open [start, end) ranges."""
+        starts = np.fromiter(starts, dtype=np.int64)
+        ends = np.fromiter(ends, dtype=np.int64)
+        lengths = np.maximum(ends - starts, 0)
+        values = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return cls.from_ids(values)
+
+    # -- Inspection ------------------------------------------------------
+
+    def __len__(self) -> int:
+        return sum(
+            len(c) if c.dtype == np.uint16 else int(np.unpackbits(c.view(np.uint8)).sum())
+            for c in self.containers
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.containers)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.to_array().tolist())
+
+    def __contains__(self, value: int) -> bool:
+        return bool(self.contains(np.array([value]))[0])
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Bitmap):
+            return NotImplemented
+        return np.array_equal(self.keys, other.keys) and all(
+            np.array_equal(_to_values(a), _to_values(b)) for a, b in zip(self.containers, other.containers)
+        )
+
+    def __repr__(self) -> str:
+        return f'Bitmap({len(self)} values, {len(self.keys)} chunks)'
+
+    def to_array(self) -> np.ndarray:
+        """Sorted int64 array of all values."""
+        if not self.containers:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([
+            (int(key) << CHUNK_BITS) + _to_values(container).astype(np.int64)
+            for key, container in zip(self.keys.tolist(), self.containers)
+        ])
+
+    def runs(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Maximal runs of consecutive values as half-open (starts, ends)."""
+        values = self.to_array()
+        if len(values) == 0:
+            return values, values
+        breaks = np.flatnonzero(np.diff(values) != 1) + 1
+        starts = values[np.concatenate([[0], breaks])]
+        ends = values[np.concatenate([breaks - 1, [len(values) - 1]])] + 1
+        return starts, ends
+
+    def contains(self, values: np.ndarray) -> np.ndarray:
+        """Membership mask of many values (any order)."""
+        values = np.asarray(values, dtype=np.int64)
+        mask = np.zeros(len(values), dtype=bool)
+        if not self.containers or len(values) == 0:
+            return mask
+        highs = values >> CHUNK_BITS
+        slots = np.searchsorted(self.keys, highs)
+        slots[slots == len(self.keys)] = 0
+        present = self.keys[slots] == highs
+        if len(self.keys) == 1:
+            groups = [(0, present)]
+        else:
+            groups = ((slot, present & (slots == slot)) for slot in np.unique(slots[present]).tolist())
+        for slot, selected in groups:
+            low = values[selected] & (CHUNK_SIZE - 1)
+            container = self.containers[slot]
+            if container.dtype == np.uint64:
+                mask[selected] = (container[low >> 6] & _BIT[low & 63]) != 0
+            else:
+                found = np.searchsorted(container, low)
+                found[found == len(container)] = 0
+                mask[selected] = container[found] == low
+        return mask
+
+    # -- Set operations --------------------------------------------------
+
+    def _combine(self, other: 'Bitmap', operation: str) -> 'Bitmap':
+        keys = []
+        containers = []
+        mine = dict(zip(self.keys.tolist(), self.containers))
+        theirs = dict(zip(other.keys.tolist(), other.containers))
+        if operation == 'and':
+            candidates = sorted(mine.keys() & theirs.keys())
+        elif operation == 'or':
+            candidates = sorted(mine.keys() | theirs.keys())
+        else:
+            candidates = sorted(mine.keys())
+
+        for key in candidates:
+            a, b = mine.get(key), theirs.get(key)
+            if b is None or a is None:
+                result = a if b is None else (b if operation == 'or' else None)
+            elif a.dtype == np.uint16 and b.dtype == np.uint16:
+                if operation == 'and':
+                    result = np.intersect1d(a, b, assume_unique=True)
+                elif operation == 'or':
+                    result = np.union1d(a, b)
+                else:
+                    result = np.setdiff1d(a, b, assume_unique=True)
+            elif operation == 'and' and a.dtype == np.uint16:
+                result = a[Bitmap([0], [b]).contains(a.astype(np.int64))]
+            elif operation == 'and' and b.dtype == np.uint16:
+                result = b[Bitmap([0], [a]).contains(b.astype(np.int64))]
+            elif operation == 'and':
+                result = a & b
+            elif operation == 'or':
+                result = _to_words(a) | _to_words(b)
+            elif a.dtype == np.uint16:
+                result = a[~Bitmap([0], [b]).contains(a.astype(np.int64))]
+            else:
+                result = a & ~_to_words(b)
+            if result is not None:
+                result = _normalize(result)
+            if result is not None:
+                if result.dtype == np.uint16 and len(result) > MAX_ARRAY_SIZE:
+                    result = _to_words(result)
+                keys.append(key)
+                containers.append(result)
+        return Bitmap(keys, containers)
+
+    def __and__(self, other: 'Bitmap') -> 'Bitmap':
+        return self._combine(other, 'and')
+
+    def __or__(self, other: 'Bitmap') -> 'Bitmap':
+        return self._combine(other, 'or')
+
+    def __sub__(self, other: 'Bitmap') -> 'Bitmap':
+        return self._combine(other, 'andnot')
+
+    def complement(self, universe: 'Bitmap') -> 'Bitmap':
+        """NOT: the values of universe that are not in this set."""
+        return universe - self
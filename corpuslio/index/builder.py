@@ -0,0 +1,272 @@
+"""Build a positional corpus index from a stream of documents.
+
+The builder is independent of Django: callers feed documents as
+``(document_id, sentences)`` where each sentence is
+``(sentence_id, tokens)`` or ``(sentence_id, tokens, metadata)`` and each
+token is a dict of attribute values.
+
+Sentence metadata gives the ``s_id`` region attribute (``sent_id``) and
+paragraph breaks: a sentence with a ``newpar`` key (CoNLL-U
+``# newpar``) starts a new ``p`` region. Documents without paragraph
+marks are a single paragraph.
+
+Example:
+    >>> builder = IndexBuilder('/srv/corpus_index')
+    >>> builder.add_document(1, [(10, [{'form': 'Kış', 'lemma': 'kış'}], {'sent_id': 's1'})],
+    ...                      metadata={'filename': 'a.conllu'})
+    >>> builder.finish()
+"""
+import json
+import logging
+import os
+import shutil
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .corpus import DEFAULT_ATTRIBUTES, FORMAT_VERSION, STRUCTURE_ATTRIBUTES, CorpusIndex
+from .lexicon import Lexicon
+from .parallel import partition
+from .postings import encode_postings
+
+logger = logging.getLogger(__name__)
+
+
+class IndexBuilder:
+    """Accumulate tokens and write the index directory on finish()."""
+
+    def __init__(self, path, attributes: Sequence[str] = DEFAULT_ATTRIBUTES, shards: int = 0):
+        """Initialize builder.
+
+        Args:
+            path: Target index directory (replaced atomically on finish)
+            attributes: Positional attributes to encode
+            shards: Number of document-range shards for parallel queries
+                    (0 = one per CPU, limited by parallel.MIN_SHARD_TOKENS)
+        """
+        self.path = Path(path)
+        self.attributes = tuple(attributes)
+        self.shards = shards
+        self.size = 0
+        # Per attribute: value -> provisional ID (in order of first occurrence)
+        self._lexicons: Dict[str, Dict[str, int]] = {a: {} for a in self.attributes}
+        self._streams: Dict[str, array] = {a: array('i') for a in self.attributes}
+        # Per structure: starts, ends, values
+        self._structures: Dict[str, Tuple[array, array, array]] = {
+            name: (array('i'), array('i'), array('q')) for name in STRUCTURE_ATTRIBUTES
+        }
+        # Per structure and region attribute: one string per region
+        self._region_attributes: Dict[str, Dict[str, List[str]]] = {
+            name: {attr: [] for attr in attrs} for name, attrs in STRUCTURE_ATTRIBUTES.items()
+        }
+
+    def add_document(
+        self,
+        document_id: int,
+        sentences: Iterable[Tuple],
+        metadata: Optional[Dict[str, Any]] = None
+    ):
+        """Append a document at the end of the corpus.
+
+        Args:
+            document_id: Database ID of the document
+            sentences: Iterable of (sentence_id, tokens[, metadata]) in reading order
+            metadata: Document metadata for the text_* region attributes
+        """
+        doc_start = self.size
+        par_start = self.size
+        par_id = ''
+        for sentence_id, tokens, *rest in sentences:
+            sent_metadata = rest[0] if rest else {}
+            if 'newpar' in sent_metadata:
+                if self.size > par_start:
+                    self._add_region('p', par_start, self.size, len(self._structures['p'][0]), id=par_id)
+                par_start = self.size
+                par_id = str(sent_metadata['newpar'] or '')
+            sent_start = self.size
+            for token in tokens:
+                for attr in self.attributes:
+                    value = token.get(attr) or ''
+                    lexicon = self._lexicons[attr]
+                    lex_id = lexicon.get(value)
+                    if lex_id is None:
+                        lex_id = lexicon[value] = len(lexicon)
+                    self._streams[attr].append(lex_id)
+                self.size += 1
+            if self.size > sent_start:
+                self._add_region('s', sent_start, self.size, sentence_id, id=sent_metadata.get('sent_id'))
+        if self.size > par_start:
+            self._add_region('p', par_start, self.size, len(self._structures['p'][0]), id=par_id)
+        if self.size > doc_start:
+            self._add_region('text', doc_start, self.size, document_id, **(metadata or {}))
+
+    def add_index(self, index: CorpusIndex):
+        """Append all live documents of an existing index (segment merging).
+
+        Lexicon IDs are remapped once per type; token streams and regions
+        are copied as arrays. Documents deleted in the source index are
+        dropped (their tombstones are purged) and later positions move up.
+
+        Args:
+            index: Opened index with the same positional attributes
+        """
+        offset = self.size
+        keep = None
+        size = index.size
+        if index.deleted_count:
+            keep = np.ones(index.size, dtype=bool)
+            for start, end in zip(*index.deleted_ranges):
+                keep[start:end] = False
+            size = int(keep.sum())
+
+        for attr in self.attributes:
+            lexicon = self._lexicons[attr]
+            if not index.has_attribute(attr):
+                lex_id = lexicon.setdefault('', len(lexicon))
+                self._streams[attr].extend([lex_id] * size)
+                continue
+            source = index.attribute(attr)
+            mapping = np.empty(len(source.lexicon), dtype=np.int32)
+            for source_id, value in enumerate(source.lexicon.values):
+                mapping[source_id] = lexicon.setdefault(value, len(lexicon))
+            stream = np.asarray(source.stream)
+            if keep is not None:
+                stream = stream[keep]
+            self._streams[attr].frombytes(mapping[stream].tobytes())
+
+        if keep is not None:
+            # Tokens deleted before a position: regions never straddle documents
+            deleted_starts, deleted_ends = (np.asarray(r, dtype=np.int64) for r in index.deleted_ranges)
+            removed = np.concatenate([[0], np.cumsum(deleted_ends - deleted_starts)])
+
+        for name, (starts, ends, values) in self._structures.items():
+            if name not in index.structure_names:
+                continue
+            source = index.structure(name)
+            regions = np.arange(len(source))
+            source_starts = np.asarray(source.starts, dtype=np.int64)
+            source_ends = np.asarray(source.ends, dtype=np.int64)
+            if keep is not None:
+                regions = regions[index.live(source_starts)]
+                source_starts = source_starts[regions]
+                source_ends = source_ends[regions]
+                source_starts -= removed[np.searchsorted(deleted_ends, source_starts, side='right')]
+                source_ends -= removed[np.searchsorted(deleted_ends, source_ends, side='right')]
+            count = len(regions)
+            starts.frombytes((source_starts + offset).astype(np.int32).tobytes())
+            ends.frombytes((source_ends + offset).astype(np.int32).tobytes())
+            if name == 'p':
+                values.frombytes(np.arange(len(values), len(values) + count, dtype=np.int64).tobytes())
+            else:
+                values.frombytes(np.asarray(source.values, dtype=np.int64)[regions].tobytes())
+            for attr, column in self._region_attributes[name].items():
+                if source.has_attribute(attr):
+                    column.extend(source.attribute_values(regions, attr))
+                else:
+                    column.extend([''] * count)
+
+        self.size += size
+
+    def document_ids(self) -> List[int]:
+        """Database IDs of the documents added so far."""
+        return list(self._structures['text'][2])
+
+    def _add_region(self, name: str, start: int, end: int, value: int, **attributes):
+        starts, ends, values = self._structures[name]
+        starts.append(start)
+        ends.append(end)
+        values.append(value)
+        for attr, column in self._region_attributes[name].items():
+            attr_value = attributes.get(attr)
+            column.append('' if attr_value is None else str(attr_value))
+
+    def finish(self) -> Path:
+        """Write the index and atomically replace the target directory.
+
+        Returns:
+            Path of the written index
+        """
+        tmp_path = self.path.with_name(f'{self.path.name}.tmp-{os.getpid()}')
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        tmp_path.mkdir(parents=True)
+
+        for attr in self.attributes:
+            self._write_attribute(tmp_path, attr)
+
+        for name, (starts, ends, values) in self._structures.items():
+            np.save(tmp_path / f'{name}.starts.npy', np.frombuffer(starts, dtype=np.int32))
+            np.save(tmp_path / f'{name}.ends.npy', np.frombuffer(ends, dtype=np.int32))
+            np.save(tmp_path / f'{name}.values.npy', np.frombuffer(values, dtype=np.int64))
+            for attr, column in self._region_attributes[name].items():
+                lexicon = sorted(set(column))
+                ids = {value: i for i, value in enumerate(lexicon)}
+                np.save(tmp_path / f'{name}_{attr}.ids.npy', np.array([ids[v] for v in column], dtype=np.int32))
+                Lexicon.write_values(tmp_path / f'{name}_{attr}.lexicon', lexicon)
+
+        info = {
+            'format_version': FORMAT_VERSION,
+            'size': self.size,
+            'attributes': list(self.attributes),
+            'structures': list(self._structures),
+            'structure_attributes': {name: list(attrs) for name, attrs in self._region_attributes.items()},
+            'documents': len(self._structures['text'][0]),
+            'shards': partition(
+                np.frombuffer(self._structures['text'][0], dtype=np.int32),
+                np.frombuffer(self._structures['text'][1], dtype=np.int32),
+                self.shards
+            ),
+            'built_at': datetime.now().isoformat(),
+        }
+        with open(tmp_path / 'index.json', 'w', encoding='utf-8') as f:
+            json.dump(info, f, indent=2)
+
+        old_path = self.path.with_name(f'{self.path.name}.old-{os.getpid()}')
+        if self.path.exists():
+            os.replace(self.path, old_path)
+        os.replace(tmp_path, self.path)
+        if old_path.exists():
+            shutil.rmtree(old_path)
+
+        logger.info(f"Index written: {self.path} ({self.size:,} tokens)")
+        return self.path
+
+    def _write_attribute(self, path: Path, attr: str):
+        """Sort the lexicon, remap provisional IDs and write attribute files."""
+        lexicon = self._lexicons[attr]
+        values = list(lexicon)  # insertion order == provisional IDs
+        order = sorted(range(len(values)), key=values.__getitem__)
+
+        # rank[provisional_id] = final (sorted) lexicon ID
+        rank = np.empty(len(values), dtype=np.int32)
+        rank[np.asarray(order, dtype=np.int64)] = np.arange(len(values), dtype=np.int32)
+
+        provisional = np.frombuffer(self._streams[attr], dtype=np.int32)
+        stream = rank[provisional] if len(provisional) else provisional.copy()
+        freq = np.bincount(stream, minlength=len(values)).astype(np.int64)
+
+        np.save(path / f'{attr}.corpus.npy', stream)
+        np.save(path / f'{attr}.freq.npy', freq)
+        Lexicon.write_values(path / f'{attr}.lexicon', [values[i] for i in order])
+
+        # Reverse index: positions grouped by lexicon ID, ascending within each ID
+        rev = np.argsort(stream, kind='stable')
+        revidx = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(freq, out=revidx[1:])
+
+        # Document frequency: count positions that open a new document within their ID group
+        doc_starts = np.frombuffer(self._structures['text'][0], dtype=np.int32)
+        doc_of = np.searchsorted(doc_starts, rev, side='right')
+        new_doc = np.ones(len(rev), dtype=bool)
+        new_doc[1:] = doc_of[1:] != doc_of[:-1]
+        new_doc[revidx[:-1][freq > 0]] = True
+        docfreq = np.bincount(stream[rev], weights=new_doc, minlength=len(values)).astype(np.int64)
+        np.save(path / f'{attr}.docfreq.npy', docfreq)
+
+        data, blocks, block_index = encode_postings(rev, revidx)
+        np.save(path / f'{attr}.postings.npy', data)
+        np.save(path / f'{attr}.blocks.npy', blocks)
+        np.save(path / f'{attr}.blockidx.npy', block_index)
@@ -0,0 +1,387 @@
+"""Collocations: vectorized window counting and association measures.
+
+All occurrences of the node are looked up once per segment; the window
+positions around them are built in one broadcast (hits x span offsets),
+clipped to the node's sentence, and the collocate IDs under them are
+counted with ``np.bincount``. No loop runs per hit or per collocate.
+
+Association measures are computed from the 2x2 contingency table of
+every collocate c (Evert 2008), with R1 = number of window positions
+(tokens co-occurring with the node), C1 = f(c) and N = corpus size:
+
+=================  ==========================================
+frequency          O11
+mi                 log2(O11 / E11)
+mi3                log2(O11^3 / E11)
+t_score            (O11 - E11) / sqrt(O11)
+log_likelihood     2 * sum(Oij * ln(Oij / Eij)), negative when O11 < E11
+chi_square         sum((Oij - Eij)^2 / Eij)
+dice               2 * O11 / (f(node) + f(c))
+log_dice           14 + log2(dice)
+=================  ==========================================
+
+with Eij = Ri * Cj / N.
+
+Example:
+    >>> finder = CollocationFinder(NgramCounter(index))
+    >>> table = finder.find('kahve', left=3, right=3, collocate_pos=['NOUN', 'ADJ'])
+    >>> table.rows('log_dice', min_frequency=3, limit=20)
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .bitmap import Bitmap
+from .frequency import dominant
+from .ngrams import CHUNK_SIZE, NgramCounter
+from .structure import in_regions
+
+# Association measures, in the order they are reported
+MEASURES = ('frequency', 'mi', 'mi3', 't_score', 'log_likelihood', 'log_dice', 'dice', 'chi_square')
+
+
+def window_offsets(left: int, right: int) -> np.ndarray:
+    """Relative positions of a window: -left..-1, 1..right."""
+    return np.concatenate([np.arange(-left, 0), np.arange(1, right + 1)]).astype(np.int64)
+
+
+def window_positions(
+    nodes: np.ndarray,
+    offsets: np.ndarray,
+    sentence_starts: np.ndarray,
+    sentence_ends: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Window positions around nodes, within each node's sentence.
+
+    Args:
+        nodes: Node positions
+        offsets: Relative window positions (window_offsets)
+        sentence_starts, sentence_ends: Bounds of each node's sentence
+
+    Returns:
+        (positions, offset index) of the valid window slots
+    """
+    positions = nodes[:, None] + offsets[None, :]
+    valid = (positions >= sentence_starts[:, None]) & (positions < sentence_ends[:, None])
+    slots = np.broadcast_to(np.arange(len(offsets)), positions.shape)
+    return positions[valid], slots[valid]
+
+
+def association_scores(
+    observed: np.ndarray,
+    node_frequency: int,
+    collocate_frequencies: np.ndarray,
+    window_total: int,
+    corpus_size: int
+) -> Dict[str, np.ndarray]:
+    """All association measures of MEASURES for many collocates.
+
+    Args:
+        observed: Co-occurrence count O11 per collocate
+        node_frequency: Frequency of the node
+        collocate_frequencies: Corpus frequency of each collocate
+        window_total: Number of window positions (R1)
+        corpus_size: Number of tokens (N)
+
+    Returns:
+        measure -> score array aligned with observed
+    """
+    o11 = np.asarray(observed, dtype=np.float64)
+    c1 = np.maximum(np.asarray(collocate_frequencies, dtype=np.float64), o11)
+    n = float(max(corpus_size, window_total, 1))
+    r1 = float(window_total)
+    r2 = n - r1
+    c2 = n - c1
+    observed_cells = [o11, np.maximum(r1 - o11, 0), np.maximum(c1 - o11, 0), np.maximum(r2 - c1 + o11, 0)]
+    expected_cells = [r1 * c1 / n, r1 * c2 / n, r2 * c1 / n, r2 * c2 / n]
+    e11 = expected_cells[0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_likelihood = 2 * sum(
+            np.where(o > 0, o * np.log(np.where(o > 0, o, 1) / e), 0.0)
+            for o, e in zip(observed_cells, expected_cells)
+        )
+        chi_square = sum(np.where(e > 0, (o - e) ** 2 / e, 0.0) for o, e in zip(observed_cells, expected_cells))
+        dice = 2 * o11 / (node_frequency + c1)
+        scores = {
+            'frequency': o11.astype(np.int64),
+            'mi': np.log2(o11 / e11),
+            'mi3': np.log2(o11 ** 3 / e11),
+            't_score': (o11 - e11) / np.sqrt(o11),
+            'log_likelihood': np.where(o11 < e11, -log_likelihood, log_likelihood),
+            'log_dice': 14 + np.log2(dice),
+            'dice': dice,
+            'chi_square': chi_square,
+        }
+    for measure, values in scores.items():
+        if values.dtype.kind == 'f':
+            scores[measure] = np.nan_to_num(values, nan=0.0, posinf=0.0, neginf=0.0)
+    return scores
+
+
+class CollocationTable:
+    """Collocates of a node with their counts and association scores."""
+
+    def __init__(
+        self,
+        values: np.ndarray,
+        observed: np.ndarray,
+        left: np.ndarray,
+        collocate_frequencies: np.ndarray,
+        node_frequency: int,
+        window_total: int,
+        corpus_size: int,
+        pos: Optional[np.ndarray] = None
+    ):
+        """Initialize table.
+
+        Args:
+            values: Collocate values
+            observed: Co-occurrence count per collocate
+            left: Co-occurrences left of the node per collocate
+            collocate_frequencies: Corpus frequency per collocate
+            node_frequency: Number of node occurrences
+            window_total: Number of window positions counted
+            corpus_size: Tokens of the (sub)corpus the frequencies come from
+            pos: Most frequent POS of each collocate in the windows
+        """
+        self.values = values
+        self.observed = observed
+        self.left = left
+        self.right = observed - left
+        self.collocate_frequencies = collocate_frequencies
+        self.node_frequency = node_frequency
+        self.window_total = window_total
+        self.corpus_size = corpus_size
+        self.pos = pos
+        self.scores = association_scores(observed, node_frequency, collocate_frequencies, window_total, corpus_size)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def rows(self, measure: str = 'frequency', min_frequency: int = 1, limit: Optional[int] = None) -> List[dict]:
+        """Collocates ranked by a measure (ties by frequency, then value).
+
+        Args:
+            measure: One of MEASURES
+            min_frequency: Minimum co-occurrence count
+            limit: Return at most this many collocates
+
+        Returns:
+            List of dicts with the collocate, its counts and every score
+
+        Raises:
+            ValueError: If the measure is unknown
+        """
+        if measure not in MEASURES:
+            raise ValueError(f"Unknown association measure: {measure}. Use one of {', '.join(MEASURES)}")
+        selected = np.flatnonzero(self.observed >= min_frequency)
+        order = np.lexsort((self.values[selected], -self.observed[selected], -self.scores[measure][selected]))
+        selected = selected[order][:limit]
+        rows = []
+        for i in selected.tolist():
+            row = {
+                'collocate': str(self.values[i]),
+                'frequency': int(self.observed[i]),
+                'left': int(self.left[i]),
+                'right': int(self.right[i]),
+                'collocate_frequency': int(self.collocate_frequencies[i]),
+                'pos': str(self.pos[i]) if self.pos is not None else '',
+            }
+            for name in MEASURES[1:]:
+                row[name] = round(float(self.scores[name][i]), 4)
+            rows.append(row)
+        return rows
+
+
+class CollocationFinder:
+    """Collocations of a node on a CorpusIndex or SegmentedIndex."""
+
+    def __init__(self, counter: NgramCounter, chunk_size: int = CHUNK_SIZE):
+        """Initialize finder.
+
+        Args:
+            counter: NgramCounter of the index (its case-folded lexicons are shared)
+            chunk_size: Window positions built per step (bounds memory for very frequent nodes)
+        """
+        self.counter = counter
+        self.segments = counter.segments
+        self.pos_attribute = counter.pos_attribute
+        self.chunk_size = chunk_size
+        self._marginals: Dict[tuple, Tuple[np.ndarray, int]] = {}
+
+    def marginals(
+        self,
+        attribute: str,
+        document_ids: Optional[Bitmap] = None,
+        exclude_pos: Iterable[str] = ('PUNCT',),
+        cache_key=None
+    ) -> Tuple[np.ndarray, int]:
+        """Case-folded frequency of every value and the token count.
+
+        Args:
+            attribute: Collocate attribute
+            document_ids: Subcorpus (None = all)
+            exclude_pos: Tokens not counted
+            cache_key: Hashable key of the subcorpus to cache it under (whole corpus always cached)
+
+        Returns:
+            (frequency per case-folded lexicon ID, tokens)
+        """
+        key = (attribute, tuple(exclude_pos), cache_key if document_ids is not None else None)
+        if key not in self._marginals or (document_ids is not None and cache_key is None):
+            values, _ = self.counter.lexicon(attribute, lowercase=True)
+            table = self.counter.frequencies.count((attribute,), document_ids, exclude_pos).lowercase()
+            folded, counts = table.counts[attribute]
+            frequencies = np.zeros(len(values), dtype=np.int64)
+            frequencies[np.searchsorted(values, folded)] = counts
+            self._marginals[key] = (frequencies, table.tokens)
+        return self._marginals[key]
+
+    def find(
+        self,
+        node: str,
+        node_attribute: str = 'lemma',
+        attribute: str = 'lemma',
+        left: int = 5,
+        right: int = 5,
+        document_ids: Optional[Iterable[int]] = None,
+        collocate_pos: Optional[Iterable[str]] = None,
+        exclude_pos: Iterable[str] = ('PUNCT',),
+        within: str = 's',
+        cache_key=None
+    ) -> CollocationTable:
+        """Count the collocates of a node (case-insensitive).
+
+        Args:
+            node: Node value, matched case-insensitively on node_attribute
+            node_attribute: Attribute the node is looked up on
+            attribute: Attribute of the collocates (case-folded)
+            left, right: Window span left and right of the node
+            document_ids: Subcorpus as document IDs or a Bitmap (None = all)
+            collocate_pos: Only count collocates with these POS tags (None = all)
+            exclude_pos: Window tokens skipped entirely (not in R1 either)
+            within: Structure windows are clipped to ('s' = sentence)
+            cache_key: Hashable key of the subcorpus for the marginal frequencies
+
+        Returns:
+            CollocationTable
+        """
+        if document_ids is not None and not isinstance(document_ids, Bitmap):
+            document_ids = Bitmap.from_ids(document_ids)
+        exclude_pos = list(exclude_pos)
+        collocate_pos = list(collocate_pos) if collocate_pos else None
+        values, maps = self.counter.lexicon(attribute, lowercase=True)
+        pos_values, pos_maps = self.counter.lexicon(self.pos_attribute)
+        offsets = window_offsets(left, right)
+        blocked = np.isin(pos_values, exclude_pos)
+        wanted = np.isin(pos_values, collocate_pos) if collocate_pos else None
+
+        observed = np.zeros(len(values), dtype=np.int64)
+        on_left = np.zeros(len(values), dtype=np.int64)
+        collocate_ids: List[np.ndarray] = []
+        collocate_tags: List[np.ndarray] = []
+        node_frequency = 0
+        window_total = 0
+        for number, segment in enumerate(self.segments):
+            lex_ids = segment.lookup(node_attribute, node, case_sensitive=False)
+            nodes = segment.attribute(node_attribute).positions_for_ids(lex_ids).astype(np.int64)
+            if document_ids is not None:
+                nodes = nodes[in_regions(nodes, *segment.document_ranges(document_ids))]
+            if len(nodes) == 0:
+                continue
+            node_frequency += len(nodes)
+            structure = segment.structure(within)
+            regions = structure.find_all(nodes)
+            nodes = nodes[regions >= 0]
+            regions = regions[regions >= 0]
+            sentence_starts = np.asarray(structure.starts, dtype=np.int64)[regions]
+            sentence_ends = np.asarray(structure.ends, dtype=np.int64)[regions]
+            stream = segment.attribute(attribute).stream
+            pos_stream = segment.attribute(self.pos_attribute).stream
+            step = max(1, self.chunk_size // max(len(offsets), 1))
+            for first in range(0, len(nodes), step):
+                chunk = slice(first, first + step)
+                positions, slots = window_positions(nodes[chunk], offsets, sentence_starts[chunk], sentence_ends[chunk])
+                tags = pos_maps[number][np.asarray(pos_stream[positions])]
+                keep = ~blocked[tags]
+                window_total += int(keep.sum())
+                if wanted is not None:
+                    keep &= wanted[tags]
+                ids = maps[number][np.asarray(stream[positions[keep]])]
+                observed += np.bincount(ids, minlength=len(values))
+                on_left += np.bincount(ids[offsets[slots[keep]] < 0], minlength=len(values))
+                collocate_ids.append(ids)
+                collocate_tags.append(tags[keep])
+
+        frequencies, corpus_size = self.marginals(attribute, document_ids, exclude_pos, cache_key)
+        present = np.flatnonzero(observed)
+        pos = None
+        if collocate_ids:
+            best = dominant(
+                np.concatenate(collocate_ids), np.concatenate(collocate_tags), len(values), len(pos_values)
+            )[present]
+            pos = np.where(best >= 0, pos_values[np.maximum(best, 0)] if len(pos_values) else '', '')
+        return CollocationTable(
+            values[present], observed[present], on_left[present], frequencies[present],
+            node_frequency, window_total, corpus_size, pos
+        )
+
+
+def count_collocates(
+    codes: np.ndarray,
+    lexicon: np.ndarray,
+    nodes: np.ndarray,
+    left: int,
+    right: int,
+    frequencies: np.ndarray,
+    corpus_size: int,
+    boundaries: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    skipped: Optional[np.ndarray] = None,
+    wanted: Optional[np.ndarray] = None,
+    pos: Optional[Tuple[np.ndarray, np.ndarray]] = None
+) -> CollocationTable:
+    """Collocations over an encoded token sequence held in memory.
+
+    Used where there is no index: a document's analysis data, or the
+    sentences of the node fetched from the database.
+
+    Args:
+        codes: Collocate ID per position
+        lexicon: Value per ID
+        nodes: Node positions
+        left, right: Window span
+        frequencies: Corpus frequency per ID
+        corpus_size: Corpus size for the measures
+        boundaries: (starts, ends) of the regions windows stay in (None = whole sequence)
+        skipped: Positions left out of windows and of R1 (e.g. PUNCT)
+        wanted: Positions that may be counted as collocates (POS filter)
+        pos: (POS ID per position, POS lexicon) for the collocates' dominant POS
+
+    Returns:
+        CollocationTable
+    """
+    nodes = np.asarray(nodes, dtype=np.int64)
+    if boundaries is None:
+        boundaries = (np.array([0]), np.array([len(codes)]))
+    starts, ends = (np.asarray(bound, dtype=np.int64) for bound in boundaries)
+    regions = np.searchsorted(starts, nodes, side='right') - 1
+    offsets = window_offsets(left, right)
+    positions, slots = window_positions(nodes, offsets, starts[regions], ends[regions])
+    keep = np.ones(len(positions), dtype=bool) if skipped is None else ~skipped[positions]
+    window_total = int(keep.sum())
+    if wanted is not None:
+        keep &= wanted[positions]
+    ids = codes[positions[keep]]
+    observed = np.bincount(ids, minlength=len(lexicon))
+    on_left = np.bincount(ids[offsets[slots[keep]] < 0], minlength=len(lexicon))
+    present = np.flatnonzero(observed)
+    best_pos = None
+    if pos is not None:
+        tags, tag_values = pos
+        best = dominant(ids, tags[positions[keep]], len(lexicon), len(tag_values))[present]
+        best_pos = np.where(best >= 0, tag_values[np.maximum(best, 0)] if len(tag_values) else '', '')
+    return CollocationTable(
+        lexicon[present], observed[present], on_left[present], np.asarray(frequencies)[present],
+        len(nodes), window_total, corpus_size, best_pos
+    )
@@ -0,0 +1,176 @@
+"""Read access to a built positional corpus index."""
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .attribute import PositionalAttribute
+from .bitmap import Bitmap
+from .structure import StructuralAttribute, in_regions
+
+FORMAT_VERSION = 4
+
+# Document tombstones: packed bitmap over the documents (text regions).
+# The only file of an index that changes after it is written.
+DELETIONS = 'deleted.npy'
+
+# Attributes encoded by default (CoNLL-U columns used for querying)
+DEFAULT_ATTRIBUTES = ('form', 'lemma', 'upos', 'xpos', 'feats', 'deprel')
+
+# Structures (outermost first) and their string region attributes
+STRUCTURE_ATTRIBUTES = {
+    'text': ('filename', 'author', 'genre', 'date'),
+    'p': ('id',),
+    's': ('id',),
+}
+
+# Query-language aliases, same mapping as CorpusQueryEngine._parse_pattern
+ATTRIBUTE_ALIASES = {
+    'word': 'form',
+    'pos': 'upos',
+    'tag': 'upos',
+}
+
+
+class CorpusIndex:
+    """CWB-style positional index over a whole corpus.
+
+    Every token has a global corpus position. Positional attributes give
+    O(1) access to the lexicon ID at a position and a reverse index from
+    lexicon ID to positions; structures map positions to documents,
+    paragraphs and sentences by binary search.
+
+    Deleted documents stay in the files until the index is rewritten
+    (segment compaction) but are masked out of every posting list.
+    """
+
+    def __init__(self, path):
+        """Open an index directory.
+
+        Args:
+            path: Directory written by IndexBuilder
+
+        Raises:
+            FileNotFoundError: If the directory holds no index
+            ValueError: If the index was written in another format version
+        """
+        self.path = Path(path)
+        with open(self.path / 'index.json', 'r', encoding='utf-8') as f:
+            self.info = json.load(f)
+
+        if self.info.get('format_version') != FORMAT_VERSION:
+            raise ValueError(
+                f"Index format {self.info.get('format_version')} is not supported "
+                f"(expected {FORMAT_VERSION}); rebuild the index"
+            )
+
+        self.size = int(self.info['size'])
+        self.attribute_names = tuple(self.info['attributes'])
+        self.structure_names = tuple(self.info['structures'])
+        self.structure_attributes = self.info.get('structure_attributes', {})
+        self._attributes: Dict[str, PositionalAttribute] = {}
+        self._structures: Dict[str, StructuralAttribute] = {}
+        self.load_deletions()
+
+    @staticmethod
+    def exists(path) -> bool:
+        """Check whether a directory contains an index."""
+        return (Path(path) / 'index.json').exists()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def has_attribute(self, name: str) -> bool:
+        """Check whether a positional attribute (or alias) is encoded."""
+        return ATTRIBUTE_ALIASES.get(name, name) in self.attribute_names
+
+    def attribute(self, name: str) -> PositionalAttribute:
+        """Get a positional attribute by name or alias ('word', 'pos')."""
+        name = ATTRIBUTE_ALIASES.get(name, name)
+        if name not in self._attributes:
+            if name not in self.attribute_names:
+                raise KeyError(f"Attribute not in index: {name}")
+            attr = self._attributes[name] = PositionalAttribute(self.path, name)
+            attr.deleted_ranges = self.deleted_ranges
+        return self._attributes[name]
+
+    def lookup(self, attribute: str, value: str, regex: bool = False, case_sensitive: bool = True) -> np.ndarray:
+        """Lexicon IDs of an attribute equal to (or, with regex, matching) a value."""
+        lexicon = self.attribute(attribute).lexicon
+        if regex:
+            return lexicon.match(value, case_sensitive)
+        return lexicon.ids_of(value, case_sensitive)
+
+    def structure(self, name: str) -> StructuralAttribute:
+        """Get a structural attribute ('text', 'p' or 's')."""
+        if name not in self._structures:
+            if name not in self.structure_names:
+                raise KeyError(f"Structure not in index: {name}")
+            self._structures[name] = StructuralAttribute(
+                self.path, name, self.structure_attributes.get(name, ())
+            )
+        return self._structures[name]
+
+    def shards(self) -> List[Tuple[int, int]]:
+        """Document-range shards as (start, end) positions (see parallel.py)."""
+        shards = self.info.get('shards')
+        if shards:
+            return [(int(start), int(end)) for start, end in shards]
+        return [(0, self.size)] if self.size else []
+
+    def document_of(self, positions: np.ndarray) -> np.ndarray:
+        """Database IDs of the documents containing positions (-1 outside)."""
+        text = self.structure('text')
+        regions = text.find_all(positions)
+        if len(text) == 0:
+            return regions
+        return np.where(regions >= 0, np.asarray(text.values)[np.maximum(regions, 0)], -1)
+
+    def document_ids(self) -> np.ndarray:
+        """Database IDs of all indexed (not deleted) documents, in corpus order."""
+        return np.asarray(self.structure('text').values)[~self.deleted]
+
+    def load_deletions(self):
+        """(Re)read the document tombstones and apply them to opened attributes."""
+        text = self.structure('text')
+        try:
+            bits = np.load(self.path / DELETIONS)
+            self.deleted = np.unpackbits(bits, count=len(text)).astype(bool)
+        except FileNotFoundError:
+            self.deleted = np.zeros(len(text), dtype=bool)
+        self.deleted_count = int(self.deleted.sum())
+        self.deleted_ranges: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        if self.deleted_count:
+            self.deleted_ranges = (np.asarray(text.starts)[self.deleted], np.asarray(text.ends)[self.deleted])
+        for attr in self._attributes.values():
+            attr.deleted_ranges = self.deleted_ranges
+
+    def live(self, positions: np.ndarray) -> np.ndarray:
+        """Boolean mask of positions outside deleted documents."""
+        positions = np.asarray(positions)
+        if self.deleted_ranges is None:
+            return np.ones(len(positions), dtype=bool)
+        return ~in_regions(positions, *self.deleted_ranges)
+
+    def document_ranges(
+        self,
+        document_ids: Optional[Iterable[int]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Get position ranges of documents.
+
+        Args:
+            document_ids: Documents to include (None = all), as IDs or a
+                          Bitmap; deleted documents are never included
+
+        Returns:
+            Tuple of (starts, ends) arrays sorted by start position
+        """
+        text = self.structure('text')
+        mask = ~self.deleted
+        if isinstance(document_ids, Bitmap):
+            mask &= document_ids.contains(text.values)
+        elif document_ids is not None:
+            wanted = np.fromiter((int(d) for d in document_ids), dtype=np.int64)
+            mask &= np.isin(text.values, wanted)
+        return np.asarray(text.starts)[mask], np.asarray(text.ends)[mask]
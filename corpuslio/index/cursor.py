@@ -0,0 +1,59 @@
+"""Opaque resumable cursors for paged query results.
+
+A cursor is a small URL-safe token holding where the next (or previous)
+page starts, e.g. the corpus position of the last hit shown, and the
+fingerprint of the query it belongs to. Resuming from a position
+restricts the next search to the positions after it, so a deep page
+decodes no more posting blocks than the first one; nothing before the
+cursor is re-read and no offset is counted off.
+
+The fingerprint covers the query, its options, the subcorpus and the
+index version, so a cursor cannot be replayed against another query or
+a rebuilt index.
+
+Example:
+    >>> key = fingerprint('form', 'ev', False, subcorpus.to_array(), version)
+    >>> token = encode_cursor(key, after=int(positions[-1]))
+    >>> decode_cursor(token, key)
+    {'after': 1234}
+"""
+import base64
+import hashlib
+import json
+from typing import Any, Dict
+
+import numpy as np
+
+
+def fingerprint(*parts: Any) -> str:
+    """Short hash of the parts that identify a query (arrays by their bytes)."""
+    digest = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def encode_cursor(key: str, **state: Any) -> str:
+    """Cursor token of a query fingerprint and a JSON-serializable resume state."""
+    payload = json.dumps({'f': key, **state}, separators=(',', ':'), sort_keys=True)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str, key: str) -> Dict[str, Any]:
+    """Resume state of a cursor token.
+
+    Raises:
+        ValueError: If the token is malformed or belongs to another query
+    """
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        state = json.loads(payload.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(state, dict) or state.pop('f', None) != key:
+        raise ValueError("Cursor does not belong to this query")
+    return state
@@ -0,0 +1,484 @@
+"""Dispersion statistics from sparse document x term count matrices.
+
+Every segment carries a CSR count matrix per attribute (documents x
+lexicon IDs, PUNCT excluded), written when the segment is built, so an
+import only adds the matrix of its own documents::
+
+    counts/
+        matrix.json             attributes, excluded POS
+        sizes.npy               tokens per document
+        lemma.indptr.npy        entries of document d: indptr[d]:indptr[d + 1]
+        lemma.indices.npy       lexicon IDs of the segment
+        lemma.data.npy          counts
+
+``DispersionCounter`` concatenates the entries of the live (and
+selected) documents of all segments, translated to merged lexicon IDs,
+and computes the measures of every type at once with bincounts over the
+non-zero entries. With v_d the frequency of a word in document d, f its
+corpus frequency, s_d the share of document d in the corpus and n the
+number of documents:
+
+==========  ==========================================================
+range       documents containing the word
+juilland_d  1 - CV / sqrt(n - 1), CV of the relative frequencies v_d / size_d
+dp          Gries' DP: 0.5 * sum |v_d / f - s_d| (0 = even, 1 = one document)
+dp_norm     DP / (1 - min s_d) (Lijffijt & Gries 2012)
+arf         average reduced frequency (Savický & Hlaváčová 2002), from the
+            distances between consecutive occurrences in corpus order
+==========  ==========================================================
+
+Example:
+    >>> table = DispersionCounter(NgramCounter(index)).table('lemma')
+    >>> table.rows(limit=10000)       # frequency list with dispersion
+    >>> table.row('ve')
+"""
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .bitmap import Bitmap
+
+logger = logging.getLogger(__name__)
+
+MATRIX_DIR = 'counts'
+MATRIX_INFO = 'matrix.json'
+MATRIX_ATTRIBUTES = ('form', 'lemma')
+MATRIX_EXCLUDE_POS = ('PUNCT',)
+
+# Tokens encoded per chunk while building a matrix (chunks end on documents)
+CHUNK_SIZE = 1 << 22
+
+# Dispersion measures, in the order they are reported
+DISPERSION_MEASURES = ('range', 'juilland_d', 'dp', 'dp_norm', 'arf')
+
+# Measures where lower values mean a more even spread
+ASCENDING_MEASURES = ('dp', 'dp_norm')
+
+
+class CountMatrix:
+    """Document x term counts of one segment in CSR layout."""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, sizes: np.ndarray):
+        """Initialize matrix.
+
+        Args:
+            indptr: Entries of document d are indptr[d]:indptr[d + 1]
+            indices: Lexicon ID per entry (sorted within a document)
+            data: Count per entry
+            sizes: Counted tokens per document
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.sizes = sizes
+
+    def document_rows(self) -> np.ndarray:
+        """Document number of every entry."""
+        return np.repeat(np.arange(len(self.sizes), dtype=np.int64), np.diff(self.indptr))
+
+    @classmethod
+    def from_segment(
+        cls,
+        segment,
+        attribute: str,
+        exclude_pos: Sequence[str] = MATRIX_EXCLUDE_POS,
+        pos_attribute: str = 'upos',
+        chunk_size: int = CHUNK_SIZE
+    ) -> 'CountMatrix':
+        """Count an attribute per document of a segment (deleted documents included).
+
+        Args:
+            segment: Opened CorpusIndex
+            attribute: Positional attribute to count
+            exclude_pos: Skip tokens with these POS tags
+            pos_attribute: Attribute holding the POS tags
+            chunk_size: Tokens per counting chunk
+        """
+        text = segment.structure('text')
+        starts = np.asarray(text.starts, dtype=np.int64)
+        ends = np.asarray(text.ends, dtype=np.int64)
+        stream = segment.attribute(attribute).stream
+        width = max(len(segment.attribute(attribute).lexicon), 1)
+        excluded = None
+        if exclude_pos and segment.has_attribute(pos_attribute):
+            pos_lexicon = segment.attribute(pos_attribute).lexicon
+            excluded = np.array([i for i in map(pos_lexicon.id_of, exclude_pos) if i >= 0], dtype=np.int64)
+
+        keys, counts = [], []
+        sizes = np.zeros(len(text), dtype=np.int64)
+        first = 0
+        while first < len(text):
+            last = max(int(np.searchsorted(ends, starts[first] + chunk_size, side='right')), first + 1)
+            positions = np.arange(starts[first], ends[last - 1])
+            documents = np.searchsorted(starts, positions, side='right') - 1
+            inside = positions < ends[documents]
+            positions, documents = positions[inside], documents[inside]
+            if excluded is not None and len(excluded):
+                keep = ~np.isin(segment.attribute(pos_attribute).stream[positions], excluded)
+                positions, documents = positions[keep], documents[keep]
+            sizes += np.bincount(documents, minlength=len(text))
+            chunk_keys, chunk_counts = np.unique(documents * width + np.asarray(stream[positions]), return_counts=True)
+            keys.append(chunk_keys)
+            counts.append(chunk_counts)
+            first = last
+
+        keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+        rows = keys // width
+        return cls(
+            np.searchsorted(rows, np.arange(len(text) + 1)).astype(np.int64),
+            (keys % width).astype(np.int32),
+            np.concatenate(counts).astype(np.int32) if counts else np.zeros(0, dtype=np.int32),
+            sizes,
+        )
+
+    @staticmethod
+    def exists(path, attribute: str) -> bool:
+        """Check whether a segment directory has a stored matrix of an attribute."""
+        return (Path(path) / MATRIX_DIR / f'{attribute}.indptr.npy').exists()
+
+    @classmethod
+    def load(cls, path, attribute: str) -> 'CountMatrix':
+        """Memory-map the stored matrix of a segment directory."""
+        path = Path(path) / MATRIX_DIR
+        return cls(
+            np.load(path / f'{attribute}.indptr.npy', mmap_mode='r'),
+            np.load(path / f'{attribute}.indices.npy', mmap_mode='r'),
+            np.load(path / f'{attribute}.data.npy', mmap_mode='r'),
+            np.load(path / 'sizes.npy'),
+        )
+
+
+def build_count_matrices(
+    segment,
+    attributes: Sequence[str] = MATRIX_ATTRIBUTES,
+    exclude_pos: Sequence[str] = MATRIX_EXCLUDE_POS
+) -> Path:
+    """Count and persist the document x term matrices of a segment.
+
+    The matrices are written into a temporary directory that is renamed
+    into place, so readers never see a partial matrix.
+
+    Args:
+        segment: Opened CorpusIndex of the segment
+        attributes: Attributes to count (missing ones are skipped)
+        exclude_pos: Skip tokens with these POS tags
+
+    Returns:
+        Path of the matrix directory
+    """
+    attributes = [attribute for attribute in attributes if segment.has_attribute(attribute)]
+    tmp_path = segment.path / f'{MATRIX_DIR}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir()
+
+    for attribute in attributes:
+        matrix = CountMatrix.from_segment(segment, attribute, exclude_pos)
+        for name in ('indptr', 'indices', 'data'):
+            np.save(tmp_path / f'{attribute}.{name}.npy', getattr(matrix, name))
+        np.save(tmp_path / 'sizes.npy', matrix.sizes)
+
+    info = {
+        'attributes': attributes,
+        'exclude_pos': list(exclude_pos),
+        'built_at': datetime.now().isoformat(),
+    }
+    with open(tmp_path / MATRIX_INFO, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+    path = segment.path / MATRIX_DIR
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Written concurrently by another process
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return path
+
+
+def dispersion_scores(
+    rows: np.ndarray,
+    columns: np.ndarray,
+    counts: np.ndarray,
+    sizes: np.ndarray,
+    column_count: int
+) -> Dict[str, np.ndarray]:
+    """Frequency, range, Juilland's D, DP and DPnorm of every column.
+
+    Args:
+        rows: Document (part) of every non-zero entry, 0 <= row < len(sizes)
+        columns: Term ID of every entry (one entry per document and term)
+        counts: Count of every entry
+        sizes: Tokens per document (all > 0)
+        column_count: Number of term IDs
+
+    Returns:
+        measure -> array over the term IDs ('frequency' included); D is
+        NaN with fewer than two documents
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    sizes = np.asarray(sizes, dtype=np.float64)
+    parts = len(sizes)
+    shares = sizes / max(sizes.sum(), 1)
+    frequency = np.bincount(columns, weights=counts, minlength=column_count)
+    document_range = np.bincount(columns, minlength=column_count)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entry_share = shares[rows]
+        deviation = np.abs(counts / frequency[columns] - entry_share)
+        dp = 0.5 * (
+            np.bincount(columns, weights=deviation, minlength=column_count)
+            + 1 - np.bincount(columns, weights=entry_share, minlength=column_count)
+        )
+        dp_norm = dp / (1 - shares.min()) if parts > 1 else np.zeros(column_count)
+
+        relative = counts / sizes[rows]
+        mean = np.bincount(columns, weights=relative, minlength=column_count) / parts
+        variance = np.bincount(columns, weights=relative * relative, minlength=column_count) / parts - mean * mean
+        variation = np.sqrt(np.maximum(variance, 0)) / mean
+        juilland_d = np.clip(1 - variation / np.sqrt(parts - 1), 0, 1) if parts > 1 else np.full(column_count, np.nan)
+
+    present = frequency > 0
+    return {
+        'frequency': frequency.astype(np.int64),
+        'range': document_range.astype(np.int64),
+        'juilland_d': np.where(present, juilland_d, np.nan),
+        'dp': np.where(present, dp, np.nan),
+        'dp_norm': np.where(present, dp_norm, np.nan),
+    }
+
+
+def reduced_frequencies(codes: np.ndarray, column_count: int) -> np.ndarray:
+    """Average reduced frequency of every ID of a token sequence.
+
+    With f occurrences in a sequence of N tokens and v = N / f, ARF is
+    sum(min(d_i, v)) / v over the f distances d_i between consecutive
+    occurrences (the first one wrapping around the end). One stable sort
+    groups the positions of all IDs.
+    """
+    size = len(codes)
+    frequency = np.bincount(codes, minlength=column_count)
+    if size == 0:
+        return np.zeros(column_count)
+    positions = np.argsort(codes, kind='stable')
+    ordered = codes[positions]
+    firsts = np.flatnonzero(np.concatenate([[True], ordered[1:] != ordered[:-1]]))
+    lasts = np.concatenate([firsts[1:], [size]]) - 1
+
+    gaps = np.empty(size, dtype=np.int64)
+    gaps[1:] = np.diff(positions)
+    gaps[firsts] = positions[firsts] + size - positions[lasts]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reduced = size / frequency
+        arf = np.bincount(ordered, weights=np.minimum(gaps, reduced[ordered]), minlength=column_count) / reduced
+    return np.where(frequency > 0, arf, 0.0)
+
+
+class DispersionTable:
+    """Frequency and dispersion of every type of an attribute."""
+
+    def __init__(self, values: np.ndarray, scores: Dict[str, np.ndarray], documents: int, tokens: int):
+        """Initialize table.
+
+        Args:
+            values: Types (sorted)
+            scores: measure -> array aligned with values, with 'frequency'
+            documents: Number of documents (parts)
+            tokens: Number of tokens counted
+        """
+        present = np.flatnonzero(scores['frequency'])
+        self.values = values[present]
+        self.scores = {measure: array[present] for measure, array in scores.items()}
+        self.documents = documents
+        self.tokens = tokens
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _row(self, i: int) -> dict:
+        row = {
+            'word': str(self.values[i]),
+            'frequency': int(self.scores['frequency'][i]),
+            'range': int(self.scores['range'][i]),
+            'range_percent': round(100 * int(self.scores['range'][i]) / max(self.documents, 1), 2),
+        }
+        for measure in DISPERSION_MEASURES[1:]:
+            if measure in self.scores:
+                value = float(self.scores[measure][i])
+                row[measure] = None if np.isnan(value) else round(value, 4)
+        return row
+
+    def row(self, value: str) -> Optional[dict]:
+        """Dispersion of one type (None if it does not occur)."""
+        i = int(np.searchsorted(self.values, value))
+        if i >= len(self.values) or self.values[i] != value:
+            return None
+        return self._row(i)
+
+    def rows(
+        self,
+        limit: Optional[int] = None,
+        min_frequency: int = 1,
+        sort: str = 'frequency',
+        words: Optional[Iterable[str]] = None
+    ) -> List[dict]:
+        """Frequency list with dispersion.
+
+        Args:
+            limit: Return at most this many types
+            min_frequency: Minimum corpus frequency
+            sort: 'frequency' or one of DISPERSION_MEASURES (most even first)
+            words: Only these types, in this order (sort is ignored)
+
+        Returns:
+            List of dicts with word, frequency, range, range_percent and
+            the dispersion measures
+
+        Raises:
+            ValueError: If the sort key is unknown
+        """
+        if words is not None:
+            found = [self.row(word) for word in words]
+            return [row for row in found if row is not None][:limit]
+        if sort != 'frequency' and sort not in DISPERSION_MEASURES:
+            raise ValueError(f"Unknown dispersion measure: {sort}. Use one of {', '.join(DISPERSION_MEASURES)}")
+        if sort not in self.scores:
+            raise ValueError(f"Dispersion measure {sort} was not computed")
+        frequency = self.scores['frequency']
+        selected = np.flatnonzero(frequency >= min_frequency)
+        key = np.nan_to_num(self.scores[sort][selected], nan=np.inf if sort in ASCENDING_MEASURES else -np.inf)
+        order = np.lexsort((self.values[selected], -frequency[selected], key if sort in ASCENDING_MEASURES else -key))
+        return [self._row(i) for i in selected[order][:limit].tolist()]
+
+
+class DispersionCounter:
+    """Dispersion of the types of a CorpusIndex or SegmentedIndex."""
+
+    def __init__(self, counter):
+        """Initialize counter.
+
+        Args:
+            counter: NgramCounter of the index (for its merged, case-folded lexicons)
+        """
+        self.counter = counter
+        self.frequencies = counter.frequencies
+        self.segments = counter.segments
+        self._matrices: Dict[Tuple[int, str], CountMatrix] = {}
+        self._tables: Dict[Tuple[str, bool, bool], DispersionTable] = {}
+
+    def matrix(self, number: int, attribute: str) -> CountMatrix:
+        """Count matrix of a segment (stored, or counted once for older segments)."""
+        key = (number, attribute)
+        if key not in self._matrices:
+            segment = self.segments[number]
+            if CountMatrix.exists(segment.path, attribute):
+                self._matrices[key] = CountMatrix.load(segment.path, attribute)
+            else:
+                self._matrices[key] = CountMatrix.from_segment(segment, attribute, MATRIX_EXCLUDE_POS)
+        return self._matrices[key]
+
+    def table(
+        self,
+        attribute: str = 'lemma',
+        document_ids: Optional[Iterable[int]] = None,
+        lowercase: bool = False,
+        arf: bool = True
+    ) -> DispersionTable:
+        """Dispersion of every type of an attribute in the corpus or a subcorpus.
+
+        Documents are the parts; PUNCT is not counted. Whole-corpus tables
+        are kept for the lifetime of the counter.
+
+        Args:
+            attribute: 'form' or 'lemma'
+            document_ids: Subcorpus as document IDs or a Bitmap (None = all)
+            lowercase: Merge case variants
+            arf: Also compute ARF (one pass over the token streams)
+
+        Returns:
+            DispersionTable
+        """
+        cache_key = (attribute, lowercase, arf)
+        if document_ids is None and cache_key in self._tables:
+            return self._tables[cache_key]
+        if document_ids is not None and not isinstance(document_ids, Bitmap):
+            document_ids = Bitmap.from_ids(document_ids)
+        values, maps = self.counter.lexicon(attribute, lowercase)
+        _, rows, columns, counts, sizes = self.entries(attribute, document_ids, lowercase)
+        parts = len(sizes)
+
+        scores = dispersion_scores(rows, columns, counts, sizes, len(values))
+        if arf:
+            scores['arf'] = reduced_frequencies(self._codes(attribute, maps, document_ids), len(values))
+        table = DispersionTable(values, scores, parts, int(sizes.sum()))
+        if document_ids is None:
+            self._tables[cache_key] = table
+        return table
+
+    def entries(
+        self,
+        attribute: str = 'lemma',
+        document_ids: Optional[Iterable[int]] = None,
+        lowercase: bool = False
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Non-zero document x term counts of the live documents with tokens.
+
+        Args:
+            attribute: 'form' or 'lemma'
+            document_ids: Subcorpus as document IDs or a Bitmap (None = all)
+            lowercase: Merge case variants
+
+        Returns:
+            (database ID per row, row per entry, merged lexicon ID per entry,
+            count per entry, tokens per row); one entry per row and term
+        """
+        if document_ids is not None and not isinstance(document_ids, Bitmap):
+            document_ids = Bitmap.from_ids(document_ids)
+        values, maps = self.counter.lexicon(attribute, lowercase)
+        ids, rows, columns, counts, sizes = [], [], [], [], []
+        parts = 0
+        for n, segment in enumerate(self.segments):
+            matrix = self.matrix(n, attribute)
+            text_values = np.asarray(segment.structure('text').values)
+            selected = ~segment.deleted & (matrix.sizes > 0)
+            if document_ids is not None:
+                selected &= document_ids.contains(text_values)
+            part_of = np.cumsum(selected) - 1 + parts
+            entries = matrix.document_rows()
+            keep = selected[entries]
+            ids.append(text_values[selected])
+            rows.append(part_of[entries[keep]])
+            columns.append(maps[n][np.asarray(matrix.indices)[keep]])
+            counts.append(np.asarray(matrix.data)[keep])
+            sizes.append(matrix.sizes[selected])
+            parts += int(selected.sum())
+
+        empty = np.zeros(0, dtype=np.int64)
+        ids = np.concatenate(ids).astype(np.int64) if ids else empty
+        rows = np.concatenate(rows) if rows else empty
+        columns = np.concatenate(columns) if columns else empty
+        counts = np.concatenate(counts).astype(np.int64) if counts else empty
+        sizes = np.concatenate(sizes) if sizes else empty
+        if lowercase:
+            # Case variants of one document become one entry
+            width = max(len(values), 1)
+            keys, inverse = np.unique(rows * width + columns, return_inverse=True)
+            counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(keys)).astype(np.int64)
+            rows, columns = keys // width, keys % width
+        return ids, rows, columns, counts, sizes
+
+    def _codes(self, attribute: str, maps: List[np.ndarray], document_ids: Optional[Bitmap]) -> np.ndarray:
+        """Merged IDs of the counted tokens in corpus order."""
+        frequencies = self.frequencies
+        codes = []
+        for n, segment in enumerate(self.segments):
+            pos_lexicon = segment.attribute(frequencies.pos_attribute).lexicon
+            excluded = np.array([i for i in map(pos_lexicon.id_of, MATRIX_EXCLUDE_POS) if i >= 0], dtype=np.int64)
+            mask = frequencies._mask(segment, document_ids, excluded)
+            stream = np.asarray(segment.attribute(attribute).stream)
+            codes.append(maps[n][stream if mask is None else stream[mask]])
+        return np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
@@ -0,0 +1,295 @@
+"""Execution of CQP query patterns on the index.
+
+Plain token sequences (``[pos="ADJ"] [pos="NOUN"]``) are executed by
+positional join: each constraint is resolved to lexicon IDs per
+attribute, the rarest constraint is the anchor whose positions, shifted
+by its offset, give candidate match starts, and candidates are filtered
+by the other constraints at their offsets and by sentence boundaries.
+Ordering and access methods are chosen by the cost-based planner
+(planner.py).
+
+Patterns with repetition, alternation or gaps are compiled to an
+automaton (``corpuslio.query_automaton``) and run over the integer
+attribute streams of the sentences that contain the rarest mandatory
+constraint (anchor seeding), in one pass per sentence.
+
+Example:
+    >>> executor = PatternExecutor(CorpusIndex('/srv/corpus_index'))
+    >>> starts, ends = executor.find(parse_cqp_query('[pos="ADJ"]+ [pos="NOUN"]'))
+"""
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..query_automaton import PatternAutomaton, required_constraints
+from .attribute import PositionalAttribute
+from .corpus import CorpusIndex
+from .planner import Predicate, QueryPlan, QueryPlanner
+from .structure import in_regions
+
+# Sentences run through the automaton per batch
+SENTENCE_BATCH_SIZE = 4096
+
+# (attribute, matching lexicon IDs, negated)
+Lookup = Tuple[PositionalAttribute, np.ndarray, bool]
+
+
+class PatternExecutor:
+    """Find matches of a QueryPattern on a CorpusIndex."""
+
+    def __init__(self, index: CorpusIndex, within: str = 's'):
+        """Initialize executor.
+
+        Args:
+            index: Opened corpus index
+            within: Structure a match may not cross ('s' = sentence), unless
+                the pattern has its own "within" clause
+        """
+        self.index = index
+        self.within = within
+        self.planner = QueryPlanner(index, within)
+        # id(constraint) -> (constraint, lookups)
+        self._lookups = {}
+
+    def constraint_lookups(self, constraint) -> List[Lookup]:
+        """Resolve a TokenConstraint to (attribute, lexicon IDs, negated) per attribute.
+
+        The constraint's own matching rules are applied to every lexicon
+        value, i.e. once per type instead of once per token.
+        """
+        cached = self._lookups.get(id(constraint))
+        if cached is not None and cached[0] is constraint:
+            return cached[1]
+
+        lookups = []
+        for attr_name, pattern in constraint.patterns():
+            attr = self.index.attribute(attr_name)
+            lex_ids = np.asarray(constraint.matching_types(pattern, attr.lexicon.values), dtype=np.int32)
+            lookups.append((attr, lex_ids, attr_name in constraint.negated))
+        self._lookups[id(constraint)] = (constraint, lookups)
+        return lookups
+
+    def estimate(self, lookup: Lookup) -> int:
+        """Number of positions a lookup matches (from lexicon frequencies)."""
+        attr, lex_ids, negated = lookup
+        count = int(attr.lexicon.frequencies[lex_ids].sum())
+        return self.index.size - count if negated else count
+
+    def find(
+        self,
+        pattern,
+        document_ids: Optional[Iterable[int]] = None,
+        limit: Optional[int] = None,
+        span: Optional[Tuple[int, int]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Find matches.
+
+        Args:
+            pattern: QueryPattern
+            document_ids: Restrict to these documents (None = all)
+            limit: Stop after this many matches (None = all)
+            span: Only matches starting in [start, end) (a shard; None = all)
+
+        Returns:
+            Tuple of (starts, ends) int64 arrays, sorted by start; ends are
+            exclusive. Per start position the longest match is returned.
+        """
+        if self._uses_join(pattern):
+            starts = self.join(pattern, document_ids, limit, span)
+            return starts, starts + len(pattern.constraints)
+        return self.run_automaton(pattern, document_ids, limit, span=span)
+
+    def _uses_join(self, pattern) -> bool:
+        """Plain sequences with a non-negated condition run as positional join."""
+        return pattern.is_fixed_length and any(
+            not negated
+            for constraint in pattern.constraints
+            for _, _, negated in self.constraint_lookups(constraint)
+        )
+
+    def _document_filter(self, positions: np.ndarray, document_ids) -> np.ndarray:
+        if document_ids is None:
+            return positions
+        doc_starts, doc_ends = self.index.document_ranges(document_ids)
+        return positions[in_regions(positions, doc_starts, doc_ends)]
+
+    def predicates(self, pattern) -> List[Predicate]:
+        """Planner predicates for the conditions of a plain token sequence."""
+        predicates = []
+        for offset, constraint in enumerate(pattern.constraints):
+            for (attr_name, value), (attr, lex_ids, negated) in zip(
+                constraint.patterns(), self.constraint_lookups(constraint)
+            ):
+                operator = '!=' if negated else '='
+                predicates.append(Predicate(offset, attr, lex_ids, negated, f'{attr_name}{operator}"{value}"'))
+        return predicates
+
+    def plan(self, pattern, document_ids: Optional[Iterable[int]] = None) -> QueryPlan:
+        """Cost-based plan for a plain token sequence (see planner.py)."""
+        return self.planner.plan(
+            self.predicates(pattern), len(pattern.constraints), document_ids, pattern.within
+        )
+
+    def join(
+        self,
+        pattern,
+        document_ids: Optional[Iterable[int]] = None,
+        limit: Optional[int] = None,
+        span: Optional[Tuple[int, int]] = None
+    ) -> np.ndarray:
+        """Positional join for plain token sequences.
+
+        Returns:
+            Sorted int64 array of corpus positions where matches start
+        """
+        if len(pattern.constraints) == 0:
+            return np.empty(0, dtype=np.int64)
+        plan = self.plan(pattern, document_ids)
+        return self.planner.execute(plan, document_ids, limit, span)
+
+    def explain(
+        self,
+        pattern,
+        document_ids: Optional[Iterable[int]] = None,
+        limit: Optional[int] = None,
+        analyze: bool = True
+    ) -> Dict[str, Any]:
+        """Describe how a pattern is executed.
+
+        Args:
+            pattern: QueryPattern
+            document_ids: Restrict to these documents (None = all)
+            limit: Limit passed to execution
+            analyze: Execute the query and report actual rows and timings
+
+        Returns:
+            Plan dict: 'strategy' is 'join' (steps with estimated/actual
+            rows) or 'automaton' (seed condition, sentences and matches)
+        """
+        if self._uses_join(pattern):
+            plan = self.plan(pattern, document_ids)
+            if analyze:
+                self.planner.execute(plan, document_ids, limit)
+            return plan.explain()
+
+        stats: Dict[str, Any] = {'strategy': 'automaton', 'within': pattern.within or self.within}
+        if analyze:
+            self.run_automaton(pattern, document_ids, limit, stats=stats)
+        else:
+            self._seed_regions(pattern, stats=stats)
+        return stats
+
+    def run_automaton(
+        self,
+        pattern,
+        document_ids: Optional[Iterable[int]] = None,
+        limit: Optional[int] = None,
+        stats: Optional[Dict[str, Any]] = None,
+        span: Optional[Tuple[int, int]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Run the compiled pattern automaton over candidate sentences.
+
+        Args:
+            stats: Optional dict filled with execution statistics (explain)
+            span: Only regions starting in [start, end) (a shard; None = all)
+
+        Returns:
+            Tuple of (starts, ends) int64 arrays
+        """
+        started = time.perf_counter()
+        automaton = PatternAutomaton(pattern)
+
+        # Per constraint: (attribute, boolean mask over the lexicon)
+        lexicon_masks = []
+        for constraint in automaton.constraints:
+            masks = []
+            for attr, lex_ids, negated in self.constraint_lookups(constraint):
+                mask = np.zeros(len(attr.lexicon), dtype=bool)
+                mask[lex_ids] = True
+                masks.append((attr, ~mask if negated else mask))
+            lexicon_masks.append(masks)
+
+        bounds = self.index.structure(pattern.within or self.within)
+        region_starts = np.asarray(bounds.starts)
+        region_ends = np.asarray(bounds.ends)
+        regions = self._seed_regions(pattern, stats, span)
+        if document_ids is not None:
+            doc_starts, doc_ends = self.index.document_ranges(document_ids)
+            regions = regions[in_regions(region_starts[regions], doc_starts, doc_ends)]
+        elif self.index.deleted_count:
+            regions = regions[self.index.live(region_starts[regions])]
+        if stats is not None:
+            stats['regions'] = len(regions)
+
+        starts: List[int] = []
+        ends: List[int] = []
+        for batch_start in range(0, len(regions), SENTENCE_BATCH_SIZE):
+            batch = regions[batch_start:batch_start + SENTENCE_BATCH_SIZE]
+            lengths = (region_ends[batch] - region_starts[batch]).astype(np.int64)
+            local_ends = np.cumsum(lengths)
+            positions = (
+                np.repeat(region_starts[batch] - (local_ends - lengths), lengths)
+                + np.arange(int(local_ends[-1]) if len(batch) else 0)
+            )
+
+            token_masks = np.zeros(len(positions), dtype=np.int64)
+            for constraint_id, masks in enumerate(lexicon_masks):
+                satisfied = np.ones(len(positions), dtype=bool)
+                for attr, mask in masks:
+                    satisfied &= mask[attr.stream[positions]]
+                token_masks |= satisfied.astype(np.int64) << constraint_id
+
+            candidates = np.flatnonzero(token_masks & automaton.first_mask)
+            sentence_ends = np.repeat(local_ends, lengths)[candidates].tolist()
+            mask_list = token_masks.tolist()
+            for local_start, local_end in zip(candidates.tolist(), sentence_ends):
+                match_end = automaton.longest_match(mask_list, local_start, local_end)
+                if match_end > 0:
+                    start = int(positions[local_start])
+                    starts.append(start)
+                    ends.append(start + match_end - local_start)
+
+            if limit is not None and len(starts) >= limit:
+                break
+
+        starts_array = np.asarray(starts, dtype=np.int64)[:limit]
+        ends_array = np.asarray(ends, dtype=np.int64)[:limit]
+        if stats is not None:
+            stats['matches'] = len(starts_array)
+            stats['dfa_states'] = automaton.dfa_state_count
+            stats['ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return starts_array, ends_array
+
+    def _seed_regions(
+        self,
+        pattern,
+        stats: Optional[Dict[str, Any]] = None,
+        span: Optional[Tuple[int, int]] = None
+    ) -> np.ndarray:
+        """Regions containing the rarest mandatory condition (all regions if none)."""
+        bounds = self.index.structure(pattern.within or self.within)
+
+        seeds = [
+            (attr_name, value, lookup)
+            for constraint in required_constraints(pattern.ast)
+            for (attr_name, value), lookup in zip(constraint.patterns(), self.constraint_lookups(constraint))
+            if not lookup[2]
+        ]
+        if not seeds:
+            if stats is not None:
+                stats['seed'] = None
+            if span is None:
+                return np.arange(len(bounds))
+            return np.arange(*np.searchsorted(bounds.starts, span))
+
+        attr_name, value, (attr, lex_ids, _) = min(seeds, key=lambda seed: self.estimate(seed[2]))
+        positions = attr.positions_for_ids(lex_ids, span)
+        if stats is not None:
+            stats['seed'] = {
+                'predicate': f'{attr_name}="{value}"',
+                'estimated_rows': self.estimate((attr, lex_ids, False)),
+                'actual_rows': len(positions),
+            }
+        regions = bounds.find_all(positions)
+        return np.unique(regions[regions >= 0])
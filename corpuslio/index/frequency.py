@@ -0,0 +1,356 @@
+"""Frequency distributions over integer-encoded token streams.
+
+Every distribution is one ``np.bincount`` over lexicon IDs instead of a
+Python ``Counter`` over strings:
+
+- on the positional index, the ID streams of the (live, subcorpus)
+  document ranges of every segment are mapped to a merged lexicon and
+  counted; segments are never decoded to strings
+- in-memory token lists (analysis data, Token rows) are encoded once
+  with ``np.unique`` and counted the same way
+
+The dominant POS of a form or lemma comes from a joint count of
+(value ID, POS ID) pairs in the same pass, so frequency lists need no
+extra query per word.
+
+Example:
+    >>> table = FrequencyCounter(index).count(('lemma', 'upos'), document_ids=subcorpus)
+    >>> table.most_common('lemma', 10)
+    [('ve', 3121), ('bir', 2480), ...]
+    >>> table.dominant_pos('lemma', 'bir')
+    'DET'
+"""
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .bitmap import Bitmap
+
+# Joint (value, POS) counts use a dense bincount up to this many cells,
+# np.unique on packed pairs above it
+MAX_JOINT_CELLS = 1 << 24
+
+# Attributes whose dominant POS is computed
+POS_LINKED = ('form', 'lemma', 'word')
+
+
+def encode(values: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Encode strings as (sorted distinct values, int64 IDs)."""
+    if len(values) == 0:
+        return np.empty(0, dtype=str), np.empty(0, dtype=np.int64)
+    lexicon, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    return lexicon, codes.astype(np.int64)
+
+
+def joint_count(
+    codes: np.ndarray,
+    pos_codes: np.ndarray,
+    size: int,
+    pos_size: int,
+    joint: Optional[Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]] = None
+) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """Count (value ID, POS ID) pairs, added to the joint count of earlier columns.
+
+    The count is a flat dense array of size * pos_size cells up to
+    MAX_JOINT_CELLS, otherwise (sorted packed pairs, counts) merged with
+    np.unique, so counting segment by segment only keeps the distinct
+    pairs and never the columns themselves.
+    """
+    pairs = np.asarray(codes, dtype=np.int64) * pos_size + pos_codes
+    if size * pos_size <= MAX_JOINT_CELLS:
+        counts = np.bincount(pairs, minlength=size * pos_size)
+        if joint is None:
+            return counts
+        joint += counts
+        return joint
+    part = np.unique(pairs, return_counts=True)
+    if joint is None:
+        return part
+    unique, inverse = np.unique(np.concatenate([joint[0], part[0]]), return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=np.concatenate([joint[1], part[1]]), minlength=len(unique))
+    return unique, counts.astype(np.int64)
+
+
+def dominant_of(
+    joint: Optional[Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]],
+    size: int,
+    pos_size: int
+) -> np.ndarray:
+    """Most frequent POS ID per value ID of a joint_count (-1 if the value does not occur).
+
+    Ties go to the lower (alphabetically first) POS ID.
+    """
+    result = np.full(size, -1, dtype=np.int64)
+    if joint is None or pos_size == 0:
+        return result
+    if isinstance(joint, np.ndarray):
+        joint = joint.reshape(size, pos_size)
+        present = joint.any(axis=1)
+        result[present] = joint[present].argmax(axis=1)
+        return result
+    pairs, counts = joint
+    values, pos = pairs // pos_size, pairs % pos_size
+    # Per value: highest count first, then lowest POS ID; keep the first row
+    order = np.lexsort((pos, -counts, values))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = values[order][1:] != values[order][:-1]
+    result[values[order][first]] = pos[order][first]
+    return result
+
+
+def dominant(codes: np.ndarray, pos_codes: np.ndarray, size: int, pos_size: int) -> np.ndarray:
+    """Most frequent POS ID per value ID of a column pair (see dominant_of)."""
+    if len(codes) == 0 or pos_size == 0:
+        return np.full(size, -1, dtype=np.int64)
+    return dominant_of(joint_count(codes, pos_codes, size, pos_size), size, pos_size)
+
+
+class FrequencyTable:
+    """Value counts of several attributes, with the dominant POS of forms and lemmas."""
+
+    def __init__(
+        self,
+        tokens: int,
+        counts: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        pos: Optional[Dict[str, np.ndarray]] = None
+    ):
+        """Initialize table.
+
+        Args:
+            tokens: Number of tokens counted
+            counts: attribute -> (sorted values, counts), zero counts removed
+            pos: attribute -> dominant POS per value (aligned with the values)
+        """
+        self.tokens = tokens
+        self.counts = counts
+        self.pos = pos or {}
+
+    @classmethod
+    def from_codes(
+        cls,
+        codes: Mapping[str, np.ndarray],
+        lexicons: Mapping[str, np.ndarray],
+        pos_attribute: Optional[str] = None
+    ) -> 'FrequencyTable':
+        """Count encoded columns of equal length.
+
+        Args:
+            codes: attribute -> ID per token
+            lexicons: attribute -> value per ID (numpy string array)
+            pos_attribute: Column used for the dominant POS of forms and lemmas
+        """
+        counts = {}
+        pos = {}
+        tokens = 0
+        for attribute, column in codes.items():
+            lexicon = lexicons[attribute]
+            tokens = len(column)
+            frequencies = np.bincount(column, minlength=len(lexicon))
+            present = np.flatnonzero(frequencies)
+            counts[attribute] = (lexicon[present], frequencies[present])
+            if pos_attribute in codes and attribute != pos_attribute and attribute in POS_LINKED:
+                pos_lexicon = lexicons[pos_attribute]
+                best = dominant(column, codes[pos_attribute], len(lexicon), len(pos_lexicon))[present]
+                pos[attribute] = np.where(best >= 0, pos_lexicon[np.maximum(best, 0)] if len(pos_lexicon) else '', '')
+        return cls(tokens, counts, pos)
+
+    @classmethod
+    def from_columns(
+        cls,
+        columns: Mapping[str, Sequence[str]],
+        pos_attribute: Optional[str] = None,
+        exclude_pos: Iterable[str] = ()
+    ) -> 'FrequencyTable':
+        """Count string columns of equal length (e.g. words, lemmas, POS tags of a document).
+
+        Args:
+            columns: attribute -> value per token
+            pos_attribute: Column used for the dominant POS of forms and lemmas
+            exclude_pos: Skip tokens with these POS tags (needs pos_attribute)
+        """
+        arrays = {attribute: np.asarray(values, dtype=str) for attribute, values in columns.items()}
+        exclude_pos = list(exclude_pos)
+        if exclude_pos and pos_attribute in arrays:
+            keep = ~np.isin(arrays[pos_attribute], exclude_pos)
+            arrays = {attribute: values[keep] for attribute, values in arrays.items()}
+        lexicons = {}
+        codes = {}
+        for attribute, values in arrays.items():
+            lexicons[attribute], codes[attribute] = encode(values)
+        return cls.from_codes(codes, lexicons, pos_attribute)
+
+    def __contains__(self, attribute: str) -> bool:
+        return attribute in self.counts
+
+    def values(self, attribute: str) -> np.ndarray:
+        """Sorted distinct values of an attribute."""
+        return self.counts[attribute][0]
+
+    def type_count(self, attribute: str) -> int:
+        """Number of distinct values."""
+        return len(self.counts[attribute][0])
+
+    def frequency(self, attribute: str, value: str) -> int:
+        """Count of a single value (0 if absent)."""
+        values, counts = self.counts[attribute]
+        i = int(np.searchsorted(values, value))
+        return int(counts[i]) if i < len(values) and values[i] == value else 0
+
+    def frequencies(self, attribute: str, values: Sequence[str]) -> np.ndarray:
+        """Counts of many values (0 where absent)."""
+        lexicon, counts = self.counts[attribute]
+        values = np.asarray(values, dtype=str)
+        if len(lexicon) == 0:
+            return np.zeros(len(values), dtype=np.int64)
+        slots = np.minimum(np.searchsorted(lexicon, values), len(lexicon) - 1)
+        return np.where(lexicon[slots] == values, counts[slots], 0)
+
+    def dominant_pos(self, attribute: str, value: str) -> str:
+        """Most frequent POS of a form or lemma ('' if unknown)."""
+        values, _ = self.counts[attribute]
+        i = int(np.searchsorted(values, value))
+        if attribute not in self.pos or i >= len(values) or values[i] != value:
+            return ''
+        return str(self.pos[attribute][i])
+
+    def top(self, attribute: str, n: Optional[int] = None, min_length: int = 1) -> List[Tuple[str, int, str]]:
+        """Most frequent values as (value, count, dominant POS).
+
+        Equal counts are ordered by value.
+        """
+        values, counts = self.counts[attribute]
+        selected = np.arange(len(values))
+        if min_length > 1 and len(values):
+            selected = np.flatnonzero(np.char.str_len(values) >= min_length)
+        order = selected[np.argsort(-counts[selected], kind='stable')][:n]
+        pos = self.pos.get(attribute)
+        return [
+            (str(values[i]), int(counts[i]), str(pos[i]) if pos is not None else '')
+            for i in order.tolist()
+        ]
+
+    def lowercase(self) -> 'FrequencyTable':
+        """Table with case variants merged (dominant POS is not kept)."""
+        counts = {}
+        for attribute, (values, frequencies) in self.counts.items():
+            if len(values) == 0:
+                counts[attribute] = (values, frequencies)
+                continue
+            folded, inverse = np.unique(np.char.lower(values), return_inverse=True)
+            counts[attribute] = (folded, np.bincount(inverse, weights=frequencies, minlength=len(folded)).astype(np.int64))
+        return FrequencyTable(self.tokens, counts)
+
+    def most_common(self, attribute: str, n: Optional[int] = None, min_length: int = 1) -> List[Tuple[str, int]]:
+        """Most frequent values as (value, count), like Counter.most_common."""
+        return [(value, count) for value, count, _ in self.top(attribute, n, min_length)]
+
+    def distribution(self, attribute: str) -> Dict[str, int]:
+        """All values with their counts, most frequent first."""
+        return dict(self.most_common(attribute))
+
+
+class FrequencyCounter:
+    """Frequency distributions of a CorpusIndex or SegmentedIndex.
+
+    Lexicons of all segments are merged once per attribute (segments
+    are immutable), so each segment's ID stream is translated with one
+    array lookup and all segments add into the same bincount.
+    """
+
+    def __init__(self, index, pos_attribute: str = 'upos'):
+        """Initialize counter.
+
+        Args:
+            index: Opened CorpusIndex or SegmentedIndex
+            pos_attribute: Attribute used for dominant POS and POS exclusion
+        """
+        self.index = index
+        self.segments = list(getattr(index, 'segments', [index]))
+        self.pos_attribute = pos_attribute
+        # attribute -> (merged lexicon, per-segment ID translation)
+        self._lexicons: Dict[str, Tuple[np.ndarray, List[np.ndarray]]] = {}
+
+    def lexicon(self, attribute: str) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """Merged lexicon of an attribute and the segment ID -> merged ID maps."""
+        if attribute not in self._lexicons:
+            lexicons = [np.asarray(s.attribute(attribute).lexicon.values, dtype=str) for s in self.segments]
+            if len(lexicons) == 1:
+                merged = lexicons[0]
+                maps = [np.arange(len(merged), dtype=np.int64)]
+            else:
+                merged, inverse = np.unique(np.concatenate(lexicons), return_inverse=True)
+                bounds = np.cumsum([0] + [len(lexicon) for lexicon in lexicons])
+                maps = [inverse[bounds[n]:bounds[n + 1]].astype(np.int64) for n in range(len(lexicons))]
+            self._lexicons[attribute] = (merged, maps)
+        return self._lexicons[attribute]
+
+    def _mask(self, segment, document_ids, exclude_ids: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """Positions of a segment to count (None = all)."""
+        mask = None
+        if document_ids is not None or segment.deleted_count:
+            starts, ends = segment.document_ranges(document_ids)
+            delta = np.bincount(starts, minlength=segment.size + 1) - np.bincount(ends, minlength=segment.size + 1)
+            mask = np.cumsum(delta[:-1]) > 0
+        if exclude_ids is not None and len(exclude_ids):
+            keep = ~np.isin(segment.attribute(self.pos_attribute).stream, exclude_ids)
+            mask = keep if mask is None else mask & keep
+        return mask
+
+    def count(
+        self,
+        attributes: Sequence[str] = ('form', 'lemma', 'upos'),
+        document_ids: Optional[Iterable[int]] = None,
+        exclude_pos: Iterable[str] = ()
+    ) -> FrequencyTable:
+        """Count attribute values in the corpus or a subcorpus.
+
+        Args:
+            attributes: Positional attributes to count
+            document_ids: Subcorpus as document IDs or a Bitmap (None = all)
+            exclude_pos: Skip tokens with these POS tags (e.g. ('PUNCT',))
+
+        Returns:
+            FrequencyTable; forms and lemmas carry their dominant POS
+            when the POS attribute is among the counted attributes
+        """
+        if document_ids is not None and not isinstance(document_ids, Bitmap):
+            document_ids = Bitmap.from_ids(document_ids)
+        exclude_pos = list(exclude_pos)
+        lexicons = {attribute: self.lexicon(attribute)[0] for attribute in attributes}
+        totals = {attribute: np.zeros(len(lexicons[attribute]), dtype=np.int64) for attribute in attributes}
+        with_pos = self.pos_attribute in attributes
+        pos_size = len(lexicons[self.pos_attribute]) if with_pos else 0
+        # attribute -> joint (value, POS) count, added up segment by segment
+        joint = {a: None for a in attributes if a in POS_LINKED and with_pos}
+        tokens = 0
+
+        for n, segment in enumerate(self.segments):
+            exclude_ids = None
+            if exclude_pos:
+                pos_lexicon = segment.attribute(self.pos_attribute).lexicon
+                exclude_ids = np.array([i for i in map(pos_lexicon.id_of, exclude_pos) if i >= 0], dtype=np.int64)
+            mask = self._mask(segment, document_ids, exclude_ids)
+            columns = {}
+            for attribute in set(attributes) | ({self.pos_attribute} if joint else set()):
+                stream = np.asarray(segment.attribute(attribute).stream)
+                columns[attribute] = self.lexicon(attribute)[1][n][stream if mask is None else stream[mask]]
+            tokens += len(next(iter(columns.values()))) if columns else 0
+            for attribute in attributes:
+                totals[attribute] += np.bincount(columns[attribute], minlength=len(totals[attribute]))
+                if attribute in joint:
+                    joint[attribute] = joint_count(
+                        columns[attribute], columns[self.pos_attribute],
+                        len(totals[attribute]), pos_size, joint[attribute]
+                    )
+            del columns, mask
+
+        counts = {}
+        pos = {}
+        for attribute in attributes:
+            present = np.flatnonzero(totals[attribute])
+            counts[attribute] = (lexicons[attribute][present], totals[attribute][present])
+            if attribute in joint:
+                best = dominant_of(joint[attribute], len(totals[attribute]), pos_size)[present]
+                pos_lexicon = lexicons[self.pos_attribute]
+                pos[attribute] = np.where(best >= 0, pos_lexicon[np.maximum(best, 0)] if pos_size else '', '')
+        return FrequencyTable(tokens, counts, pos)
@@ -0,0 +1,192 @@
+"""Keyness: compare the frequency lists of a focus and a reference corpus.
+
+Both frequency lists come from the frequency engine (FrequencyTable) and
+are aligned on the union of their values, so every score is computed
+on arrays over all types at once. With a, b the frequencies of a word
+in the focus and reference corpus and c, d their sizes:
+
+==================  =================================================
+log_likelihood      2 * (a ln(a/E1) + b ln(b/E2)), E1 = c(a+b)/(c+d),
+                    E2 = d(a+b)/(c+d); negative when the word is
+                    relatively more frequent in the reference
+percent_diff        %DIFF (Gabrielatos & Marchi 2012): difference of the
+                    normalized frequencies in % of the reference one
+                    (a zero reference frequency counts as 1e-18)
+simple_maths        (per-million focus + k) / (per-million reference + k)
+                    (Kilgarriff 2009), k = smoothing
+log_ratio           log2 of the ratio of relative frequencies
+                    (Hardie 2014), zero counts replaced by 0.5
+odds_ratio          (a / (c - a)) / (b / (d - b)), zeros replaced by 0.5
+bic                 |LL| - ln(c + d), signed like LL (Wilson 2013)
+==================  =================================================
+
+Example:
+    >>> focus = counter.count(('lemma',), novels, ('PUNCT',)).lowercase()
+    >>> reference = counter.count(('lemma',), None, ('PUNCT',)).lowercase()
+    >>> compare(focus, reference, 'lemma').rows('log_likelihood', limit=50)
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .frequency import FrequencyTable
+
+# Keyness measures, in the order they are reported
+KEYNESS_MEASURES = ('log_likelihood', 'percent_diff', 'simple_maths', 'log_ratio', 'odds_ratio', 'bic')
+
+# Reference frequency standing in for zero in %DIFF
+PERCENT_DIFF_ZERO = 1e-18
+
+
+def keyness_scores(
+    focus: np.ndarray,
+    reference: np.ndarray,
+    focus_total: int,
+    reference_total: int,
+    smoothing: float = 1.0
+) -> Dict[str, np.ndarray]:
+    """All measures of KEYNESS_MEASURES for aligned frequency vectors.
+
+    Args:
+        focus: Frequency per word in the focus corpus
+        reference: Frequency per word in the reference corpus
+        focus_total: Tokens of the focus corpus
+        reference_total: Tokens of the reference corpus
+        smoothing: Simple maths constant k (per million)
+
+    Returns:
+        measure -> score array aligned with the inputs
+    """
+    a = np.asarray(focus, dtype=np.float64)
+    b = np.asarray(reference, dtype=np.float64)
+    c = float(max(focus_total, 1))
+    d = float(max(reference_total, 1))
+    expected_focus = c * (a + b) / (c + d)
+    expected_reference = d * (a + b) / (c + d)
+    focus_pm = a / c * 1e6
+    reference_pm = b / d * 1e6
+    overused = focus_pm >= reference_pm
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_likelihood = 2 * (
+            np.where(a > 0, a * np.log(np.where(a > 0, a, 1) / expected_focus), 0.0)
+            + np.where(b > 0, b * np.log(np.where(b > 0, b, 1) / expected_reference), 0.0)
+        )
+        a_corrected = np.where(a > 0, a, 0.5)
+        b_corrected = np.where(b > 0, b, 0.5)
+        scores = {
+            'log_likelihood': np.where(overused, log_likelihood, -log_likelihood),
+            'percent_diff': (focus_pm - reference_pm) * 100 / np.where(b > 0, reference_pm, PERCENT_DIFF_ZERO),
+            'simple_maths': (focus_pm + smoothing) / (reference_pm + smoothing),
+            'log_ratio': np.log2((a_corrected / c) / (b_corrected / d)),
+            'odds_ratio': (a_corrected / np.maximum(c - a, 0.5)) / (b_corrected / np.maximum(d - b, 0.5)),
+            'bic': np.where(overused, 1, -1) * (log_likelihood - np.log(c + d)),
+        }
+    return {measure: np.nan_to_num(values, nan=0.0) for measure, values in scores.items()}
+
+
+class KeynessTable:
+    """Words of a focus corpus with their keyness against a reference corpus."""
+
+    def __init__(
+        self,
+        values: np.ndarray,
+        focus: np.ndarray,
+        reference: np.ndarray,
+        focus_total: int,
+        reference_total: int,
+        smoothing: float = 1.0
+    ):
+        """Initialize table.
+
+        Args:
+            values: Words (union of both frequency lists)
+            focus: Focus frequency per word
+            reference: Reference frequency per word
+            focus_total: Tokens of the focus corpus
+            reference_total: Tokens of the reference corpus
+            smoothing: Simple maths constant k
+        """
+        self.values = values
+        self.focus = focus
+        self.reference = reference
+        self.focus_total = focus_total
+        self.reference_total = reference_total
+        self.smoothing = smoothing
+        self.scores = keyness_scores(focus, reference, focus_total, reference_total, smoothing)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def rows(
+        self,
+        measure: str = 'log_likelihood',
+        min_frequency: int = 1,
+        limit: Optional[int] = None,
+        negative: bool = False
+    ) -> List[dict]:
+        """Key words ranked by a measure.
+
+        Args:
+            measure: One of KEYNESS_MEASURES
+            min_frequency: Minimum frequency in the corpus the words are key in
+            limit: Return at most this many words
+            negative: Rank words underused in the focus corpus (key in the reference)
+
+        Returns:
+            List of dicts with the word, both frequencies and every score
+
+        Raises:
+            ValueError: If the measure is unknown
+        """
+        if measure not in KEYNESS_MEASURES:
+            raise ValueError(f"Unknown keyness measure: {measure}. Use one of {', '.join(KEYNESS_MEASURES)}")
+        focus_pm = self.focus / max(self.focus_total, 1) * 1e6
+        reference_pm = self.reference / max(self.reference_total, 1) * 1e6
+        words = self.values != ''
+        if negative:
+            selected = np.flatnonzero(words & (self.reference >= min_frequency) & (reference_pm > focus_pm))
+            order = np.lexsort((self.values[selected], -self.reference[selected], self.scores[measure][selected]))
+        else:
+            selected = np.flatnonzero(words & (self.focus >= min_frequency) & (focus_pm > reference_pm))
+            order = np.lexsort((self.values[selected], -self.focus[selected], -self.scores[measure][selected]))
+        rows = []
+        for i in selected[order][:limit].tolist():
+            row = {
+                'word': str(self.values[i]),
+                'focus_frequency': int(self.focus[i]),
+                'reference_frequency': int(self.reference[i]),
+                'focus_per_million': round(float(focus_pm[i]), 2),
+                'reference_per_million': round(float(reference_pm[i]), 2),
+            }
+            for name in KEYNESS_MEASURES:
+                row[name] = round(float(self.scores[name][i]), 4)
+            rows.append(row)
+        return rows
+
+
+def compare(
+    focus: FrequencyTable,
+    reference: FrequencyTable,
+    attribute: str,
+    smoothing: float = 1.0
+) -> KeynessTable:
+    """Keyness of every value of an attribute in focus against reference.
+
+    Args:
+        focus: Frequency table of the focus corpus
+        reference: Frequency table of the reference corpus
+        attribute: Attribute counted in both tables
+        smoothing: Simple maths constant k
+
+    Returns:
+        KeynessTable
+    """
+    focus_values, focus_counts = focus.counts[attribute]
+    reference_values, reference_counts = reference.counts[attribute]
+    values = np.union1d(focus_values, reference_values)
+    aligned_focus = np.zeros(len(values), dtype=np.int64)
+    aligned_reference = np.zeros(len(values), dtype=np.int64)
+    aligned_focus[np.searchsorted(values, focus_values)] = focus_counts
+    aligned_reference[np.searchsorted(values, reference_values)] = reference_counts
+    return KeynessTable(values, aligned_focus, aligned_reference, focus.tokens, reference.tokens, smoothing)
@@ -0,0 +1,108 @@
+"""Sorted lexicon mapping attribute values to integer IDs.
+
+Lexicon IDs are assigned in sorted string order, so a value can be located
+by binary search and comparing two IDs compares the underlying strings.
+"""
+import bisect
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class Lexicon:
+    """Distinct values of one positional attribute with their frequencies."""
+
+    def __init__(
+        self,
+        values: List[str],
+        frequencies: Optional[np.ndarray] = None,
+        document_frequencies: Optional[np.ndarray] = None
+    ):
+        """Initialize lexicon.
+
+        Args:
+            values: Distinct attribute values in sorted order (index = lexicon ID)
+            frequencies: Corpus frequency per lexicon ID
+            document_frequencies: Number of documents containing each lexicon ID
+        """
+        self.values = values
+        self.frequencies = frequencies
+        self.document_frequencies = document_frequencies
+        self._lower_index: Optional[Dict[str, List[int]]] = None
+
+    @staticmethod
+    def read_values(path: Path) -> List[str]:
+        """Read lexicon values from a newline-terminated UTF-8 file."""
+        with open(path, 'r', encoding='utf-8', newline='\n') as f:
+            return f.read().split('\n')[:-1]
+
+    @staticmethod
+    def write_values(path: Path, values: List[str]):
+        """Write lexicon values, one per line.
+
+        Line breaks inside values cannot be represented and are replaced
+        by spaces (CoNLL-U and VRT never contain them anyway).
+        """
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            for value in values:
+                f.write(value.replace('\n', ' ').replace('\r', ' '))
+                f.write('\n')
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, lex_id: int) -> str:
+        return self.values[lex_id]
+
+    def id_of(self, value: str) -> int:
+        """Get lexicon ID of an exact value.
+
+        Returns:
+            Lexicon ID or -1 if the value does not occur in the corpus
+        """
+        i = bisect.bisect_left(self.values, value)
+        if i < len(self.values) and self.values[i] == value:
+            return i
+        return -1
+
+    def ids_of(self, value: str, case_sensitive: bool = True) -> np.ndarray:
+        """Get all lexicon IDs equal to value.
+
+        Args:
+            value: Attribute value
+            case_sensitive: If False, all case variants are returned
+
+        Returns:
+            Sorted int32 array of lexicon IDs
+        """
+        if case_sensitive:
+            lex_id = self.id_of(value)
+            return np.array([lex_id] if lex_id >= 0 else [], dtype=np.int32)
+
+        if self._lower_index is None:
+            index: Dict[str, List[int]] = {}
+            for lex_id, item in enumerate(self.values):
+                index.setdefault(item.lower(), []).append(lex_id)
+            self._lower_index = index
+
+        return np.array(self._lower_index.get(value.lower(), []), dtype=np.int32)
+
+    def match(self, pattern: str, case_sensitive: bool = False) -> np.ndarray:
+        """Get lexicon IDs whose value matches a regular expression.
+
+        Uses ``re.search`` semantics, like the ORM ``__regex`` lookups.
+
+        Args:
+            pattern: Regular expression
+            case_sensitive: Case-sensitive matching
+
+        Returns:
+            Sorted int32 array of matching lexicon IDs
+        """
+        regex = re.compile(pattern, 0 if case_sensitive else re.IGNORECASE)
+        return np.array(
+            [lex_id for lex_id, value in enumerate(self.values) if regex.search(value)],
+            dtype=np.int32
+        )
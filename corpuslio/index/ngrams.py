@@ -0,0 +1,601 @@
+"""Exact n-gram counts over integer-encoded token streams.
+
+An n-gram is n consecutive lexicon IDs; the IDs are bit-packed into one
+int64 key when their widths add up to at most 63 bits, otherwise the
+n-gram is kept as a row of IDs (counted with ``np.unique(axis=0)``).
+Windows that cross a sentence boundary, contain a masked token (PUNCT)
+or lie outside the subcorpus are dropped with vectorized masks, and
+keys are counted chunk by chunk with ``np.unique`` and reduced with a
+sort-based merge, so memory follows the number of distinct n-grams and
+not the corpus size.
+
+Each slot of an n-gram may use another attribute ('lemma', 'upos', ...),
+e.g. ``('lemma', 'upos')`` counts lemma + following POS pairs.
+
+Segments can carry persisted 2- to 5-gram tables with per document
+postings (``build_ngram_tables``); ``NgramCounter.stored`` merges them
+across segments and subcorpus/tombstone masks without touching the
+token streams. Tables hold every n-gram of their segment, so merged
+counts are exact; min_frequency applies to the merged table only.
+
+Example:
+    >>> table = NgramCounter(index).count(3, 'lemma', document_ids=subcorpus)
+    >>> table.top(10, min_frequency=2)
+    [(('bir', 'şey', 'değil'), 412), ...]
+"""
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .bitmap import Bitmap
+from .frequency import POS_LINKED, FrequencyCounter
+from .lexicon import Lexicon
+from .structure import in_regions
+
+logger = logging.getLogger(__name__)
+
+# Window start positions handled per chunk
+CHUNK_SIZE = 1 << 22
+
+KEY_BITS = 63
+
+# Persisted tables: directory inside a segment and what it holds
+TABLES_DIR = 'ngrams'
+TABLES_INFO = 'tables.json'
+TABLE_ARRAYS = ('rows', 'counts', 'offsets', 'documents', 'document_counts')
+TABLE_ATTRIBUTES = ('form', 'lemma')
+TABLE_SIZES = (2, 3, 4, 5)
+TABLE_EXCLUDE_POS = ('PUNCT',)
+
+# N-grams occurring less often in a segment are not stored. Pruned
+# tables (above 1) lose the share of every segment an n-gram is rare in,
+# so they are only used on single-segment indexes.
+TABLE_MIN_FREQUENCY = 1
+
+# Smaller segments are counted directly
+TABLE_MIN_SEGMENT_TOKENS = 100_000
+
+Counts = Tuple[np.ndarray, np.ndarray]
+
+
+def slot_bits(sizes: Sequence[int]) -> Optional[List[int]]:
+    """Bit width per slot for packed keys (None if they do not fit in an int64)."""
+    bits = [max(1, int(size - 1).bit_length()) for size in sizes]
+    return bits if sum(bits) <= KEY_BITS else None
+
+
+def pack(columns: Sequence[np.ndarray], bits: Optional[Sequence[int]]) -> np.ndarray:
+    """Pack ID columns into int64 keys, or stack them into rows when bits is None."""
+    if bits is None:
+        return np.stack([np.asarray(c, dtype=np.int64) for c in columns], axis=1)
+    key = np.zeros(len(columns[0]), dtype=np.int64)
+    shift = 0
+    for column, width in zip(columns, bits):
+        key |= np.asarray(column, dtype=np.int64) << shift
+        shift += width
+    return key
+
+
+def unpack(keys: np.ndarray, bits: Optional[Sequence[int]]) -> np.ndarray:
+    """ID rows (k x n) of packed keys."""
+    if bits is None:
+        return keys
+    rows = np.empty((len(keys), len(bits)), dtype=np.int64)
+    shift = 0
+    for j, width in enumerate(bits):
+        rows[:, j] = (keys >> shift) & ((1 << width) - 1)
+        shift += width
+    return rows
+
+
+def reduce_counts(parts: Sequence[Counts]) -> Counts:
+    """Merge partial (keys, counts) results by summing the counts of equal keys."""
+    parts = [part for part in parts if len(part[0])]
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    if len(parts) == 1:
+        return parts[0]
+    keys = np.concatenate([keys for keys, _ in parts])
+    counts = np.concatenate([counts for _, counts in parts])
+    if keys.ndim == 1:
+        unique, inverse = np.unique(keys, return_inverse=True)
+    else:
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    return unique, np.bincount(inverse.ravel(), weights=counts, minlength=len(unique)).astype(np.int64)
+
+
+def count_windows(
+    columns: Sequence[np.ndarray],
+    starts: np.ndarray,
+    bits: Optional[Sequence[int]],
+    chunk_size: int = CHUNK_SIZE
+) -> Counts:
+    """Count the n-grams starting at the given positions.
+
+    Args:
+        columns: ID stream per slot (slot j is read at start + j)
+        starts: Window start positions
+        bits: Slot widths from slot_bits (None = unpacked rows)
+        chunk_size: Windows counted per np.unique call
+
+    Returns:
+        (keys, counts), keys sorted
+    """
+    parts = []
+    for first in range(0, len(starts), chunk_size):
+        chunk = starts[first:first + chunk_size]
+        keys = pack([column[chunk + j] for j, column in enumerate(columns)], bits)
+        if keys.ndim == 1:
+            parts.append(np.unique(keys, return_counts=True))
+        else:
+            parts.append(np.unique(keys, axis=0, return_counts=True))
+    return reduce_counts(parts)
+
+
+def window_starts(
+    n: int,
+    first: int,
+    last: int,
+    boundaries: Tuple[np.ndarray, np.ndarray],
+    blocked: Optional[np.ndarray] = None,
+    regions: Optional[Tuple[np.ndarray, np.ndarray]] = None
+) -> np.ndarray:
+    """Start positions in [first, last) of windows of n tokens.
+
+    Args:
+        n: Window length
+        first, last: Position range to scan
+        boundaries: (starts, ends) of the regions a window must not cross (sentences)
+        blocked: Boolean mask over all positions of tokens no window may contain
+        regions: (starts, ends) of the documents to count (None = all)
+    """
+    positions = np.arange(first, last, dtype=np.int64)
+    region_starts, region_ends = boundaries
+    sentence = np.searchsorted(region_starts, positions, side='right') - 1
+    valid = sentence >= 0
+    valid[valid] = positions[valid] + n <= np.asarray(region_ends)[sentence[valid]]
+    if blocked is not None:
+        seen = np.concatenate([[0], np.cumsum(blocked[first:min(last + n, len(blocked))], dtype=np.int64)])
+        ends = np.minimum(positions - first + n, len(seen) - 1)
+        valid &= seen[ends] - seen[positions - first] == 0
+    if regions is not None:
+        valid &= in_regions(positions, *regions)
+    return positions[valid]
+
+
+class NgramTable:
+    """Counted n-grams with the lexicons to decode them."""
+
+    def __init__(self, attributes: Sequence[str], lexicons: Sequence[np.ndarray], keys: np.ndarray,
+                 counts: np.ndarray, bits: Optional[Sequence[int]]):
+        """Initialize table.
+
+        Args:
+            attributes: Attribute per slot
+            lexicons: Value per ID for each slot
+            keys: Packed keys (or ID rows) of the distinct n-grams
+            counts: Count per key
+            bits: Slot widths of the packed keys (None = rows)
+        """
+        self.attributes = tuple(attributes)
+        self.lexicons = list(lexicons)
+        self.keys = keys
+        self.counts = counts
+        self.bits = bits
+        # Counts descending (see by_frequency)
+        self.ordered = False
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    @property
+    def total(self) -> int:
+        """Number of n-gram tokens counted."""
+        return int(self.counts.sum())
+
+    def rows(self, selected: Optional[np.ndarray] = None) -> np.ndarray:
+        """ID rows (k x n) of all or of the selected n-grams."""
+        keys = self.keys if selected is None else self.keys[selected]
+        return unpack(keys, self.bits)
+
+    def top(self, limit: Optional[int] = None, min_frequency: int = 1) -> List[Tuple[Tuple[str, ...], int]]:
+        """Most frequent n-grams as (values, count); equal counts in key order."""
+        if self.ordered:
+            end = int(np.searchsorted(-self.counts, -min_frequency, side='right'))
+            selected = np.arange(end if limit is None else min(end, limit))
+        else:
+            selected = np.flatnonzero(self.counts >= min_frequency)
+            selected = selected[np.argsort(-self.counts[selected], kind='stable')][:limit]
+        if len(selected) == 0:
+            return []
+        rows = self.rows(selected)
+        columns = [lexicon[rows[:, j]].tolist() for j, lexicon in enumerate(self.lexicons)]
+        return list(zip(zip(*columns), self.counts[selected].tolist()))
+
+    def by_frequency(self) -> 'NgramTable':
+        """Copy sorted by count (descending), so top() only slices."""
+        order = np.argsort(-self.counts, kind='stable')
+        table = NgramTable(self.attributes, self.lexicons, self.keys[order], self.counts[order], self.bits)
+        table.ordered = True
+        return table
+
+
+def searchable(keys: np.ndarray) -> np.ndarray:
+    """1-D sortable view of keys: packed keys as they are, ID rows as
+    big-endian byte strings (byte order = lexicographic ID order)."""
+    if keys.ndim == 1:
+        return keys
+    rows = np.ascontiguousarray(keys.astype('>u4'))
+    return rows.view(np.dtype((np.void, 4 * keys.shape[1]))).ravel()
+
+
+def sort_counts(keys: np.ndarray, counts: np.ndarray) -> Counts:
+    """Sort distinct keys (packed or rows) with their counts."""
+    order = np.argsort(keys, kind='stable') if keys.ndim == 1 else np.lexsort(keys.T[::-1])
+    return keys[order], counts[order]
+
+
+class NgramTables:
+    """Persisted n-gram tables of one segment (written by build_ngram_tables).
+
+    Per attribute and n-gram length the directory holds the distinct
+    n-grams as rows of IDs into the segment's case-folded lexicon, their
+    counts, and CSR postings (offsets, document numbers, counts per
+    document) for subcorpus and tombstone masks::
+
+        ngrams/
+            tables.json                 attributes, sizes, min_frequency
+            lemma.lexicon               case-folded lemmas of the segment
+            lemma.3.rows.npy            k x 3 IDs
+            lemma.3.counts.npy          count per row
+            lemma.3.offsets.npy         postings of row i: offsets[i]:offsets[i + 1]
+            lemma.3.documents.npy       document numbers (index into 'text')
+            lemma.3.document_counts.npy
+    """
+
+    def __init__(self, path):
+        """Open the tables of a segment directory.
+
+        Args:
+            path: Segment directory
+        """
+        self.path = Path(path) / TABLES_DIR
+        with open(self.path / TABLES_INFO, 'r', encoding='utf-8') as f:
+            self.info = json.load(f)
+        self.min_frequency = self.info['min_frequency']
+        self._lexicons: Dict[str, np.ndarray] = {}
+        self._arrays: Dict[Tuple[str, int], Dict[str, np.ndarray]] = {}
+
+    @staticmethod
+    def exists(path) -> bool:
+        """Check whether a segment directory has n-gram tables."""
+        return (Path(path) / TABLES_DIR / TABLES_INFO).exists()
+
+    def covers(self, n: int, attribute: str) -> bool:
+        """Check whether n-grams of an attribute are stored."""
+        return n in self.info['sizes'] and attribute in self.info['attributes']
+
+    def lexicon(self, attribute: str) -> np.ndarray:
+        """Case-folded values of the segment's lexicon of an attribute."""
+        if attribute not in self._lexicons:
+            values = Lexicon.read_values(self.path / f'{attribute}.lexicon')
+            self._lexicons[attribute] = np.asarray(values, dtype=str)
+        return self._lexicons[attribute]
+
+    def arrays(self, attribute: str, n: int) -> Dict[str, np.ndarray]:
+        """Memory-mapped arrays of one table."""
+        key = (attribute, n)
+        if key not in self._arrays:
+            self._arrays[key] = {
+                name: np.load(self.path / f'{attribute}.{n}.{name}.npy', mmap_mode='r')
+                for name in TABLE_ARRAYS
+            }
+        return self._arrays[key]
+
+    def counts(self, attribute: str, n: int, documents: Optional[np.ndarray] = None) -> np.ndarray:
+        """Count per row, over all documents or a mask of document numbers.
+
+        Args:
+            attribute: Attribute of the table
+            n: N-gram length
+            documents: Boolean mask over the segment's documents (None = as built)
+        """
+        arrays = self.arrays(attribute, n)
+        if documents is None:
+            return np.asarray(arrays['counts'])
+        selected = np.where(documents[arrays['documents']], arrays['document_counts'], 0)
+        totals = np.concatenate([[0], np.cumsum(selected, dtype=np.int64)])
+        offsets = np.asarray(arrays['offsets'])
+        return totals[offsets[1:]] - totals[offsets[:-1]]
+
+
+class NgramCounter:
+    """Exact n-gram counts on a CorpusIndex or SegmentedIndex."""
+
+    def __init__(self, index, frequencies: Optional[FrequencyCounter] = None, chunk_size: int = CHUNK_SIZE):
+        """Initialize counter.
+
+        Args:
+            index: Opened CorpusIndex or SegmentedIndex
+            frequencies: FrequencyCounter of the same index, to share its merged lexicons
+            chunk_size: Window start positions per counting chunk
+        """
+        self.frequencies = frequencies or FrequencyCounter(index)
+        self.index = index
+        self.segments = self.frequencies.segments
+        self.pos_attribute = self.frequencies.pos_attribute
+        self.chunk_size = chunk_size
+        self._folded: Dict[str, Tuple[np.ndarray, List[np.ndarray]]] = {}
+        self._tables: Dict[int, Optional[NgramTables]] = {}
+        self._stored: Dict[Tuple[int, str], NgramTable] = {}
+
+    def lexicon(self, attribute: str, lowercase: bool = False) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """Merged (optionally case-folded) lexicon and segment ID maps."""
+        values, maps = self.frequencies.lexicon(attribute)
+        if not lowercase or attribute not in POS_LINKED or len(values) == 0:
+            return values, maps
+        if attribute not in self._folded:
+            folded, inverse = np.unique(np.char.lower(values), return_inverse=True)
+            self._folded[attribute] = (folded, [inverse.ravel()[m] for m in maps])
+        return self._folded[attribute]
+
+    def _chunks(
+        self,
+        number: int,
+        n: int,
+        attributes: Sequence[str],
+        maps: Sequence[np.ndarray],
+        document_ids: Optional[Bitmap],
+        exclude_pos: Sequence[str],
+        within: str
+    ) -> Iterator[Tuple[int, np.ndarray, List[np.ndarray]]]:
+        """Valid windows of a segment, chunk by chunk.
+
+        Yields:
+            (first position, window starts relative to it, ID column per slot)
+        """
+        segment = self.segments[number]
+        structure = segment.structure(within)
+        boundaries = (np.asarray(structure.starts), np.asarray(structure.ends))
+        regions = None
+        if document_ids is not None or segment.deleted_count:
+            regions = segment.document_ranges(document_ids)
+            if len(regions[0]) == 0:
+                return
+        blocked = None
+        if exclude_pos:
+            pos = segment.attribute(self.pos_attribute)
+            ids = [i for i in map(pos.lexicon.id_of, exclude_pos) if i >= 0]
+            if ids:
+                blocked = np.isin(pos.stream, ids)
+        streams = [segment.attribute(attribute).stream for attribute in attributes]
+        for first in range(0, segment.size, self.chunk_size):
+            last = min(first + self.chunk_size, segment.size)
+            starts = window_starts(n, first, last, boundaries, blocked, regions)
+            if len(starts) == 0:
+                continue
+            columns = [
+                maps[j][np.asarray(stream[first:min(last + n, segment.size)])]
+                for j, stream in enumerate(streams)
+            ]
+            yield first, starts - first, columns
+
+    def count(
+        self,
+        n: int = 2,
+        attributes: Union[str, Sequence[str]] = 'form',
+        document_ids: Optional[Iterable[int]] = None,
+        exclude_pos: Iterable[str] = ('PUNCT',),
+        lowercase: bool = False,
+        within: str = 's'
+    ) -> NgramTable:
+        """Count all n-grams of the corpus or a subcorpus.
+
+        Args:
+            n: N-gram length
+            attributes: Attribute for every slot, or one per slot (mixed n-grams)
+            document_ids: Subcorpus as document IDs or a Bitmap (None = all)
+            exclude_pos: N-grams containing these POS tags are skipped
+            lowercase: Merge case variants of forms and lemmas
+            within: Structure n-grams must not cross ('s' = sentence, 'text' = document)
+
+        Returns:
+            NgramTable
+        """
+        attributes = (attributes,) * n if isinstance(attributes, str) else tuple(attributes)
+        if len(attributes) != n:
+            raise ValueError(f"Expected {n} attributes, got {len(attributes)}")
+        if document_ids is not None and not isinstance(document_ids, Bitmap):
+            document_ids = Bitmap.from_ids(document_ids)
+        exclude_pos = list(exclude_pos)
+        lexicons = [self.lexicon(attribute, lowercase) for attribute in attributes]
+        bits = slot_bits([len(values) for values, _ in lexicons])
+
+        parts = []
+        for number in range(len(self.segments)):
+            maps = [segment_maps[number] for _, segment_maps in lexicons]
+            for _, starts, columns in self._chunks(number, n, attributes, maps, document_ids, exclude_pos, within):
+                parts.append(count_windows(columns, starts, bits, self.chunk_size))
+
+        keys, counts = reduce_counts(parts)
+        return NgramTable(attributes, [values for values, _ in lexicons], keys, counts, bits)
+
+    def tables(self, number: int) -> Optional[NgramTables]:
+        """Persisted n-gram tables of a segment (None if not built)."""
+        if number not in self._tables:
+            path = getattr(self.segments[number], 'path', None)
+            self._tables[number] = NgramTables(path) if path and NgramTables.exists(path) else None
+        return self._tables[number]
+
+    def stored(
+        self,
+        n: int,
+        attribute: str,
+        document_ids: Optional[Iterable[int]] = None,
+        min_frequency: int = TABLE_MIN_FREQUENCY
+    ) -> Optional[NgramTable]:
+        """N-gram counts merged from the persisted segment tables.
+
+        Counts as ``count(n, attribute, document_ids, ('PUNCT',), lowercase=True)``;
+        segments without tables are counted directly. Pruned tables
+        (built with min_frequency above 1) miss the n-grams that are rare
+        in their segment but not in the corpus, so they are only used on
+        a single-segment index. The whole-corpus table is kept sorted by
+        frequency, so repeated requests only slice it.
+
+        Args:
+            n: N-gram length
+            attribute: 'form' or 'lemma' (every slot)
+            document_ids: Subcorpus as document IDs or a Bitmap (None = all)
+            min_frequency: Smallest count the caller will use; tables
+                pruned above it cannot answer the request
+
+        Returns:
+            NgramTable, or None if no segment has a table for the request or
+            the tables cannot give exact counts
+        """
+        if document_ids is None and (n, attribute) in self._stored:
+            return self._stored[(n, attribute)]
+        tables = [self.tables(number) for number in range(len(self.segments))]
+        tables = [t if t is not None and t.covers(n, attribute) else None for t in tables]
+        if all(t is None for t in tables) or any(t and t.min_frequency > min_frequency for t in tables):
+            return None
+        if len(self.segments) > 1 and any(t and t.min_frequency > 1 for t in tables):
+            return None
+        if document_ids is not None and not isinstance(document_ids, Bitmap):
+            document_ids = Bitmap.from_ids(document_ids)
+
+        values, maps = self.lexicon(attribute, lowercase=True)
+        bits = slot_bits([len(values)] * n)
+        parts = []
+        for number, (segment, table) in enumerate(zip(self.segments, tables)):
+            if table is None:
+                for _, starts, columns in self._chunks(
+                    number, n, (attribute,) * n, [maps[number]] * n, document_ids, TABLE_EXCLUDE_POS, 's'
+                ):
+                    parts.append(count_windows(columns, starts, bits, self.chunk_size))
+                continue
+            documents = None
+            if document_ids is not None or segment.deleted_count != table.info['deleted']:
+                documents = ~segment.deleted
+                if document_ids is not None:
+                    documents &= document_ids.contains(segment.structure('text').values)
+            counts = table.counts(attribute, n, documents)
+            kept = np.flatnonzero(counts)
+            ids = np.searchsorted(values, table.lexicon(attribute))
+            rows = np.asarray(table.arrays(attribute, n)['rows'])[kept]
+            parts.append(sort_counts(pack([ids[rows[:, j]] for j in range(n)], bits), counts[kept]))
+
+        keys, counts = reduce_counts(parts)
+        result = NgramTable((attribute,) * n, [values] * n, keys, counts, bits).by_frequency()
+        if document_ids is None:
+            self._stored[(n, attribute)] = result
+        return result
+
+
+def build_ngram_tables(
+    segment,
+    attributes: Sequence[str] = TABLE_ATTRIBUTES,
+    sizes: Sequence[int] = TABLE_SIZES,
+    min_frequency: int = TABLE_MIN_FREQUENCY,
+    chunk_size: int = CHUNK_SIZE
+) -> Path:
+    """Count and persist the n-gram tables of a segment (see NgramTables).
+
+    N-grams are lowercased, do not cross sentences and skip PUNCT. Each
+    table is counted twice: once for the segment totals (to prune
+    n-grams below min_frequency) and once for the postings of the kept
+    n-grams. The tables are written into a temporary directory that is
+    renamed into place, so readers never see a partial table.
+
+    Args:
+        segment: Opened CorpusIndex of the segment
+        attributes: Attributes to count (missing ones are skipped)
+        sizes: N-gram lengths
+        min_frequency: Prune n-grams occurring less often in the segment
+        chunk_size: Window start positions per counting chunk
+
+    Returns:
+        Path of the tables directory
+    """
+    counter = NgramCounter(segment, chunk_size=chunk_size)
+    text = segment.structure('text')
+    attributes = [attribute for attribute in attributes if segment.has_attribute(attribute)]
+    tmp_path = segment.path / f'{TABLES_DIR}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir()
+
+    for attribute in attributes:
+        values, maps = counter.lexicon(attribute, lowercase=True)
+        Lexicon.write_values(tmp_path / f'{attribute}.lexicon', values.tolist())
+        for n in sizes:
+            totals = counter.count(n, attribute, exclude_pos=TABLE_EXCLUDE_POS, lowercase=True)
+            kept = np.flatnonzero(totals.counts >= min_frequency)
+            kept = kept[np.argsort(searchable(totals.keys[kept]), kind='stable')]
+            keys = searchable(totals.keys[kept])
+            pairs = []
+            chunks = counter._chunks(0, n, (attribute,) * n, maps * n, None, TABLE_EXCLUDE_POS, 's')
+            for first, starts, columns in chunks if len(kept) else ():
+                windows = searchable(pack([column[starts + j] for j, column in enumerate(columns)], totals.bits))
+                slots = np.minimum(np.searchsorted(keys, windows), len(keys) - 1)
+                found = keys[slots] == windows
+                documents = text.find_all(first + starts[found]).astype(np.int64)
+                pairs.append(np.unique(slots[found] * len(text) + documents, return_counts=True))
+            pair_keys, pair_counts = reduce_counts(pairs)
+            slots = pair_keys // max(len(text), 1)
+            arrays = {
+                'rows': unpack(totals.keys[kept], totals.bits).astype(np.int32).reshape(-1, n),
+                'counts': totals.counts[kept],
+                'offsets': np.searchsorted(slots, np.arange(len(kept) + 1)).astype(np.int64),
+                'documents': (pair_keys % max(len(text), 1)).astype(np.int32),
+                'document_counts': pair_counts.astype(np.int32),
+            }
+            for name in TABLE_ARRAYS:
+                np.save(tmp_path / f'{attribute}.{n}.{name}.npy', arrays[name])
+
+    info = {
+        'attributes': attributes,
+        'sizes': list(sizes),
+        'min_frequency': min_frequency,
+        'exclude_pos': list(TABLE_EXCLUDE_POS),
+        'deleted': segment.deleted_count,
+        'built_at': datetime.now().isoformat(),
+    }
+    with open(tmp_path / TABLES_INFO, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+    path = segment.path / TABLES_DIR
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Written concurrently by another process
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return path
+
+
+def build_missing_ngram_tables(
+    index,
+    min_segment_tokens: int = TABLE_MIN_SEGMENT_TOKENS,
+    min_frequency: int = TABLE_MIN_FREQUENCY
+) -> List[Path]:
+    """Build the n-gram tables of every segment that has none yet.
+
+    Segments below min_segment_tokens (fresh imports) are left to direct
+    counting: they are cheap to count and a table would not save much.
+
+    Returns:
+        Paths of the tables written
+    """
+    written = []
+    for segment in getattr(index, 'segments', [index]):
+        if segment.size < min_segment_tokens or NgramTables.exists(segment.path):
+            continue
+        written.append(build_ngram_tables(segment, min_frequency=min_frequency))
+        logger.info(f"N-gram tables built for {segment.path.name} ({segment.size:,} tokens)")
+    return written
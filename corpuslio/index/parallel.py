@@ -0,0 +1,428 @@
+"""Parallel query execution over document-range shards.
+
+The corpus positions are partitioned into shards of whole documents
+(recorded in index.json at build time). A query is run on every shard in
+a process pool; workers open the same memory-mapped index, so shards
+share the page cache and nothing but the query and the result arrays is
+pickled. Posting lists are only decoded for the blocks inside a shard.
+
+Shards are disjoint and in corpus order, so the k-way merge of the
+per-shard results is a concatenation in shard order: results are taken
+shard by shard until ``limit`` hits are collected and the remaining
+shards are cancelled. On a segmented index every segment is sharded and
+lexicon lookups are resolved per segment.
+
+Example:
+    >>> executor = ShardedExecutor(CorpusIndex('/srv/corpus_index'), workers=8)
+    >>> starts, ends = executor.find('[pos="ADJ"]+ [pos="NOUN"]', limit=1000)
+"""
+import logging
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..query_parser import parse_cqp_query
+from .bitmap import Bitmap
+from .corpus import CorpusIndex
+from .executor import PatternExecutor
+from .planner import Predicate, QueryPlanner
+from .structure import in_regions
+
+logger = logging.getLogger(__name__)
+
+# Shards are not made smaller than this (fan-out overhead dominates below)
+MIN_SHARD_TOKENS = 1_000_000
+
+# First window of a limited positions walk: expected span of the hits times this slack
+WINDOW_SLACK = 1.5
+WINDOW_MIN_TOKENS = 4096
+
+Span = Tuple[int, int]
+
+# Process pools by worker count, shared by all executors of a process
+_pools: Dict[int, ProcessPoolExecutor] = {}
+
+# Worker-side cache of opened indexes: path -> (version, index, pattern executor)
+_worker_indexes: Dict[str, Tuple[str, CorpusIndex, PatternExecutor]] = {}
+
+
+def partition(
+    doc_starts: np.ndarray,
+    doc_ends: np.ndarray,
+    count: int = 0,
+    min_tokens: int = MIN_SHARD_TOKENS
+) -> List[Span]:
+    """Cut the corpus into shards of whole documents with similar token counts.
+
+    Args:
+        doc_starts: Sorted document start positions
+        doc_ends: Document end positions (exclusive)
+        count: Wanted number of shards (0 = one per CPU)
+        min_tokens: Minimum tokens per shard
+
+    Returns:
+        List of (start, end) position ranges covering all documents
+    """
+    if len(doc_starts) == 0:
+        return []
+    first, last = int(doc_starts[0]), int(doc_ends[-1])
+    count = count or os.cpu_count() or 1
+    count = max(1, min(count, (last - first) // max(min_tokens, 1), len(doc_starts)))
+
+    targets = first + (last - first) * np.arange(1, count) / count
+    cuts = np.unique(np.asarray(doc_ends)[np.searchsorted(doc_ends, targets)])
+    bounds = [first] + [int(c) for c in cuts if first < c < last] + [last]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def index_version(index: CorpusIndex) -> str:
+    """Changes when an index is rebuilt or documents in it are deleted."""
+    return f"{index.info.get('built_at', '')}/{index.deleted_count}"
+
+
+def _open_index(path: str, version: str) -> Tuple[CorpusIndex, PatternExecutor]:
+    """Open (or reuse) the index in a worker process."""
+    cached = _worker_indexes.get(path)
+    if cached is None or cached[0] != version:
+        index = CorpusIndex(path)
+        cached = _worker_indexes[path] = (version, index, PatternExecutor(index))
+    return cached[1], cached[2]
+
+
+def _run_shard(path: str, version: str, task: Callable, span: Span, args: tuple):
+    """Worker entry point: run a task on one shard."""
+    index, executor = _open_index(path, version)
+    return task(index, executor, span, *args)
+
+
+def find_task(index, executor, span, query, document_ids, limit):
+    """Shard task: CQP pattern matches as (starts, ends)."""
+    return executor.find(parse_cqp_query(query), document_ids, limit, span)
+
+
+def positions_task(index, executor, span, condition, document_ids, limit, reverse=False):
+    """Shard task: positions matching an (attribute, value, regex, case_sensitive) condition.
+
+    With a limit the span is read in growing windows from its start (from
+    its end when reverse, keeping the last hits), sized from the term
+    frequencies, so only the posting blocks of about ``limit`` hits are
+    decoded however far into the corpus the span starts.
+    """
+    attribute, value, regex, case_sensitive = condition
+    lex_ids = index.lookup(attribute, value, regex, case_sensitive)
+    stream = index.attribute(attribute)
+    regions = index.document_ranges(document_ids) if document_ids is not None else None
+    if limit is None:
+        positions = stream.positions_for_ids(lex_ids, span)
+        if regions is not None:
+            positions = positions[in_regions(positions, *regions)]
+        return (positions,)
+
+    start, end = span if span is not None else (0, index.size)
+    frequency = int(stream.lexicon.frequencies[lex_ids].sum()) if len(lex_ids) else 0
+    if limit <= 0 or frequency == 0 or start >= end:
+        return (np.empty(0, dtype=np.int32),)
+    window = max(WINDOW_MIN_TOKENS, int(WINDOW_SLACK * limit * index.size / frequency))
+    parts, found = [], 0
+    while start < end and found < limit:
+        if reverse:
+            part = (max(start, end - window), end)
+            end = part[0]
+        else:
+            part = (start, min(end, start + window))
+            start = part[1]
+        positions = stream.positions_for_ids(lex_ids, part)
+        if regions is not None:
+            positions = positions[in_regions(positions, *regions)]
+        parts.append(positions)
+        found += len(positions)
+        window *= 2
+    if reverse:
+        parts.reverse()
+    positions = np.concatenate(parts)
+    return (positions[-limit:] if reverse else positions[:limit],)
+
+
+def join_task(index, executor, span, conditions, length, within, document_ids, limit):
+    """Shard task: planned join of (offset, attribute, value, regex, case_sensitive) conditions."""
+    planner = QueryPlanner(index, within)
+    plan = planner.plan(condition_predicates(index, conditions), length, document_ids)
+    return (planner.execute(plan, document_ids, limit, span),)
+
+
+def condition_predicates(index: CorpusIndex, conditions: Sequence[tuple]) -> List[Predicate]:
+    """Resolve (offset, attribute, value, regex, case_sensitive) conditions on one index."""
+    predicates = []
+    for offset, attribute, value, regex, case_sensitive in conditions:
+        lex_ids = index.lookup(attribute, value, regex, case_sensitive)
+        predicates.append(Predicate(offset, index.attribute(attribute), lex_ids, label=f'{attribute}="{value}"'))
+    return predicates
+
+
+class ShardedExecutor:
+    """Fan a query out to all shards of an index and merge the results.
+
+    Works on a single CorpusIndex or on a SegmentedIndex, whose segments
+    are sharded individually; results are global corpus positions.
+    """
+
+    def __init__(self, index, workers: int = 0):
+        """Initialize executor.
+
+        Args:
+            index: Opened CorpusIndex or SegmentedIndex
+            workers: Worker processes (0 = one per CPU, 1 = run in this process)
+        """
+        self.index = index
+        self.workers = workers or os.cpu_count() or 1
+        self.segments: List[CorpusIndex] = list(getattr(index, 'segments', [index]))
+        self.bases = np.zeros(len(self.segments) + 1, dtype=np.int64)
+        np.cumsum([segment.size for segment in self.segments], out=self.bases[1:])
+        # (segment number, span within the segment)
+        self.shards: List[Tuple[int, Span]] = [
+            (n, span) for n, segment in enumerate(self.segments) for span in segment.shards()
+        ]
+        self._executors = [PatternExecutor(segment) for segment in self.segments]
+
+    @property
+    def parallel(self) -> bool:
+        """Whether queries are fanned out to worker processes."""
+        return self.workers > 1 and len(self.shards) > 1
+
+    def _pool(self) -> ProcessPoolExecutor:
+        pool = _pools.get(self.workers)
+        if pool is None:
+            pool = _pools[self.workers] = ProcessPoolExecutor(max_workers=self.workers)
+        return pool
+
+    def map(
+        self,
+        task: Callable,
+        args: tuple,
+        limit: Optional[int] = None,
+        document_ids: Optional[List[int]] = None,
+        start: int = 0,
+        end: Optional[int] = None,
+        reverse: bool = False
+    ) -> Tuple[np.ndarray, ...]:
+        """Run a shard task on every shard and merge in corpus order.
+
+        Args:
+            task: Module-level function ``task(index, executor, span, *args)``
+                  returning a tuple of position arrays (local to the segment)
+            args: Extra task arguments (must be picklable)
+            limit: Stop after this many results
+            document_ids: Skip shards without any of these documents
+            start: Only global positions >= start (shard spans are clipped,
+                   earlier shards are not run)
+            end: Only global positions < end (None = end of the corpus)
+            reverse: Run the shards backwards from end and keep the last
+                     limit results (the task must do the same)
+
+        Returns:
+            Tuple of concatenated global position arrays, truncated to limit
+        """
+        end = int(self.bases[-1]) if end is None else end
+        shards = self._shards_for(document_ids)
+        if not self.parallel:
+            runs = []
+            for n in sorted({n for n, _ in shards}):
+                base, size = int(self.bases[n]), self.segments[n].size
+                span = None
+                if start > base or end < base + size:
+                    span = (max(0, start - base), min(size, end - base))
+                    if span[0] >= span[1]:
+                        continue
+                runs.append((n, span))
+            results = []
+            found = 0
+            for n, span in (reversed(runs) if reverse else runs):
+                result = task(self.segments[n], self._executors[n], span, *args)
+                results.append(tuple(column + self.bases[n] for column in result))
+                found += len(result[0])
+                if limit is not None and found >= limit:
+                    break
+            return self._merge(results[::-1] if reverse else results, limit, reverse)
+
+        spans = []
+        for n, (first, last) in shards:
+            base = int(self.bases[n])
+            span = (max(first, start - base), min(last, end - base))
+            if span[0] < span[1]:
+                spans.append((n, span))
+        if reverse:
+            spans.reverse()
+        pool = self._pool()
+        logger.debug(f"Fan-out of {task.__name__} to {len(spans)} shards")
+        futures: List[Tuple[int, Future]] = [
+            (n, pool.submit(
+                _run_shard, str(self.segments[n].path), index_version(self.segments[n]), task, span, args
+            ))
+            for n, span in spans
+        ]
+
+        results = []
+        found = 0
+        for i, (n, future) in enumerate(futures):
+            result = future.result()
+            results.append(tuple(column + self.bases[n] for column in result))
+            found += len(result[0])
+            if limit is not None and found >= limit:
+                for _, pending in futures[i + 1:]:
+                    pending.cancel()
+                break
+        return self._merge(results[::-1] if reverse else results, limit, reverse)
+
+    def _shards_for(self, document_ids: Optional[List[int]]) -> List[Tuple[int, Span]]:
+        """Shards holding at least one of the documents (all when None)."""
+        if document_ids is None:
+            return self.shards
+        wanted = set()
+        for n, segment in enumerate(self.segments):
+            doc_starts, _ = segment.document_ranges(document_ids)
+            if len(doc_starts):
+                shard_starts = np.array([span[0] for m, span in self.shards if m == n])
+                for k in np.unique(np.searchsorted(shard_starts, doc_starts, side='right') - 1).tolist():
+                    wanted.add((n, k))
+        shards = []
+        counts: Dict[int, int] = {}
+        for n, span in self.shards:
+            k = counts.get(n, 0)
+            counts[n] = k + 1
+            if (n, k) in wanted:
+                shards.append((n, span))
+        return shards
+
+    @staticmethod
+    def _merge(
+        results: Sequence[Tuple[np.ndarray, ...]],
+        limit: Optional[int],
+        reverse: bool = False
+    ) -> Tuple[np.ndarray, ...]:
+        if not results or limit == 0:
+            return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        merged = tuple(np.concatenate(columns) for columns in zip(*results))
+        if limit is not None:
+            merged = tuple(column[-limit:] if reverse else column[:limit] for column in merged)
+        return merged
+
+    def find(
+        self,
+        query: str,
+        document_ids: Optional[Iterable[int]] = None,
+        limit: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Find CQP pattern matches (see PatternExecutor.find).
+
+        Raises:
+            ValueError: If the query cannot be parsed
+        """
+        if parse_cqp_query(query) is None:
+            raise ValueError(f"Invalid query: {query}")
+        document_ids = self._document_list(document_ids)
+        starts, ends = self.map(find_task, (query, document_ids, limit), limit, document_ids)[:2]
+        return starts, ends
+
+    def positions(
+        self,
+        attribute: str,
+        value: str,
+        regex: bool = False,
+        case_sensitive: bool = True,
+        document_ids: Optional[Iterable[int]] = None,
+        limit: Optional[int] = None,
+        start: int = 0,
+        end: Optional[int] = None,
+        reverse: bool = False
+    ) -> np.ndarray:
+        """Sorted positions where an attribute has a value (or matches a regex).
+
+        ``start``/``end`` restrict the search to global positions in
+        [start, end), e.g. to resume after the last hit of a page; with
+        reverse the last ``limit`` positions before end are returned.
+        """
+        document_ids = self._document_list(document_ids)
+        condition = (attribute, value, regex, case_sensitive)
+        args = (condition, document_ids, limit, reverse)
+        return self.map(positions_task, args, limit, document_ids, start, end, reverse)[0]
+
+    def join(
+        self,
+        conditions: Sequence[tuple],
+        length: int,
+        document_ids: Optional[Iterable[int]] = None,
+        limit: Optional[int] = None,
+        within: str = 's'
+    ) -> np.ndarray:
+        """Planned join (see QueryPlanner) of conditions
+        ``(offset, attribute, value, regex, case_sensitive)``."""
+        document_ids = self._document_list(document_ids)
+        args = (list(conditions), length, within, document_ids, limit)
+        return self.map(join_task, args, limit, document_ids)[0]
+
+    def count(
+        self,
+        attribute: str,
+        value: str,
+        regex: bool = False,
+        case_sensitive: bool = True,
+        document_ids: Optional[Iterable[int]] = None
+    ) -> int:
+        """Exact number of positions where an attribute has a value (or matches a regex).
+
+        Segments without deletions are counted from the lexicon term
+        frequencies alone; with deletions or a document filter the
+        posting lists are decoded, but no position leaves the segment.
+        """
+        document_ids = self._document_list(document_ids)
+        condition = (attribute, value, regex, case_sensitive)
+        total = 0
+        for n, segment in enumerate(self.segments):
+            if document_ids is None and not segment.deleted_count:
+                lex_ids = segment.lookup(attribute, value, regex, case_sensitive)
+                total += int(segment.attribute(attribute).lexicon.frequencies[lex_ids].sum())
+            else:
+                total += len(positions_task(segment, self._executors[n], None, condition, document_ids, None)[0])
+        return total
+
+    def count_join(
+        self,
+        conditions: Sequence[tuple],
+        length: int,
+        document_ids: Optional[Iterable[int]] = None,
+        within: str = 's'
+    ) -> int:
+        """Exact number of matches of a planned join (no context is read)."""
+        return len(self.join(conditions, length, document_ids, within=within))
+
+    def estimate(
+        self,
+        conditions: Sequence[tuple],
+        length: int = 1,
+        document_ids: Optional[Iterable[int]] = None,
+        within: str = 's'
+    ) -> int:
+        """Estimated matches of conditions ``(offset, attribute, value, regex, case_sensitive)``.
+
+        Sums the QueryPlanner estimates of all segments: lexicon term
+        frequencies scaled by the subcorpus share, the sentence-length
+        correction and the selectivity of every further condition.
+        Nothing is decoded.
+        """
+        document_ids = self._document_list(document_ids)
+        total = 0
+        for segment in self.segments:
+            plan = QueryPlanner(segment, within).plan(
+                condition_predicates(segment, conditions), length, document_ids
+            )
+            total += plan.steps[-1].estimated_rows
+        return total
+
+    @staticmethod
+    def _document_list(document_ids: Optional[Iterable[int]]):
+        """Document filter as sent to shards (bitmaps are passed as they are)."""
+        if document_ids is None or isinstance(document_ids, Bitmap):
+            return document_ids
+        return [int(d) for d in document_ids]
@@ -0,0 +1,288 @@
+"""Cost-based planning of token-sequence queries on the index.
+
+A query is a list of predicates (attribute value sets at a token offset).
+The planner estimates each predicate's cardinality from the lexicon term
+and document frequencies, picks the rarest non-negated predicate as the
+anchor, orders the remaining predicates by selectivity and chooses an
+access method per predicate:
+
+- ``intersect``: decode the whole posting list once and intersect
+- ``skip``: decode only the posting blocks the candidates fall into
+- ``scan``: read the token stream at each candidate position
+
+``QueryPlan.explain()`` reports the plan with estimated and (after
+execution) actual row counts.
+
+Example:
+    >>> planner = QueryPlanner(index)
+    >>> plan = planner.plan(predicates, length=2)
+    >>> starts = planner.execute(plan)
+    >>> print(plan)
+"""
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .attribute import PositionalAttribute
+from .corpus import CorpusIndex
+from .postings import BLOCK_SIZE
+from .structure import in_regions
+
+# Candidates processed per batch (lets a limit stop execution early)
+BATCH_SIZE = 65536
+
+# Relative cost of one random token-stream read vs. decoding one posting
+SCAN_COST = 4
+
+# Lists checked one by one with the skip method (more IDs -> intersect/scan)
+MAX_SKIP_LISTS = 8
+
+
+@dataclass
+class Predicate:
+    """Token at ``offset`` has (or, if negated, has not) one of ``lex_ids``."""
+    offset: int
+    attribute: PositionalAttribute
+    lex_ids: np.ndarray
+    negated: bool = False
+    label: str = ''
+
+    @property
+    def frequency(self) -> int:
+        """Corpus positions matching the value set (ignoring negation)."""
+        return int(self.attribute.lexicon.frequencies[self.lex_ids].sum())
+
+    @property
+    def document_frequency(self) -> int:
+        """Upper bound on documents containing the value set."""
+        return int(self.attribute.lexicon.document_frequencies[self.lex_ids].sum())
+
+
+@dataclass
+class PlanStep:
+    """One step of a plan with estimated and actual output rows."""
+    operation: str
+    predicate: Optional[Predicate] = None
+    estimated_rows: int = 0
+    actual_rows: Optional[int] = None
+    seconds: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        result = {
+            'operation': self.operation,
+            'estimated_rows': self.estimated_rows,
+            'actual_rows': self.actual_rows,
+            'ms': round(self.seconds * 1000, 3),
+        }
+        if self.predicate is not None:
+            result.update({
+                'predicate': self.predicate.label,
+                'offset': self.predicate.offset,
+                'types': len(self.predicate.lex_ids),
+                'term_frequency': self.predicate.frequency,
+                'document_frequency': self.predicate.document_frequency,
+            })
+        return result
+
+
+@dataclass
+class QueryPlan:
+    """Ordered steps for a fixed-length token sequence query."""
+    length: int
+    within: str
+    steps: List[PlanStep] = field(default_factory=list)
+    truncated: bool = False
+
+    def explain(self) -> Dict[str, Any]:
+        """Plan as a dict (actual rows are None until executed)."""
+        return {
+            'strategy': 'join',
+            'length': self.length,
+            'within': self.within,
+            'truncated': self.truncated,
+            'steps': [step.as_dict() for step in self.steps],
+        }
+
+    def __str__(self) -> str:
+        lines = [f"join length={self.length} within={self.within}"]
+        for step in self.steps:
+            label = f" {step.predicate.label}@{step.predicate.offset}" if step.predicate else ''
+            actual = '-' if step.actual_rows is None else f'{step.actual_rows:,}'
+            lines.append(
+                f"  {step.operation:<9}{label}  est={step.estimated_rows:,} "
+                f"actual={actual} ({step.seconds * 1000:.2f} ms)"
+            )
+        if self.truncated:
+            lines.append("  (stopped at limit)")
+        return '\n'.join(lines)
+
+
+class QueryPlanner:
+    """Plan and execute predicate joins on a CorpusIndex."""
+
+    def __init__(self, index: CorpusIndex, within: str = 's'):
+        """Initialize planner.
+
+        Args:
+            index: Opened corpus index
+            within: Structure a match may not cross ('s' = sentence)
+        """
+        self.index = index
+        self.within = within
+
+    def plan(
+        self,
+        predicates: List[Predicate],
+        length: int,
+        document_ids: Optional[Iterable[int]] = None,
+        within: Optional[str] = None
+    ) -> QueryPlan:
+        """Build a plan.
+
+        Args:
+            predicates: Conditions of the query
+            length: Tokens per match
+            document_ids: Restrict to these documents (None = all)
+            within: Structure a match may not cross (default: self.within)
+
+        Raises:
+            ValueError: If there is no non-negated predicate to anchor on
+        """
+        positive = sorted((p for p in predicates if not p.negated), key=lambda p: p.frequency)
+        negated = sorted((p for p in predicates if p.negated), key=lambda p: -p.frequency)
+        if not positive:
+            raise ValueError("Query plan needs at least one non-negated condition")
+
+        size = max(self.index.size, 1)
+        scale = 1.0
+        if document_ids is not None:
+            starts, ends = self.index.document_ranges(document_ids)
+            scale = float((ends - starts).sum()) / size
+
+        plan = QueryPlan(length=length, within=within or self.within)
+        anchor = positive[0]
+        rows = anchor.frequency * scale
+        plan.steps.append(PlanStep('anchor', anchor, int(round(rows))))
+
+        if length > 1:
+            regions = max(len(self.index.structure(plan.within)), 1)
+            average_length = size / regions
+            rows *= max(0.0, 1.0 - (length - 1) / average_length)
+            plan.steps.append(PlanStep('within', None, int(round(rows))))
+
+        for predicate in positive[1:] + negated:
+            selectivity = predicate.frequency / size
+            if predicate.negated:
+                selectivity = 1.0 - selectivity
+            operation = self.access_method(predicate, rows)
+            rows *= selectivity
+            plan.steps.append(PlanStep(operation, predicate, int(round(rows))))
+
+        return plan
+
+    def access_method(self, predicate: Predicate, candidates: float) -> str:
+        """Cheapest way to check candidates against a predicate."""
+        costs = {
+            'intersect': predicate.frequency,
+            'scan': candidates * SCAN_COST,
+        }
+        if len(predicate.lex_ids) <= MAX_SKIP_LISTS:
+            blocks = predicate.attribute.block_count(predicate.lex_ids)
+            costs['skip'] = min(candidates * len(predicate.lex_ids), blocks) * BLOCK_SIZE
+        return min(costs, key=costs.get)
+
+    def execute(
+        self,
+        plan: QueryPlan,
+        document_ids: Optional[Iterable[int]] = None,
+        limit: Optional[int] = None,
+        span: Optional[Tuple[int, int]] = None
+    ) -> np.ndarray:
+        """Run a plan and record actual rows per step.
+
+        Args:
+            plan: Plan from plan()
+            document_ids: Restrict to these documents (None = all)
+            limit: Stop after this many matches (None = all)
+            span: Only matches starting in [start, end) (a shard; None = all)
+
+        Returns:
+            Sorted int64 array of match start positions
+        """
+        first, last = span if span is not None else (0, self.index.size)
+        anchor_step = plan.steps[0]
+        anchor = anchor_step.predicate
+        started = time.perf_counter()
+        anchor_span = None if span is None else (first + anchor.offset, last + anchor.offset)
+        starts = anchor.attribute.positions_for_ids(anchor.lex_ids, anchor_span).astype(np.int64) - anchor.offset
+        starts = starts[(starts >= first) & (starts < last) & (starts + plan.length <= self.index.size)]
+        if document_ids is not None:
+            doc_starts, doc_ends = self.index.document_ranges(document_ids)
+            starts = starts[in_regions(starts, doc_starts, doc_ends)]
+        anchor_step.actual_rows = len(starts)
+        anchor_step.seconds = time.perf_counter() - started
+
+        bounds = self.index.structure(plan.within)
+
+        for step in plan.steps[1:]:
+            step.actual_rows = 0
+            step.seconds = 0.0
+        decoded = {}
+
+        results = []
+        found = 0
+        plan.truncated = False
+        for batch_start in range(0, len(starts), BATCH_SIZE):
+            batch = starts[batch_start:batch_start + BATCH_SIZE]
+
+            for n, step in enumerate(plan.steps[1:], start=1):
+                started = time.perf_counter()
+                if step.operation == 'within':
+                    _, _, region_ends = bounds.bounds(batch)
+                    batch = batch[batch + plan.length <= region_ends]
+                elif len(batch):
+                    mask = self._check(step, batch + step.predicate.offset, decoded, n, span)
+                    batch = batch[~mask if step.predicate.negated else mask]
+                step.actual_rows += len(batch)
+                step.seconds += time.perf_counter() - started
+
+            results.append(batch)
+            found += len(batch)
+            if limit is not None and found >= limit:
+                plan.truncated = batch_start + BATCH_SIZE < len(starts)
+                break
+
+        matches = np.concatenate(results) if results else np.empty(0, dtype=np.int64)
+        return matches[:limit] if limit is not None else matches
+
+    def _check(
+        self,
+        step: PlanStep,
+        positions: np.ndarray,
+        decoded: Dict[int, Any],
+        n: int,
+        span: Optional[Tuple[int, int]] = None
+    ) -> np.ndarray:
+        """Membership mask of positions for a step's predicate (ignoring negation)."""
+        predicate = step.predicate
+        attr = predicate.attribute
+
+        if step.operation == 'intersect':
+            if n not in decoded:
+                check_span = None if span is None else (span[0], span[1] + predicate.offset)
+                decoded[n] = attr.positions_for_ids(predicate.lex_ids, check_span)
+            return np.isin(positions, decoded[n])
+
+        if step.operation == 'skip':
+            mask = np.zeros(len(positions), dtype=bool)
+            for lex_id in predicate.lex_ids.tolist():
+                mask |= attr.postings(lex_id).contains(positions)
+            return mask
+
+        if n not in decoded:
+            lexicon_mask = np.zeros(len(attr.lexicon), dtype=bool)
+            lexicon_mask[predicate.lex_ids] = True
+            decoded[n] = lexicon_mask
+        return decoded[n][attr.stream[positions]]
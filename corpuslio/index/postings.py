@@ -0,0 +1,254 @@
+"""Compressed posting lists (delta + bit-packing in fixed-size blocks).
+
+The positions of each lexicon ID are cut into blocks of BLOCK_SIZE
+positions. A block stores its first position verbatim (the skip pointer)
+and the remaining gaps ``p[i] - p[i-1] - 1`` bit-packed with the smallest
+width that fits the largest gap of the block.
+
+Files per attribute:
+
+- ``<name>.postings.npy``  uint8 packed gap bits of all blocks
+- ``<name>.blocks.npy``    block table (first position, byte offset, bit width, count)
+- ``<name>.blockidx.npy``  int64 offsets into the block table (length = lexicon size + 1)
+
+Encoding and decoding are vectorized over many blocks at once: blocks are
+grouped by bit width and unpacked with ``np.unpackbits`` in chunks.
+"""
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+BLOCK_SIZE = 128
+
+BLOCK_DTYPE = np.dtype([
+    ('first', '<i4'),
+    ('offset', '<i8'),
+    ('bits', 'u1'),
+    ('count', 'u1'),
+])
+
+# Blocks unpacked per NumPy call (bounds temporary memory)
+_CHUNK_BLOCKS = 2048
+
+_GAP_SLOTS = BLOCK_SIZE - 1
+
+
+def encode_postings(
+    positions: np.ndarray,
+    offsets: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compress grouped posting lists.
+
+    Args:
+        positions: Corpus positions grouped by lexicon ID, ascending within each ID
+        offsets: Start of each lexicon ID in ``positions`` (length = lexicon size + 1)
+
+    Returns:
+        Tuple of (data, blocks, block_index)
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    freq = np.diff(offsets)
+
+    n_blocks = (freq + BLOCK_SIZE - 1) // BLOCK_SIZE
+    block_index = np.zeros(len(freq) + 1, dtype=np.int64)
+    np.cumsum(n_blocks, out=block_index[1:])
+    total = int(block_index[-1])
+
+    blocks = np.zeros(total, dtype=BLOCK_DTYPE)
+    if total == 0:
+        return np.zeros(0, dtype=np.uint8), blocks, block_index
+
+    owner = np.repeat(np.arange(len(freq)), n_blocks)
+    nth = np.arange(total) - block_index[:-1][owner]
+    starts = offsets[:-1][owner] + nth * BLOCK_SIZE
+    counts = np.minimum(starts + BLOCK_SIZE, offsets[1:][owner]) - starts
+
+    gaps = np.zeros(len(positions), dtype=np.int64)
+    gaps[1:] = np.diff(positions) - 1
+    gaps[starts] = 0
+    bits = np.frexp(np.maximum.reduceat(gaps, starts).astype(np.float64))[1]
+
+    n_bytes = ((counts - 1) * bits + 7) // 8
+    byte_offsets = np.zeros(total, dtype=np.int64)
+    np.cumsum(n_bytes[:-1], out=byte_offsets[1:])
+
+    blocks['first'] = positions[starts]
+    blocks['offset'] = byte_offsets
+    blocks['bits'] = bits
+    blocks['count'] = counts
+
+    data = np.zeros(int(n_bytes.sum()), dtype=np.uint8)
+    slots = np.arange(_GAP_SLOTS)
+    for width in np.unique(bits):
+        width = int(width)
+        if width == 0:
+            continue
+        shifts = np.arange(width, dtype=np.uint32)
+        selected = np.flatnonzero(bits == width)
+        for chunk_start in range(0, len(selected), _CHUNK_BLOCKS):
+            b = selected[chunk_start:chunk_start + _CHUNK_BLOCKS]
+            valid = slots < (counts[b] - 1)[:, None]
+            idx = np.where(valid, starts[b][:, None] + 1 + slots, 0)
+            values = np.where(valid, gaps[idx], 0).astype(np.uint32)
+
+            bit_matrix = ((values[:, :, None] >> shifts) & 1).astype(np.uint8)
+            packed = np.packbits(bit_matrix.reshape(len(b), -1), axis=1, bitorder='little')
+
+            columns = np.arange(packed.shape[1])
+            keep = columns < n_bytes[b][:, None]
+            data[(byte_offsets[b][:, None] + columns)[keep]] = packed[keep]
+
+    return data, blocks, block_index
+
+
+def decode_blocks(data: np.ndarray, blocks: np.ndarray, block_ids: Sequence[int]) -> np.ndarray:
+    """Decode blocks into positions.
+
+    Args:
+        data: Packed gap bytes
+        blocks: Block table
+        block_ids: Blocks to decode (output keeps this order)
+
+    Returns:
+        int32 array of the concatenated block positions
+    """
+    block_ids = np.asarray(block_ids, dtype=np.int64)
+    if len(block_ids) == 0:
+        return np.empty(0, dtype=np.int32)
+
+    selected = blocks[block_ids]
+    firsts = selected['first'].astype(np.int64)
+    counts = selected['count'].astype(np.int64)
+    bits = selected['bits']
+    byte_offsets = selected['offset']
+
+    out_offsets = np.zeros(len(block_ids), dtype=np.int64)
+    np.cumsum(counts[:-1], out=out_offsets[1:])
+    out = np.empty(int(counts.sum()), dtype=np.int32)
+    out[out_offsets] = firsts
+
+    slots = np.arange(_GAP_SLOTS)
+    last_byte = max(len(data) - 1, 0)
+    for width in np.unique(bits):
+        width = int(width)
+        weights = np.left_shift(1, np.arange(width, dtype=np.int64))
+        n_bytes = (_GAP_SLOTS * width + 7) // 8
+        selected_rows = np.flatnonzero(bits == width)
+        for chunk_start in range(0, len(selected_rows), _CHUNK_BLOCKS):
+            rows = selected_rows[chunk_start:chunk_start + _CHUNK_BLOCKS]
+            if width:
+                idx = np.minimum(byte_offsets[rows][:, None] + np.arange(n_bytes), last_byte)
+                bit_matrix = np.unpackbits(
+                    np.asarray(data[idx]), axis=1, count=_GAP_SLOTS * width, bitorder='little'
+                ).reshape(len(rows), _GAP_SLOTS, width)
+                gaps = bit_matrix @ weights
+            else:
+                gaps = np.zeros((len(rows), _GAP_SLOTS), dtype=np.int64)
+
+            positions = firsts[rows][:, None] + np.cumsum(gaps + 1, axis=1)
+            valid = slots < (counts[rows] - 1)[:, None]
+            dest = out_offsets[rows][:, None] + 1 + slots
+            out[dest[valid]] = positions[valid]
+
+    return out
+
+
+class PostingList:
+    """Sorted positions of one lexicon ID, decoded block by block.
+
+    ``next_geq`` walks the list forwards with a cursor, using the block
+    skip pointers to jump over blocks that cannot contain the target.
+    """
+
+    def __init__(self, data: np.ndarray, blocks: np.ndarray, start_block: int, end_block: int):
+        """Initialize posting list.
+
+        Args:
+            data: Packed gap bytes of the attribute
+            blocks: Block table of the attribute
+            start_block: First block of this list
+            end_block: End (exclusive) of the block range
+        """
+        self._data = data
+        self._blocks = blocks
+        self.start_block = int(start_block)
+        self.end_block = int(end_block)
+        self.skips = np.asarray(blocks['first'][self.start_block:self.end_block])
+        self._length = None
+        self._cursor = 0
+        self._cached_block = -1
+        self._cached = None
+
+    def __len__(self) -> int:
+        if self._length is None:
+            self._length = int(self._blocks['count'][self.start_block:self.end_block].astype(np.int64).sum())
+        return self._length
+
+    @property
+    def block_count(self) -> int:
+        return self.end_block - self.start_block
+
+    def decode_block(self, n: int) -> np.ndarray:
+        """Decode the n-th block of this list (last block is cached)."""
+        if n != self._cached_block:
+            self._cached = decode_blocks(self._data, self._blocks, [self.start_block + n])
+            self._cached_block = n
+        return self._cached
+
+    def to_array(self) -> np.ndarray:
+        """Decode the whole list."""
+        return decode_blocks(self._data, self._blocks, np.arange(self.start_block, self.end_block))
+
+    def reset(self):
+        """Move the cursor back to the first block."""
+        self._cursor = 0
+
+    def next_geq(self, position: int) -> int:
+        """Smallest position >= ``position`` at or after the cursor.
+
+        Targets must not decrease between calls (call reset() to rewind).
+
+        Returns:
+            Matching position, or -1 when the list is exhausted
+        """
+        n = max(self._cursor, int(np.searchsorted(self.skips, position, side='right')) - 1)
+        while n < self.block_count:
+            block = self.decode_block(n)
+            i = int(np.searchsorted(block, position))
+            if i < len(block):
+                self._cursor = n
+                return int(block[i])
+            n += 1
+        self._cursor = self.block_count
+        return -1
+
+    def contains(self, positions: np.ndarray) -> np.ndarray:
+        """Membership mask for sorted positions.
+
+        Only the blocks that may hold one of the positions are decoded.
+        """
+        positions = np.asarray(positions)
+        if len(positions) == 0 or self.block_count == 0:
+            return np.zeros(len(positions), dtype=bool)
+        candidate_blocks = np.searchsorted(self.skips, positions, side='right') - 1
+        needed = np.unique(candidate_blocks[candidate_blocks >= 0])
+        decoded = decode_blocks(self._data, self._blocks, needed + self.start_block)
+        return np.isin(positions, decoded, assume_unique=False)
+
+
+def intersect(lists: Iterable[PostingList]) -> np.ndarray:
+    """Intersect posting lists, rarest first.
+
+    The rarest list is decoded in full; every other list only decodes the
+    blocks its skip pointers select for the surviving candidates.
+    """
+    ordered: List[PostingList] = sorted(lists, key=len)
+    if not ordered:
+        return np.empty(0, dtype=np.int32)
+    result = ordered[0].to_array()
+    for posting_list in ordered[1:]:
+        if len(result) == 0:
+            break
+        result = result[posting_list.contains(result)]
+    return result
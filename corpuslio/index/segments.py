@@ -0,0 +1,432 @@
+"""Segmented index: immutable segments with tiered background merging.
+
+An index directory holds a manifest and a list of segments, each of them
+a complete CorpusIndex over its own documents::
+
+    corpus_index/
+        manifest.json          live segments in corpus order
+        segments/<name>/       one CorpusIndex per segment, with its
+                               document x term count matrices (counts/)
+
+New documents are indexed into a new small segment and become searchable
+as soon as the manifest lists it; nothing is rebuilt. Queries span all
+live segments: a segment's local positions are shifted by the sizes of
+the segments before it to give global corpus positions.
+
+``SegmentStore.compact()`` merges runs of ``merge_factor`` adjacent
+segments of the same size tier into one (tier = log base merge_factor of
+size / min_segment_tokens), so the segment count stays logarithmic in the
+corpus size. Merged segments are only deleted at a later compaction, so
+readers that opened them before the manifest changed are not disturbed.
+
+Deleting documents only sets their bits in the tombstone bitmap of the
+segment that holds them (``deleted.npy``, see CorpusIndex); queries mask
+them out at once. Merging drops tombstoned documents, and segments with
+many deleted tokens are rewritten on their own.
+
+Example:
+    >>> store = SegmentStore('/srv/corpus_index')
+    >>> store.add_segment(documents)          # after an import
+    >>> store.compact()                       # periodically
+    >>> index = SegmentedIndex('/srv/corpus_index')
+"""
+import json
+import logging
+import math
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .builder import IndexBuilder
+from .corpus import DELETIONS, CorpusIndex
+from .dispersion import build_count_matrices
+
+try:
+    import fcntl
+except ImportError:  # Windows: manifest updates are not serialized across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+SEGMENTS_DIR = 'segments'
+
+# Segments merged at once, and per tier before a merge is due
+MERGE_FACTOR = 4
+
+# Segments up to this size form the lowest tier
+MIN_SEGMENT_TOKENS = 100_000
+
+# Segments at or above this size are never merged further
+MAX_SEGMENT_TOKENS = 200_000_000
+
+# Seconds a merged-away segment is kept for readers that still use it
+OBSOLETE_GRACE_SECONDS = 3600
+
+# Segments with this share of deleted tokens are rewritten without them
+PURGE_DELETED_RATIO = 0.25
+
+
+def read_manifest(path) -> Dict[str, Any]:
+    """Read the manifest of an index directory (empty manifest if none)."""
+    try:
+        with open(Path(path) / MANIFEST, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'generation': 0, 'segments': [], 'obsolete': []}
+
+
+class SegmentedIndex:
+    """Read-only view of all live segments as one corpus."""
+
+    def __init__(self, path, previous: Optional['SegmentedIndex'] = None):
+        """Open the live segments of an index directory.
+
+        Args:
+            path: Index directory
+            previous: Earlier view of the same directory; its opened
+                      segments are reused when still live
+
+        Raises:
+            FileNotFoundError: If the directory has no manifest or a segment is missing
+            ValueError: If a segment was written in another format version
+        """
+        self.path = Path(path)
+        if not (self.path / MANIFEST).exists():
+            raise FileNotFoundError(f"No index manifest in {self.path}")
+        self.info = read_manifest(self.path)
+        self.info.setdefault('built_at', str(self.info.get('generation', 0)))
+
+        reusable = {}
+        if previous is not None:
+            reusable = dict(zip(previous.segment_names, previous.segments))
+        self.segment_names: List[str] = [entry['name'] for entry in self.info['segments']]
+        self.segments: List[CorpusIndex] = []
+        for entry in self.info['segments']:
+            segment = reusable.get(entry['name'])
+            if segment is None:
+                segment = CorpusIndex(self.path / SEGMENTS_DIR / entry['name'])
+            elif segment.deleted_count != entry.get('deleted', 0):
+                segment.load_deletions()
+            self.segments.append(segment)
+
+        self.bases = np.zeros(len(self.segments) + 1, dtype=np.int64)
+        np.cumsum([segment.size for segment in self.segments], out=self.bases[1:])
+        self.size = int(self.bases[-1])
+
+    @staticmethod
+    def exists(path) -> bool:
+        """Check whether a directory holds a segmented index with data."""
+        return bool(read_manifest(path)['segments'])
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def attribute_names(self) -> Tuple[str, ...]:
+        return self.segments[0].attribute_names if self.segments else ()
+
+    def has_attribute(self, name: str) -> bool:
+        """Check whether a positional attribute (or alias) is encoded."""
+        return bool(self.segments) and self.segments[0].has_attribute(name)
+
+    def document_ids(self) -> np.ndarray:
+        """Database IDs of all indexed documents, in corpus order."""
+        if not self.segments:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([segment.document_ids() for segment in self.segments])
+
+    def segment_of(self, positions: np.ndarray) -> np.ndarray:
+        """Segment numbers of global positions."""
+        return np.searchsorted(self.bases, positions, side='right') - 1
+
+    def split(self, positions: np.ndarray) -> Iterator[Tuple[CorpusIndex, int, np.ndarray]]:
+        """Split sorted global positions by segment.
+
+        Yields:
+            (segment, base, local positions) for segments with positions
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        cuts = np.searchsorted(positions, self.bases)
+        for n, segment in enumerate(self.segments):
+            if cuts[n + 1] > cuts[n]:
+                yield segment, int(self.bases[n]), positions[cuts[n]:cuts[n + 1]] - self.bases[n]
+
+
+class SegmentStore:
+    """Add, merge and replace the segments of an index directory."""
+
+    def __init__(
+        self,
+        path,
+        merge_factor: int = MERGE_FACTOR,
+        min_segment_tokens: int = MIN_SEGMENT_TOKENS,
+        max_segment_tokens: int = MAX_SEGMENT_TOKENS
+    ):
+        """Initialize store.
+
+        Args:
+            path: Index directory (created on first write)
+            merge_factor: Segments per merge and per tier
+            min_segment_tokens: Size of the lowest tier
+            max_segment_tokens: Segments this large are not merged
+        """
+        self.path = Path(path)
+        self.merge_factor = max(2, merge_factor)
+        self.min_segment_tokens = min_segment_tokens
+        self.max_segment_tokens = max_segment_tokens
+
+    # -- Manifest --------------------------------------------------------
+
+    @contextmanager
+    def _locked(self):
+        """Serialize manifest updates across processes."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        manifest['generation'] = manifest.get('generation', 0) + 1
+        manifest['updated_at'] = datetime.now().isoformat()
+        tmp_path = self.path / f'{MANIFEST}.tmp-{os.getpid()}'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.path / MANIFEST)
+
+    def _new_name(self) -> str:
+        return f'seg-{time.time_ns():x}-{os.getpid()}'
+
+    def segments(self) -> List[Dict[str, Any]]:
+        """Manifest entries of the live segments."""
+        return read_manifest(self.path)['segments']
+
+    # -- Writing ---------------------------------------------------------
+
+    def _build(self, documents: Iterable[Tuple[int, dict, Iterable]], shards: int) -> Optional[Dict[str, Any]]:
+        """Write documents into a new segment directory (not yet live)."""
+        name = self._new_name()
+        builder = IndexBuilder(self.path / SEGMENTS_DIR / name, shards=shards)
+        for document_id, metadata, sentences in documents:
+            builder.add_document(document_id, sentences, metadata)
+        if builder.size == 0:
+            return None
+        builder.finish()
+        build_count_matrices(CorpusIndex(self.path / SEGMENTS_DIR / name))
+        return {'name': name, 'size': builder.size, 'documents': len(builder.document_ids())}
+
+    def add_segment(self, documents: Iterable[Tuple[int, dict, Iterable]], shards: int = 0) -> Optional[str]:
+        """Index documents into a new segment appended to the corpus.
+
+        Args:
+            documents: Iterable of (document_id, metadata, sentences), see IndexBuilder
+            shards: Shards of the new segment (0 = automatic)
+
+        Returns:
+            Segment name, or None if the documents have no tokens
+        """
+        entry = self._build(documents, shards)
+        if entry is None:
+            return None
+        with self._locked():
+            manifest = read_manifest(self.path)
+            manifest['segments'].append(entry)
+            self._write_manifest(manifest)
+        logger.info(f"Index segment added: {entry['name']} ({entry['size']:,} tokens)")
+        return entry['name']
+
+    def delete_documents(self, document_ids: Iterable[int]) -> int:
+        """Tombstone documents in the segments that hold them.
+
+        Only a bitmap per affected segment and the manifest are written;
+        the tokens are dropped at the segment's next merge.
+
+        Args:
+            document_ids: Database IDs of deleted documents
+
+        Returns:
+            Number of documents newly marked as deleted
+        """
+        wanted = np.fromiter((int(d) for d in document_ids), dtype=np.int64)
+        if len(wanted) == 0:
+            return 0
+        deleted = 0
+        with self._locked():
+            manifest = read_manifest(self.path)
+            for entry in manifest['segments']:
+                segment = CorpusIndex(self.path / SEGMENTS_DIR / entry['name'])
+                hits = np.isin(segment.structure('text').values, wanted) & ~segment.deleted
+                if hits.any():
+                    self._write_deletions(entry, segment, segment.deleted | hits)
+                    deleted += int(hits.sum())
+            if deleted:
+                self._write_manifest(manifest)
+        if deleted:
+            logger.info(f"Index tombstones set for {deleted} documents")
+        return deleted
+
+    def _write_deletions(self, entry: Dict[str, Any], segment: CorpusIndex, deleted: np.ndarray):
+        """Replace a segment's tombstone bitmap and update its manifest entry."""
+        path = segment.path / DELETIONS
+        tmp_path = segment.path / f'{DELETIONS}.tmp-{os.getpid()}'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.packbits(deleted))
+        os.replace(tmp_path, path)
+        text = segment.structure('text')
+        lengths = np.asarray(text.ends, dtype=np.int64) - np.asarray(text.starts, dtype=np.int64)
+        entry['deleted'] = int(deleted.sum())
+        entry['deleted_tokens'] = int(lengths[deleted].sum())
+
+    def replace_all(self, documents: Iterable[Tuple[int, dict, Iterable]], shards: int = 0) -> Optional[str]:
+        """Rebuild: index documents into one segment that replaces all others."""
+        entry = self._build(documents, shards)
+        with self._locked():
+            manifest = read_manifest(self.path)
+            self._retire(manifest, [segment['name'] for segment in manifest['segments']])
+            manifest['segments'] = [entry] if entry else []
+            self._write_manifest(manifest)
+        return entry['name'] if entry else None
+
+    # -- Compaction ------------------------------------------------------
+
+    def tier(self, size: int) -> int:
+        """Size tier of a segment."""
+        if size <= self.min_segment_tokens:
+            return 0
+        return int(math.log(size / self.min_segment_tokens, self.merge_factor)) + 1
+
+    def pending_merge(self, segments: List[Dict[str, Any]]) -> Optional[Tuple[int, int]]:
+        """First run of merge_factor adjacent mergeable segments of one tier,
+        else the first segment with PURGE_DELETED_RATIO deleted tokens.
+
+        Returns:
+            (first, end) indexes into segments, or None if no merge is due
+        """
+        run_start = 0
+        for n in range(1, len(segments) + 1):
+            if n == len(segments) or self._run_key(segments[n]) != self._run_key(segments[run_start]):
+                key = self._run_key(segments[run_start])
+                if key is not None and n - run_start >= self.merge_factor:
+                    return run_start, run_start + self.merge_factor
+                run_start = n
+        for n, entry in enumerate(segments):
+            if entry.get('deleted_tokens', 0) >= entry['size'] * PURGE_DELETED_RATIO:
+                return n, n + 1
+        return None
+
+    def _run_key(self, entry: Dict[str, Any]) -> Optional[int]:
+        live_size = entry['size'] - entry.get('deleted_tokens', 0)
+        if live_size >= self.max_segment_tokens:
+            return None
+        return self.tier(live_size)
+
+    def compact(self, max_merges: Optional[int] = None) -> List[str]:
+        """Merge segments until no tier has merge_factor adjacent segments.
+
+        Args:
+            max_merges: Stop after this many merges (None = until done)
+
+        Returns:
+            Names of the merged segments written
+        """
+        self.purge_obsolete()
+        merged = []
+        while max_merges is None or len(merged) < max_merges:
+            segments = self.segments()
+            pending = self.pending_merge(segments)
+            if pending is None:
+                break
+            first, end = pending
+            inputs = [entry['name'] for entry in segments[first:end]]
+            entry, snapshots = self._merge(inputs)
+
+            with self._locked():
+                manifest = read_manifest(self.path)
+                names = [segment['name'] for segment in manifest['segments']]
+                try:
+                    position = names.index(inputs[0])
+                except ValueError:
+                    position = -1
+                if position < 0 or names[position:position + len(inputs)] != inputs:
+                    # Replaced concurrently (e.g. a rebuild); drop our result
+                    if entry is not None:
+                        shutil.rmtree(self.path / SEGMENTS_DIR / entry['name'], ignore_errors=True)
+                    break
+                if entry is not None:
+                    self._carry_deletions(entry, inputs, snapshots)
+                manifest['segments'][position:position + len(inputs)] = [entry] if entry else []
+                self._retire(manifest, inputs)
+                self._write_manifest(manifest)
+
+            if entry is None:
+                logger.info(f"Dropped {len(inputs)} fully deleted index segments")
+                continue
+            logger.info(f"Merged {len(inputs)} index segments into {entry['name']} ({entry['size']:,} tokens)")
+            merged.append(entry['name'])
+        return merged
+
+    def _merge(self, names: List[str]) -> Tuple[Optional[Dict[str, Any]], List[np.ndarray]]:
+        """Write one segment with the live documents of several (in order).
+
+        Returns:
+            (manifest entry or None if nothing is left, tombstones of the
+            inputs as they were merged)
+        """
+        name = self._new_name()
+        builder = IndexBuilder(self.path / SEGMENTS_DIR / name)
+        snapshots = []
+        for segment_name in names:
+            segment = CorpusIndex(self.path / SEGMENTS_DIR / segment_name)
+            snapshots.append(segment.deleted.copy())
+            builder.add_index(segment)
+        if builder.size == 0:
+            return None, snapshots
+        builder.finish()
+        build_count_matrices(CorpusIndex(self.path / SEGMENTS_DIR / name))
+        return {'name': name, 'size': builder.size, 'documents': len(builder.document_ids())}, snapshots
+
+    def _carry_deletions(self, entry: Dict[str, Any], inputs: List[str], snapshots: List[np.ndarray]):
+        """Tombstone in a merged segment the documents deleted while it was written."""
+        late = []
+        offset = 0
+        for segment_name, snapshot in zip(inputs, snapshots):
+            current = CorpusIndex(self.path / SEGMENTS_DIR / segment_name).deleted
+            merged_numbers = offset + np.cumsum(~snapshot) - 1
+            late.append(merged_numbers[current & ~snapshot])
+            offset += int((~snapshot).sum())
+        late = np.concatenate(late)
+        if len(late):
+            segment = CorpusIndex(self.path / SEGMENTS_DIR / entry['name'])
+            deleted = segment.deleted.copy()
+            deleted[late] = True
+            self._write_deletions(entry, segment, deleted)
+
+    def _retire(self, manifest: Dict[str, Any], names: List[str]):
+        """Mark segments for deletion after the grace period."""
+        now = time.time()
+        manifest.setdefault('obsolete', []).extend({'name': name, 'since': now} for name in names)
+
+    def purge_obsolete(self, grace_seconds: float = OBSOLETE_GRACE_SECONDS):
+        """Delete merged-away segments older than the grace period."""
+        with self._locked():
+            manifest = read_manifest(self.path)
+            obsolete = manifest.get('obsolete', [])
+            cutoff = time.time() - grace_seconds
+            expired = [entry for entry in obsolete if entry['since'] < cutoff]
+            if not expired:
+                return
+            manifest['obsolete'] = [entry for entry in obsolete if entry['since'] >= cutoff]
+            self._write_manifest(manifest)
+        for entry in expired:
+            shutil.rmtree(self.path / SEGMENTS_DIR / entry['name'], ignore_errors=True)
@@ -0,0 +1,296 @@
+"""Document similarity from weighted, normalized sparse term vectors.
+
+Documents are rows of the document x term count matrix (see
+dispersion.py), weighted by TF-IDF or PPMI and L2-normalized, so the
+dot product of two rows is their cosine similarity:
+
+=======  ===========================================================
+tfidf    (1 + ln tf) * ln(N / df), N documents, df documents with the term
+ppmi     max(0, ln(tf * T / (size * f))), T corpus tokens, f corpus frequency
+=======  ===========================================================
+
+Terms occurring in every document get an IDF of 0 and are dropped, which
+keeps the vectors (and the products) small.
+
+Similarities are sparse x sparse products against the term -> document
+transpose: for a block of query rows the postings of their terms are
+gathered with one fancy-indexing step, multiplied by the query weights
+and summed per (query, document) with one bincount; terms spread over
+most documents are multiplied as dense blocks instead. Blocks are sized
+so the gathered products and the dense result stay below PRODUCT_BLOCK
+values.
+
+Example:
+    >>> vectors = DocumentVectors.from_counter(DispersionCounter(NgramCounter(index)))
+    >>> vectors.most_similar(document_id=42, k=10)
+    [(57, 0.83), (12, 0.79), ...]
+    >>> vectors.compare([[1, 2, 3], [4], [5, 6]])     # 3 x 3 cosine matrix
+"""
+import logging
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .bitmap import Bitmap
+
+logger = logging.getLogger(__name__)
+
+WEIGHTINGS = ('tfidf', 'ppmi')
+
+# Products (and dense result cells) per block of a similarity product
+PRODUCT_BLOCK = 1 << 23
+
+# Terms in more than this share of the documents are multiplied densely
+DENSE_SHARE = 1 / 16
+
+
+def csr(rows: np.ndarray, columns: np.ndarray, values: np.ndarray, row_count: int):
+    """CSR arrays (indptr, indices, data) of entries, sorted by row then column."""
+    order = np.lexsort((columns, rows))
+    indptr = np.searchsorted(rows[order], np.arange(row_count + 1)).astype(np.int64)
+    return indptr, columns[order].astype(np.int64), values[order].astype(np.float32)
+
+
+def normalize(rows: np.ndarray, values: np.ndarray, row_count: int) -> np.ndarray:
+    """Scale the entries of every row to unit L2 norm."""
+    norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=row_count))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(norms[rows] > 0, values / norms[rows], 0.0)
+
+
+def sparse_product(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    data: np.ndarray,
+    postings: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    column_count: int,
+    block: int = PRODUCT_BLOCK
+) -> np.ndarray:
+    """Dense (query rows x documents) product of CSR query rows with a term -> document CSR.
+
+    Terms in more than DENSE_SHARE of the documents would dominate the
+    gathered products; they are multiplied as dense blocks (BLAS) instead.
+
+    Args:
+        indptr, indices, data: CSR query rows over term IDs
+        postings: (offsets, documents, weights) of the term -> document transpose
+        column_count: Number of documents
+        block: Budget of gathered products and result cells per block
+
+    Returns:
+        float32 array of shape (query rows, documents)
+    """
+    offsets, documents, weights = postings
+    row_count = len(indptr) - 1
+    result = np.zeros((row_count, column_count), dtype=np.float32)
+    frequency = np.diff(offsets)
+    dense_terms = np.flatnonzero(frequency > column_count * DENSE_SHARE)
+    dense_terms = dense_terms[np.argsort(-frequency[dense_terms], kind='stable')][:block // max(column_count, 1)]
+    slots = np.full(len(frequency), -1, dtype=np.int64)
+    slots[dense_terms] = np.arange(len(dense_terms))
+    dense = np.zeros((len(dense_terms), column_count), dtype=np.float32)
+    spans = frequency[dense_terms]
+    gathered = np.repeat(offsets[dense_terms] - np.cumsum(spans) + spans, spans) + np.arange(int(spans.sum()))
+    dense[np.repeat(np.arange(len(dense_terms)), spans), documents[gathered]] = weights[gathered]
+
+    entry_slots = slots[indices]
+    lengths = np.where(entry_slots < 0, frequency[indices], 0)
+    work = (
+        np.concatenate([[0], np.cumsum(lengths)])[indptr]
+        + np.arange(row_count + 1) * (column_count + len(dense_terms))
+    )
+
+    first = 0
+    while first < row_count:
+        last = max(int(np.searchsorted(work, work[first] + block, side='right')) - 1, first + 1)
+        entries = slice(indptr[first], indptr[last])
+        query_rows = np.repeat(np.arange(last - first), np.diff(indptr[first:last + 1]))
+        counts = lengths[entries]
+        total = int(counts.sum())
+        if total:
+            starts = offsets[indices[entries]]
+            gathered = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+            cells = np.repeat(query_rows, counts) * column_count + documents[gathered]
+            products = np.repeat(data[entries].astype(np.float64), counts) * weights[gathered]
+            result[first:last] = np.bincount(
+                cells, weights=products, minlength=(last - first) * column_count
+            ).reshape(last - first, column_count)
+        in_dense = entry_slots[entries] >= 0
+        if in_dense.any():
+            queries = np.zeros((last - first, len(dense_terms)), dtype=np.float32)
+            queries[query_rows[in_dense], entry_slots[entries][in_dense]] = data[entries][in_dense]
+            result[first:last] += queries @ dense
+        first = last
+    return result
+
+
+class DocumentVectors:
+    """Normalized TF-IDF or PPMI vectors of the documents of a corpus."""
+
+    def __init__(
+        self,
+        document_ids: np.ndarray,
+        rows: np.ndarray,
+        columns: np.ndarray,
+        counts: np.ndarray,
+        sizes: np.ndarray,
+        column_count: int,
+        weighting: str = 'tfidf'
+    ):
+        """Weigh and normalize document x term counts.
+
+        Args:
+            document_ids: Database ID per row
+            rows: Row per entry (one entry per row and term)
+            columns: Term ID per entry
+            counts: Count per entry
+            sizes: Tokens per row
+            column_count: Number of term IDs
+            weighting: One of WEIGHTINGS
+
+        Raises:
+            ValueError: If the weighting is unknown
+        """
+        if weighting not in WEIGHTINGS:
+            raise ValueError(f"Unknown weighting: {weighting}. Use one of {', '.join(WEIGHTINGS)}")
+        self.document_ids = np.asarray(document_ids, dtype=np.int64)
+        self.weighting = weighting
+        self.column_count = column_count
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+        self.document_frequency = np.bincount(columns, minlength=column_count)
+        self.frequency = np.bincount(columns, weights=counts, minlength=column_count)
+        self.tokens = int(self.sizes.sum())
+        # Raw counts stay available for subcorpus (centroid) vectors
+        self.counts = csr(rows, columns, np.asarray(counts, dtype=np.float64), len(self.document_ids))
+
+        values = normalize(rows, self.weigh(columns, counts, self.sizes[rows]), len(self.document_ids))
+        kept = values > 0
+        self.vectors = csr(rows[kept], columns[kept], values[kept], len(self.document_ids))
+        order = np.lexsort((rows[kept], columns[kept]))
+        self.postings = (
+            np.searchsorted(columns[kept][order], np.arange(column_count + 1)).astype(np.int64),
+            rows[kept][order].astype(np.int64),
+            values[kept][order],
+        )
+        self._rows = {int(d): i for i, d in enumerate(self.document_ids.tolist())}
+
+    @classmethod
+    def from_counter(
+        cls,
+        counter,
+        attribute: str = 'lemma',
+        weighting: str = 'tfidf',
+        lowercase: bool = True
+    ) -> 'DocumentVectors':
+        """Vectors of all live documents of an index.
+
+        Args:
+            counter: DispersionCounter of the index
+            attribute: 'form' or 'lemma'
+            weighting: One of WEIGHTINGS
+            lowercase: Merge case variants
+        """
+        values, _ = counter.counter.lexicon(attribute, lowercase)
+        ids, rows, columns, counts, sizes = counter.entries(attribute, None, lowercase)
+        return cls(ids, rows, columns, counts, sizes, len(values), weighting)
+
+    def __len__(self) -> int:
+        return len(self.document_ids)
+
+    def weigh(self, columns: np.ndarray, counts: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+        """Weights of (term, count) entries of rows with the given token counts."""
+        counts = np.asarray(counts, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if self.weighting == 'ppmi':
+                pmi = np.log(counts * self.tokens / (np.asarray(sizes, dtype=np.float64) * self.frequency[columns]))
+                return np.nan_to_num(np.maximum(pmi, 0), nan=0.0, posinf=0.0)
+            idf = np.log(max(len(self.document_ids), 1) / self.document_frequency[columns])
+            return np.where(counts > 0, (1 + np.log(np.maximum(counts, 1))) * np.nan_to_num(idf, posinf=0.0), 0.0)
+
+    def rows_of(self, document_ids: Iterable[int]) -> np.ndarray:
+        """Rows of documents (documents without a vector are skipped)."""
+        return np.array([self._rows[d] for d in map(int, document_ids) if d in self._rows], dtype=np.int64)
+
+    def group_vectors(self, groups: Sequence[Iterable[int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Normalized CSR vectors of document groups from their summed counts.
+
+        A group of one document gets exactly that document's vector.
+        """
+        indptr, indices, data = self.counts
+        rows, columns, counts, sizes = [], [], [], []
+        for n, group in enumerate(groups):
+            members = self.rows_of(group.to_array() if isinstance(group, Bitmap) else group)
+            spans = [np.arange(indptr[m], indptr[m + 1]) for m in members.tolist()]
+            entries = np.concatenate(spans) if spans else np.zeros(0, dtype=np.int64)
+            terms, inverse = np.unique(indices[entries], return_inverse=True)
+            rows.append(np.full(len(terms), n, dtype=np.int64))
+            columns.append(terms)
+            counts.append(np.bincount(inverse.ravel(), weights=data[entries], minlength=len(terms)))
+            sizes.append(self.sizes[members].sum())
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        columns = np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64)
+        counts = np.concatenate(counts) if counts else np.zeros(0)
+        sizes = np.array(sizes, dtype=np.int64)
+        values = normalize(rows, self.weigh(columns, counts, sizes[rows]), len(groups))
+        kept = values > 0
+        return csr(rows[kept], columns[kept], values[kept], len(groups))
+
+    def similarities(self, queries: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> np.ndarray:
+        """Cosine similarity of normalized CSR query vectors with every document."""
+        return sparse_product(*queries, self.postings, len(self.document_ids))
+
+    def most_similar(
+        self,
+        document_id: Optional[int] = None,
+        document_ids: Optional[Iterable[int]] = None,
+        k: int = 10,
+        candidates: Optional[Iterable[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """Documents most similar to a document or to a subcorpus.
+
+        Args:
+            document_id: Query document
+            document_ids: Query subcorpus (IDs or Bitmap), compared by its summed counts
+            k: Number of documents to return
+            candidates: Only rank these documents (IDs or Bitmap; default all)
+
+        Returns:
+            List of (document ID, cosine similarity), most similar first;
+            the query documents themselves are left out
+        """
+        query = [document_id] if document_id is not None else document_ids
+        if isinstance(query, Bitmap):
+            query = query.to_array().tolist()
+        query = list(query or [])
+        scores = self.similarities(self.group_vectors([query]))[0]
+        eligible = np.ones(len(scores), dtype=bool)
+        eligible[self.rows_of(query)] = False
+        if candidates is not None:
+            allowed = np.zeros(len(scores), dtype=bool)
+            allowed[self.rows_of(candidates.to_array() if isinstance(candidates, Bitmap) else candidates)] = True
+            eligible &= allowed
+        selected = np.flatnonzero(eligible & (scores > 0))
+        if len(selected) > k:
+            selected = selected[np.argpartition(-scores[selected], k - 1)[:k]]
+        order = selected[np.lexsort((self.document_ids[selected], -scores[selected]))]
+        return [(int(self.document_ids[i]), round(float(scores[i]), 4)) for i in order.tolist()]
+
+    def compare(self, groups: Sequence[Iterable[int]]) -> np.ndarray:
+        """N x N cosine similarity matrix of documents or document groups.
+
+        Args:
+            groups: One entry per compared item: document IDs (or a Bitmap)
+                whose counts are summed
+
+        Returns:
+            float array of shape (N, N)
+        """
+        indptr, indices, data = self.group_vectors(groups)
+        count = len(groups)
+        order = np.lexsort((np.repeat(np.arange(count), np.diff(indptr)), indices))
+        transpose = (
+            np.searchsorted(indices[order], np.arange(self.column_count + 1)).astype(np.int64),
+            np.repeat(np.arange(count), np.diff(indptr))[order],
+            data[order],
+        )
+        return np.clip(sparse_product(indptr, indices, data, transpose, count), 0, 1).astype(np.float64)
@@ -0,0 +1,410 @@
+"""Streaming, mergeable sketches for approximate corpus overviews.
+
+Imports feed tokens sentence by sentence into a CorpusSketch; the tokens
+are buffered and hashed in vectorized batches, so one pass with bounded
+memory gives:
+
+==============  ===========================================================
+HyperLogLog     distinct forms and lemmas (HLL_PRECISION bits: 4096
+                registers, ~1.6% standard error)
+Count-Min       frequency estimates of any form, lemma, bigram or trigram
+                (CMS_DEPTH x CMS_WIDTH counters, overestimates only)
+Space-Saving    the TOP_CAPACITY heaviest forms, lemmas, bigrams and
+                trigrams with guaranteed error bounds
+==============  ===========================================================
+
+All three are mergeable (register max, counter sum, summary merge), so
+per-document sketches combine into corpus or subcorpus overviews without
+touching the tokens. Strings are hashed with a fixed 64-bit hash over
+their code points (not Python's salted ``hash``), so sketches written by
+different processes merge correctly. Top-k words and n-grams skip PUNCT;
+n-grams do not cross sentences or punctuation.
+
+Example:
+    >>> sketch = CorpusSketch()
+    >>> for forms, lemmas, tags in sentences:
+    ...     sketch.add_sentence(forms, lemmas, tags)
+    >>> sketch.flush()
+    >>> data = sketch.to_dict()                    # JSON-serializable
+    >>> CorpusSketch.merged([data, other]).overview(top=20)
+"""
+import base64
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# HyperLogLog registers: 2 ** HLL_PRECISION
+HLL_PRECISION = 12
+
+# Count-Min rows and counters per row (power of two)
+CMS_DEPTH = 4
+CMS_WIDTH = 1024
+
+# Items kept by each Space-Saving summary
+TOP_CAPACITY = 200
+
+# Tokens buffered before a vectorized update
+FLUSH_TOKENS = 1 << 16
+
+# Counted attributes: (name, n-gram length)
+SKETCH_KEYS = (('form', 1), ('lemma', 1), ('bigram', 2), ('trigram', 3))
+
+_FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+_FNV_PRIME = np.uint64(0x100000001B3)
+_COMBINE = np.uint64(0x9E3779B97F4A7C15)
+_ROW_SEEDS = np.array([0x243F6A8885A308D3, 0x13198A2E03707344, 0xA4093822299F31D0, 0x082EFA98EC4E6C89,
+                       0x452821E638D01377, 0xBE5466CF34E90C6C, 0xC0AC29B7C97C50DD, 0x3F84D5B5B5470917],
+                      dtype=np.uint64)
+
+
+def mix64(values: np.ndarray) -> np.ndarray:
+    """SplitMix64 finalizer: spread the bits of 64-bit values."""
+    with np.errstate(over='ignore'):
+        values = np.asarray(values, dtype=np.uint64)
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return values ^ (values >> np.uint64(31))
+
+
+def hash_strings(values: Sequence[str]) -> np.ndarray:
+    """Stable 64-bit hashes of strings (FNV-1a over code points, then mixed).
+
+    Vectorized over the batch: one pass per character column of the
+    fixed-width array; padding is skipped, so a string hashes the same
+    in every batch.
+    """
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    array = np.ascontiguousarray(np.asarray(values, dtype=str))
+    width = array.dtype.itemsize // 4
+    hashes = np.full(len(array), _FNV_OFFSET, dtype=np.uint64)
+    if width:
+        codes = array.view(np.uint32).reshape(len(array), width)
+        with np.errstate(over='ignore'):
+            for column in range(width):
+                code = codes[:, column]
+                hashes = np.where(code != 0, (hashes ^ code.astype(np.uint64)) * _FNV_PRIME, hashes)
+    return mix64(hashes)
+
+
+def combine_hashes(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Hash of a sequence from the hashes of its prefix and next element."""
+    with np.errstate(over='ignore'):
+        return mix64(first * _COMBINE + second)
+
+
+def sequence_hashes(values: Sequence[str], n: int) -> np.ndarray:
+    """Hashes of space-separated n-grams, as computed while counting (0 if not n words)."""
+    if n == 1:
+        return hash_strings(values)
+    parts = [value.split(' ') for value in values]
+    valid = np.array([len(words) == n for words in parts], dtype=bool)
+    parts = [words if len(words) == n else [''] * n for words in parts]
+    hashes = hash_strings([words[0] for words in parts])
+    for j in range(1, n):
+        hashes = combine_hashes(hashes, hash_strings([words[j] for words in parts]))
+    return np.where(valid, hashes, np.uint64(0))
+
+
+def _pack(array: np.ndarray) -> str:
+    return base64.b64encode(zlib.compress(np.ascontiguousarray(array).tobytes())).decode('ascii')
+
+
+def _unpack(text: str, dtype) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(base64.b64decode(text)), dtype=dtype).copy()
+
+
+class HyperLogLog:
+    """Cardinality estimate from 2 ** precision rank registers."""
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[np.ndarray] = None):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, hashes: np.ndarray):
+        """Add hashed items."""
+        if len(hashes) == 0:
+            return
+        bits = 64 - self.precision
+        index = (hashes >> np.uint64(bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << bits) - 1)
+        high = (rest >> np.uint64(32)).astype(np.float64)
+        low = (rest & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        length = np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+        rank = (bits - length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: 'HyperLogLog'):
+        """Add the items of another sketch of the same precision."""
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> float:
+        """Estimated number of distinct items."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return float(estimate)
+
+
+class CountMinSketch:
+    """Frequency estimates (never below the true count) in depth x width counters."""
+
+    def __init__(self, depth: int = CMS_DEPTH, width: int = CMS_WIDTH, table: Optional[np.ndarray] = None):
+        self.depth = depth
+        self.width = width
+        self.table = table if table is not None else np.zeros((depth, width), dtype=np.int64)
+
+    def _columns(self, hashes: np.ndarray) -> np.ndarray:
+        return (mix64(hashes[None, :] ^ _ROW_SEEDS[:self.depth, None]) & np.uint64(self.width - 1)).astype(np.int64)
+
+    def add(self, hashes: np.ndarray, counts: Optional[np.ndarray] = None):
+        """Add hashed items (with multiplicities)."""
+        if len(hashes) == 0:
+            return
+        for row, columns in enumerate(self._columns(hashes)):
+            self.table[row] += np.bincount(columns, weights=counts, minlength=self.width).astype(np.int64)
+
+    def query(self, hashes: np.ndarray) -> np.ndarray:
+        """Estimated counts of hashed items."""
+        if len(hashes) == 0:
+            return np.zeros(0, dtype=np.int64)
+        columns = self._columns(hashes)
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def merge(self, other: 'CountMinSketch'):
+        """Add the counts of another sketch of the same shape."""
+        self.table += other.table
+
+
+class SpaceSaving:
+    """The heaviest items of a stream with count and overestimation bound.
+
+    Batches are reduced to exact counts first and folded in with the
+    mergeable-summary rule: an item missing from a full summary is
+    credited with that summary's smallest count (its error bound).
+    """
+
+    def __init__(self, capacity: int = TOP_CAPACITY):
+        self.capacity = capacity
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.errors = np.zeros(0, dtype=np.int64)
+        self.items: Dict[int, str] = {}
+
+    def floor(self) -> int:
+        """Count credited to items not in the summary."""
+        return int(self.counts.min()) if len(self.keys) >= self.capacity else 0
+
+    def add(self, hashes: np.ndarray, label: Callable[[int], str]):
+        """Add hashed items; label(i) gives the item at batch index i."""
+        if len(hashes) == 0:
+            return
+        keys, first, counts = np.unique(hashes, return_index=True, return_counts=True)
+        floor = 0
+        if len(keys) > self.capacity:
+            order = np.argsort(-counts, kind='stable')
+            floor = int(counts[order[self.capacity]])
+            keep = np.sort(order[:self.capacity])
+            keys, first, counts = keys[keep], first[keep], counts[keep]
+        items = {int(key): index for key, index in zip(keys.tolist(), first.tolist())}
+        self._merge(keys, counts, np.zeros(len(keys), dtype=np.int64), floor, lambda key: label(items[key]))
+
+    def merge(self, other: 'SpaceSaving'):
+        """Add the items of another summary."""
+        self._merge(other.keys, other.counts, other.errors, other.floor(), other.items.__getitem__)
+
+    def _merge(self, keys: np.ndarray, counts: np.ndarray, errors: np.ndarray, floor: int,
+               label: Callable[[int], str]):
+        own_floor = self.floor()
+        union = np.union1d(self.keys, keys)
+        total = np.full(len(union), own_floor + floor, dtype=np.int64)
+        error = total.copy()
+        mine = np.searchsorted(union, self.keys)
+        theirs = np.searchsorted(union, keys)
+        total[mine] += self.counts - own_floor
+        error[mine] += self.errors - own_floor
+        total[theirs] += counts - floor
+        error[theirs] += errors - floor
+        order = np.lexsort((union, -total))[:self.capacity]
+        kept = union[order]
+        items = {}
+        for key in kept.tolist():
+            items[key] = self.items[key] if key in self.items else label(key)
+        self.keys, self.counts, self.errors, self.items = kept, total[order], error[order], items
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """(item, count, maximum overestimation), heaviest first."""
+        order = np.lexsort((self.keys, -self.counts))[:n]
+        return [
+            (self.items[int(self.keys[i])], int(self.counts[i]), int(self.errors[i]))
+            for i in order.tolist()
+        ]
+
+
+class CorpusSketch:
+    """Token/sentence counts, type cardinalities and heavy hitters of a document or corpus."""
+
+    def __init__(self):
+        self.tokens = 0
+        self.sentences = 0
+        self.types = {'form': HyperLogLog(), 'lemma': HyperLogLog()}
+        self.frequencies = {name: CountMinSketch() for name, _ in SKETCH_KEYS}
+        self.top = {name: SpaceSaving() for name, _ in SKETCH_KEYS}
+        self._buffer: Dict[str, list] = {'form': [], 'lemma': [], 'skip': [], 'sentence': []}
+
+    def add_sentence(self, forms: Sequence[str], lemmas: Sequence[str], tags: Optional[Sequence[str]] = None):
+        """Add one sentence (values are lowercased; empty lemmas are not counted).
+
+        Args:
+            forms: Word forms
+            lemmas: Lemmas, aligned with forms
+            tags: UPOS tags; PUNCT tokens are left out of top-k and n-grams
+        """
+        buffer = self._buffer
+        buffer['form'].extend(form.lower() for form in forms)
+        buffer['lemma'].extend((lemma or '').lower() for lemma in lemmas)
+        buffer['skip'].extend(tag == 'PUNCT' for tag in (tags if tags is not None else [''] * len(forms)))
+        buffer['sentence'].extend([self.sentences] * len(forms))
+        self.sentences += 1
+        if len(buffer['form']) >= FLUSH_TOKENS:
+            self.flush()
+
+    def flush(self):
+        """Fold the buffered tokens into the sketches."""
+        buffer = self._buffer
+        forms, lemmas = buffer['form'], buffer['lemma']
+        if not forms:
+            return
+        skip = np.array(buffer['skip'], dtype=bool)
+        sentence = np.array(buffer['sentence'], dtype=np.int64)
+        form_hashes = hash_strings(forms)
+        lemma_hashes = hash_strings(lemmas)
+        has_lemma = np.array([bool(lemma) for lemma in lemmas], dtype=bool)
+        self.tokens += len(forms)
+        self.types['form'].add(form_hashes)
+        self.types['lemma'].add(lemma_hashes[has_lemma])
+
+        words = np.flatnonzero(~skip)
+        self.frequencies['form'].add(form_hashes[words])
+        self.top['form'].add(form_hashes[words], lambda i: forms[words[i]])
+        with_lemma = words[has_lemma[words]]
+        self.frequencies['lemma'].add(lemma_hashes[with_lemma])
+        self.top['lemma'].add(lemma_hashes[with_lemma], lambda i: lemmas[with_lemma[i]])
+
+        for name, n in SKETCH_KEYS:
+            if n == 1 or len(forms) < n:
+                continue
+            starts = np.arange(len(forms) - n + 1)
+            valid = ~skip[starts]
+            hashes = form_hashes[starts]
+            for j in range(1, n):
+                valid &= ~skip[starts + j] & (sentence[starts + j] == sentence[starts])
+                hashes = combine_hashes(hashes, form_hashes[starts + j])
+            starts, hashes = starts[valid], hashes[valid]
+            self.frequencies[name].add(hashes)
+            self.top[name].add(hashes, lambda i, n=n, starts=starts: ' '.join(forms[starts[i]:starts[i] + n]))
+
+        self._buffer = {'form': [], 'lemma': [], 'skip': [], 'sentence': []}
+
+    def merge(self, other: 'CorpusSketch'):
+        """Add another (flushed) sketch."""
+        self.tokens += other.tokens
+        self.sentences += other.sentences
+        for name, sketch in self.types.items():
+            sketch.merge(other.types[name])
+        for name, sketch in self.frequencies.items():
+            sketch.merge(other.frequencies[name])
+        for name, summary in self.top.items():
+            summary.merge(other.top[name])
+
+    @classmethod
+    def merged(cls, sketches: Iterable) -> 'CorpusSketch':
+        """Merge sketches or their to_dict() forms into one."""
+        result = cls()
+        for sketch in sketches:
+            if isinstance(sketch, dict):
+                if not sketch:
+                    continue
+                sketch = cls.from_dict(sketch)
+            result.merge(sketch)
+        return result
+
+    def estimate(self, name: str, values: Sequence[str]) -> List[int]:
+        """Estimated frequencies of forms, lemmas or n-grams (space-separated forms)."""
+        hashes = sequence_hashes([value.lower() for value in values], dict(SKETCH_KEYS)[name])
+        return self.frequencies[name].query(hashes).tolist()
+
+    def overview(self, top: int = 20) -> dict:
+        """Approximate summary: sizes, type counts and heaviest items.
+
+        Top-k counts are the smaller of the Space-Saving and Count-Min
+        estimates (both only overestimate).
+        """
+        result = {
+            'tokens': self.tokens,
+            'sentences': self.sentences,
+            'unique_forms': int(round(self.types['form'].estimate())),
+            'unique_lemmas': int(round(self.types['lemma'].estimate())),
+        }
+        for name, _ in SKETCH_KEYS:
+            summary = self.top[name]
+            estimates = np.minimum(summary.counts, self.frequencies[name].query(summary.keys))
+            order = np.lexsort((summary.keys, -estimates))[:top]
+            result[f'top_{name}s'] = [
+                {
+                    'value': summary.items[int(summary.keys[i])],
+                    'frequency': int(estimates[i]),
+                    'max_error': int(summary.errors[i]),
+                }
+                for i in order.tolist()
+            ]
+        return result
+
+    def to_dict(self) -> dict:
+        """JSON-serializable form (flushes first)."""
+        self.flush()
+        frequencies = {}
+        for name, sketch in self.frequencies.items():
+            dtype = np.uint32 if sketch.table.max(initial=0) < 2 ** 32 else np.int64
+            frequencies[name] = {'dtype': np.dtype(dtype).name, 'table': _pack(sketch.table.astype(dtype))}
+        return {
+            'version': 1,
+            'tokens': self.tokens,
+            'sentences': self.sentences,
+            'types': {name: _pack(sketch.registers) for name, sketch in self.types.items()},
+            'frequencies': frequencies,
+            'top': {
+                name: [[summary.items[int(k)], int(c), int(e)] for k, c, e in zip(
+                    summary.keys, summary.counts, summary.errors
+                )]
+                for name, summary in self.top.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CorpusSketch':
+        """Rebuild a sketch written by to_dict()."""
+        sketch = cls()
+        sketch.tokens = int(data.get('tokens', 0))
+        sketch.sentences = int(data.get('sentences', 0))
+        for name, packed in data.get('types', {}).items():
+            sketch.types[name] = HyperLogLog(registers=_unpack(packed, np.uint8))
+        for name, packed in data.get('frequencies', {}).items():
+            table = _unpack(packed['table'], np.dtype(packed['dtype'])).astype(np.int64)
+            sketch.frequencies[name] = CountMinSketch(table=table.reshape(CMS_DEPTH, CMS_WIDTH))
+        for name, rows in data.get('top', {}).items():
+            summary = SpaceSaving()
+            labels = [row[0] for row in rows]
+            if rows:
+                hashes = sequence_hashes(labels, dict(SKETCH_KEYS)[name])
+                order = np.argsort(hashes)
+                summary.keys = hashes[order]
+                summary.counts = np.array([row[1] for row in rows], dtype=np.int64)[order]
+                summary.errors = np.array([row[2] for row in rows], dtype=np.int64)[order]
+                summary.items = {int(h): labels[i] for i, h in zip(order.tolist(), summary.keys.tolist())}
+            sketch.top[name] = summary
+        return sketch
@@ -0,0 +1,145 @@
+"""Concordance sorting and sampling over the full hit set.
+
+A sort spec names context positions relative to the hit, most
+significant first: 'L1' is the word before the hit, 'R2+R1' sorts by
+the second word after it and then by the first, 'KWIC' is the hit
+itself. For every level the token ID at that offset is read from the
+attribute stream and replaced by its rank in the collated merged
+lexicon (case-folded unless case_sensitive), so all hits are ordered by
+one ``np.lexsort`` over small integer columns and no context string is
+built before the page is cut. Offsets outside the hit's sentence get
+rank -1 and sort first, like an empty context; ties keep corpus order.
+
+sample_hits draws a seeded uniform sample (sorted random indices), so
+only the sampled hits get their context read.
+
+Example:
+    >>> sorter = ConcordanceSorter(index, FrequencyCounter(index))
+    >>> ordered = sorter.sort(executor.positions('lemma', 'ev'), 'R2+R1')
+    >>> page = ordered[100:200]
+    >>> sample_hits(executor.positions('lemma', 'ev'), 500, seed=42)
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Furthest context offset a sort level may use
+MAX_SORT_OFFSET = 9
+
+_LEVEL = re.compile(r'^(?:(L|R)([1-9])|KWIC|NODE)$')
+
+
+def parse_sort(spec: str) -> List[int]:
+    """Context offsets of a sort spec ('L1', 'R2+R1', 'KWIC'), most significant first.
+
+    Raises:
+        ValueError: If a level is not L1-L9, R1-R9 or KWIC
+    """
+    offsets = []
+    for level in spec.upper().replace(' ', '').split('+'):
+        match = _LEVEL.match(level)
+        if match is None:
+            raise ValueError(f"Invalid sort level: {level!r}. Use L1-L{MAX_SORT_OFFSET}, R1-R{MAX_SORT_OFFSET} or KWIC")
+        side, distance = match.groups()
+        offsets.append(0 if side is None else (-int(distance) if side == 'L' else int(distance)))
+    return offsets
+
+
+def sample_hits(hits: np.ndarray, size: int, seed: Optional[int] = None) -> np.ndarray:
+    """Uniform sample of hits without replacement, in their original order.
+
+    The same hits, size and seed always give the same sample.
+    """
+    hits = np.asarray(hits)
+    if size >= len(hits):
+        return hits
+    chosen = np.random.default_rng(seed).choice(len(hits), size=size, replace=False)
+    return hits[np.sort(chosen)]
+
+
+def collation_ranks(values: np.ndarray, case_sensitive: bool = False) -> np.ndarray:
+    """Rank of every value of a sorted lexicon in sort order.
+
+    Case variants share a rank unless case_sensitive, so the next sort
+    level decides between them.
+    """
+    if case_sensitive or len(values) == 0:
+        return np.arange(len(values), dtype=np.int64)
+    return np.unique(np.char.lower(values), return_inverse=True)[1].astype(np.int64).ravel()
+
+
+class ConcordanceSorter:
+    """Sort hit positions of a CorpusIndex or SegmentedIndex by their context."""
+
+    def __init__(self, index, counter):
+        """Initialize sorter.
+
+        Args:
+            index: Opened CorpusIndex or SegmentedIndex
+            counter: FrequencyCounter of the index (merged lexicons)
+        """
+        self.index = index
+        self.counter = counter
+        self.segments = counter.segments
+        self.bases = np.asarray(getattr(index, 'bases', [0, index.size]), dtype=np.int64)
+        # (attribute, case_sensitive) -> per-segment lexicon ID -> rank
+        self._ranks: Dict[Tuple[str, bool], List[np.ndarray]] = {}
+
+    def ranks(self, attribute: str, case_sensitive: bool = False) -> List[np.ndarray]:
+        """Per-segment arrays mapping lexicon IDs to collated ranks."""
+        key = (attribute, case_sensitive)
+        if key not in self._ranks:
+            merged, maps = self.counter.lexicon(attribute)
+            ranks = collation_ranks(merged, case_sensitive)
+            self._ranks[key] = [ranks[ids] for ids in maps]
+        return self._ranks[key]
+
+    def keys(
+        self,
+        positions: np.ndarray,
+        offsets: List[int],
+        attribute: str = 'form',
+        case_sensitive: bool = False
+    ) -> List[np.ndarray]:
+        """Rank columns of sorted global positions, one per offset (-1 outside the sentence)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        columns = [np.full(len(positions), -1, dtype=np.int64) for _ in offsets]
+        ranks = self.ranks(attribute, case_sensitive)
+        cuts = np.searchsorted(positions, self.bases)
+        for n, segment in enumerate(self.segments):
+            first, last = int(cuts[n]), int(cuts[n + 1])
+            if last == first:
+                continue
+            local = positions[first:last] - self.bases[n]
+            stream = segment.attribute(attribute).stream
+            _, starts, ends = segment.structure('s').bounds(local)
+            for column, offset in zip(columns, offsets):
+                target = local + offset
+                inside = np.flatnonzero((target >= starts) & (target < ends))
+                column[first + inside] = ranks[n][np.asarray(stream[target[inside]], dtype=np.int64)]
+        return columns
+
+    def order(
+        self,
+        positions: np.ndarray,
+        spec: str,
+        attribute: str = 'form',
+        case_sensitive: bool = False
+    ) -> np.ndarray:
+        """Permutation of sorted global positions that orders them by a sort spec."""
+        columns = self.keys(positions, parse_sort(spec), attribute, case_sensitive)
+        if not len(positions):
+            return np.zeros(0, dtype=np.int64)
+        return np.lexsort(tuple(reversed(columns)))
+
+    def sort(
+        self,
+        positions: np.ndarray,
+        spec: str,
+        attribute: str = 'form',
+        case_sensitive: bool = False
+    ) -> np.ndarray:
+        """Positions ordered by a sort spec."""
+        positions = np.asarray(positions, dtype=np.int64)
+        return positions[self.order(positions, spec, attribute, case_sensitive)]
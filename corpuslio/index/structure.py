@@ -0,0 +1,140 @@
+"""Structural attributes: non-overlapping regions over corpus positions.
+
+A structure (``text`` for documents, ``p`` for paragraphs, ``s`` for
+sentences) is stored as:
+
+- ``<name>.starts.npy``  int32 first position of each region (sorted)
+- ``<name>.ends.npy``    int32 end position of each region (exclusive)
+- ``<name>.values.npy``  int64 database ID of each region (number for ``p``)
+
+Regions may carry string attributes (CWB's ``s_id``, ``text_author``...),
+stored per attribute as a sorted lexicon plus one lexicon ID per region:
+
+- ``<name>_<attr>.lexicon``
+- ``<name>_<attr>.ids.npy``  int32
+
+Region lookup is a binary search over the sorted starts, for one
+position (``find``) or vectorized over many (``find_all``).
+"""
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .lexicon import Lexicon
+
+
+class StructuralAttribute:
+    """Sorted region boundaries with binary-search lookup."""
+
+    def __init__(self, path: Path, name: str, attributes: Sequence[str] = ()):
+        """Open structure files.
+
+        Args:
+            path: Index directory
+            name: Structure name (e.g. 'text', 'p', 's')
+            attributes: Names of the region attributes stored for this structure
+        """
+        self.path = Path(path)
+        self.name = name
+        self.attribute_names = tuple(attributes)
+        self.starts = np.load(self.path / f'{name}.starts.npy', mmap_mode='r')
+        self.ends = np.load(self.path / f'{name}.ends.npy', mmap_mode='r')
+        self.values = np.load(self.path / f'{name}.values.npy', mmap_mode='r')
+        # attribute -> (lexicon values, lexicon ID per region)
+        self._attributes: Dict[str, Tuple[List[str], np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def find(self, position: int) -> int:
+        """Get the region number containing a position.
+
+        Returns:
+            Region number or -1 if the position lies outside every region
+        """
+        n = int(np.searchsorted(self.starts, position, side='right')) - 1
+        if n >= 0 and position < self.ends[n]:
+            return n
+        return -1
+
+    def find_all(self, positions: np.ndarray) -> np.ndarray:
+        """Get region numbers for many positions.
+
+        Returns:
+            int64 array aligned with positions (-1 outside every region)
+        """
+        positions = np.asarray(positions)
+        regions = np.searchsorted(self.starts, positions, side='right').astype(np.int64) - 1
+        inside = regions >= 0
+        inside[inside] = positions[inside] < self.ends[regions[inside]]
+        regions[~inside] = -1
+        return regions
+
+    def region(self, n: int) -> Tuple[int, int]:
+        """Get (start, end) of region n."""
+        return int(self.starts[n]), int(self.ends[n])
+
+    def bounds(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get the enclosing region of many positions.
+
+        Positions outside every region get the empty region (p, p).
+
+        Returns:
+            Tuple of (region numbers, starts, ends) arrays aligned with positions
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        regions = self.find_all(positions)
+        inside = regions >= 0
+        starts = positions.copy()
+        ends = positions.copy()
+        starts[inside] = self.starts[regions[inside]]
+        ends[inside] = self.ends[regions[inside]]
+        return regions, starts, ends
+
+    def has_attribute(self, attr: str) -> bool:
+        """Check whether regions carry a string attribute."""
+        return attr in self.attribute_names
+
+    def _attribute(self, attr: str) -> Tuple[List[str], np.ndarray]:
+        if attr not in self._attributes:
+            if attr not in self.attribute_names:
+                raise KeyError(f"Structural attribute not in index: {self.name}_{attr}")
+            self._attributes[attr] = (
+                Lexicon.read_values(self.path / f'{self.name}_{attr}.lexicon'),
+                np.load(self.path / f'{self.name}_{attr}.ids.npy', mmap_mode='r'),
+            )
+        return self._attributes[attr]
+
+    def attribute_value(self, n: int, attr: str) -> str:
+        """Get a string attribute of region n (e.g. 's_id')."""
+        values, ids = self._attribute(attr)
+        return values[ids[n]]
+
+    def attribute_values(self, regions: np.ndarray, attr: str) -> List[str]:
+        """Get a string attribute for many region numbers ('' for -1)."""
+        values, ids = self._attribute(attr)
+        regions = np.asarray(regions, dtype=np.int64)
+        if len(ids) == 0:
+            return [''] * len(regions)
+        lex_ids = np.where(regions >= 0, np.asarray(ids)[np.maximum(regions, 0)], -1)
+        return [values[i] if i >= 0 else '' for i in lex_ids.tolist()]
+
+
+def in_regions(positions: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Boolean mask of positions that fall inside any of the given regions.
+
+    Args:
+        positions: Corpus positions
+        starts: Sorted region starts
+        ends: Region ends (exclusive), aligned with starts
+
+    Returns:
+        Boolean array aligned with positions
+    """
+    if len(starts) == 0:
+        return np.zeros(len(positions), dtype=bool)
+    n = np.searchsorted(starts, positions, side='right') - 1
+    inside = n >= 0
+    inside[inside] = positions[inside] < ends[n[inside]]
+    return inside
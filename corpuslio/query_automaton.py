@@ -0,0 +1,226 @@
+"""Automaton execution of CQP query patterns.
+
+A QueryPattern AST is compiled (Thompson construction) to an NFA whose
+transitions are labelled with token constraints. Tokens are presented to
+the automaton as bitmasks: bit k is set when the token satisfies
+constraint k. The NFA is determinized lazily, one (state set, bitmask)
+transition at a time, so each token of a match is consumed in O(1).
+
+Example:
+    >>> automaton = PatternAutomaton(parse_cqp_query('[pos="ADJ"]+ [pos="NOUN"]'))
+    >>> masks = automaton.token_masks(tokens)
+    >>> automaton.longest_match(masks, 0, len(masks))
+"""
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from .query_parser import (
+    AlternationNode,
+    Node,
+    QueryPattern,
+    RepeatNode,
+    SequenceNode,
+    TokenConstraint,
+    TokenNode,
+)
+
+# Constraints are bits of a 64-bit mask
+MAX_CONSTRAINTS = 63
+
+
+class PatternAutomaton:
+    """NFA over token constraints with a lazily built DFA."""
+
+    def __init__(self, pattern: QueryPattern):
+        """Compile a query pattern.
+
+        Args:
+            pattern: Parsed QueryPattern
+
+        Raises:
+            ValueError: If the pattern has more than MAX_CONSTRAINTS constraints
+        """
+        self.constraints: List[TokenConstraint] = list(pattern.constraints)
+        if len(self.constraints) > MAX_CONSTRAINTS:
+            raise ValueError(f"Query too complex (more than {MAX_CONSTRAINTS} token patterns)")
+        self._constraint_ids = {id(c): i for i, c in enumerate(self.constraints)}
+
+        self._epsilon: List[List[int]] = []
+        self._edges: List[List[Tuple[int, int]]] = []
+        ast = pattern.ast if pattern.ast is not None else SequenceNode(
+            [TokenNode(c) for c in pattern.constraints]
+        )
+        self.start, self.accept = self._build(ast)
+
+        # Lazy DFA: state sets are numbered in order of discovery
+        self._dfa_states: List[FrozenSet[int]] = []
+        self._dfa_ids: Dict[FrozenSet[int], int] = {}
+        self._dfa_accepting: List[bool] = []
+        self._transitions: Dict[Tuple[int, int], int] = {}
+        self.dfa_start = self._dfa_state(self._closure([self.start]))
+
+        self.first_mask = 0
+        for state in self._dfa_states[self.dfa_start]:
+            for constraint_id, _ in self._edges[state]:
+                self.first_mask |= 1 << constraint_id
+
+    # -- NFA construction ------------------------------------------------
+
+    def _new_state(self) -> int:
+        self._epsilon.append([])
+        self._edges.append([])
+        return len(self._edges) - 1
+
+    def _build(self, node: Node) -> Tuple[int, int]:
+        """Build the fragment for a node; returns (entry, exit) states."""
+        if isinstance(node, TokenNode):
+            entry, exit_ = self._new_state(), self._new_state()
+            self._edges[entry].append((self._constraint_ids[id(node.constraint)], exit_))
+            return entry, exit_
+
+        if isinstance(node, SequenceNode):
+            entry = exit_ = self._new_state()
+            for item in node.items:
+                item_entry, item_exit = self._build(item)
+                self._epsilon[exit_].append(item_entry)
+                exit_ = item_exit
+            return entry, exit_
+
+        if isinstance(node, AlternationNode):
+            entry, exit_ = self._new_state(), self._new_state()
+            for option in node.options:
+                option_entry, option_exit = self._build(option)
+                self._epsilon[entry].append(option_entry)
+                self._epsilon[option_exit].append(exit_)
+            return entry, exit_
+
+        if isinstance(node, RepeatNode):
+            entry = exit_ = self._new_state()
+            for _ in range(node.min_count):
+                item_entry, item_exit = self._build(node.item)
+                self._epsilon[exit_].append(item_entry)
+                exit_ = item_exit
+
+            end = self._new_state()
+            if node.max_count is None:
+                # Kleene star: loop back over the item
+                item_entry, item_exit = self._build(node.item)
+                self._epsilon[exit_].append(item_entry)
+                self._epsilon[item_exit].append(exit_)
+                self._epsilon[exit_].append(end)
+            else:
+                # Optional copies, each may skip to the end
+                for _ in range(node.max_count - node.min_count):
+                    self._epsilon[exit_].append(end)
+                    item_entry, item_exit = self._build(node.item)
+                    self._epsilon[exit_].append(item_entry)
+                    exit_ = item_exit
+                self._epsilon[exit_].append(end)
+            return entry, end
+
+        raise TypeError(f"Unknown query node: {type(node).__name__}")
+
+    def _closure(self, states) -> FrozenSet[int]:
+        stack = list(states)
+        seen = set(stack)
+        while stack:
+            for target in self._epsilon[stack.pop()]:
+                if target not in seen:
+                    seen.add(target)
+                    stack.append(target)
+        return frozenset(seen)
+
+    def _dfa_state(self, states: FrozenSet[int]) -> int:
+        dfa_id = self._dfa_ids.get(states)
+        if dfa_id is None:
+            dfa_id = self._dfa_ids[states] = len(self._dfa_states)
+            self._dfa_states.append(states)
+            self._dfa_accepting.append(self.accept in states)
+        return dfa_id
+
+    # -- Execution -------------------------------------------------------
+
+    @property
+    def dfa_state_count(self) -> int:
+        """DFA states built so far."""
+        return len(self._dfa_states)
+
+    @property
+    def dead_state(self) -> int:
+        """DFA state of the empty state set."""
+        return self._dfa_state(frozenset())
+
+    def step(self, dfa_id: int, mask: int) -> int:
+        """DFA transition on a token with the given constraint bitmask."""
+        key = (dfa_id, mask)
+        target = self._transitions.get(key)
+        if target is None:
+            moved = [
+                target_state
+                for state in self._dfa_states[dfa_id]
+                for constraint_id, target_state in self._edges[state]
+                if mask >> constraint_id & 1
+            ]
+            target = self._transitions[key] = self._dfa_state(self._closure(moved))
+        return target
+
+    def longest_match(self, masks: Sequence[int], start: int, end: int) -> int:
+        """Longest non-empty match starting at ``start`` and ending before ``end``.
+
+        Args:
+            masks: Constraint bitmask per token
+            start: Match start
+            end: Matches may not extend past this position (e.g. sentence end)
+
+        Returns:
+            End (exclusive) of the longest match, or -1 if none
+        """
+        dead = self.dead_state
+        accepting = self._dfa_accepting
+        state = self.dfa_start
+        last = -1
+        position = start
+        while position < end:
+            state = self.step(state, masks[position])
+            if state == dead:
+                break
+            position += 1
+            if accepting[state]:
+                last = position
+        return last
+
+    def token_masks(self, tokens: List[Dict[str, Any]]) -> List[int]:
+        """Constraint bitmasks for token dicts ('word', 'lemma', 'pos').
+
+        Constraints are evaluated once per distinct (word, lemma, pos).
+        """
+        masks_by_type: Dict[Tuple[str, str, str], int] = {}
+        masks = []
+        for token in tokens:
+            key = (token.get('word', ''), token.get('lemma', ''), token.get('pos', ''))
+            mask = masks_by_type.get(key)
+            if mask is None:
+                token_view = {'word': key[0], 'lemma': key[1], 'pos': key[2]}
+                mask = 0
+                for i, constraint in enumerate(self.constraints):
+                    if constraint.matches(token_view):
+                        mask |= 1 << i
+                masks_by_type[key] = mask
+            masks.append(mask)
+        return masks
+
+
+def required_constraints(node: Optional[Node]) -> List[TokenConstraint]:
+    """Constraints that every match must contain at least once.
+
+    Used to seed execution from the rarest mandatory token instead of
+    trying every corpus position.
+    """
+    if node is None:
+        return []
+    if isinstance(node, TokenNode):
+        return [node.constraint]
+    if isinstance(node, SequenceNode):
+        return [c for item in node.items for c in required_constraints(item)]
+    if isinstance(node, RepeatNode) and node.min_count > 0:
+        return required_constraints(node.item)
+    return []
@@ -6,12 +6,22 @@ Supports:
 - [pos="TAG"] - POS tag matching
 - [word="pattern" & pos="TAG"] - multiple conditions
 - [pos="ADJ"] [pos="NOUN"] - sequence patterns
+- [pos!="PUNCT"] - negated conditions
+- [] - any token
+- ?, *, +, {n}, {n,m}, {n,} - repetition (e.g. []{0,3} for gaps)
+- ([pos="ADJ"] | [pos="NUM"]) - alternation and grouping
 - Regex support in patterns
+
+Queries are parsed into an AST (TokenNode, SequenceNode, AlternationNode,
+RepeatNode); patterns with repetition or alternation are compiled to an
+automaton (see query_automaton.py).
 """
 
 import re
-from typing import List, Dict, Any, Optional, Tuple
-from dataclasses import dataclass
+from typing import List, Dict, Any, Iterator, Optional, Set, Tuple, Union
+from dataclasses import dataclass, field
+
+from .concordance import ConcordanceLine, ConcordanceLines, TokenBatch, batched, iter_lines
 
 
 @dataclass
@@ -22,6 +32,12 @@ class TokenConstraint:
     pos_pattern: Optional[str] = None
     is_regex: bool = True  # By default, patterns are treated as regex
     case_sensitive: bool = False
+    # Attributes compared with != instead of =
+    negated: Set[str] = field(default_factory=set)
+    # Match results per (pattern, value): each distinct type is evaluated once
+    _type_cache: Dict[Tuple[str, str], bool] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
     
     def matches(self, token: Dict[str, Any]) -> bool:
         """Check if a token matches all constraints.
@@ -32,29 +48,36 @@ class TokenConstraint:
         Returns:
             True if token matches all active constraints
         """
-        # Word pattern matching
-        if self.word_pattern:
-            word = token.get('word', '')
-            if not self._match_pattern(word, self.word_pattern):
-                return False
-        
-        # Lemma pattern matching
-        if self.lemma_pattern:
-            lemma = token.get('lemma', '')
-            if not self._match_pattern(lemma, self.lemma_pattern):
-                return False
-        
-        # POS pattern matching
-        if self.pos_pattern:
-            pos = token.get('pos', '')
-            if not self._match_pattern(pos, self.pos_pattern):
+        for attr, pattern in self.patterns():
+            matched = self._match_pattern(token.get(attr, ''), pattern)
+            if matched == (attr in self.negated):
                 return False
         
         return True
     
+    def patterns(self) -> List[Tuple[str, str]]:
+        """Active (attribute, pattern) pairs, attribute in 'word', 'lemma', 'pos'."""
+        pairs = [
+            ('word', self.word_pattern),
+            ('lemma', self.lemma_pattern),
+            ('pos', self.pos_pattern),
+        ]
+        return [(attr, pattern) for attr, pattern in pairs if pattern]
+    
+    def matching_types(self, pattern: str, values: List[str]) -> List[int]:
+        """Indices of the distinct values (e.g. a lexicon) that match pattern.
+        
+        Same semantics as matching token by token, but the pattern is run
+        once per type.
+        """
+        return [i for i, value in enumerate(values) if value and self._evaluate_pattern(value, pattern)]
+    
     def _match_pattern(self, value: str, pattern: str) -> bool:
         """Match a value against a pattern.
         
+        Results are cached per distinct value, so a regex runs once per
+        type of the vocabulary rather than once per token.
+        
         Args:
             value: Token attribute value
             pattern: Pattern to match (regex or literal)
@@ -65,6 +88,14 @@ class TokenConstraint:
         if not value:
             return False
         
+        key = (pattern, value)
+        result = self._type_cache.get(key)
+        if result is None:
+            result = self._type_cache[key] = self._evaluate_pattern(value, pattern)
+        return result
+    
+    def _evaluate_pattern(self, value: str, pattern: str) -> bool:
+        """Match a single type against a pattern (uncached)."""
         flags = 0 if self.case_sensitive else re.IGNORECASE
         
         if self.is_regex:
@@ -85,13 +116,63 @@ class TokenConstraint:
                 return pattern.lower() == value.lower()
 
 
+@dataclass
+class TokenNode:
+    """AST leaf: one token matching a constraint."""
+    constraint: TokenConstraint
+
+
+@dataclass
+class SequenceNode:
+    """AST node: items matched one after another."""
+    items: List['Node']
+
+
+@dataclass
+class AlternationNode:
+    """AST node: any one of the options."""
+    options: List['Node']
+
+
+@dataclass
+class RepeatNode:
+    """AST node: item repeated min_count..max_count times (None = unbounded)."""
+    item: 'Node'
+    min_count: int
+    max_count: Optional[int]
+
+
+Node = Union[TokenNode, SequenceNode, AlternationNode, RepeatNode]
+
+
 @dataclass
 class QueryPattern:
-    """Represents a complete query pattern (sequence of token constraints)."""
+    """Represents a complete query pattern.
+    
+    ``constraints`` lists the token constraints in query order. For plain
+    sequences (no repetition or alternation) constraint k matches the k-th
+    token of a match; otherwise ``ast`` describes the structure.
+    """
     constraints: List[TokenConstraint]
+    ast: Optional[Node] = None
+    # Structure a match may not cross ('s', 'p', 'text'); None = engine default
+    within: Optional[str] = None
     
     def __len__(self):
         return len(self.constraints)
+    
+    @property
+    def is_fixed_length(self) -> bool:
+        """True for plain token sequences (every match has len(constraints) tokens)."""
+        if self.ast is None:
+            return True
+        return isinstance(self.ast, SequenceNode) and all(
+            isinstance(item, TokenNode) for item in self.ast.items
+        )
+
+
+class CQPQueryParseError(ValueError):
+    """Raised internally on invalid query syntax (reported via last_error)."""
 
 
 class CQPQueryParser:
@@ -103,7 +184,21 @@ class CQPQueryParser:
     - [pos="NOUN"] - POS tag match
     - [word="test.*"] - regex word match
     - [word="test" & pos="NOUN"] - multiple constraints
+    - [pos!="PUNCT"] - negated constraint
     - [pos="ADJ"] [pos="NOUN"] - sequence pattern
+    - [] - any token
+    - [pos="ADJ"]+ [pos="NOUN"] - repetition: ?, *, +, {n}, {n,m}, {n,}
+    - [lemma="ev"] []{0,3} [pos="VERB"] - gap of up to 3 tokens
+    - ([pos="ADJ"] | [pos="NUM"]) [pos="NOUN"] - alternation
+    - [pos="ADJ"] []* [pos="NOUN"] within p - matches may not cross a paragraph
+    
+    Grammar:
+        query      := alternation ('within' structure)?
+        alternation:= sequence ('|' sequence)*
+        sequence   := item+
+        item       := ('[' conditions? ']' | '(' alternation ')') quantifier?
+        conditions := attr ('=' | '!=') "value" ('&' attr ('=' | '!=') "value")*
+                      (each attr at most once per token)
     
     Examples:
         >>> parser = CQPQueryParser()
@@ -111,19 +206,29 @@ class CQPQueryParser:
         >>> print(len(pattern.constraints))  # 2
     """
     
-    # Regex to match a single token pattern: [attribute="value" & ...]
-    TOKEN_PATTERN = re.compile(
-        r'\[([^\]]+)\]'
-    )
+    ATTRIBUTES = ('word', 'lemma', 'pos')
     
-    # Regex to match attribute="value" pairs
-    ATTR_PATTERN = re.compile(
-        r'(word|lemma|pos)\s*=\s*"([^"]+)"'
-    )
+    # Structures for "within" (sentence, paragraph, document)
+    STRUCTURES = ('s', 'p', 'text')
+    
+    # Upper bound for {n,m} repetition counts
+    MAX_REPEAT = 50
+    
+    # Query tokens: strings, operators, names and {n,m} quantifiers
+    LEXER = re.compile(r"""
+        \s*(?:
+            (?P<string>"[^"]*")
+          | (?P<repeat>\{\s*\d+\s*(?:,\s*\d*\s*)?\})
+          | (?P<op>!=|[\[\]()|&=?*+])
+          | (?P<name>\w+)
+        )
+    """, re.VERBOSE)
     
     def __init__(self):
         """Initialize CQP query parser."""
         self.last_error = None
+        self._tokens: List[Tuple[str, str]] = []
+        self._pos = 0
     
     def parse(self, query: str) -> Optional[QueryPattern]:
         """Parse a CQP-style query into a QueryPattern.
@@ -139,6 +244,7 @@ class CQPQueryParser:
             >>> pattern = parser.parse('[word="test"]')
             >>> pattern = parser.parse('[pos="ADJ"] [pos="NOUN"]')
             >>> pattern = parser.parse('[word="run.*" & pos="VERB"]')
+            >>> pattern = parser.parse('[lemma="ev"] []{0,3} [pos="VERB"]')
         """
         self.last_error = None
         
@@ -146,52 +252,162 @@ class CQPQueryParser:
             self.last_error = "Empty query"
             return None
         
-        # Find all token patterns
-        token_matches = self.TOKEN_PATTERN.findall(query)
-        
-        if not token_matches:
-            self.last_error = "No valid token patterns found. Use format: [attribute=\"value\"]"
+        try:
+            self._tokens = self._tokenize(query)
+            self._pos = 0
+            if not any(kind == 'op' and value == '[' for kind, value in self._tokens):
+                raise CQPQueryParseError(
+                    "No valid token patterns found. Use format: [attribute=\"value\"]"
+                )
+            ast = self._parse_alternation()
+            within = self._parse_within()
+            if self._pos < len(self._tokens):
+                raise CQPQueryParseError(f"Unexpected '{self._tokens[self._pos][1]}'")
+        except CQPQueryParseError as e:
+            self.last_error = str(e)
             return None
         
-        constraints = []
-        
-        for token_str in token_matches:
-            constraint = self._parse_token_constraint(token_str)
-            if constraint is None:
-                # Error already set in _parse_token_constraint
-                return None
-            constraints.append(constraint)
-        
-        return QueryPattern(constraints=constraints)
+        constraints = self._collect_constraints(ast)
+        if isinstance(ast, TokenNode):
+            ast = SequenceNode([ast])
+        return QueryPattern(constraints=constraints, ast=ast, within=within)
     
-    def _parse_token_constraint(self, token_str: str) -> Optional[TokenConstraint]:
-        """Parse a single token constraint string.
+    def _tokenize(self, query: str) -> List[Tuple[str, str]]:
+        tokens = []
+        pos = 0
+        query = query.rstrip()
+        while pos < len(query):
+            match = self.LEXER.match(query, pos)
+            if not match or match.end() == pos:
+                raise CQPQueryParseError(f"Invalid character at position {pos}: '{query[pos]}'")
+            kind = match.lastgroup
+            tokens.append((kind, match.group(kind)))
+            pos = match.end()
+        return tokens
+    
+    def _peek(self) -> Optional[str]:
+        if self._pos < len(self._tokens) and self._tokens[self._pos][0] == 'op':
+            return self._tokens[self._pos][1]
+        return None
+    
+    def _next(self, kind: str, value: Optional[str] = None) -> str:
+        if self._pos >= len(self._tokens):
+            raise CQPQueryParseError("Unexpected end of query")
+        token_kind, token_value = self._tokens[self._pos]
+        if token_kind != kind or (value is not None and token_value != value):
+            raise CQPQueryParseError(f"Expected {value or kind}, found '{token_value}'")
+        self._pos += 1
+        return token_value
+    
+    def _parse_alternation(self) -> Node:
+        options = [self._parse_sequence()]
+        while self._peek() == '|':
+            self._pos += 1
+            options.append(self._parse_sequence())
+        return options[0] if len(options) == 1 else AlternationNode(options)
+    
+    def _parse_within(self) -> Optional[str]:
+        if self._pos >= len(self._tokens) or self._tokens[self._pos] != ('name', 'within'):
+            return None
+        self._pos += 1
+        structure = self._next('name')
+        if structure not in self.STRUCTURES:
+            raise CQPQueryParseError(
+                f"Unknown structure '{structure}' after within (use: {', '.join(self.STRUCTURES)})"
+            )
+        return structure
+    
+    def _parse_sequence(self) -> Node:
+        items = []
+        while self._peek() in ('[', '('):
+            items.append(self._parse_item())
+        if not items:
+            raise CQPQueryParseError("Expected token pattern [...] or group (...)")
+        return items[0] if len(items) == 1 else SequenceNode(items)
+    
+    def _parse_item(self) -> Node:
+        if self._peek() == '(':
+            self._pos += 1
+            node = self._parse_alternation()
+            self._next('op', ')')
+        else:
+            self._pos += 1
+            node = TokenNode(self._parse_token_constraint())
+        return self._parse_quantifier(node)
+    
+    def _parse_quantifier(self, node: Node) -> Node:
+        if self._pos >= len(self._tokens):
+            return node
+        kind, value = self._tokens[self._pos]
+        if kind == 'op' and value in ('?', '*', '+'):
+            self._pos += 1
+            bounds = {'?': (0, 1), '*': (0, None), '+': (1, None)}[value]
+            return RepeatNode(node, *bounds)
+        if kind == 'repeat':
+            self._pos += 1
+            parts = value.strip('{} ').split(',')
+            min_count = int(parts[0])
+            if len(parts) == 1:
+                max_count = min_count
+            else:
+                max_count = int(parts[1]) if parts[1].strip() else None
+            if max_count is not None and max_count < min_count:
+                raise CQPQueryParseError(f"Invalid repetition {value}")
+            if max(min_count, max_count or 0) > self.MAX_REPEAT:
+                raise CQPQueryParseError(f"Repetition limit is {self.MAX_REPEAT}")
+            return RepeatNode(node, min_count, max_count)
+        return node
+    
+    def _parse_token_constraint(self) -> TokenConstraint:
+        """Parse the conditions of a token pattern (after '[') up to ']'.
         
-        Args:
-            token_str: Content between brackets, e.g., 'word="test" & pos="NOUN"'
-            
         Returns:
-            TokenConstraint object or None if invalid
+            TokenConstraint (without patterns for [], which matches any token)
         """
-        # Find all attribute="value" pairs
-        attr_matches = self.ATTR_PATTERN.findall(token_str)
-        
-        if not attr_matches:
-            self.last_error = f"No valid attributes found in [{token_str}]"
-            return None
-        
         constraint = TokenConstraint()
+        seen = set()
+
+        while self._peek() != ']':
+            if seen:
+                if self._peek() != '&':
+                    raise CQPQueryParseError("Expected & or ] between conditions")
+                self._pos += 1
+            if self._pos >= len(self._tokens) or self._tokens[self._pos][0] != 'name':
+                raise CQPQueryParseError("Expected attribute name")
+            attr = self._next('name')
+            if attr not in self.ATTRIBUTES:
+                raise CQPQueryParseError(
+                    f"Unknown attribute '{attr}' (use {', '.join(self.ATTRIBUTES)})"
+                )
+            if attr in seen:
+                raise CQPQueryParseError(
+                    f"Attribute '{attr}' is used twice in one token (combine values with |)"
+                )
+            seen.add(attr)
+            operator = self._peek()
+            if operator not in ('=', '!='):
+                raise CQPQueryParseError(f"Expected = or != after {attr}")
+            self._pos += 1
+            value = self._next('string')[1:-1]
+            if not value:
+                raise CQPQueryParseError(f"Empty value for {attr}")
+            
+            setattr(constraint, f'{attr}_pattern', value)
+            if operator == '!=':
+                constraint.negated.add(attr)
         
-        for attr, value in attr_matches:
-            if attr == 'word':
-                constraint.word_pattern = value
-            elif attr == 'lemma':
-                constraint.lemma_pattern = value
-            elif attr == 'pos':
-                constraint.pos_pattern = value
-        
+        self._pos += 1
         return constraint
     
+    def _collect_constraints(self, node: Node) -> List[TokenConstraint]:
+        """Token constraints of an AST in query order."""
+        if isinstance(node, TokenNode):
+            return [node.constraint]
+        if isinstance(node, RepeatNode):
+            return self._collect_constraints(node.item)
+        children = node.items if isinstance(node, SequenceNode) else node.options
+        return [c for child in children for c in self._collect_constraints(child)]
+    
     def validate_query(self, query: str) -> Tuple[bool, Optional[str]]:
         """Validate a CQP query without parsing.
         
@@ -227,21 +443,33 @@ class CQPQueryParser:
         
         attributes_used = set()
         for constraint in pattern.constraints:
-            if constraint.word_pattern:
-                attributes_used.add('word')
-            if constraint.lemma_pattern:
-                attributes_used.add('lemma')
-            if constraint.pos_pattern:
-                attributes_used.add('pos')
+            for attr, _ in constraint.patterns():
+                attributes_used.add(attr)
         
         return {
             'valid': True,
             'token_count': len(pattern.constraints),
             'attributes_used': sorted(attributes_used),
-            'is_sequence': len(pattern.constraints) > 1
+            'is_sequence': len(pattern.constraints) > 1,
+            'is_fixed_length': pattern.is_fixed_length,
+            'within': pattern.within
         }
 
 
+class PatternMatchBatch(TokenBatch):
+    """Pattern matches in a token list with their context token lists."""
+    
+    fields = {
+        'position': lambda batch, row: int(batch.starts[row]),
+        'left_context': lambda batch, row: batch.left(row),
+        'match': lambda batch, row: batch.match(row),
+        'right_context': lambda batch, row: batch.right(row),
+        'left_context_text': lambda batch, row: batch.words(batch.left(row)),
+        'match_text': lambda batch, row: batch.words(batch.match(row)),
+        'right_context_text': lambda batch, row: batch.words(batch.right(row)),
+    }
+
+
 class PatternMatcher:
     """Pattern matching engine for corpus queries.
     
@@ -257,7 +485,7 @@ class PatternMatcher:
         pattern: QueryPattern,
         tokens: List[Dict[str, Any]],
         context_size: int = 5
-    ) -> List[Dict[str, Any]]:
+    ) -> ConcordanceLines:
         """Find all matches of pattern in token sequence.
         
         Args:
@@ -266,25 +494,126 @@ class PatternMatcher:
             context_size: Number of tokens before/after match for context
             
         Returns:
-            List of match dictionaries with context
+            Sequence of matches with context (see iter_matches)
+        """
+        return ConcordanceLines(self._match_batches(pattern, tokens, context_size))
+    
+    def iter_matches(
+        self,
+        pattern: QueryPattern,
+        tokens: List[Dict[str, Any]],
+        context_size: int = 5
+    ) -> Iterator[ConcordanceLine]:
+        """Stream matches of pattern in token sequence.
+        
+        Match spans are found first; each match is a lazy mapping with the
+        keys of _extract_match, holding only its window bounds in tokens.
+        Extra keys (e.g. 'document') can be assigned.
+        """
+        return iter_lines(self._match_batches(pattern, tokens, context_size))
+    
+    def _match_batches(
+        self,
+        pattern: QueryPattern,
+        tokens: List[Dict[str, Any]],
+        context_size: int
+    ) -> Iterator[PatternMatchBatch]:
+        """Batches of match spans, found as the batches are consumed."""
+        if pattern.is_fixed_length:
+            pattern_len = len(pattern.constraints)
+            spans = ((i, i + pattern_len) for i in self.match_positions(pattern, tokens))
+        else:
+            spans = self.match_spans(pattern, tokens)
+        
+        for chunk in batched(spans):
+            starts, ends = zip(*chunk)
+            yield PatternMatchBatch(tokens, starts, ends, context_size)
+    
+    def match_spans(
+        self,
+        pattern: QueryPattern,
+        tokens: List[Dict[str, Any]]
+    ) -> List[Tuple[int, int]]:
+        """Find matches of any pattern (repetition, alternation, negation).
+        
+        Runs the compiled automaton from every position where the pattern
+        can start and keeps the longest match per start position.
+        
+        Args:
+            pattern: QueryPattern to match
+            tokens: List of token dictionaries
+            
+        Returns:
+            List of (start, end) spans, end exclusive
+        """
+        from .query_automaton import PatternAutomaton
+        
+        automaton = PatternAutomaton(pattern)
+        masks = automaton.token_masks(tokens)
+        
+        spans = []
+        for start, mask in enumerate(masks):
+            if not mask & automaton.first_mask:
+                continue
+            end = automaton.longest_match(masks, start, len(masks))
+            if end > 0:
+                spans.append((start, end))
+        return spans
+    
+    def match_positions(
+        self,
+        pattern: QueryPattern,
+        tokens: List[Dict[str, Any]]
+    ) -> List[int]:
+        """Find start positions of all matches by positional join.
+        
+        Each constraint is resolved to the set of positions it matches
+        (evaluated once per distinct word/lemma/pos combination). The
+        rarest constraint is the anchor; its positions shifted by the
+        constraint offset are the candidate starts, which are then checked
+        against the position sets of the other constraints at their offsets.
+        
+        Args:
+            pattern: QueryPattern to match
+            tokens: List of token dictionaries
+            
+        Returns:
+            Sorted match start positions
         """
-        matches = []
         pattern_len = len(pattern.constraints)
+        if pattern_len == 0 or len(tokens) < pattern_len:
+            return []
         
-        # Slide window over tokens
-        for i in range(len(tokens) - pattern_len + 1):
-            # Check if pattern matches starting at position i
-            if self._matches_at_position(pattern, tokens, i):
-                # Extract match with context
-                match = self._extract_match(
-                    tokens=tokens,
-                    start_pos=i,
-                    pattern_len=pattern_len,
-                    context_size=context_size
-                )
-                matches.append(match)
+        # Distinct (word, lemma, pos) combinations -> positions
+        types: Dict[Tuple[str, str, str], List[int]] = {}
+        for i, token in enumerate(tokens):
+            key = (token.get('word', ''), token.get('lemma', ''), token.get('pos', ''))
+            types.setdefault(key, []).append(i)
         
-        return matches
+        position_sets = []
+        for constraint in pattern.constraints:
+            positions = set()
+            for (word, lemma, pos), type_positions in types.items():
+                if constraint.matches({'word': word, 'lemma': lemma, 'pos': pos}):
+                    positions.update(type_positions)
+            position_sets.append(positions)
+        
+        anchor = min(range(pattern_len), key=lambda k: len(position_sets[k]))
+        others = sorted(
+            (k for k in range(pattern_len) if k != anchor),
+            key=lambda k: len(position_sets[k])
+        )
+        
+        starts = []
+        last_start = len(tokens) - pattern_len
+        for position in sorted(position_sets[anchor]):
+            start = position - anchor
+            if start < 0 or start > last_start:
+                continue
+            if all(start + k in position_sets[k] for k in others):
+                starts.append(start)
+        
+        return starts
     
     def _matches_at_position(
         self,
@@ -321,7 +650,7 @@ class PatternMatcher:
         start_pos: int,
         pattern_len: int,
         context_size: int
-    ) -> Dict[str, Any]:
+    ) -> ConcordanceLine:
         """Extract match with context.
         
         Args:
@@ -331,26 +660,9 @@ class PatternMatcher:
             context_size: Context window size
             
         Returns:
-            Match dictionary with left_context, match, right_context
+            Match mapping with left_context, match, right_context
         """
-        # Calculate context boundaries
-        left_start = max(0, start_pos - context_size)
-        right_end = min(len(tokens), start_pos + pattern_len + context_size)
-        
-        # Extract contexts and match
-        left_context = tokens[left_start:start_pos]
-        match_tokens = tokens[start_pos:start_pos + pattern_len]
-        right_context = tokens[start_pos + pattern_len:right_end]
-        
-        return {
-            'position': start_pos,
-            'left_context': left_context,
-            'match': match_tokens,
-            'right_context': right_context,
-            'left_context_text': ' '.join(t.get('word', '') for t in left_context),
-            'match_text': ' '.join(t.get('word', '') for t in match_tokens),
-            'right_context_text': ' '.join(t.get('word', '') for t in right_context)
-        }
+        return next(PatternMatchBatch(tokens, [start_pos], [start_pos + pattern_len], context_size).lines())
 
 
 # Convenience functions
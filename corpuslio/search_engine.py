@@ -8,12 +8,110 @@ Provides:
 """
 import re
 import unicodedata
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Callable, Iterator, Optional
 import logging
 
+from .concordance import ConcordanceBatch, ConcordanceLine, ConcordanceLines, TokenBatch, batched, iter_lines
+
 logger = logging.getLogger(__name__)
 
 
+class AnalysisKWICBatch(TokenBatch):
+    """Concordance lines of matches located in a document's analysis tokens.
+
+    Lemma, POS and confidence come from the match when it has them,
+    else from the token.
+    """
+
+    def __init__(self, tokens: List[Dict[str, Any]], positions: List[int], matches: List[Dict[str, Any]], context_size: int):
+        super().__init__(tokens, positions, [p + 1 for p in positions], context_size)
+        self.matches = matches
+
+    def center(self, row: int) -> Dict[str, Any]:
+        return self.tokens[int(self.starts[row])]
+
+    def annotation(self, row: int, key: str, default: Any) -> Any:
+        return self.matches[row].get(key, self.center(row).get(key, default))
+
+    fields = {
+        # legacy keys
+        'left': lambda batch, row: batch.words(batch.left(row)),
+        'center': lambda batch, row: batch.center(row).get('word', ''),
+        'right': lambda batch, row: batch.words(batch.right(row)),
+        # template-friendly keys
+        'left_context': lambda batch, row: batch.words(batch.left(row)),
+        'keyword': lambda batch, row: batch.center(row).get('word', ''),
+        'right_context': lambda batch, row: batch.words(batch.right(row)),
+        # pair-aware keys
+        'left_pairs': lambda batch, row: batch.pairs(batch.left(row)),
+        'keyword_pair': lambda batch, row: batch.pairs([batch.center(row)])[0],
+        'right_pairs': lambda batch, row: batch.pairs(batch.right(row)),
+        'position': lambda batch, row: int(batch.starts[row]),
+        'lemma': lambda batch, row: batch.annotation(row, 'lemma', ''),
+        'pos': lambda batch, row: batch.annotation(row, 'pos', ''),
+        'confidence': lambda batch, row: batch.annotation(row, 'confidence', 1.0),
+        'warning': lambda batch, row: batch.matches[row].get('warning', ''),
+    }
+
+
+class TextKWICBatch(ConcordanceBatch):
+    """Concordance lines of words matched in a document's cleaned text.
+
+    POS, lemma and confidence are looked up in the analysis (by the
+    search engine's lookup function) only when a line's annotation or
+    pair keys are read.
+    """
+
+    def __init__(
+        self,
+        words: List[str],
+        positions: List[int],
+        context_size: int,
+        lookup: Callable[[str], Dict[str, Any]]
+    ):
+        super().__init__(len(positions))
+        self.words = words
+        self.positions = positions
+        self.context_size = context_size
+        self.lookup = lookup
+        self._keyword_data: Dict[int, Dict[str, Any]] = {}
+
+    def left(self, row: int) -> List[str]:
+        idx = self.positions[row]
+        return self.words[max(0, idx - self.context_size):idx]
+
+    def right(self, row: int) -> List[str]:
+        idx = self.positions[row]
+        return self.words[idx + 1:idx + self.context_size + 1]
+
+    def keyword(self, row: int) -> str:
+        return self.words[self.positions[row]]
+
+    def keyword_data(self, row: int) -> Dict[str, Any]:
+        if row not in self._keyword_data:
+            self._keyword_data[row] = self.lookup(self.keyword(row))
+        return self._keyword_data[row]
+
+    def pairs(self, words: List[str]) -> List[str]:
+        return [f"{w};{self.lookup(w).get('pos', '')}" for w in words]
+
+    fields = {
+        'left_context': lambda batch, row: ' '.join(batch.left(row)),
+        'keyword': lambda batch, row: batch.keyword(row),
+        'right_context': lambda batch, row: ' '.join(batch.right(row)),
+        'left': lambda batch, row: ' '.join(batch.left(row)),
+        'center': lambda batch, row: batch.keyword(row),
+        'right': lambda batch, row: ' '.join(batch.right(row)),
+        'position': lambda batch, row: batch.positions[row],
+        'lemma': lambda batch, row: batch.keyword_data(row).get('lemma', ''),
+        'pos': lambda batch, row: batch.keyword_data(row).get('pos', ''),
+        'confidence': lambda batch, row: batch.keyword_data(row).get('confidence', 1.0),
+        'left_pairs': lambda batch, row: batch.pairs(batch.left(row)),
+        'keyword_pair': lambda batch, row: f"{batch.keyword(row)};{batch.keyword_data(row).get('pos', '')}",
+        'right_pairs': lambda batch, row: batch.pairs(batch.right(row)),
+    }
+
+
 class CorpusSearchEngine:
     """Advanced search engine for linguistic corpus."""
 
@@ -79,6 +177,47 @@ class CorpusSearchEngine:
         s_clean = re.sub(r"[^\w\s]", "", s_norm, flags=re.UNICODE)
         return s_clean.casefold().strip()
 
+    def _type_index(self, analysis: List[Dict[str, Any]], key: str) -> Dict[str, List[int]]:
+        """Group token positions by distinct attribute value.
+
+        Built per call: get_document returns a new analysis each time, so
+        there is nothing to reuse between searches.
+        """
+        types: Dict[str, List[int]] = {}
+        for idx, item in enumerate(analysis):
+            if isinstance(item, dict):
+                types.setdefault(item.get(key, ''), []).append(idx)
+        return types
+
+    def _word_positions(
+        self,
+        analysis: List[Dict[str, Any]],
+        pattern: str,
+        regex: bool,
+        case_sensitive: bool
+    ) -> List[int]:
+        """Positions of words matching pattern.
+
+        The pattern is evaluated once per distinct word of the document and
+        the positions of matching types are merged, instead of running the
+        regex on every token.
+        """
+        if regex:
+            compiled = re.compile(pattern, 0 if case_sensitive else re.IGNORECASE)
+            predicate = lambda word: compiled.search(word) is not None
+        elif case_sensitive:
+            predicate = lambda word: pattern != '' and pattern in word
+        else:
+            pattern_cmp = self._clean_text(pattern)
+            predicate = lambda word: pattern_cmp != '' and pattern_cmp in self._clean_text(word)
+
+        positions = []
+        for word, word_positions in self._type_index(analysis, 'word').items():
+            if predicate(word):
+                positions.extend(word_positions)
+        positions.sort()
+        return positions
+
     def search_word(
         self,
         pattern: str,
@@ -109,31 +248,9 @@ class CorpusSearchEngine:
         if len(analysis) > 0:
             logger.debug(f"First 3 tokens: {analysis[:3]}")
         
-        matches = []
+        positions = self._word_positions(analysis, pattern, regex, case_sensitive)
+        matches = [{**analysis[idx], 'position': idx} for idx in positions]
 
-        for idx, item in enumerate(analysis):
-            if not isinstance(item, dict):
-                continue
-
-            word = item.get('word', '')
-
-            # Apply pattern matching
-            if regex:
-                flags = 0 if case_sensitive else re.IGNORECASE
-                if re.search(pattern, word, flags):
-                    matches.append({**item, 'position': idx})
-            else:
-                if case_sensitive:
-                    word_cmp = word
-                    pattern_cmp = pattern
-                else:
-                    word_cmp = self._clean_text(word)
-                    pattern_cmp = self._clean_text(pattern)
-
-                # substring match on cleaned forms
-                if pattern_cmp and pattern_cmp in word_cmp:
-                    matches.append({**item, 'position': idx})
-                    
         logger.info(f"Search word '{pattern}': found {len(matches)} matches")
         if len(matches) == 0 and len(analysis) > 0:
             # Debug: show sample of original and cleaned words
@@ -254,31 +371,20 @@ class CorpusSearchEngine:
         analysis = self._normalize_analysis(doc['analysis'])
         matches = []
 
-        for idx, item in enumerate(analysis):
+        # Word pattern filter (evaluated on distinct words, see _word_positions)
+        if word_pattern:
+            candidates = self._word_positions(analysis, word_pattern, regex, case_sensitive)
+        else:
+            candidates = range(len(analysis))
+
+        for idx in candidates:
+            item = analysis[idx]
             if not isinstance(item, dict):
                 continue
 
-            # Apply all filters
+            # Apply remaining filters
             passed = True
 
-            # Word pattern filter
-            if word_pattern:
-                word = item.get('word', '')
-                if regex:
-                    flags = 0 if case_sensitive else re.IGNORECASE
-                    if not re.search(word_pattern, word, flags):
-                        passed = False
-                else:
-                    if case_sensitive:
-                        word_cmp = word
-                        pattern_cmp = word_pattern
-                    else:
-                        word_cmp = self._clean_text(word)
-                        pattern_cmp = self._clean_text(word_pattern)
-
-                    if not pattern_cmp or pattern_cmp not in word_cmp:
-                        passed = False
-
             # Lemma filter
             if passed and lemma:
                 item_lemma = item.get('lemma', '')
@@ -309,7 +415,7 @@ class CorpusSearchEngine:
         matches: List[Dict[str, Any]],
         doc_id: int,
         context_words: int = 5
-    ) -> List[Dict[str, Any]]:
+    ) -> ConcordanceLines:
         """Generate KWIC concordance from matches.
 
         Args:
@@ -318,19 +424,40 @@ class CorpusSearchEngine:
             context_words: Number of words on each side
 
         Returns:
-            Concordance results with left/center/right context
+            Concordance lines with left/center/right context (see iter_concordance)
         """
+        return ConcordanceLines(self._concordance_batches(matches, doc_id, context_words))
+
+    def iter_concordance(
+        self,
+        matches: List[Dict[str, Any]],
+        doc_id: int,
+        context_words: int = 5
+    ) -> Iterator[ConcordanceLine]:
+        """Stream KWIC concordance lines of matches.
+
+        Matches are located in batches; each line keeps only its window
+        bounds in the document's token list, and its legacy, template and
+        pair keys are formatted when read.
+        """
+        return iter_lines(self._concordance_batches(matches, doc_id, context_words))
+
+    def _concordance_batches(
+        self,
+        matches: List[Dict[str, Any]],
+        doc_id: int,
+        context_words: int
+    ) -> Iterator[AnalysisKWICBatch]:
+        """KWIC batches of matches, located as the batches are consumed."""
         doc = self.db.get_document(doc_id)
 
         if not doc:
-            return []
+            return
 
         # Normalize analysis into list of token dicts
         analysis = self._normalize_analysis(doc.get('analysis', []))
         if not analysis:
-            return []
-
-        concordance = []
+            return
 
         # Build a quick index of token positions by (word,lemma,pos) to help
         # resolve matches that didn't include an explicit 'position'.
@@ -361,52 +488,17 @@ class CorpusSearchEngine:
 
             return None
 
-        for match in matches:
-            pos = resolve_position(match)
-            if pos is None:
-                # skip matches we cannot locate
-                continue
-
-            # Extract context window
-            left_start = max(0, pos - context_words)
-            right_end = min(len(analysis), pos + context_words + 1)
-
-            left_ctx = analysis[left_start:pos]
-            center = analysis[pos]
-            right_ctx = analysis[pos+1:right_end]
-
-            # Build word lists and word;pos pairs
-            left_words = [t.get('word', '') for t in left_ctx]
-            right_words = [t.get('word', '') for t in right_ctx]
-            center_word = center.get('word', '')
-
-            left_pairs = [f"{t.get('word','')};{t.get('pos','')}" for t in left_ctx]
-            right_pairs = [f"{t.get('word','')};{t.get('pos','')}" for t in right_ctx]
-            center_pair = f"{center.get('word','')};{center.get('pos','')}"
-
-            entry = {
-                # legacy keys
-                'left': ' '.join(left_words),
-                'center': center_word,
-                'right': ' '.join(right_words),
-                # template-friendly keys
-                'left_context': ' '.join(left_words),
-                'keyword': center_word,
-                'right_context': ' '.join(right_words),
-                # new pair-aware keys
-                'left_pairs': left_pairs,
-                'keyword_pair': center_pair,
-                'right_pairs': right_pairs,
-                'position': pos,
-                'lemma': match.get('lemma', center.get('lemma', '')),
-                'pos': match.get('pos', center.get('pos', '')),
-                'confidence': match.get('confidence', center.get('confidence', 1.0)),
-                'warning': match.get('warning', '')
-            }
-
-            concordance.append(entry)
-
-        return concordance
+        for chunk in batched(matches):
+            positions, located = [], []
+            for match in chunk:
+                pos = resolve_position(match)
+                if pos is None:
+                    # skip matches we cannot locate
+                    continue
+                positions.append(pos)
+                located.append(match)
+            if positions:
+                yield AnalysisKWICBatch(analysis, positions, located, context_words)
 
     def get_text_based_concordance(
         self,
@@ -415,7 +507,7 @@ class CorpusSearchEngine:
         context_words: int = 5,
         regex: bool = False,
         case_sensitive: bool = False
-    ) -> List[Dict[str, Any]]:
+    ) -> ConcordanceLines:
         """Generate KWIC concordance directly from cleaned text.
         
         This method searches in the raw text rather than the analysis tokens,
@@ -429,17 +521,17 @@ class CorpusSearchEngine:
             case_sensitive: Case-sensitive search
             
         Returns:
-            Concordance results with left/center/right context
+            Sequence of concordance lines with left/center/right context (formatted when read)
         """
         doc = self.db.get_document(doc_id)
         if not doc:
             logger.warning(f"No document found for doc_id={doc_id}")
-            return []
+            return ConcordanceLines()
             
         text = doc.get('cleaned_text', '')
         if not text:
             logger.warning(f"No cleaned text for doc_id={doc_id}")
-            return []
+            return ConcordanceLines()
             
         # Build analysis lookup for POS/lemma enrichment
         analysis = self._normalize_analysis(doc.get('analysis', []))
@@ -475,95 +567,45 @@ class CorpusSearchEngine:
         words = re.findall(r'\S+', text)  # Split on whitespace
         logger.info(f"Text-based search: {len(words)} words in text")
         
-        concordance = []
-        
-        # Search through words
-        for idx, word in enumerate(words):
-            matched = False
+        # Enrich with analysis data - multiple strategies
+        def get_analysis_data(w):
+            """Get POS/lemma for a word using multiple lookup strategies."""
+            w_strip = w.strip()
             
-            if regex:
-                flags = 0 if case_sensitive else re.IGNORECASE
-                if re.search(pattern, word, flags):
-                    matched = True
-            else:
-                if case_sensitive:
-                    if pattern in word:
-                        matched = True
-                else:
-                    if pattern.lower() in word.lower():
-                        matched = True
+            # Strategy 1: Exact original match (case-insensitive)
+            data = analysis_by_original.get(w_strip.lower())
+            if data:
+                logger.debug(f"Found '{w}' via original lookup: pos={data.get('pos')}")
+                return data
+            
+            # Strategy 2: Cleaned match
+            w_clean = self._clean_text(w_strip)
+            data = analysis_by_cleaned.get(w_clean)
+            if data:
+                logger.debug(f"Found '{w}' via cleaned lookup: pos={data.get('pos')}")
+                return data
+            
+            # Strategy 3: Partial cleaned match (for punctuation differences)
+            for clean_key, analysis_item in analysis_by_cleaned.items():
+                if w_clean in clean_key or clean_key in w_clean:
+                    logger.debug(f"Found '{w}' via partial match with '{clean_key}': pos={analysis_item.get('pos')}")
+                    return analysis_item
             
-            if matched:
-                # Extract context
-                left_start = max(0, idx - context_words)
-                right_end = min(len(words), idx + context_words + 1)
-                
-                left_words = words[left_start:idx]
-                keyword = words[idx]
-                right_words = words[idx+1:right_end]
-                
-                # Try to enrich with analysis data - multiple strategies
-                def get_analysis_data(w):
-                    """Get POS/lemma for a word using multiple lookup strategies."""
-                    w_strip = w.strip()
-                    
-                    # Strategy 1: Exact original match (case-insensitive)
-                    data = analysis_by_original.get(w_strip.lower())
-                    if data:
-                        logger.debug(f"Found '{w}' via original lookup: pos={data.get('pos')}")
-                        return data
-                    
-                    # Strategy 2: Cleaned match
-                    w_clean = self._clean_text(w_strip)
-                    data = analysis_by_cleaned.get(w_clean)
-                    if data:
-                        logger.debug(f"Found '{w}' via cleaned lookup: pos={data.get('pos')}")
-                        return data
-                    
-                    # Strategy 3: Partial cleaned match (for punctuation differences)
-                    for clean_key, analysis_item in analysis_by_cleaned.items():
-                        if w_clean in clean_key or clean_key in w_clean:
-                            logger.debug(f"Found '{w}' via partial match with '{clean_key}': pos={analysis_item.get('pos')}")
-                            return analysis_item
-                    
-                    logger.debug(f"No analysis data found for word '{w}' (cleaned: '{w_clean}')")
-                    return {}
-                
-                keyword_data = get_analysis_data(keyword)
-                
-                # Build pairs for context words
-                left_pairs = []
-                for w in left_words:
-                    w_data = get_analysis_data(w)
-                    pos_tag = w_data.get('pos', '')
-                    left_pairs.append(f"{w};{pos_tag}")
-                
-                right_pairs = []
-                for w in right_words:
-                    w_data = get_analysis_data(w)
-                    pos_tag = w_data.get('pos', '')
-                    right_pairs.append(f"{w};{pos_tag}")
-                
-                keyword_pos = keyword_data.get('pos', '')
-                keyword_lemma = keyword_data.get('lemma', '')
-                
-                entry = {
-                    'left_context': ' '.join(left_words),
-                    'keyword': keyword,
-                    'right_context': ' '.join(right_words),
-                    'left': ' '.join(left_words),
-                    'center': keyword,
-                    'right': ' '.join(right_words),
-                    'position': idx,
-                    'lemma': keyword_lemma,
-                    'pos': keyword_pos,
-                    'confidence': keyword_data.get('confidence', 1.0),
-                    'left_pairs': left_pairs,
-                    'keyword_pair': f"{keyword};{keyword_pos}",
-                    'right_pairs': right_pairs,
-                }
-                
-                concordance.append(entry)
+            logger.debug(f"No analysis data found for word '{w}' (cleaned: '{w_clean}')")
+            return {}
+        
+        def matched(word):
+            if regex:
+                return re.search(pattern, word, 0 if case_sensitive else re.IGNORECASE) is not None
+            if case_sensitive:
+                return pattern in word
+            return pattern.lower() in word.lower()
+        
+        # Search through words; context and annotations are read per line when it is formatted
+        hits = (idx for idx, word in enumerate(words) if matched(word))
+        concordance = ConcordanceLines(
+            TextKWICBatch(words, positions, context_words, get_analysis_data) for positions in batched(hits)
+        )
         
         logger.info(f"Text-based search for '{pattern}': found {len(concordance)} matches")
         if len(concordance) > 0:
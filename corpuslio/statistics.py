@@ -11,6 +11,8 @@ from typing import List, Dict, Any, Tuple
 from collections import Counter
 import logging
 
+from .index.frequency import FrequencyTable
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,6 +29,11 @@ class CorpusStatistics:
         self.words = [item.get('word', '') for item in self.data]
         self.lemmas = [item.get('lemma', '') for item in self.data]
         self.pos_tags = [item.get('pos', '') for item in self.data]
+        # Word, lemma and POS counts from one encoded pass
+        self.frequencies = FrequencyTable.from_columns(
+            {'word': self.words, 'lemma': self.lemmas, 'pos': self.pos_tags},
+            pos_attribute='pos'
+        )
 
     def token_count(self) -> int:
         """Total number of tokens."""
@@ -34,7 +41,7 @@ class CorpusStatistics:
 
     def type_count(self) -> int:
         """Number of unique words (types)."""
-        return len(set(self.words))
+        return self.frequencies.type_count('word')
 
     def type_token_ratio(self) -> float:
         """Type-Token Ratio (lexical diversity)."""
@@ -51,8 +58,7 @@ class CorpusStatistics:
         Returns:
             List of (word, count) tuples sorted by frequency
         """
-        counter = Counter(self.words)
-        return counter.most_common(top_n)
+        return self.frequencies.most_common('word', top_n)
 
     def lemma_frequency(self, top_n: int = 50) -> List[Tuple[str, int]]:
         """Get lemma frequency list.
@@ -63,8 +69,7 @@ class CorpusStatistics:
         Returns:
             List of (lemma, count) tuples
         """
-        counter = Counter(self.lemmas)
-        return counter.most_common(top_n)
+        return self.frequencies.most_common('lemma', top_n)
 
     def pos_distribution(self) -> Dict[str, int]:
         """Get POS tag distribution.
@@ -72,7 +77,7 @@ class CorpusStatistics:
         Returns:
             Dictionary of POS tag counts
         """
-        return dict(Counter(self.pos_tags))
+        return self.frequencies.distribution('pos')
 
     def zipf_distribution(self) -> List[Tuple[int, str, int, float]]:
         """Calculate Zipf distribution.
@@ -135,6 +140,14 @@ class CorpusStatistics:
         # Filter by minimum frequency
         return [(ng, count) for ng, count in counter.most_common() if count >= min_freq]
 
+    def _pair_frequencies(self, bigrams: List[Tuple[Tuple[str, str], int]]) -> List[Tuple[int, int]]:
+        """Word frequencies of both members of each bigram (one lookup per column)."""
+        if not bigrams:
+            return []
+        first = self.frequencies.frequencies('word', [w1 for (w1, _), _ in bigrams])
+        second = self.frequencies.frequencies('word', [w2 for (_, w2), _ in bigrams])
+        return list(zip(first.tolist(), second.tolist()))
+
     def calculate_pmi(self, bigrams: List[Tuple[Tuple[str, str], int]]) -> List[Tuple[Tuple[str, str], float]]:
         """Calculate Pointwise Mutual Information for bigrams.
 
@@ -145,16 +158,16 @@ class CorpusStatistics:
             List of (bigram, PMI_score)
         """
         total_bigrams = sum(count for _, count in bigrams)
-        word_freq = Counter(self.words)
+        word_freq = self._pair_frequencies(bigrams)
         total_words = len(self.words)
         
         pmi_scores = []
-        for (w1, w2), count in bigrams:
+        for ((w1, w2), count), (f1, f2) in zip(bigrams, word_freq):
             # P(w1, w2)
             p_bigram = count / total_bigrams
             # P(w1) * P(w2)
-            p_w1 = word_freq[w1] / total_words
-            p_w2 = word_freq[w2] / total_words
+            p_w1 = f1 / total_words
+            p_w2 = f2 / total_words
             p_independent = p_w1 * p_w2
             
             # PMI = log2(P(w1,w2) / (P(w1)*P(w2)))
@@ -176,16 +189,16 @@ class CorpusStatistics:
             List of (bigram, t_score)
         """
         total_bigrams = sum(count for _, count in bigrams)
-        word_freq = Counter(self.words)
+        word_freq = self._pair_frequencies(bigrams)
         total_words = len(self.words)
         
         t_scores = []
-        for (w1, w2), count in bigrams:
+        for ((w1, w2), count), (f1, f2) in zip(bigrams, word_freq):
             # Observed frequency
             obs = count
             # Expected frequency under independence
-            p_w1 = word_freq[w1] / total_words
-            p_w2 = word_freq[w2] / total_words
+            p_w1 = f1 / total_words
+            p_w2 = f2 / total_words
             exp = total_bigrams * p_w1 * p_w2
             
             # t-score = (observed - expected) / sqrt(observed)
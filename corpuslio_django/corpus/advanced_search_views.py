@@ -13,11 +13,147 @@ from .permissions import role_required
 from .validators import validate_cqp_query as validate_query, validate_integer_param
 import sys
 import os
+import numpy as np
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 from corpuslio.query_parser import CQPQueryParser, PatternMatcher, parse_cqp_query
+from .services.index_service import get_corpus_index, get_sharded_executor
+
+# Matches rendered per page of results (total_matches still counts all)
+MAX_DISPLAYED_MATCHES = 1000
+
+
+def _index_matches(index, starts, ends, context_size):
+    """Build PatternMatcher-style match dicts for index match positions.
+    
+    Context is clipped to the document, like PatternMatcher on a
+    document's token list; positions are relative to the document start.
+    Documents and their filenames come from the structural index.
+    Matches are resolved in the segment that holds them.
+    """
+    matches = []
+    for segment, base, local_starts in index.split(starts):
+        first = int(np.searchsorted(starts, base))
+        local_ends = ends[first:first + len(local_starts)] - base
+        matches.extend(_segment_matches(segment, local_starts, local_ends, context_size))
+    return matches
+
+
+def _segment_matches(index, starts, ends, context_size):
+    """Match dicts for match positions local to one index segment."""
+    forms = index.attribute('form')
+    lemmas = index.attribute('lemma')
+    upos = index.attribute('upos')
+    texts = index.structure('text')
+    
+    def token_dicts(start, end):
+        return [
+            {'word': w, 'lemma': l, 'pos': p}
+            for w, l, p in zip(forms.values(start, end), lemmas.values(start, end), upos.values(start, end))
+        ]
+    
+    doc_numbers, doc_starts, doc_ends = texts.bounds(starts)
+    doc_ids = texts.values[doc_numbers].tolist()
+    filenames = texts.attribute_values(doc_numbers, 'filename')
+    
+    matches = []
+    for start, end, doc_start, doc_end, doc_id, filename in zip(
+        starts.tolist(), ends.tolist(), doc_starts.tolist(), doc_ends.tolist(), doc_ids, filenames
+    ):
+        left_context = token_dicts(max(doc_start, start - context_size), start)
+        match_tokens = token_dicts(start, end)
+        right_context = token_dicts(end, min(doc_end, end + context_size))
+        
+        matches.append({
+            'position': start - doc_start,
+            'left_context': left_context,
+            'match': match_tokens,
+            'right_context': right_context,
+            'left_context_text': ' '.join(t['word'] for t in left_context),
+            'match_text': ' '.join(t['word'] for t in match_tokens),
+            'right_context_text': ' '.join(t['word'] for t in right_context),
+            'document': {
+                'id': doc_id,
+                'title': filename,
+                'filename': filename,
+            },
+        })
+    
+    return matches
+
+
+def _document_matches(documents, pattern, context_size):
+    """Run PatternMatcher over each document's stored analysis tokens."""
+    all_matches = []
+    matcher = PatternMatcher()
+    
+    for doc in documents:
+        # Get document analysis (a token list, or a dict with 'tokens')
+        analysis = doc.analysis if hasattr(doc, 'analysis') else None
+        tokens = analysis.data if analysis else None
+        if isinstance(tokens, dict):
+            tokens = tokens.get('tokens')
+        if not tokens:
+            continue
+        
+        # Normalize tokens if needed
+        if isinstance(tokens[0], dict):
+            tokens = [
+                {'word': t.get('word', t.get('form', '')), 'lemma': t.get('lemma', ''), 'pos': t.get('pos', t.get('upos', ''))}
+                for t in tokens if isinstance(t, dict)
+            ]
+        else:
+            # Convert flat list to dict format
+            normalized_tokens = []
+            i = 0
+            while i < len(tokens):
+                if i + 2 < len(tokens):
+                    normalized_tokens.append({
+                        'word': tokens[i],
+                        'lemma': tokens[i+1],
+                        'pos': tokens[i+2]
+                    })
+                i += 3
+            tokens = normalized_tokens
+        
+        # Find matches in this document
+        matches = matcher.find_matches(pattern, tokens, context_size)
+        
+        # Add document info to each match
+        for match in matches:
+            match['document'] = {
+                'id': doc.id,
+                'title': doc.title if hasattr(doc, 'title') else doc.filename,
+                'filename': doc.filename
+            }
+            all_matches.append(match)
+    
+    return all_matches
+
+
+def _indexed_search(index, query, pattern, document_ids, context_size):
+    """Search the index, plus the analysis tokens of documents it does not hold.
+
+    Documents processed by the web upload path only store analysis JSON
+    (no Token rows), so they never reach the index; they are matched
+    with PatternMatcher and their matches follow the index hits.
+
+    Returns:
+        (match dicts, at most MAX_DISPLAYED_MATCHES; total match count)
+    """
+    # Index search on all shards in parallel (sentence-bounded matches)
+    starts, ends = get_sharded_executor(index).find(query, document_ids=document_ids)
+    matches = _index_matches(index, starts[:MAX_DISPLAYED_MATCHES], ends[:MAX_DISPLAYED_MATCHES], context_size)
+
+    indexed = set(index.document_ids().tolist())
+    unindexed_ids = [doc_id for doc_id in document_ids if doc_id not in indexed]
+    unindexed = []
+    if unindexed_ids:
+        documents = Document.objects.filter(id__in=unindexed_ids).select_related('analysis')
+        unindexed = _document_matches(documents, pattern, context_size)
+    return (matches + unindexed)[:MAX_DISPLAYED_MATCHES], len(starts) + len(unindexed)
 
 
 @login_required
@@ -102,46 +238,23 @@ def advanced_search_view(request):
                     uploaded_by=request.user
                 )
         
-        all_matches = []
-        matcher = PatternMatcher()
+        index = get_corpus_index()
         
-        for doc in documents:
-            # Get document analysis
-            if not doc.analysis or not doc.analysis.get('tokens'):
-                continue
-            
-            tokens = doc.analysis.get('tokens', [])
-            
-            # Normalize tokens if needed
-            if tokens and not isinstance(tokens[0], dict):
-                # Convert flat list to dict format
-                normalized_tokens = []
-                i = 0
-                while i < len(tokens):
-                    if i + 2 < len(tokens):
-                        normalized_tokens.append({
-                            'word': tokens[i],
-                            'lemma': tokens[i+1],
-                            'pos': tokens[i+2]
-                        })
-                    i += 3
-                tokens = normalized_tokens
-            
-            # Find matches in this document
-            matches = matcher.find_matches(pattern, tokens, context_size)
-            
-            # Add document info to each match
-            for match in matches:
-                match['document'] = {
-                    'id': doc.id,
-                    'title': doc.title if hasattr(doc, 'title') else doc.filename,
-                    'filename': doc.filename
-                }
-                all_matches.append(match)
+        if index is not None:
+            if isinstance(documents, list):
+                document_ids = [doc.id for doc in documents]
+            else:
+                document_ids = list(documents.values_list('id', flat=True))
+            all_matches, total_matches = _indexed_search(index, query, pattern, document_ids, context_size)
+            document_count = len(document_ids)
+        else:
+            all_matches = _document_matches(documents, pattern, context_size)
+            total_matches = len(all_matches)
+            document_count = len(documents)
         
         context['results'] = all_matches
-        context['total_matches'] = len(all_matches)
-        context['document_count'] = len(documents)
+        context['total_matches'] = total_matches
+        context['document_count'] = document_count
         
         # Log query (for POST-based advanced search)
         QueryLog.objects.create(
@@ -151,13 +264,13 @@ def advanced_search_view(request):
             user_agent=request.META.get('HTTP_USER_AGENT', '')[:256],
             query_text=query,
             query_type='advanced',
-            result_count=len(all_matches),
+            result_count=total_matches,
             rate_limit_hit=False,
             is_cached=False,
         )
         
-        if len(all_matches) > 0:
-            messages.success(request, f"Found {len(all_matches)} matches in {len(documents)} document(s)")
+        if total_matches > 0:
+            messages.success(request, f"Found {total_matches} matches in {document_count} document(s)")
         else:
             messages.warning(request, "No matches found")
     
@@ -297,6 +410,35 @@ def query_syntax_help(request):
                 }
             ]
         },
+        {
+            'category': 'Repetition, Gaps and Alternation',
+            'items': [
+                {
+                    'query': '[pos="ADJ"]+ [pos="NOUN"]',
+                    'description': 'One or more adjectives followed by a noun',
+                    'matches': 'güzel ev, büyük güzel ev',
+                    'not_matches': 'ev güzel'
+                },
+                {
+                    'query': '[lemma="ev"] []{0,3} [pos="VERB"]',
+                    'description': '"ev" followed by a verb within 0-3 tokens',
+                    'matches': 'eve geldi, evde çok geç kaldı',
+                    'not_matches': 'ev (no verb in the sentence)'
+                },
+                {
+                    'query': '([pos="ADJ"] | [pos="NUM"]) [pos="NOUN"]',
+                    'description': 'Adjective or numeral followed by a noun',
+                    'matches': 'güzel ev, üç kitap',
+                    'not_matches': 'bu ev'
+                },
+                {
+                    'query': '[pos="NOUN"] [pos!="PUNCT"]',
+                    'description': 'Noun not followed by punctuation',
+                    'matches': 'ev güzel, kitap okudu',
+                    'not_matches': 'ev.'
+                }
+            ]
+        },
         {
             'category': 'Advanced Examples',
             'items': [
@@ -342,6 +484,31 @@ def query_syntax_help(request):
                 'description': 'AND - combine multiple constraints',
                 'example': '[word="test" & pos="NOUN"]'
             },
+            {
+                'symbol': '!=',
+                'description': 'NOT - attribute must not match',
+                'example': '[pos!="PUNCT"]'
+            },
+            {
+                'symbol': '[]',
+                'description': 'Any token',
+                'example': '[pos="ADJ"] [] [pos="NOUN"]'
+            },
+            {
+                'symbol': '? * + {n,m}',
+                'description': 'Repeat the preceding token or group',
+                'example': '[pos="ADJ"]* [pos="NOUN"], []{0,3}'
+            },
+            {
+                'symbol': '( | )',
+                'description': 'Group and alternation',
+                'example': '([pos="ADJ"] | [pos="NUM"]) [pos="NOUN"]'
+            },
+            {
+                'symbol': 'within s|p|text',
+                'description': 'Matches may not cross a sentence, paragraph or document (default: sentence)',
+                'example': '[lemma="ev"] []* [pos="VERB"] within p'
+            },
             {
                 'symbol': '.*',
                 'description': 'Regex: match any characters',
@@ -4,6 +4,7 @@ from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from .models import Document
 from .ngrams import NgramAnalyzer
+from .services.frequency_service import document_frequencies
 import json
 
 
@@ -59,15 +60,10 @@ def wordcloud_view(request, doc_id):
         from django.shortcuts import redirect
         return redirect('corpus:library')
     
-    from collections import Counter
-    
-    # Get word frequencies
-    words = [item.get('word', '').lower() for item in document.analysis.data if isinstance(item, dict)]
-    word_freq = dict(Counter(words).most_common(100))
-    
-    # Get lemma frequencies
-    lemmas = [item.get('lemma', '').lower() for item in document.analysis.data if isinstance(item, dict) and item.get('lemma')]
-    lemma_freq = dict(Counter(lemmas).most_common(100))
+    # Word and lemma frequencies (case-folded) from the frequency engine
+    frequencies = document_frequencies(document).lowercase()
+    word_freq = dict(frequencies.most_common('form', 100))
+    lemma_freq = dict([(lemma, count) for lemma, count in frequencies.most_common('lemma', 101) if lemma][:100])
     
     # Prepare data for Plotly
     context = {
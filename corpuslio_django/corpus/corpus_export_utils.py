@@ -124,7 +124,7 @@ def export_concordance_json(results, query, user=None):
                 'head': 'Head token ID in dependency tree'
             } if is_verified else None
         },
-        'results': results
+        'results': [dict(result) for result in results]
     }
     
     content_str = json.dumps(data, ensure_ascii=False, indent=2)
@@ -9,12 +9,13 @@ from django.contrib.auth.models import User
 from django.core.mail import send_mail
 from django.conf import settings
 import os
+import secrets
 import tempfile
 from decimal import Decimal
 
-from corpus.models import Document, ExportLog, UserProfile, CorpusMetadata
-from corpus.query_engine import CorpusQueryEngine
-from corpus.collections import Collection as CollectionService
+from corpus.models import Document, ExportLog, UserProfile
+from corpus.query_engine import CorpusQueryEngine, collocation_options
+from corpus.services.subcorpus_service import subcorpus_from_params
 from corpus.corpus_export_utils import (
     export_concordance_csv,
     export_concordance_json,
@@ -32,7 +33,8 @@ def export_concordance_async_task(self, user_id, search_params, export_format='c
     
     Args:
         user_id: User ID who requested export
-        search_params: Dict with query, search_type, regex, etc.
+        search_params: Dict with query, search_type, regex, etc.; 'sample'
+            and 'seed' export a reproducible random sample of all hits
         export_format: 'csv' or 'json'
     
     Returns:
@@ -51,33 +53,15 @@ def export_concordance_async_task(self, user_id, search_params, export_format='c
         case_sensitive = search_params.get('case_sensitive', False)
         context_size = search_params.get('context_size', 5)
         limit = search_params.get('limit', 500)
-        collection_id = search_params.get('collection_id')
-        genre_filter = search_params.get('genre_filter')
-        author_filter = search_params.get('author_filter')
+        sample = search_params.get('sample')
+        seed = search_params.get('seed')
+        if sample:
+            limit = int(sample)
+            # Record the seed so the exported sample can be repeated
+            seed = int(seed) if seed is not None else secrets.randbelow(2 ** 32)
         
         # Filter documents
-        document_ids = None
-        if collection_id:
-            try:
-                collection = CollectionService.objects.get(id=collection_id)
-                document_ids = list(collection.documents.values_list('id', flat=True))
-            except:
-                pass
-        
-        # Genre/author filtering
-        if genre_filter or author_filter:
-            meta_query = CorpusMetadata.objects.all()
-            if genre_filter:
-                meta_query = meta_query.filter(global_metadata__genre__icontains=genre_filter)
-            if author_filter:
-                meta_query = meta_query.filter(global_metadata__author__icontains=author_filter)
-            
-            meta_doc_ids = list(meta_query.values_list('document_id', flat=True))
-            
-            if document_ids:
-                document_ids = list(set(document_ids) & set(meta_doc_ids))
-            else:
-                document_ids = meta_doc_ids
+        document_ids = subcorpus_from_params(search_params)
         
         self.update_state(state='PROCESSING', meta={'current': 30, 'total': 100, 'status': 'Executing concordance search'})
         
@@ -89,7 +73,9 @@ def export_concordance_async_task(self, user_id, search_params, export_format='c
             query_type=search_type,
             regex=regex,
             case_sensitive=case_sensitive,
-            limit=limit
+            limit=limit,
+            sample=int(sample) if sample else None,
+            seed=seed
         )
         
         self.update_state(state='PROCESSING', meta={'current': 70, 'total': 100, 'status': 'Generating export file'})
@@ -119,6 +105,8 @@ def export_concordance_async_task(self, user_id, search_params, export_format='c
             'filepath': filepath,
             'filename': filename,
             'result_count': len(results),
+            'sample': int(sample) if sample else None,
+            'seed': seed,
             'file_size_mb': round(os.path.getsize(filepath) / (1024 * 1024), 2)
         }
         
@@ -135,7 +123,8 @@ def export_collocation_async_task(self, user_id, keyword, search_params):
     Args:
         user_id: User ID
         keyword: Target keyword
-        search_params: Dict with window_size, min_freq, collection_id
+        search_params: Dict with window_size, min_freq, collection_id and
+            optionally measure, left, right, pos
     """
     try:
         user = User.objects.get(id=user_id)
@@ -144,23 +133,18 @@ def export_collocation_async_task(self, user_id, keyword, search_params):
         
         window_size = search_params.get('window_size', 5)
         min_freq = search_params.get('min_freq', 2)
-        collection_id = search_params.get('collection_id')
         
         # Filter documents
-        document_ids = None
-        if collection_id:
-            try:
-                collection = CollectionService.objects.get(id=collection_id)
-                document_ids = list(collection.documents.values_list('id', flat=True))
-            except:
-                pass
+        document_ids = subcorpus_from_params(search_params)
         
         # Execute analysis
         engine = CorpusQueryEngine(documents=document_ids)
         collocates = engine.collocation(
             keyword=keyword,
             window_size=window_size,
-            min_frequency=min_freq
+            min_frequency=min_freq,
+            limit=100,
+            **collocation_options(search_params)
         )
         
         self.update_state(state='PROCESSING', meta={'current': 70, 'total': 100, 'status': 'Generating CSV'})
@@ -207,19 +191,12 @@ def export_ngram_async_task(self, user_id, search_params):
         n = search_params.get('n', 2)
         min_freq = search_params.get('min_freq', 2)
         use_lemma = search_params.get('use_lemma', False)
-        collection_id = search_params.get('collection_id')
         limit = search_params.get('limit', 500)
         
         # Filter documents
-        document_ids = None
-        if collection_id:
-            try:
-                collection = CollectionService.objects.get(id=collection_id)
-                document_ids = list(collection.documents.values_list('id', flat=True))
-            except:
-                pass
-        
-        # Execute analysis (uses streaming from query_engine.py fix)
+        document_ids = subcorpus_from_params(search_params)
+        
+        # Execute analysis (read from the persisted n-gram tables when built)
         engine = CorpusQueryEngine(documents=document_ids)
         ngrams = engine.ngrams(
             n=n,
@@ -271,17 +248,10 @@ def export_frequency_async_task(self, user_id, search_params):
         
         use_lemma = search_params.get('use_lemma', True)
         min_length = search_params.get('min_length', 1)
-        collection_id = search_params.get('collection_id')
         limit = search_params.get('limit', 500)
         
         # Filter documents
-        document_ids = None
-        if collection_id:
-            try:
-                collection = CollectionService.objects.get(id=collection_id)
-                document_ids = list(collection.documents.values_list('id', flat=True))
-            except:
-                pass
+        document_ids = subcorpus_from_params(search_params)
         
         # Execute analysis
         engine = CorpusQueryEngine(documents=document_ids)
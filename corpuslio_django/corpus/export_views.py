@@ -8,6 +8,7 @@ from django.utils import timezone
 from decimal import Decimal
 from .models import Document, UserProfile, ExportLog
 from .services import ExportService
+from .services.frequency_service import document_frequencies, form_lemmas
 from .permissions import role_required
 from collections import Counter
 import csv
@@ -761,49 +762,22 @@ def _get_concordance_results(document, query_text):
 
 def _get_frequency_results(document):
     """
-    Get frequency table for a document using Analysis data.
+    Get frequency table for a document (index, Token rows or Analysis data).
     """
     try:
-        # Try to get frequency data from Analysis
-        if hasattr(document, 'analysis') and document.analysis and document.analysis.data:
-            from collections import Counter
+        frequencies = document_frequencies(document)
+        if frequencies is not None:
+            total_words = frequencies.tokens
             
-            # Count words, lemmas, and POS tags
-            word_counts = Counter()
-            lemma_counts = Counter()
-            pos_counts = Counter()
-            
-            for item in document.analysis.data:
-                if isinstance(item, dict):
-                    word = item.get('word', item.get('form', ''))
-                    lemma = item.get('lemma', '')
-                    pos = item.get('pos', '')
-                    
-                    if word:
-                        word_counts[word] += 1
-                    if lemma:
-                        lemma_counts[lemma] += 1
-                    if pos:
-                        pos_counts[pos] += 1
-            
-            total_words = sum(word_counts.values())
-            
-            # Build frequency table (top 100 words)
+            # Build frequency table (top 100 words) with the most common POS and lemma per word
+            top = [row for row in frequencies.top('form', 101) if row[0]][:100]
+            lemmas = form_lemmas(document, [word for word, _, _ in top])
             results = []
-            for word, freq in word_counts.most_common(100):
-                # Find corresponding lemma and POS
-                lemma = ''
-                pos = ''
-                for item in document.analysis.data:
-                    if isinstance(item, dict) and item.get('word') == word:
-                        lemma = item.get('lemma', '')
-                        pos = item.get('pos', '')
-                        break
-                
+            for word, freq, pos in top:
                 percentage = (freq / total_words * 100) if total_words > 0 else 0
                 results.append({
                     'word': word,
-                    'lemma': lemma or word,
+                    'lemma': lemmas.get(word) or word,
                     'pos': pos or 'UNKNOWN',
                     'frequency': freq,
                     'percentage': round(percentage, 2)
@@ -19,6 +19,7 @@ from .models import (
     DataExportRequest, ConsentRecord, AccountDeletionRequest,
     Document, QueryLog, ExportLog, UserProfile
 )
+from .services.index_service import remove_from_index
 
 
 class UserDataExportService:
@@ -393,7 +394,11 @@ class AccountDeletionService:
     def _full_deletion(self):
         """Complete account and data deletion."""
         # Delete all user data
-        Document.objects.filter(uploaded_by=self.user).delete()
+        documents = Document.objects.filter(uploaded_by=self.user)
+        document_ids = list(documents.values_list('id', flat=True))
+        documents.delete()
+        # Hide the documents from index queries at once (no rebuild)
+        remove_from_index(document_ids)
         QueryLog.objects.filter(user=self.user).delete()
         ExportLog.objects.filter(user=self.user).delete()
         ConsentRecord.objects.filter(user=self.user).delete()
@@ -0,0 +1,68 @@
+"""Django management command to build the positional corpus index."""
+
+import time
+from django.core.management.base import BaseCommand
+from corpus.services.index_service import (
+    build_corpus_index, build_ngram_tables, compact_corpus_index, get_index_path
+)
+
+
+class Command(BaseCommand):
+    help = 'Build the positional corpus index (integer-encoded attribute streams) from the Token table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            type=str,
+            help='Index directory (default: settings.CORPUS_INDEX_DIR)'
+        )
+        parser.add_argument(
+            '--documents',
+            type=int,
+            nargs='+',
+            help='Only index these document IDs'
+        )
+        parser.add_argument(
+            '--shards',
+            type=int,
+            help='Document-range shards for parallel queries (default: settings.CORPUS_INDEX_SHARDS, 0 = one per CPU)'
+        )
+        parser.add_argument(
+            '--compact',
+            action='store_true',
+            help='Merge small segments instead of rebuilding (as the periodic Celery task does)'
+        )
+        parser.add_argument(
+            '--ngrams',
+            action='store_true',
+            help='Only write the n-gram tables of segments that have none yet'
+        )
+
+    def handle(self, *args, **options):
+        if options.get('compact'):
+            merged = compact_corpus_index()
+            self.stdout.write(self.style.SUCCESS(f'✓ {len(merged)} merged segments written'))
+            return
+
+        if options.get('ngrams'):
+            written = build_ngram_tables()
+            self.stdout.write(self.style.SUCCESS(f'✓ N-gram tables written for {written} segments'))
+            return
+
+        path = options.get('path') or get_index_path()
+        self.stdout.write(self.style.SUCCESS(f'Building corpus index: {path}'))
+
+        start_time = time.time()
+        index = build_corpus_index(
+            path, document_ids=options.get('documents'), stdout=self.stdout, shards=options.get('shards')
+        )
+        elapsed = time.time() - start_time
+
+        self.stdout.write(self.style.SUCCESS('✓ Index built!'))
+        self.stdout.write(f'  Documents: {len(index.document_ids()):,}')
+        self.stdout.write(f'  Tokens: {index.size:,}')
+        for segment in index.segments:
+            self.stdout.write(f'  Shards: {len(segment.shards())}')
+            for name in segment.attribute_names:
+                self.stdout.write(f'  {name}: {len(segment.attribute(name).lexicon):,} types')
+        self.stdout.write(f'  Time: {elapsed:.1f}s')
@@ -0,0 +1,16 @@
+"""Django management command to write the import sketches of older documents."""
+
+from django.core.management.base import BaseCommand
+from corpus.services.overview_service import backfill_sketches, corpus_overview
+
+
+class Command(BaseCommand):
+    help = 'Compute the approximate-statistics sketches of imported documents that have none (from the Token table)'
+
+    def handle(self, *args, **options):
+        updated = backfill_sketches(stdout=self.stdout)
+        overview = corpus_overview(top=0)
+        self.stdout.write(self.style.SUCCESS(f'✓ Sketches written for {updated} documents'))
+        self.stdout.write(f'  Tokens: {overview["tokens"]:,}')
+        self.stdout.write(f'  Unique forms (approx.): {overview["unique_forms"]:,}')
+        self.stdout.write(f'  Unique lemmas (approx.): {overview["unique_lemmas"]:,}')
@@ -5,6 +5,8 @@ from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
 from corpus.models import Document
 from corpus.parsers import CoNLLUParser, VRTParser
+from corpus.services.index_service import index_documents
+from corpuslio.index.sketches import CorpusSketch
 
 
 class Command(BaseCommand):
@@ -118,12 +120,19 @@ class Command(BaseCommand):
             self.stdout.write('Statistics:')
             self.stdout.write(f'  Sentences: {metadata.sentence_count:,}')
             self.stdout.write(f'  Tokens: {document.token_count:,}')
-            self.stdout.write(f'  Unique forms: {metadata.unique_forms:,}')
-            self.stdout.write(f'  Unique lemmas: {metadata.unique_lemmas:,}')
+            self.stdout.write(f'  Unique forms (approx.): {metadata.unique_forms:,}')
+            self.stdout.write(f'  Unique lemmas (approx.): {metadata.unique_lemmas:,}')
+            top_forms = CorpusSketch.from_dict(metadata.sketches).overview(top=10)['top_forms']
+            self.stdout.write(f"  Top words: {', '.join(row['value'] for row in top_forms)}")
             self.stdout.write('')
             self.stdout.write(f'Document ID: {document.id}')
             self.stdout.write(f'Title: {document.filename}')
             
+            # Searchable on the index backend without a rebuild
+            segment = index_documents([document.id])
+            if segment:
+                self.stdout.write(f'Index segment: {segment}')
+            
             if metadata.global_metadata:
                 self.stdout.write('')
                 self.stdout.write('Global Metadata:')
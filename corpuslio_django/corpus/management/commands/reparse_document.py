@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from django.conf import settings
 from corpus.models import Document
 from corpus.parsers import CoNLLUParser, VRTParser
+from corpus.services.index_service import reindex_documents
 import os
 
 
@@ -63,5 +64,8 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS('Reparse successful'))
             self.stdout.write(f'Document ID: {document.id} - tokens: {document.token_count}')
 
+            # Old version is tombstoned, the new one indexed into a new segment
+            reindex_documents([document.id])
+
         except Exception as e:
             raise CommandError(f'Reparse failed: {e}')
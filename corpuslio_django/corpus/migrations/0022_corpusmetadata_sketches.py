@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-16 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corpus', '0021_userprofile_enable_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='corpusmetadata',
+            name='sketches',
+            field=models.JSONField(blank=True, default=dict, help_text='HyperLogLog, Count-Min and Space-Saving sketches written at import', verbose_name='İstatistik Özetleri'),
+        ),
+    ]
@@ -1974,6 +1974,14 @@ class CorpusMetadata(models.Model):
         verbose_name="Benzersiz Form Sayısı"
     )
     
+    # Mergeable approximate statistics (corpuslio.index.sketches.CorpusSketch.to_dict)
+    sketches = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="İstatistik Özetleri",
+        help_text="HyperLogLog, Count-Min and Space-Saving sketches written at import"
+    )
+    
     class Meta:
         verbose_name = "Korpus Metadata"
         verbose_name_plural = "Korpus Metadata"
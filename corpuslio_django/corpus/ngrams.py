@@ -1,7 +1,19 @@
 """N-gram and collocation analysis module."""
 
-from collections import Counter, defaultdict
-import math
+from collections import Counter
+import os
+import sys
+
+import numpy as np
+
+# Add project root (parent of corpuslio_django) to path for corpuslio imports
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from corpuslio.index import FrequencyTable, count_collocates
+from corpuslio.index.frequency import encode
+from corpuslio.index.ngrams import count_windows, slot_bits, unpack
 
 
 class NgramAnalyzer:
@@ -17,6 +29,26 @@ class NgramAnalyzer:
         self.data = analysis_data
         self.words = [item.get('word', '').lower() for item in analysis_data if isinstance(item, dict)]
         self.total_words = len(self.words)
+        # Word counts (encoded once instead of list.count per lookup)
+        self.frequencies = FrequencyTable.from_columns({'word': self.words})
+        # Encoded text for vectorized window counting
+        self.lexicon, self.codes = encode(self.words)
+        self.counts = np.bincount(self.codes, minlength=len(self.lexicon))
+    
+    def _count_ngrams(self, lexicon, codes, n):
+        """Distinct n-grams as ID rows with their counts (packed-key np.unique,
+        no tuple per window)."""
+        if len(codes) < n:
+            return np.empty((0, n), dtype=np.int64), np.empty(0, dtype=np.int64)
+        bits = slot_bits([len(lexicon)] * n)
+        keys, counts = count_windows([codes] * n, np.arange(len(codes) - n + 1), bits)
+        return unpack(keys, bits), counts
+    
+    def _top(self, lexicon, codes, n, top_k):
+        """Most frequent n-grams as (tuple, count), ties in alphabetical order."""
+        rows, counts = self._count_ngrams(lexicon, codes, n)
+        order = np.lexsort(tuple(rows[:, j] for j in reversed(range(n))) + (-counts,))[:top_k]
+        return [(tuple(lexicon[rows[i]].tolist()), int(counts[i])) for i in order.tolist()]
     
     def extract_ngrams(self, n=2):
         """
@@ -28,12 +60,9 @@ class NgramAnalyzer:
         Returns:
             Counter object with n-grams and frequencies
         """
-        ngrams = []
-        for i in range(len(self.words) - n + 1):
-            ngram = tuple(self.words[i:i+n])
-            ngrams.append(ngram)
-        
-        return Counter(ngrams)
+        rows, counts = self._count_ngrams(self.lexicon, self.codes, n)
+        words = self.lexicon[rows]
+        return Counter({tuple(ngram): count for ngram, count in zip(words.tolist(), counts.tolist())})
     
     def get_top_ngrams(self, n=2, top_k=50):
         """
@@ -46,8 +75,29 @@ class NgramAnalyzer:
         Returns:
             List of tuples: (ngram, count)
         """
-        ngrams = self.extract_ngrams(n)
-        return ngrams.most_common(top_k)
+        return self._top(self.lexicon, self.codes, n, top_k)
+    
+    def _collocates(self, target_word, window):
+        """Co-occurrence counts of every word within window of target_word
+        (one vectorized pass over all occurrences)."""
+        target_id = int(np.searchsorted(self.lexicon, target_word))
+        if target_id >= len(self.lexicon) or self.lexicon[target_id] != target_word:
+            return None
+        nodes = np.flatnonzero(self.codes == target_id)
+        return count_collocates(
+            self.codes, self.lexicon, nodes, window, window, self.counts, self.total_words
+        )
+    
+    def _scores(self, c1, c2, c12):
+        """MI and T-score of word pairs from their counts (arrays or scalars)."""
+        n = self.total_words
+        p1 = np.asarray(c1, dtype=np.float64) / n
+        p2 = np.asarray(c2, dtype=np.float64) / n
+        p12 = np.asarray(c12, dtype=np.float64) / n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mi = np.nan_to_num(np.log2(p12 / (p1 * p2)), nan=0.0, posinf=0.0, neginf=0.0)
+            t_score = np.nan_to_num((p12 - p1 * p2) / np.sqrt(p12 / n), nan=0.0, posinf=0.0, neginf=0.0)
+        return mi, t_score
     
     def calculate_collocation_scores(self, word1, word2, window=5):
         """
@@ -65,40 +115,25 @@ class NgramAnalyzer:
         word2 = word2.lower()
         
         # Count occurrences
-        c1 = self.words.count(word1)
-        c2 = self.words.count(word2)
-        c12 = 0  # Co-occurrence count
+        c1 = self.frequencies.frequency('word', word1)
+        c2 = self.frequencies.frequency('word', word2)
         
-        # Find co-occurrences within window
-        for i, w in enumerate(self.words):
-            if w == word1:
-                context = self.words[max(0, i-window):min(len(self.words), i+window+1)]
-                c12 += context.count(word2)
+        # Co-occurrences within window
+        table = self._collocates(word1, window)
+        c12 = 0
+        if table is not None:
+            i = int(np.searchsorted(table.values, word2))
+            if i < len(table.values) and table.values[i] == word2:
+                c12 = int(table.observed[i])
         
         if c12 == 0:
             return None
         
-        # Calculate probabilities
-        p1 = c1 / self.total_words
-        p2 = c2 / self.total_words
-        p12 = c12 / self.total_words
-        
-        # Mutual Information (MI)
-        try:
-            mi = math.log2(p12 / (p1 * p2))
-        except (ValueError, ZeroDivisionError):
-            mi = 0
-        
-        # T-score
-        try:
-            t_score = (p12 - p1 * p2) / math.sqrt(p12 / self.total_words)
-        except (ValueError, ZeroDivisionError):
-            t_score = 0
-        
+        mi, t_score = self._scores(c1, c2, c12)
         return {
             'frequency': c12,
-            'mutual_information': mi,
-            't_score': t_score,
+            'mutual_information': float(mi),
+            't_score': float(t_score),
             'word1_freq': c1,
             'word2_freq': c2
         }
@@ -117,33 +152,29 @@ class NgramAnalyzer:
             List of dicts with collocate info, sorted by MI score
         """
         target_word = target_word.lower()
-        collocates = defaultdict(int)
-        
-        # Find all words co-occurring with target
-        for i, w in enumerate(self.words):
-            if w == target_word:
-                context_start = max(0, i - window)
-                context_end = min(len(self.words), i + window + 1)
-                context = self.words[context_start:i] + self.words[i+1:context_end]
-                
-                for collocate in context:
-                    if collocate != target_word:
-                        collocates[collocate] += 1
-        
-        # Calculate scores for each collocate
-        results = []
-        for collocate, freq in collocates.items():
-            if freq >= min_freq:
-                scores = self.calculate_collocation_scores(target_word, collocate, window)
-                if scores:
-                    results.append({
-                        'collocate': collocate,
-                        **scores
-                    })
+        table = self._collocates(target_word, window)
+        if table is None:
+            return []
+        
+        selected = np.flatnonzero((table.observed >= min_freq) & (table.values != target_word))
+        c1 = self.frequencies.frequency('word', target_word)
+        c2 = table.collocate_frequencies[selected]
+        c12 = table.observed[selected]
+        mi, t_score = self._scores(c1, c2, c12)
         
         # Sort by MI score
-        results.sort(key=lambda x: x['mutual_information'], reverse=True)
-        return results[:top_k]
+        order = np.argsort(-mi, kind='stable')[:top_k]
+        return [
+            {
+                'collocate': str(table.values[selected[i]]),
+                'frequency': int(c12[i]),
+                'mutual_information': float(mi[i]),
+                't_score': float(t_score[i]),
+                'word1_freq': c1,
+                'word2_freq': int(c2[i]),
+            }
+            for i in order.tolist()
+        ]
     
     def get_ngram_pos_patterns(self, n=2, top_k=30):
         """
@@ -157,10 +188,5 @@ class NgramAnalyzer:
             List of tuples: (pos_pattern, count)
         """
         pos_tags = [item.get('pos', 'UNK') for item in self.data if isinstance(item, dict)]
-        
-        ngrams = []
-        for i in range(len(pos_tags) - n + 1):
-            ngram = tuple(pos_tags[i:i+n])
-            ngrams.append(ngram)
-        
-        return Counter(ngrams).most_common(top_k)
+        lexicon, codes = encode(pos_tags)
+        return self._top(lexicon, codes, n, top_k)
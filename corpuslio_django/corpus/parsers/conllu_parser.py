@@ -19,12 +19,21 @@ Format:
   10. MISC: Any other annotation
 """
 
+import os
 import re
+import sys
 import hashlib
 from typing import Dict, List, Tuple, Optional
 from django.db import transaction
 from corpus.models import Document, Sentence, Token, CorpusMetadata, Content, Analysis
 
+# Add project root (parent of corpuslio_django) to path for corpuslio imports
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from corpuslio.index.sketches import CorpusSketch
+
 
 class CoNLLUParser:
     """Parse CoNLL-U format corpus files."""
@@ -43,9 +52,9 @@ class CoNLLUParser:
         self.stats = {
             'sentence_count': 0,
             'token_count': 0,
-            'unique_forms': set(),
-            'unique_lemmas': set(),
         }
+        # Type counts and top words/n-grams in one bounded-memory pass
+        self.sketch = CorpusSketch()
     
     def parse(self) -> Dict:
         """Parse entire CoNLL-U file.
@@ -71,6 +80,8 @@ class CoNLLUParser:
                 self.sentences.append(sentence_data)
                 self.stats['sentence_count'] += 1
         
+        self.sketch.flush()
+        overview = self.sketch.overview(top=0)
         return {
             'file_hash': file_hash,
             'global_metadata': self.global_metadata,
@@ -78,9 +89,10 @@ class CoNLLUParser:
             'stats': {
                 'sentence_count': self.stats['sentence_count'],
                 'token_count': self.stats['token_count'],
-                'unique_forms': len(self.stats['unique_forms']),
-                'unique_lemmas': len(self.stats['unique_lemmas']),
-            }
+                'unique_forms': overview['unique_forms'],
+                'unique_lemmas': overview['unique_lemmas'],
+            },
+            'sketch': self.sketch.to_dict(),
         }
     
     def _parse_sentence_block(self, block: str) -> Optional[Dict]:
@@ -147,13 +159,16 @@ class CoNLLUParser:
             
             tokens.append(token_data)
             self.stats['token_count'] += 1
-            self.stats['unique_forms'].add(token_data['form'].lower())
-            if token_data['lemma']:
-                self.stats['unique_lemmas'].add(token_data['lemma'].lower())
         
         if not tokens:
             return None
         
+        self.sketch.add_sentence(
+            [token['form'] for token in tokens],
+            [token['lemma'] for token in tokens],
+            [token['upos'] for token in tokens],
+        )
+        
         # Reconstruct text if not provided
         if not text:
             text = self._reconstruct_text(tokens)
@@ -233,6 +248,7 @@ class CoNLLUParser:
             sentence_count=parse_result['stats']['sentence_count'],
             unique_lemmas=parse_result['stats']['unique_lemmas'],
             unique_forms=parse_result['stats']['unique_forms'],
+            sketches=parse_result['sketch'],
         )
         
         # Import sentences and tokens
@@ -22,13 +22,22 @@ geldi\tgel\tVERB\tAspect=Perf|Mood=Ind|Number=Sing|Person=3|Polarity=Pos|Tense=P
 </text>
 """
 
+import os
 import re
+import sys
 import hashlib
 from typing import Dict, List, Tuple, Optional
 from xml.etree import ElementTree as ET
 from django.db import transaction
 from corpus.models import Document, Sentence, Token, CorpusMetadata, Content, Analysis
 
+# Add project root (parent of corpuslio_django) to path for corpuslio imports
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from corpuslio.index.sketches import CorpusSketch
+
 
 class VRTParser:
     """Parse VRT (Verticalized Text) format corpus files."""
@@ -48,9 +57,9 @@ class VRTParser:
         self.stats = {
             'sentence_count': 0,
             'token_count': 0,
-            'unique_forms': set(),
-            'unique_lemmas': set(),
         }
+        # Type counts and top words/n-grams in one bounded-memory pass
+        self.sketch = CorpusSketch()
         
         # Column configuration (can be customized per corpus)
         self.columns = ['form', 'lemma', 'pos']  # Default, will auto-detect
@@ -75,6 +84,7 @@ class VRTParser:
         current_metadata = {}
         text_metadata = {}
         para_metadata = {}
+        new_paragraph = False
         
         for line_num, line in enumerate(lines, start=1):
             line = line.strip()
@@ -91,8 +101,13 @@ class VRTParser:
                     self.global_metadata = attrs
                 elif tag == 'p':
                     para_metadata = attrs
+                    new_paragraph = True
                 elif tag == 's':
                     current_metadata = {**text_metadata, **para_metadata, **attrs}
+                    if new_paragraph:
+                        # Mark the paragraph start like CoNLL-U "# newpar id = ..."
+                        current_metadata['newpar id'] = para_metadata.get('id', '')
+                        new_paragraph = False
                     current_sentence_text = []
                     current_sentence_tokens = []
                 
@@ -112,6 +127,11 @@ class VRTParser:
                         }
                         self.sentences.append(sentence_data)
                         self.stats['sentence_count'] += 1
+                        self.sketch.add_sentence(
+                            [token['form'] for token in current_sentence_tokens],
+                            [token.get('lemma', '') for token in current_sentence_tokens],
+                            [token.get('upos', '') for token in current_sentence_tokens],
+                        )
                     
                     current_sentence_text = []
                     current_sentence_tokens = []
@@ -130,10 +150,9 @@ class VRTParser:
                     current_sentence_tokens.append(token_data)
                     current_sentence_text.append(token_data['form'])
                     self.stats['token_count'] += 1
-                    self.stats['unique_forms'].add(token_data['form'].lower())
-                    if token_data.get('lemma'):
-                        self.stats['unique_lemmas'].add(token_data['lemma'].lower())
         
+        self.sketch.flush()
+        overview = self.sketch.overview(top=0)
         return {
             'file_hash': file_hash,
             'global_metadata': self.global_metadata,
@@ -142,9 +161,10 @@ class VRTParser:
             'stats': {
                 'sentence_count': self.stats['sentence_count'],
                 'token_count': self.stats['token_count'],
-                'unique_forms': len(self.stats['unique_forms']),
-                'unique_lemmas': len(self.stats['unique_lemmas']),
-            }
+                'unique_forms': overview['unique_forms'],
+                'unique_lemmas': overview['unique_lemmas'],
+            },
+            'sketch': self.sketch.to_dict(),
         }
     
     def _parse_opening_tag(self, line: str) -> Tuple[str, Dict]:
@@ -251,6 +271,7 @@ class VRTParser:
             sentence_count=parse_result['stats']['sentence_count'],
             unique_lemmas=parse_result['stats']['unique_lemmas'],
             unique_forms=parse_result['stats']['unique_forms'],
+            sketches=parse_result['sketch'],
         )
         
         # Import sentences and tokens
@@ -10,25 +10,152 @@ Supports:
 """
 
 import re
-from typing import List, Dict, Optional, Tuple
-from django.db.models import Q, Count, F
-from corpus.models import Token, Sentence, Document
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import numpy as np
+from django.conf import settings
+from django.db.models import Q, Count, F, Max
+from corpus.models import Token, Document
+from corpus.services.index_service import (
+    get_collocation_finder, get_concordance_sorter, get_corpus_index, get_dispersion_counter, get_document_vectors, get_frequency_counter,
+    get_ngram_counter, get_sharded_executor,
+)
+from corpus.services.subcorpus_service import subcorpus_q
+from corpuslio.concordance import (
+    BATCH_SIZE as KWIC_BATCH_SIZE, ConcordanceBatch, ConcordanceLine, ConcordanceLines, MergedBatch, StreamBatch, batched,
+    iter_lines,
+)
+from corpuslio.index import (
+    KEYNESS_MEASURES, MEASURES, Bitmap, CollocationTable, DispersionTable, DocumentVectors, FrequencyTable,
+    KeynessTable, Lexicon, QueryPlanner, count_collocates,
+)
+from corpuslio.index.cursor import decode_cursor, encode_cursor, fingerprint
+from corpuslio.index.dispersion import dispersion_scores, reduced_frequencies
+from corpuslio.index.keyness import compare
+from corpuslio.index.frequency import encode
+from corpuslio.index.ngrams import NgramTable, count_windows, reduce_counts, slot_bits, window_starts
+from corpuslio.index.sorting import MAX_SORT_OFFSET, collation_ranks, parse_sort, sample_hits
+from corpuslio.index.parallel import condition_predicates, index_version
+
+# Regex matching more types than this is left to the database (an IN list
+# of that size is no cheaper than scanning)
+MAX_REGEX_TYPES = 5000
+
+# Tokens read per block by the ORM n-gram counter (blocks end on sentence boundaries)
+NGRAM_BLOCK_SIZE = 200_000
+
+# Hit count modes of CorpusQueryEngine.count / pattern_count
+COUNT_MODES = ('exact', 'estimate', 'auto')
+
+# Estimated hits above which 'auto' counting keeps the estimate
+AUTO_EXACT_LIMIT = 1_000_000
+
+# Values per IN (...) list of the ORM backend (below SQLite's variable limit)
+ORM_IN_BLOCK = 500
+
+# Concordance sort by document filename, then corpus position (besides context sort specs)
+DOCUMENT_SORT = 'document'
+
+# ORM backend vocabulary per field, invalidated when new tokens are imported:
+# field -> (max token id, Lexicon)
+_vocabulary_cache: Dict[str, Tuple[Optional[int], Lexicon]] = {}
+
+# ORM backend document vectors, invalidated when new tokens are imported:
+# (field, weighting) -> (max token id, DocumentVectors)
+_document_vectors_cache: Dict[Tuple[str, str], Tuple[Optional[int], DocumentVectors]] = {}
+
+
+def collocation_options(params) -> dict:
+    """Association measure, left/right span and collocate POS from request parameters."""
+    measure = params.get('measure', 'frequency')
+    left = params.get('left', '')
+    right = params.get('right', '')
+    pos = params.get('pos', '')
+    return {
+        'measure': measure if measure in MEASURES else 'frequency',
+        'left': int(left) if str(left).isdigit() else None,
+        'right': int(right) if str(right).isdigit() else None,
+        'pos': [tag.strip().upper() for tag in str(pos).split(',') if tag.strip()] or None,
+    }
+
+
+class OrmBatch(ConcordanceBatch):
+    """ORM hit tokens with the (index, form) pairs of their sentences.
+    
+    Context windows are cut from the sentence forms (one query per batch)
+    when a line's 'left' or 'right' is read.
+    """
+    
+    def __init__(self, tokens: List[Token], sentence_forms: Dict[int, List[Tuple[int, str]]], context_size: int):
+        super().__init__(len(tokens))
+        self.tokens = tokens
+        self.sentence_forms = sentence_forms
+        self.context_size = context_size
+    
+    def context(self, row: int, side: int) -> str:
+        """Forms before (side -1) or after (side 1) a hit, clipped to its sentence."""
+        token = self.tokens[row]
+        forms = self.sentence_forms.get(token.sentence_id, [])
+        if side < 0:
+            words = [form for index, form in forms if index < token.index][-self.context_size:]
+        else:
+            words = [form for index, form in forms if index > token.index][:self.context_size]
+        return ' '.join(words) if self.context_size else ''
+    
+    def keyword(self, row: int) -> Optional[str]:
+        token = self.tokens[row]
+        return next((form for index, form in self.sentence_forms.get(token.sentence_id, []) if index == token.index), None)
+    
+    fields = {
+        'left': lambda batch, row: batch.context(row, -1),
+        'keyword': lambda batch, row: batch.keyword(row),
+        'right': lambda batch, row: batch.context(row, 1),
+        'document': lambda batch, row: batch.tokens[row].document.filename,
+        'sentence_id': lambda batch, row: batch.tokens[row].sentence.id,
+        'sentence_index': lambda batch, row: batch.tokens[row].sentence.index,
+        'token_id': lambda batch, row: batch.tokens[row].id,
+        'lemma': lambda batch, row: batch.tokens[row].lemma,
+        'pos': lambda batch, row: batch.tokens[row].upos,
+    }
 
 
 class CorpusQueryEngine:
-    """Query engine for linguistic corpus search."""
+    """Query engine for linguistic corpus search.
+    
+    Runs on one of two backends:
+    - 'orm': filters Token rows in the database
+    - 'index': positional corpus index (corpuslio.index), built with
+      ``python manage.py build_corpus_index``
+    """
     
-    def __init__(self, documents: Optional[List[int]] = None):
+    def __init__(self, documents: Optional[Union[List[int], Bitmap]] = None, backend: Optional[str] = None):
         """Initialize query engine.
         
         Args:
-            documents: List of document IDs to search in (None = all)
+            documents: Document IDs or subcorpus Bitmap to search in
+                (None or an empty list = all; an empty Bitmap = none)
+            backend: 'orm', 'index' or 'auto' (index when one has been built).
+                Defaults to settings.CORPUS_QUERY_BACKEND.
+        
+        Raises:
+            ValueError: If backend='index' and no index has been built
         """
+        if documents is not None and not isinstance(documents, Bitmap):
+            documents = Bitmap.from_ids(documents) if documents else None
         self.documents = documents
         self.base_queryset = Token.objects.all()
         
-        if documents:
-            self.base_queryset = self.base_queryset.filter(document_id__in=documents)
+        if documents is not None:
+            self.base_queryset = self.base_queryset.filter(subcorpus_q(documents))
+        
+        backend = backend or getattr(settings, 'CORPUS_QUERY_BACKEND', 'auto')
+        self.index = None
+        if backend in ('auto', 'index'):
+            self.index = get_corpus_index()
+            if self.index is None and backend == 'index':
+                raise ValueError("Corpus index not built. Run: python manage.py build_corpus_index")
+        self.backend = 'index' if self.index is not None else 'orm'
+        self.shards = get_sharded_executor(self.index) if self.index is not None else None
+        self._frequency_tables: Dict[tuple, FrequencyTable] = {}
     
     def concordance(
         self, 
@@ -37,8 +164,12 @@ class CorpusQueryEngine:
         query_type: str = 'form',
         regex: bool = False,
         case_sensitive: bool = False,
-        limit: int = 100
-    ) -> List[Dict]:
+        limit: int = 100,
+        sort: Optional[str] = None,
+        offset: int = 0,
+        sample: Optional[int] = None,
+        seed: Optional[int] = None
+    ) -> ConcordanceLines:
         """KWIC concordance search.
         
         Args:
@@ -48,72 +179,371 @@ class CorpusQueryEngine:
             regex: Use regex matching (default False)
             case_sensitive: Case-sensitive search (default False)
             limit: Max results (default 100)
+            sort: Context sort spec ('L1', 'R1', 'R2+R1', 'KWIC'), 'document'
+                (document filename, then corpus position) or None (corpus order);
+                both backends sort all hits before the page is cut
+            offset: Skip this many (sorted) hits
+            sample: Draw this many hits uniformly at random first (None = all hits);
+                only the sampled hits get context, and sort/offset/limit apply to the sample
+            seed: Random seed of the sample (same seed, same sample)
         
         Returns:
-            List of concordance lines with left/right context
+            Sequence of concordance lines (lazy mappings, see iter_concordance)
+        
+        Raises:
+            ValueError: If the sort spec is invalid
         """
-        # Build query
-        if query_type == 'form':
-            field = 'form'
-        elif query_type == 'lemma':
-            field = 'lemma'
-        elif query_type == 'upos':
-            field = 'upos'
+        return ConcordanceLines(self._concordance_batches(
+            query, context_size, query_type, regex, case_sensitive, limit, sort, offset, sample, seed
+        ))
+    
+    def iter_concordance(
+        self,
+        query: str,
+        context_size: int = 5,
+        query_type: str = 'form',
+        regex: bool = False,
+        case_sensitive: bool = False,
+        limit: int = 100,
+        sort: Optional[str] = None,
+        offset: int = 0,
+        sample: Optional[int] = None,
+        seed: Optional[int] = None
+    ) -> Iterator[ConcordanceLine]:
+        """KWIC concordance lines as a stream (arguments as for concordance).
+        
+        Hit positions are resolved up front; context windows are then read
+        KWIC_BATCH_SIZE hits at a time and every hit becomes a
+        ConcordanceLine whose 'left', 'keyword', 'right', ... are only
+        formatted when read. Use ``dict(line)`` to serialize a line.
+        
+        Raises:
+            ValueError: If the sort spec is invalid (when called, not when iterated)
+        """
+        return iter_lines(self._concordance_batches(
+            query, context_size, query_type, regex, case_sensitive, limit, sort, offset, sample, seed
+        ))
+    
+    def _concordance_batches(
+        self,
+        query: str,
+        context_size: int,
+        query_type: str,
+        regex: bool,
+        case_sensitive: bool,
+        limit: int,
+        sort: Optional[str],
+        offset: int,
+        sample: Optional[int],
+        seed: Optional[int]
+    ) -> Iterator[ConcordanceBatch]:
+        """Context batches of a concordance; hits are resolved when called."""
+        self._check_sort(sort)
+        field = self._query_field(query_type)
+        
+        if self.index is not None:
+            if sort or sample is not None:
+                positions = self.shards.positions(field, query, regex, case_sensitive, self.documents)
+                if sample is not None:
+                    positions = sample_hits(positions, sample, seed)
+                if sort == DOCUMENT_SORT:
+                    positions = positions[self._document_order(positions)]
+                elif sort:
+                    positions = get_concordance_sorter(self.index).sort(positions, sort)
+                positions = positions[offset:offset + limit]
+            else:
+                positions = self.shards.positions(field, query, regex, case_sensitive, self.documents, offset + limit)
+                positions = positions[offset:]
+            return self._index_batches(positions, context_size)
+        
+        queryset = self.base_queryset.filter(
+            self._query_q(field, query, regex, case_sensitive)
+        ).select_related('sentence', 'document')
+        if sort or sample is not None:
+            # Order (or sample) the hit IDs first, then load only the rows of the page
+            page = self._orm_hit_ids(queryset, sort, sample, seed)[offset:offset + limit].tolist()
+            rows = queryset.in_bulk(page)
+            matching_tokens = [rows[token_id] for token_id in page]
         else:
-            field = 'form'
+            # Corpus order, as on the index backend and in concordance_page
+            matching_tokens = queryset.order_by('document_id', 'sentence_id', 'index')[offset:offset + limit].iterator(
+                chunk_size=KWIC_BATCH_SIZE
+            )
         
-        # Apply filters
-        if regex:
-            if case_sensitive:
-                filter_kwargs = {f'{field}__regex': query}
+        return self._orm_batches(matching_tokens, context_size)
+    
+    def concordance_page(
+        self,
+        query: str,
+        context_size: int = 5,
+        query_type: str = 'form',
+        regex: bool = False,
+        case_sensitive: bool = False,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        sort: Optional[str] = None,
+        sample: Optional[int] = None,
+        seed: Optional[int] = None
+    ) -> Dict:
+        """One page of a KWIC concordance, resumable from an opaque cursor.
+        
+        In corpus order the cursor holds the last (or first) hit shown:
+        the index backend resumes the posting list walk right after it and
+        the ORM backend filters on (document, sentence, index), so a deep
+        page costs the same as the first one. Sorted and sampled
+        concordances page by offset into the sorted or sampled hits.
+        
+        Args:
+            query, context_size, query_type, regex, case_sensitive, sort,
+            sample, seed: As for concordance
+            limit: Lines per page
+            cursor: next_cursor or prev_cursor of an earlier page of the
+                same query (None = first page)
+        
+        Returns:
+            Dict with 'results', 'next_cursor' and 'prev_cursor' (None at
+            the last or first page)
+        
+        Raises:
+            ValueError: If the sort spec is invalid, or the cursor is
+                malformed or belongs to another query, subcorpus or index
+        """
+        self._check_sort(sort)
+        field = self._query_field(query_type)
+        key = self._cursor_key(field, query, regex, case_sensitive, sort, sample, seed)
+        state = decode_cursor(cursor, key) if cursor else {}
+        
+        if sort or sample is not None:
+            offset = max(0, int(state.get('offset', 0)))
+            results = self.concordance(
+                query, context_size, query_type, regex, case_sensitive, limit + 1, sort, offset, sample, seed
+            )
+            return {
+                'results': results[:limit],
+                'next_cursor': encode_cursor(key, offset=offset + limit) if len(results) > limit else None,
+                'prev_cursor': encode_cursor(key, offset=max(0, offset - limit)) if offset > 0 else None,
+            }
+        
+        reverse = 'before' in state
+        if self.index is not None:
+            if reverse:
+                positions = self.shards.positions(
+                    field, query, regex, case_sensitive, self.documents, limit + 1,
+                    end=int(state['before']), reverse=True
+                )
             else:
-                filter_kwargs = {f'{field}__iregex': query}
+                positions = self.shards.positions(
+                    field, query, regex, case_sensitive, self.documents, limit + 1,
+                    start=int(state.get('after', -1)) + 1
+                )
+            more = len(positions) > limit
+            positions = positions[len(positions) - limit:] if reverse and more else positions[:limit]
+            results = list(iter_lines(self._index_batches(positions, context_size)))
+            bounds = [int(p) for p in positions[[0, -1]]] if len(positions) else None
         else:
-            if case_sensitive:
-                filter_kwargs = {f'{field}__exact': query}
+            queryset = self.base_queryset.filter(
+                self._query_q(field, query, regex, case_sensitive)
+            ).select_related('sentence', 'document')
+            if reverse:
+                queryset = queryset.filter(self._keyset_q(state['before'], 'lt')).order_by(
+                    '-document_id', '-sentence_id', '-index'
+                )
             else:
-                filter_kwargs = {f'{field}__iexact': query}
+                if 'after' in state:
+                    queryset = queryset.filter(self._keyset_q(state['after'], 'gt'))
+                queryset = queryset.order_by('document_id', 'sentence_id', 'index')
+            tokens = list(queryset[:limit + 1])
+            more = len(tokens) > limit
+            tokens = tokens[:limit]
+            if reverse:
+                tokens.reverse()
+            results = list(iter_lines(self._orm_batches(tokens, context_size)))
+            bounds = [[t.document_id, t.sentence_id, t.index] for t in (tokens[0], tokens[-1])] if tokens else None
+        
+        has_next = more if not reverse else True
+        has_prev = more if reverse else 'after' in state
+        return {
+            'results': results,
+            'next_cursor': encode_cursor(key, after=bounds[1]) if bounds and has_next else None,
+            'prev_cursor': encode_cursor(key, before=bounds[0]) if bounds and has_prev else None,
+        }
+    
+    def _cursor_key(self, *parts) -> str:
+        """Fingerprint of a query on this engine's backend, index version and subcorpus."""
+        if self.index is not None:
+            version = [index_version(segment) for segment in self.shards.segments]
+        else:
+            version = Token.objects.aggregate(max_id=Max('id'))['max_id']
+        documents = self.documents.to_array() if self.documents is not None else None
+        return fingerprint(self.backend, version, documents, *parts)
+    
+    @staticmethod
+    def _keyset_q(key: List[int], lookup: str) -> Q:
+        """Tokens before ('lt') or after ('gt') a (document, sentence, index) key."""
+        document_id, sentence_id, index = key
+        return (
+            Q(**{f'document_id__{lookup}': document_id})
+            | Q(document_id=document_id, **{f'sentence_id__{lookup}': sentence_id})
+            | Q(document_id=document_id, sentence_id=sentence_id, **{f'index__{lookup}': index})
+        )
+    
+    @staticmethod
+    def _sentence_forms(tokens: List[Token]) -> Dict[int, List[Tuple[int, str]]]:
+        """(index, form) pairs of the sentences of hit tokens, in one query."""
+        sentence_forms = {}
+        for sentence_id, index, form in Token.objects.filter(
+            sentence_id__in={token.sentence_id for token in tokens}
+        ).order_by('sentence_id', 'index').values_list('sentence_id', 'index', 'form'):
+            sentence_forms.setdefault(sentence_id, []).append((index, form))
+        return sentence_forms
+    
+    def _orm_batches(self, tokens: Iterable[Token], context_size: int) -> Iterator[ConcordanceBatch]:
+        """Context batches of hit tokens, one sentence query per batch of hits."""
+        for chunk in batched(tokens, KWIC_BATCH_SIZE):
+            yield OrmBatch(chunk, self._sentence_forms(chunk), context_size)
+    
+    @staticmethod
+    def _check_sort(sort: Optional[str]):
+        """Validate a concordance sort.
         
-        matching_tokens = self.base_queryset.filter(
-            **filter_kwargs
-        ).select_related('sentence', 'document')[:limit]
+        Raises:
+            ValueError: If it is neither 'document' nor a valid context sort spec
+        """
+        if sort and sort != DOCUMENT_SORT:
+            parse_sort(sort)
+    
+    def _orm_hit_ids(self, queryset, sort: Optional[str], sample: Optional[int], seed: Optional[int]) -> np.ndarray:
+        """Token IDs of all hits (or of a sample of them) in sort order.
         
-        results = []
-        for token in matching_tokens:
-            # Get context tokens
-            sent_tokens = Token.objects.filter(
-                sentence=token.sentence
-            ).order_by('index')
-            
-            left_context = []
-            keyword = None
-            right_context = []
-            
-            for t in sent_tokens:
-                if t.index < token.index:
-                    left_context.append(t.form)
-                elif t.index == token.index:
-                    keyword = t.form
-                else:
-                    right_context.append(t.form)
-            
-            # Trim context
-            left_context = left_context[-context_size:] if left_context else []
-            right_context = right_context[:context_size] if right_context else []
-            
-            results.append({
-                'left': ' '.join(left_context),
-                'keyword': keyword,
-                'right': ' '.join(right_context),
-                'document': token.document.filename,
-                'sentence_id': token.sentence.id,
-                'sentence_index': token.sentence.index,
-                'token_id': token.id,
-                'lemma': token.lemma,
-                'pos': token.upos,
-            })
+        Hits are sampled in corpus order, as on the index. Context sorts
+        read the forms of the hit sentences in one query and order the
+        hits by one ``np.lexsort`` over collated ranks, like
+        ConcordanceSorter (case-folded, missing context first, ties in
+        corpus order).
+        """
+        fields = ('id', 'sentence_id', 'index') + (('document__filename',) if sort == DOCUMENT_SORT else ())
+        rows = list(queryset.order_by('document_id', 'sentence_id', 'index').values_list(*fields))
+        if sample is not None:
+            rows = [rows[i] for i in sample_hits(np.arange(len(rows)), sample, seed).tolist()]
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        if not sort or not rows:
+            return ids
+        if sort == DOCUMENT_SORT:
+            return ids[np.argsort(np.array([row[3] or '' for row in rows], dtype=str), kind='stable')]
         
-        return results
+        hits = np.array([row[1:3] for row in rows], dtype=np.int64)
+        context = list(Token.objects.filter(
+            sentence_id__in=queryset.values('sentence_id')
+        ).values_list('sentence_id', 'index', 'form'))
+        sentence_ids = np.array([row[0] for row in context], dtype=np.int64)
+        indexes = np.array([row[1] for row in context], dtype=np.int64)
+        lexicon, form_ids = np.unique(np.array([row[2] or '' for row in context], dtype=str), return_inverse=True)
+        ranks = collation_ranks(lexicon)[form_ids.ravel()]
+        # (sentence, index + offset) as one sortable int64 key
+        stride = int(max(indexes.max(), hits[:, 1].max())) + 2 * MAX_SORT_OFFSET + 1
+        keys = sentence_ids * stride + indexes + MAX_SORT_OFFSET
+        order = np.argsort(keys, kind='stable')
+        keys, ranks = keys[order], ranks[order]
+        columns = []
+        for offset in parse_sort(sort):
+            target = hits[:, 0] * stride + hits[:, 1] + offset + MAX_SORT_OFFSET
+            slots = np.minimum(np.searchsorted(keys, target), len(keys) - 1)
+            columns.append(np.where(keys[slots] == target, ranks[slots], -1))
+        return ids[np.lexsort(tuple(reversed(columns)))]
+    
+    def _document_order(self, positions: np.ndarray) -> np.ndarray:
+        """Permutation of sorted global positions by document filename, then position."""
+        names, rows = [], []
+        for segment, base, local in self.index.split(positions):
+            texts = segment.structure('text')
+            numbers, inverse = np.unique(texts.find_all(local), return_inverse=True)
+            rows.append(inverse.ravel() + len(names))
+            names.extend(texts.attribute_values(numbers, 'filename'))
+        if not names:
+            return np.zeros(0, dtype=np.int64)
+        ranks = np.unique(np.array(names, dtype=str), return_inverse=True)[1].ravel()
+        return np.argsort(ranks[np.concatenate(rows)], kind='stable')
+    
+    @staticmethod
+    def _query_field(query_type: str) -> str:
+        """Token field searched by a concordance query type."""
+        return query_type if query_type in ('form', 'lemma', 'upos') else 'form'
+    
+    def _query_q(self, field: str, query: str, regex: bool, case_sensitive: bool) -> Q:
+        """ORM filter of a concordance query."""
+        if regex:
+            return self._regex_q(field, query, case_sensitive)
+        if case_sensitive:
+            return Q(**{f'{field}__exact': query})
+        return Q(**{f'{field}__iexact': query})
+    
+    def count(
+        self,
+        query: str,
+        query_type: str = 'form',
+        regex: bool = False,
+        case_sensitive: bool = False,
+        mode: str = 'exact'
+    ) -> Dict:
+        """Number of concordance hits, without building any context.
+        
+        Args:
+            query: Search term (as for concordance)
+            query_type: 'form', 'lemma', 'upos'
+            regex: Use regex matching
+            case_sensitive: Case-sensitive search
+            mode: 'exact' (posting list cardinalities), 'estimate' (lexicon
+                statistics only) or 'auto' (exact unless a subcorpus query is
+                estimated above AUTO_EXACT_LIMIT hits)
+        
+        Returns:
+            Dict with 'count' and 'exact' (False for estimates)
+        
+        Raises:
+            ValueError: If the mode is unknown
+        """
+        if mode not in COUNT_MODES:
+            raise ValueError(f"Unknown count mode: {mode}. Use one of {', '.join(COUNT_MODES)}")
+        field = self._query_field(query_type)
+        if self.index is None:
+            count = self.base_queryset.filter(self._query_q(field, query, regex, case_sensitive)).count()
+            return {'count': count, 'exact': True}
+        
+        if mode == 'estimate' or (mode == 'auto' and self.documents is not None):
+            estimate = self.shards.estimate([(0, field, query, regex, case_sensitive)], 1, self.documents)
+            if mode == 'estimate' or estimate > AUTO_EXACT_LIMIT:
+                return {'count': estimate, 'exact': False}
+        return {'count': self.shards.count(field, query, regex, case_sensitive, self.documents), 'exact': True}
+    
+    def pattern_count(self, pattern: str, mode: str = 'exact') -> Dict:
+        """Number of pattern_search matches, without building any context.
+        
+        Args:
+            pattern: CQP-style pattern
+            mode: 'exact' (planned posting list intersection), 'estimate'
+                (planner cardinality estimate) or 'auto' (exact unless
+                estimated above AUTO_EXACT_LIMIT matches)
+        
+        Returns:
+            Dict with 'count' and 'exact' (False for estimates)
+        
+        Raises:
+            ValueError: If the mode is unknown
+        """
+        if mode not in COUNT_MODES:
+            raise ValueError(f"Unknown count mode: {mode}. Use one of {', '.join(COUNT_MODES)}")
+        conditions = self._parse_pattern(pattern)
+        if not conditions:
+            return {'count': 0, 'exact': True}
+        if self.index is None:
+            return {'count': self.base_queryset.filter(self._pattern_q(conditions)).count(), 'exact': True}
+        
+        index_conditions = self._index_conditions(conditions)
+        if mode != 'exact':
+            estimate = self.shards.estimate(index_conditions, 1, self.documents)
+            if mode == 'estimate' or estimate > AUTO_EXACT_LIMIT:
+                return {'count': estimate, 'exact': False}
+        return {'count': self.shards.count_join(index_conditions, 1, self.documents), 'exact': True}
     
     def pattern_search(
         self,
@@ -138,15 +568,10 @@ class CorpusQueryEngine:
         # Parse pattern
         conditions = self._parse_pattern(pattern)
         
-        # Build query
-        query = Q()
-        for field, value, is_regex in conditions:
-            if is_regex:
-                query &= Q(**{f'{field}__iregex': value})
-            else:
-                query &= Q(**{f'{field}__iexact': value})
+        if self.index is not None:
+            return self._index_pattern_search(conditions, limit)
         
-        matching_tokens = self.base_queryset.filter(query)[:limit]
+        matching_tokens = self.base_queryset.filter(self._pattern_q(conditions))[:limit]
         
         results = []
         for token in matching_tokens:
@@ -160,6 +585,151 @@ class CorpusQueryEngine:
         
         return results
     
+    def _regex_q(self, field: str, pattern: str, case_sensitive: bool) -> Q:
+        """Regex filter evaluated against the vocabulary of a field.
+        
+        The pattern runs once per distinct value and the query becomes an
+        IN lookup on the matching types; unselective patterns fall back to
+        a database regex.
+        """
+        vocabulary = self._vocabulary(field)
+        lex_ids = vocabulary.match(pattern, case_sensitive)
+        if len(lex_ids) > MAX_REGEX_TYPES:
+            lookup = 'regex' if case_sensitive else 'iregex'
+            return Q(**{f'{field}__{lookup}': pattern})
+        
+        return Q(**{f'{field}__in': [vocabulary[i] for i in lex_ids.tolist()]})
+    
+    def _vocabulary(self, field: str) -> Lexicon:
+        """Distinct values of a Token field (cached per process)."""
+        max_id = Token.objects.aggregate(max_id=Max('id'))['max_id']
+        cached = _vocabulary_cache.get(field)
+        if cached is None or cached[0] != max_id:
+            values = sorted(Token.objects.values_list(field, flat=True).distinct().order_by())
+            cached = _vocabulary_cache[field] = (max_id, Lexicon(values))
+        return cached[1]
+    
+    def _index_pattern_search(self, conditions: List[Tuple[str, str, bool]], limit: int) -> List[Dict]:
+        """Single-token pattern search on the positional index.
+        
+        Conditions are ordered and executed by the cost-based planner
+        (the rarest condition is decoded, the others filter its
+        candidates), on all index shards in parallel.
+        """
+        if not conditions:
+            return []
+        
+        positions = self.shards.join(self._index_conditions(conditions), 1, self.documents, limit)
+        
+        results = []
+        for segment, base, local in self.index.split(positions[:limit]):
+            forms = segment.attribute('form')
+            lemmas = segment.attribute('lemma')
+            upos = segment.attribute('upos')
+            _, sent_starts, sent_ends = segment.structure('s').bounds(local)
+            filenames = self._document_filenames(segment, local)
+            
+            for pos, sent_start, sent_end, filename in zip(
+                local.tolist(), sent_starts.tolist(), sent_ends.tolist(), filenames
+            ):
+                results.append({
+                    'form': forms.value_at(pos),
+                    'lemma': lemmas.value_at(pos),
+                    'pos': upos.value_at(pos),
+                    'sentence': ' '.join(forms.values(sent_start, sent_end)),
+                    'document': filename,
+                })
+        
+        return results
+    
+    def _index_conditions(self, conditions: List[Tuple[str, str, bool]]) -> List[tuple]:
+        """Single-token conditions as (offset, attribute, value, regex, case_sensitive)."""
+        return [(0, field, value, is_regex, False) for field, value, is_regex in conditions]
+    
+    def _pattern_q(self, conditions: List[Tuple[str, str, bool]]) -> Q:
+        """ORM filter for pattern conditions."""
+        query = Q()
+        for field, value, is_regex in conditions:
+            if is_regex:
+                query &= self._regex_q(field, value, case_sensitive=False)
+            else:
+                query &= Q(**{f'{field}__iexact': value})
+        return query
+    
+    def explain(self, pattern: str, limit: int = 100) -> Dict:
+        """Show how pattern_search executes a pattern.
+        
+        On the index backend the query is run and every plan step reports
+        estimated and actual rows; on the ORM backend the database plan is
+        returned.
+        
+        Args:
+            pattern: CQP-style pattern (as for pattern_search)
+            limit: Max results (as for pattern_search)
+        
+        Returns:
+            Dict with 'backend' and the plan
+        """
+        conditions = self._parse_pattern(pattern)
+        
+        if self.index is not None:
+            if not conditions:
+                return {'backend': 'index', 'segments': []}
+            # Every segment has its own lexicons and statistics, hence its own plan
+            segments = []
+            for name, segment in zip(self.index.segment_names, self.index.segments):
+                planner = QueryPlanner(segment)
+                predicates = condition_predicates(segment, self._index_conditions(conditions))
+                plan = planner.plan(predicates, 1, self.documents)
+                planner.execute(plan, self.documents, limit)
+                segments.append({'segment': name, **plan.explain()})
+            return {'backend': 'index', 'segments': segments}
+        
+        queryset = self.base_queryset.filter(self._pattern_q(conditions))
+        return {
+            'backend': 'orm',
+            'sql': str(queryset.query),
+            'plan': queryset.explain(),
+            'actual_rows': queryset[:limit].count(),
+        }
+    
+    @staticmethod
+    def _document_filenames(segment, positions: np.ndarray) -> List[str]:
+        """Filenames of the documents containing segment positions (text_filename)."""
+        texts = segment.structure('text')
+        return texts.attribute_values(texts.find_all(positions), 'filename')
+    
+    def _index_batches(self, positions: np.ndarray, context_size: int) -> Iterator[ConcordanceBatch]:
+        """Context batches of index positions, KWIC_BATCH_SIZE hits at a time.
+        
+        Sentence and document of every hit come from the structural index
+        (binary search, no database query); the context windows of a batch
+        are read from the form stream in one read per segment and clipped
+        to the sentence, like the ORM backend. Positions are global; each
+        is resolved in its own segment. Rows come in the order of
+        positions (e.g. a sorted concordance page).
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        for first in range(0, len(positions), KWIC_BATCH_SIZE):
+            chunk = positions[first:first + KWIC_BATCH_SIZE]
+            order = np.argsort(chunk, kind='stable')
+            batches, parts = [], []
+            for segment, base, local in self.index.split(chunk[order]):
+                extra = [name for name in ('xpos', 'feats', 'deprel') if segment.has_attribute(name)]
+                batches.append(StreamBatch(segment, base, local, context_size, extra))
+                parts.append(np.full(len(local), len(batches) - 1, dtype=np.int32))
+            if len(batches) == 1 and np.all(order[1:] > order[:-1]):
+                yield batches[0]
+                continue
+            # Map every row of the chunk to its segment batch and row there
+            sorted_parts = np.concatenate(parts)
+            sorted_rows = np.concatenate([np.arange(len(p), dtype=np.int32) for p in parts])
+            merged_parts = np.empty(len(chunk), dtype=np.int32)
+            merged_rows = np.empty(len(chunk), dtype=np.int32)
+            merged_parts[order] = sorted_parts
+            merged_rows[order] = sorted_rows
+            yield MergedBatch(batches, merged_parts, merged_rows)
+    
     def _parse_pattern(self, pattern: str) -> List[Tuple[str, str, bool]]:
         """Parse CQP-style pattern.
         
@@ -205,68 +775,106 @@ class CorpusQueryEngine:
         keyword: str,
         window_size: int = 5,
         min_frequency: int = 2,
-        measure: str = 'frequency'
+        measure: str = 'frequency',
+        left: Optional[int] = None,
+        right: Optional[int] = None,
+        pos: Optional[List[str]] = None,
+        limit: Optional[int] = None
     ) -> List[Dict]:
         """Collocation analysis.
         
+        Collocates (case-folded lemmas) are counted in the windows around
+        all occurrences of the keyword at once and ranked by an association
+        measure (see corpuslio.index.collocation). Windows stay inside the
+        keyword's sentence and skip punctuation.
+        
         Args:
-            keyword: Target word
-            window_size: Context window (default 5)
+            keyword: Target lemma (case-insensitive)
+            window_size: Context window on both sides (default 5)
             min_frequency: Minimum co-occurrence (default 2)
-            measure: 'frequency', 'mi' (mutual information)
+            measure: 'frequency', 'mi', 'mi3', 't_score', 'log_likelihood',
+                'log_dice', 'dice' or 'chi_square'
+            left: Window left of the keyword (default: window_size)
+            right: Window right of the keyword (default: window_size)
+            pos: Only count collocates with these POS tags
+            limit: Max results
         
         Returns:
-            List of collocates with statistics
-        """
-        # Find keyword tokens
-        keyword_tokens = self.base_queryset.filter(
-            lemma__iexact=keyword
-        ).select_related('sentence')
-        
-        # Collect collocates
-        collocates = {}
-        
-        for kw_token in keyword_tokens:
-            # Get context tokens
-            sent_tokens = Token.objects.filter(
-                sentence=kw_token.sentence
-            ).order_by('index')
-            
-            for token in sent_tokens:
-                # Skip keyword itself and punctuation
-                if token.id == kw_token.id or token.upos == 'PUNCT':
-                    continue
-                
-                # Check if in window
-                distance = abs(token.index - kw_token.index)
-                if distance <= window_size:
-                    collocate = token.lemma.lower()
-                    
-                    if collocate not in collocates:
-                        collocates[collocate] = {
-                            'lemma': collocate,
-                            'frequency': 0,
-                            'positions': {'left': 0, 'right': 0},
-                        }
-                    
-                    collocates[collocate]['frequency'] += 1
-                    
-                    if token.index < kw_token.index:
-                        collocates[collocate]['positions']['left'] += 1
-                    else:
-                        collocates[collocate]['positions']['right'] += 1
-        
-        # Filter by min frequency
-        results = [
-            col for col in collocates.values()
-            if col['frequency'] >= min_frequency
-        ]
+            List of collocates with counts and all association scores
+            ('score' = the ranking measure)
         
-        # Sort by frequency
-        results.sort(key=lambda x: x['frequency'], reverse=True)
+        Raises:
+            ValueError: If the measure is unknown
+        """
+        left = window_size if left is None else left
+        right = window_size if right is None else right
+        if self.index is not None:
+            table = get_collocation_finder(self.index).find(
+                keyword, 'lemma', 'lemma', left, right, self.documents, collocate_pos=pos
+            )
+        else:
+            table = self._orm_collocations(keyword, left, right, pos)
         
+        results = []
+        for row in table.rows(measure, min_frequency, limit):
+            row.update(
+                lemma=row['collocate'],
+                word=row['collocate'],
+                positions={'left': row['left'], 'right': row['right']},
+                left_count=row['left'],
+                right_count=row['right'],
+                mi_score=row['mi'],
+                score=row[measure],
+            )
+            results.append(row)
         return results
     
+    def _orm_collocations(
+        self, keyword: str, left: int, right: int, pos: Optional[List[str]]
+    ) -> CollocationTable:
+        """Collocations on the ORM backend.
+        
+        The keyword's sentences are read in bulk (no query per hit) and
+        counted with count_collocates; collocate frequencies come from one
+        grouped query per block of lemmas.
+        """
+        nodes = self.base_queryset.filter(lemma__iexact=keyword)
+        node_keys = set(nodes.values_list('sentence_id', 'index'))
+        sentence_ids = sorted({sentence_id for sentence_id, _ in node_keys})
+        rows = []
+        for first in range(0, len(sentence_ids), ORM_IN_BLOCK):
+            rows.extend(Token.objects.filter(
+                sentence_id__in=sentence_ids[first:first + ORM_IN_BLOCK]
+            ).order_by('sentence_id', 'index').values_list('sentence_id', 'index', 'lemma', 'upos'))
+        
+        sentences = np.array([row[0] for row in rows], dtype=np.int64)
+        lemmas = [row[2] or '' for row in rows]
+        tags = np.array([row[3] or '' for row in rows], dtype=str)
+        lexicon, codes = encode([lemma.lower() for lemma in lemmas])
+        tag_values, tag_codes = encode(tags)
+        changes = np.flatnonzero(sentences[1:] != sentences[:-1]) + 1
+        boundaries = (np.concatenate([[0], changes]), np.concatenate([changes, [len(rows)]]))
+        node_positions = np.array(
+            [n for n, row in enumerate(rows) if (row[0], row[1]) in node_keys], dtype=np.int64
+        )
+        
+        base = self.base_queryset.exclude(upos='PUNCT')
+        frequencies = np.zeros(len(lexicon), dtype=np.int64)
+        distinct = sorted(set(lemmas))
+        for first in range(0, len(distinct), ORM_IN_BLOCK):
+            for lemma, count in base.filter(lemma__in=distinct[first:first + ORM_IN_BLOCK]).values_list(
+                'lemma'
+            ).annotate(count=Count('id')).order_by():
+                frequencies[np.searchsorted(lexicon, (lemma or '').lower())] += count
+        
+        return count_collocates(
+            codes, lexicon, node_positions, left, right, frequencies, base.count(),
+            boundaries=boundaries,
+            skipped=tags == 'PUNCT',
+            wanted=np.isin(tags, pos) if pos else None,
+            pos=(tag_codes, tag_values),
+        )
+    
     def ngrams(
         self,
         n: int = 2,
@@ -274,7 +882,13 @@ class CorpusQueryEngine:
         use_lemma: bool = False,
         limit: int = 100
     ) -> List[Dict]:
-        """N-gram extraction with streaming to prevent memory issues.
+        """N-gram extraction over the whole corpus or subcorpus.
+        
+        N-grams are counted exactly on integer-encoded tokens (see
+        corpuslio.index.ngrams): they do not cross sentence boundaries,
+        skip punctuation and are case-insensitive. On the index backend
+        the persisted per-segment tables answer 2- to 5-grams when they
+        are built.
         
         Args:
             n: N-gram size (2=bigram, 3=trigram)
@@ -284,65 +898,275 @@ class CorpusQueryEngine:
         
         Returns:
             List of n-grams with frequencies
-        
-        NOTE: This implementation uses database streaming to prevent memory
-        explosion with large corpora. For very large datasets (100M+ tokens),
-        consider pre-computing n-grams or using the engine layer.
         """
-        # Build base sentence queryset
-        if self.documents:
-            sentences_qs = Sentence.objects.filter(
-                document_id__in=self.documents
+        field = 'lemma' if use_lemma else 'form'
+        if self.index is not None:
+            counter = get_ngram_counter(self.index)
+            table = counter.stored(n, field, self.documents, min_frequency) or counter.count(
+                n, field, self.documents, exclude_pos=('PUNCT',), lowercase=True
             )
         else:
-            sentences_qs = Sentence.objects.all()
+            table = self._orm_ngrams(n, field)
         
-        ngram_counts = {}
-        processed_sentences = 0
-        max_sentences = 10000  # Safety limit to prevent runaway queries
+        return [
+            {'ngram': ' '.join(values), 'frequency': count}
+            for values, count in table.top(limit, min_frequency)
+        ]
+    
+    def _orm_ngrams(self, n: int, field: str) -> NgramTable:
+        """Count n-grams of the Token table on the ORM backend.
         
-        # Use iterator() for memory-efficient streaming
-        # chunk_size=1000 processes 1000 sentences at a time
-        for sentence in sentences_qs.iterator(chunk_size=1000):
-            if processed_sentences >= max_sentences:
-                break
-            
-            # Get tokens for this sentence only (not prefetched)
-            tokens = list(Token.objects.filter(
-                sentence=sentence
-            ).order_by('index').only('form', 'lemma', 'upos'))
-            
-            # Generate n-grams
-            for i in range(len(tokens) - n + 1):
-                ngram_tokens = tokens[i:i+n]
-                
-                # Skip if contains punctuation
-                if any(t.upos == 'PUNCT' for t in ngram_tokens):
-                    continue
-                
-                # Build n-gram string
-                if use_lemma:
-                    ngram_str = ' '.join(t.lemma for t in ngram_tokens)
-                else:
-                    ngram_str = ' '.join(t.form for t in ngram_tokens)
-                
-                ngram_str = ngram_str.lower()
-                
-                if ngram_str not in ngram_counts:
-                    ngram_counts[ngram_str] = 0
-                ngram_counts[ngram_str] += 1
-            
-            processed_sentences += 1
+        Tokens are streamed in sentence order and encoded against the
+        case-folded vocabulary of the field; every block of about
+        NGRAM_BLOCK_SIZE tokens ends on a sentence boundary and is counted
+        with the vectorized window counter.
+        """
+        vocabulary = self._vocabulary(field)
+        folded = np.unique(np.char.lower(np.array([value or '' for value in vocabulary.values], dtype=str)))
+        bits = slot_bits([len(folded)] * n)
         
-        # Filter and sort
-        results = [
-            {'ngram': ngram, 'frequency': count}
-            for ngram, count in ngram_counts.items()
-            if count >= min_frequency
-        ]
-        results.sort(key=lambda x: x['frequency'], reverse=True)
+        parts = []
+        
+        def flush(sentences, values, tags):
+            if not sentences:
+                return
+            sentences = np.array(sentences, dtype=np.int64)
+            changes = np.flatnonzero(sentences[1:] != sentences[:-1]) + 1
+            boundaries = (np.concatenate([[0], changes]), np.concatenate([changes, [len(sentences)]]))
+            blocked = np.array(tags, dtype=object) == 'PUNCT'
+            starts = window_starts(n, 0, len(sentences), boundaries, blocked)
+            ids = np.searchsorted(folded, np.char.lower(np.array(values, dtype=str)))
+            parts.append(count_windows([ids] * n, starts, bits))
+        
+        sentences, values, tags = [], [], []
+        rows = self.base_queryset.order_by('sentence_id', 'index').values_list('sentence_id', field, 'upos')
+        for sentence_id, value, upos in rows.iterator(chunk_size=10000):
+            if len(sentences) >= NGRAM_BLOCK_SIZE and sentence_id != sentences[-1]:
+                flush(sentences, values, tags)
+                sentences, values, tags = [], [], []
+            sentences.append(sentence_id)
+            values.append(value or '')
+            tags.append(upos)
+        flush(sentences, values, tags)
+        
+        keys, counts = reduce_counts(parts)
+        return NgramTable((field,) * n, [folded] * n, keys, counts, bits)
+    
+    def keyness(
+        self,
+        reference: Optional[Union[List[int], Bitmap]] = None,
+        use_lemma: bool = True,
+        measure: str = 'log_likelihood',
+        min_frequency: int = 3,
+        smoothing: float = 1.0,
+        negative: bool = False,
+        limit: int = 100
+    ) -> List[Dict]:
+        """Keywords of the engine's subcorpus against a reference subcorpus.
+        
+        Both frequency lists are case-insensitive and skip punctuation; on
+        the index backend they come from the frequency engine, so any two
+        subcorpora (collections, facets, years...) can be compared.
+        
+        Args:
+            reference: Reference document IDs or Bitmap (None = whole corpus)
+            use_lemma: Use lemmas instead of forms
+            measure: One of KEYNESS_MEASURES
+            min_frequency: Minimum frequency in the corpus the words are key in
+            smoothing: Simple maths constant k
+            negative: Return the words key in the reference instead
+            limit: Max results
         
-        return results[:limit]
+        Returns:
+            List of keywords with both frequencies, every keyness score and
+            'score' (the ranking measure)
+        """
+        if measure not in KEYNESS_MEASURES:
+            measure = 'log_likelihood'
+        table = self.keyness_table(reference, 'lemma' if use_lemma else 'form', smoothing)
+        rows = table.rows(measure, min_frequency, limit, negative)
+        for row in rows:
+            row['score'] = row[measure]
+        return rows
+    
+    def keyness_table(
+        self,
+        reference: Optional[Union[List[int], Bitmap]],
+        field: str,
+        smoothing: float = 1.0
+    ) -> KeynessTable:
+        """Aligned focus/reference frequency lists of a field (see keyness)."""
+        if reference is not None and not isinstance(reference, Bitmap):
+            reference = Bitmap.from_ids(reference) if reference else None
+        
+        if self.index is not None:
+            focus = self.frequency_table((field,), ('PUNCT',)).lowercase()
+            reference = get_frequency_counter(self.index).count((field,), reference, ('PUNCT',)).lowercase()
+        else:
+            focus = self._orm_frequency_list(self.base_queryset, field)
+            queryset = Token.objects.all() if reference is None else Token.objects.filter(subcorpus_q(reference))
+            reference = self._orm_frequency_list(queryset, field)
+        return compare(focus, reference, field, smoothing)
+    
+    @staticmethod
+    def _orm_frequency_list(queryset, field: str) -> FrequencyTable:
+        """Case-folded frequency list of a field from one grouped query."""
+        rows = queryset.exclude(upos='PUNCT').values_list(field).annotate(c=Count('id')).order_by()
+        rows = list(rows)
+        values = np.array([value or '' for value, _ in rows], dtype=str)
+        counts = np.array([count for _, count in rows], dtype=np.int64)
+        folded, inverse = np.unique(np.char.lower(values), return_inverse=True)
+        totals = np.bincount(inverse, weights=counts, minlength=len(folded)).astype(np.int64)
+        return FrequencyTable(int(counts.sum()), {field: (folded, totals)})
+    
+    def dispersion(
+        self,
+        words: Optional[List[str]] = None,
+        use_lemma: bool = True,
+        sort: str = 'frequency',
+        min_frequency: int = 1,
+        lowercase: bool = False,
+        limit: Optional[int] = 100
+    ) -> List[Dict]:
+        """Dispersion of words across the documents of the corpus or subcorpus.
+        
+        Range, Juilland's D, Gries' DP (and DPnorm) and ARF of every type
+        are computed at once (see corpuslio.index.dispersion); PUNCT is not
+        counted.
+        
+        Args:
+            words: Only these words, in this order (default: frequency list)
+            use_lemma: Use lemmas instead of forms
+            sort: 'frequency' or a dispersion measure (most even first)
+            min_frequency: Minimum frequency of listed words
+            lowercase: Merge case variants
+            limit: Max results
+        
+        Returns:
+            List of words with frequency, range and dispersion measures
+        """
+        return self.dispersion_table(use_lemma, lowercase).rows(limit, min_frequency, sort, words)
+    
+    def dispersion_table(self, use_lemma: bool = True, lowercase: bool = False) -> DispersionTable:
+        """Dispersion of every form or lemma (see dispersion)."""
+        field = 'lemma' if use_lemma else 'form'
+        if self.index is not None:
+            return get_dispersion_counter(self.index).table(field, self.documents, lowercase)
+        
+        base = self.base_queryset.exclude(upos='PUNCT')
+        documents, rows, columns, frequencies, sizes, lexicon = self._orm_document_counts(base, field, lowercase)
+        scores = dispersion_scores(rows, columns, frequencies, sizes, len(lexicon))
+        
+        stream = [value or '' for value in base.order_by('document_id', 'sentence_id', 'index').values_list(
+            field, flat=True
+        ).iterator(chunk_size=10000)]
+        stream = np.array(stream, dtype=str)
+        if lowercase:
+            stream = np.char.lower(stream)
+        scores['arf'] = reduced_frequencies(np.searchsorted(lexicon, stream), len(lexicon))
+        return DispersionTable(lexicon, scores, len(documents), int(sizes.sum()))
+    
+    @staticmethod
+    def _orm_document_counts(queryset, field: str, lowercase: bool = False):
+        """Document x term counts of the ORM backend from one grouped query.
+        
+        Returns:
+            (document ID per row, row per entry, term ID per entry, count
+            per entry, tokens per row, sorted terms)
+        """
+        counts = list(queryset.values_list('document_id', field).annotate(c=Count('id')).order_by())
+        values = np.array([value or '' for _, value, _ in counts], dtype=str)
+        if lowercase:
+            values = np.char.lower(values)
+        lexicon, columns = encode(values)
+        documents, rows = np.unique(np.array([d for d, _, _ in counts], dtype=np.int64), return_inverse=True)
+        frequencies = np.array([c for _, _, c in counts], dtype=np.int64)
+        # Case variants of one document become one entry
+        width = max(len(lexicon), 1)
+        keys, inverse = np.unique(rows.ravel() * width + columns, return_inverse=True)
+        frequencies = np.bincount(inverse.ravel(), weights=frequencies, minlength=len(keys)).astype(np.int64)
+        rows, columns = keys // width, keys % width
+        sizes = np.bincount(rows, weights=frequencies, minlength=len(documents)).astype(np.int64)
+        return documents, rows, columns, frequencies, sizes, lexicon
+    
+    def document_vectors(self, use_lemma: bool = True, weighting: str = 'tfidf') -> DocumentVectors:
+        """Normalized TF-IDF or PPMI vectors of all documents (not only the subcorpus)."""
+        field = 'lemma' if use_lemma else 'form'
+        if self.index is not None:
+            return get_document_vectors(field, weighting, self.index)
+        
+        key = (field, weighting)
+        cached = _document_vectors_cache.get(key)
+        latest = Token.objects.aggregate(latest=Max('id'))['latest']
+        if cached is None or cached[0] != latest:
+            documents, rows, columns, counts, sizes, lexicon = self._orm_document_counts(
+                Token.objects.exclude(upos='PUNCT'), field, lowercase=True
+            )
+            cached = (latest, DocumentVectors(documents, rows, columns, counts, sizes, len(lexicon), weighting))
+            _document_vectors_cache[key] = cached
+        return cached[1]
+    
+    def similar_documents(
+        self,
+        document_id: Optional[int] = None,
+        k: int = 10,
+        use_lemma: bool = True,
+        weighting: str = 'tfidf',
+        candidates: Optional[Union[List[int], Bitmap]] = None
+    ) -> List[Dict]:
+        """"More like this": documents most similar to a document or to the subcorpus.
+        
+        Args:
+            document_id: Query document (default: the engine's subcorpus as a whole)
+            k: Number of documents
+            use_lemma: Compare lemma instead of form vectors
+            weighting: 'tfidf' or 'ppmi'
+            candidates: Only rank these documents (default: all)
+        
+        Returns:
+            List of {'document_id', 'similarity'}, most similar first
+        
+        Raises:
+            ValueError: If neither a document nor a subcorpus is given
+        """
+        if document_id is None and self.documents is None:
+            raise ValueError("Give a document or a subcorpus to compare")
+        vectors = self.document_vectors(use_lemma, weighting)
+        similar = vectors.most_similar(document_id, self.documents, k, candidates)
+        return [{'document_id': doc_id, 'similarity': score} for doc_id, score in similar]
+    
+    def compare_documents(
+        self,
+        groups: List[Union[List[int], Bitmap]],
+        use_lemma: bool = True,
+        weighting: str = 'tfidf'
+    ) -> List[List[float]]:
+        """N-way cosine similarity matrix of documents or subcorpora.
+        
+        Args:
+            groups: One entry per compared item: document IDs or a Bitmap
+            use_lemma: Compare lemma instead of form vectors
+            weighting: 'tfidf' or 'ppmi'
+        
+        Returns:
+            N x N nested list of similarities
+        """
+        matrix = self.document_vectors(use_lemma, weighting).compare(groups)
+        return np.round(matrix, 4).tolist()
+    
+    def frequency_table(self, attributes: Tuple[str, ...], exclude_pos: Tuple[str, ...] = ()) -> FrequencyTable:
+        """Frequency distributions of attributes on the index backend.
+        
+        One bincount pass over the subcorpus (see corpuslio.index.frequency);
+        forms and lemmas carry their dominant POS when 'upos' is counted.
+        Tables are kept for the lifetime of the engine.
+        """
+        key = (attributes, exclude_pos)
+        if key not in self._frequency_tables:
+            self._frequency_tables[key] = get_frequency_counter(self.index).count(
+                attributes, self.documents, exclude_pos
+            )
+        return self._frequency_tables[key]
     
     def pos_distribution(self) -> Dict[str, int]:
         """Get POS tag distribution.
@@ -350,6 +1174,10 @@ class CorpusQueryEngine:
         Returns:
             Dict mapping POS tags to counts
         """
+        if self.index is not None:
+            distribution = self.frequency_table(('upos',)).distribution('upos')
+            return {pos: count for pos, count in distribution.items() if pos}
+        
         pos_counts = self.base_queryset.values('upos').annotate(
             count=Count('id')
         ).order_by('-count')
@@ -374,32 +1202,38 @@ class CorpusQueryEngine:
         """
         field = 'lemma' if use_lemma else 'form'
 
-        # Base queryset excluding punctuation
-        base = self.base_queryset.exclude(upos='PUNCT')
-
-        # Total tokens to compute percentages
-        try:
-            total_tokens = base.count() or 1
-        except Exception:
-            total_tokens = 1
-
-        # Count frequencies and also gather a representative POS tag
-        freq_qs = base.values(field).annotate(
-            count=Count('id')
-        ).order_by('-count')[:limit]
+        if self.index is not None:
+            table = self.frequency_table((field, 'upos'), ('PUNCT',))
+            total_tokens = table.tokens or 1
+            rows = [(word, frequency, pos) for word, frequency, pos in table.top(field, limit, min_length) if word]
+        else:
+            # Base queryset excluding punctuation
+            base = self.base_queryset.exclude(upos='PUNCT')
 
-        results = []
-        for item in freq_qs:
-            word = item.get(field)
-            if not word or len(word) < min_length:
-                continue
+            # Total tokens to compute percentages
+            try:
+                total_tokens = base.count() or 1
+            except Exception:
+                total_tokens = 1
 
-            frequency = item.get('count', 0)
+            freq_qs = base.values(field).annotate(
+                count=Count('id')
+            ).order_by('-count')[:limit]
+            top = [
+                (item[field], item['count']) for item in freq_qs
+                if item.get(field) and len(item[field]) >= min_length
+            ]
 
-            # Determine the most common POS for this token/lemma
-            pos_q = base.filter(**{f"{field}__iexact": word}).values('upos').annotate(c=Count('id')).order_by('-c')
-            pos = pos_q[0]['upos'] if pos_q and pos_q[0].get('upos') else ''
+            # Most common POS of every listed word from one grouped query
+            pos_counts = {}
+            for word, upos, count in base.filter(**{f'{field}__in': [word for word, _ in top]}).values_list(
+                field, 'upos'
+            ).annotate(c=Count('id')).order_by(field, '-c', 'upos'):
+                pos_counts.setdefault(word, upos or '')
+            rows = [(word, frequency, pos_counts.get(word, '')) for word, frequency in top]
 
+        results = []
+        for word, frequency, pos in rows:
             # If using lemma, include lemma explicitly; otherwise lemma == word
             lemma = word if use_lemma else ''
 
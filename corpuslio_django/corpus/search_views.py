@@ -6,14 +6,37 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django_ratelimit.decorators import ratelimit
 from corpus.models import Document
-from corpus.query_engine import CorpusQueryEngine
+from corpus.query_engine import COUNT_MODES, DOCUMENT_SORT, CorpusQueryEngine, collocation_options
+from corpuslio.index import DISPERSION_MEASURES, KEYNESS_MEASURES, MEASURES, WEIGHTINGS, parse_sort
 from corpus.collections import Collection as CollectionService
+from corpus.services.facet_service import get_facet_index
+from corpus.services.overview_service import corpus_overview
+from corpus.services.subcorpus_service import build_subcorpus, subcorpus_from_params
 from corpus.corpus_export_utils import (
     export_concordance_csv, export_concordance_json,
     export_collocation_csv, export_ngram_csv, export_frequency_csv
 )
+import secrets
 import time
 
+# Concordance sort menu values -> context sort specs (corpuslio.index.sorting)
+CONCORDANCE_SORTS = {'left': 'L1', 'right': 'R1'}
+
+# Further multi-level sorts offered in the search form
+CONCORDANCE_SORT_SPECS = ('L2', 'L3', 'R2', 'R3', 'L1+L2', 'R1+R2', 'R2+R1', 'KWIC+R1')
+
+# Largest random sample of concordance hits returned by the API
+MAX_CONCORDANCE_SAMPLE = 5000
+
+
+def sample_params(params):
+    """(sample size, seed) of a request; a missing seed is drawn so the sample can be repeated."""
+    sample = params.get('sample', '')
+    if not str(sample).isdigit() or int(sample) == 0:
+        return None, None
+    seed = params.get('seed', '')
+    return int(sample), int(seed) if str(seed).isdigit() else secrets.randbelow(2 ** 32)
+
 
 @ratelimit(key='user_or_ip', rate='100/h', method='GET')
 def corpus_search_view(request):
@@ -38,11 +61,15 @@ def corpus_search_view(request):
     collection_id = request.GET.get('collection')
     genre_filter = request.GET.get('genre')
     author_filter = request.GET.get('author')
-    sort_by = request.GET.get('sort', 'none')  # none, left, right, frequency
+    sort_by = request.GET.get('sort', 'none')  # none, left, right, document or a spec like L2, R2+R1
     limit = int(request.GET.get('limit', 100))
+    cursor = request.GET.get('cursor') or None
+    page = max(int(request.GET.get('page', 1)), 1) if cursor else 1
     
     results = []
+    next_cursor = prev_cursor = None
     total_matches = 0
+    total_exact = True
     execution_time = 0
     unique_docs = 0
     
@@ -50,78 +77,57 @@ def corpus_search_view(request):
         import time
         start_time = time.time()
         
-        # Filter by collection, genre, author
-        document_ids = None
-        from corpus.models import CorpusMetadata
-        
-        filter_kwargs = {}
-        if collection_id:
-            try:
-                collection = CollectionService.objects.get(id=collection_id)
-                document_ids = list(collection.documents.values_list('id', flat=True))
-            except:
-                pass
-        
-        # Filter by genre/author
-        if genre_filter or author_filter:
-            meta_query = CorpusMetadata.objects.all()
-            if genre_filter:
-                meta_query = meta_query.filter(global_metadata__genre__icontains=genre_filter)
-            if author_filter:
-                meta_query = meta_query.filter(global_metadata__author__icontains=author_filter)
-            
-            meta_doc_ids = list(meta_query.values_list('document_id', flat=True))
-            
-            if document_ids:
-                # Intersection with collection
-                document_ids = list(set(document_ids) & set(meta_doc_ids))
-            else:
-                document_ids = meta_doc_ids
+        # Collection, genre, author and year filters as one document bitmap
+        document_ids = subcorpus_from_params(request.GET)
         
         # Initialize query engine
         engine = CorpusQueryEngine(documents=document_ids)
         
-        # Execute concordance search
-        results = engine.concordance(
+        # Execute concordance search; context and document sorts run over all hits in the engine,
+        # other pages resume from the cursor of the page before or after them
+        sort_spec = CONCORDANCE_SORTS.get(sort_by, sort_by if sort_by != 'none' else None)
+        if sort_spec and sort_spec != DOCUMENT_SORT:
+            try:
+                parse_sort(sort_spec)
+            except ValueError:
+                sort_by, sort_spec = 'none', None
+        search = dict(
             query=query,
             context_size=context_size,
             query_type=search_type,
             regex=regex,
             case_sensitive=case_sensitive,
-            limit=limit
+            limit=limit,
+            sort=sort_spec
         )
+        try:
+            concordance = engine.concordance_page(cursor=cursor, **search)
+        except ValueError:
+            # Stale cursor (other query or rebuilt index): start over
+            cursor, page = None, 1
+            concordance = engine.concordance_page(**search)
+        results = concordance['results']
+        next_cursor, prev_cursor = concordance['next_cursor'], concordance['prev_cursor']
         
-        # Sorting
-        if sort_by == 'left':
-            results.sort(key=lambda x: x.get('left', '').lower())
-        elif sort_by == 'right':
-            results.sort(key=lambda x: x.get('right', '').lower())
-        elif sort_by == 'document':
-            results.sort(key=lambda x: x.get('document', ''))
-        
-        total_matches = len(results)
+        # Hit total from the count fast path (estimated for large subcorpus queries)
+        counted = engine.count(query, search_type, regex, case_sensitive, mode='auto')
+        total_matches, total_exact = counted['count'], counted['exact']
         unique_docs = len(set(r.get('document', '') for r in results))
         execution_time = int((time.time() - start_time) * 1000)  # ms
     
+    params = request.GET.copy()
+    params.pop('page', None)
+    params.pop('cursor', None)
+    page_query = params.urlencode()
+    
     # Get available collections, genres, authors (only show collections with documents)
     from django.db.models import Count
     collections = CollectionService.objects.annotate(doc_count=Count('documents')).filter(doc_count__gt=0)
     
-    # Get unique genres and authors from CorpusMetadata.global_metadata JSONField
-    from corpus.models import CorpusMetadata
-    
-    genres = set()
-    authors = set()
-    
-    for metadata in CorpusMetadata.objects.all():
-        if metadata.global_metadata:
-            if 'genre' in metadata.global_metadata and metadata.global_metadata['genre']:
-                genres.add(metadata.global_metadata['genre'])
-            if 'author' in metadata.global_metadata and metadata.global_metadata['author']:
-                authors.add(metadata.global_metadata['author'])
-    
-    genres = sorted(genres)
-    authors = sorted(authors)
+    # Genre and author dropdowns from the facet index (no metadata scan)
+    facets = get_facet_index()
+    genres = facets.facet_values('genre')
+    authors = facets.facet_values('author')
     
     context = {
         'query': query,
@@ -131,6 +137,7 @@ def corpus_search_view(request):
         'context_size': context_size,
         'results': results,
         'total_matches': total_matches,
+        'total_exact': total_exact,
         'unique_docs': unique_docs,
         'execution_time': execution_time,
         'collections': collections,
@@ -140,6 +147,13 @@ def corpus_search_view(request):
         'selected_genre': genre_filter,
         'selected_author': author_filter,
         'sort_by': sort_by,
+        'sort_specs': CONCORDANCE_SORT_SPECS,
+        'page': page,
+        'page_query': page_query,
+        'previous_page': max(page - 1, 1) if prev_cursor else None,
+        'next_page': page + 1 if next_cursor else None,
+        'prev_cursor': prev_cursor,
+        'next_cursor': next_cursor,
         'active_tab': 'search',
     }
     
@@ -155,7 +169,7 @@ def collocation_view(request):
     keyword = request.GET.get('keyword', '').strip()
     window_size = int(request.GET.get('window', 5))
     min_freq = int(request.GET.get('min_freq', 2))
-    collection_id = request.GET.get('collection')
+    options = collocation_options(request.GET)
     
     collocates = []
     execution_time = 0
@@ -165,19 +179,15 @@ def collocation_view(request):
         start_time = time.time()
         
         # Filter by collection
-        document_ids = None
-        if collection_id:
-            try:
-                collection = CollectionService.objects.get(id=collection_id)
-                document_ids = list(collection.documents.values_list('id', flat=True))
-            except:
-                pass
+        document_ids = subcorpus_from_params(request.GET)
         
         engine = CorpusQueryEngine(documents=document_ids)
         collocates = engine.collocation(
             keyword=keyword,
             window_size=window_size,
-            min_frequency=min_freq
+            min_frequency=min_freq,
+            limit=50,
+            **options
         )
         
         execution_time = int((time.time() - start_time) * 1000)
@@ -192,6 +202,11 @@ def collocation_view(request):
         'min_freq': min_freq,
         'collocates': collocates[:50],  # Top 50
         'total_collocates': sum(c['frequency'] for c in collocates[:50]),
+        'measure': options['measure'],
+        'measures': MEASURES,
+        'left': request.GET.get('left', ''),
+        'right': request.GET.get('right', ''),
+        'collocate_pos': request.GET.get('pos', ''),
         'execution_time': execution_time,
         'collections': collections,
         'active_tab': 'statistics',
@@ -209,7 +224,6 @@ def ngram_view(request):
     n = int(request.GET.get('n', 2))
     min_freq = int(request.GET.get('min_freq', 2))
     use_lemma = request.GET.get('use_lemma', 'true') == 'true'
-    collection_id = request.GET.get('collection')
     limit = int(request.GET.get('limit', 100))
     
     ngrams = []
@@ -220,13 +234,7 @@ def ngram_view(request):
         start_time = time.time()
         
         # Filter by collection
-        document_ids = None
-        if collection_id:
-            try:
-                collection = CollectionService.objects.get(id=collection_id)
-                document_ids = list(collection.documents.values_list('id', flat=True))
-            except:
-                pass
+        document_ids = subcorpus_from_params(request.GET)
         
         engine = CorpusQueryEngine(documents=document_ids)
         ngrams = engine.ngrams(
@@ -256,6 +264,71 @@ def ngram_view(request):
     return render(request, 'corpus/ngram.html', context)
 
 
+@ratelimit(key='user_or_ip', rate='50/h', method='GET')
+def keyness_view(request):
+    """Keyword (keyness) analysis of a focus subcorpus against a reference subcorpus.
+    
+    The focus corpus is selected with the usual subcorpus parameters
+    (collection, genre, year, facet.<name>), the reference with the same
+    keys prefixed by 'ref.' (whole corpus when none is given).
+    """
+    if getattr(request, 'limited', False):
+        return render(request, 'corpus/429.html', status=429)
+    
+    measure = request.GET.get('measure', 'log_likelihood')
+    if measure not in KEYNESS_MEASURES:
+        measure = 'log_likelihood'
+    min_freq = int(request.GET.get('min_freq', 3))
+    limit = int(request.GET.get('limit', 100))
+    # Unchecked checkboxes are not submitted, so the lemma default only applies to the empty form
+    use_lemma = request.GET.get('use_lemma', '' if request.GET.get('analyze') else 'true') == 'true'
+    negative = request.GET.get('negative') == 'true'
+    try:
+        smoothing = max(float(request.GET.get('smoothing', 1.0)), 0.0)
+    except ValueError:
+        smoothing = 1.0
+    
+    keywords = []
+    execution_time = 0
+    
+    if request.GET.get('analyze'):
+        start_time = time.time()
+        
+        engine = CorpusQueryEngine(documents=subcorpus_from_params(request.GET))
+        keywords = engine.keyness(
+            reference=subcorpus_from_params(request.GET, prefix='ref.'),
+            use_lemma=use_lemma,
+            measure=measure,
+            min_frequency=min_freq,
+            smoothing=smoothing,
+            negative=negative,
+            limit=limit
+        )
+        
+        execution_time = int((time.time() - start_time) * 1000)
+    
+    from django.db.models import Count
+    collections = CollectionService.objects.annotate(doc_count=Count('documents')).filter(doc_count__gt=0)
+    
+    context = {
+        'measure': measure,
+        'measures': KEYNESS_MEASURES,
+        'min_freq': min_freq,
+        'limit': limit,
+        'smoothing': smoothing,
+        'use_lemma': use_lemma,
+        'negative': negative,
+        'keywords': keywords,
+        'collection': request.GET.get('collection', ''),
+        'reference_collection': request.GET.get('ref.collection', ''),
+        'execution_time': execution_time,
+        'collections': collections,
+        'active_tab': 'statistics',
+    }
+    
+    return render(request, 'corpus/keyness.html', context)
+
+
 @ratelimit(key='user_or_ip', rate='50/h', method='GET')
 def frequency_view(request):
     """Word frequency analysis view."""
@@ -264,8 +337,8 @@ def frequency_view(request):
     
     use_lemma = request.GET.get('use_lemma', 'true') == 'true'
     min_length = int(request.GET.get('min_length', 1))
-    collection_id = request.GET.get('collection')
     limit = int(request.GET.get('limit', 100))
+    show_dispersion = request.GET.get('dispersion') == 'true'
     
     frequencies = []
     pos_dist = {}
@@ -276,13 +349,7 @@ def frequency_view(request):
         start_time = time.time()
         
         # Filter by collection
-        document_ids = None
-        if collection_id:
-            try:
-                collection = CollectionService.objects.get(id=collection_id)
-                document_ids = list(collection.documents.values_list('id', flat=True))
-            except:
-                pass
+        document_ids = subcorpus_from_params(request.GET)
         
         engine = CorpusQueryEngine(documents=document_ids)
         
@@ -293,6 +360,13 @@ def frequency_view(request):
             min_length=min_length
         )
         
+        # Range, Juilland's D, DP and ARF of the listed words
+        if show_dispersion:
+            rows = engine.dispersion(words=[item['word'] for item in frequencies], use_lemma=use_lemma, limit=None)
+            dispersion = {row['word']: row for row in rows}
+            for item in frequencies:
+                item['dispersion'] = dispersion.get(item['word'])
+        
         # POS distribution
         pos_dist = engine.pos_distribution()
         
@@ -308,6 +382,7 @@ def frequency_view(request):
         'frequencies': frequencies,
         'pos_distribution': pos_dist,
         'pos_max': max(pos_dist.values()) if pos_dist else 1,
+        'show_dispersion': show_dispersion,
         'execution_time': execution_time,
         'collections': collections,
         'active_tab': 'statistics',
@@ -318,7 +393,14 @@ def frequency_view(request):
 
 @require_http_methods(['GET'])
 def api_concordance(request):
-    """JSON API for concordance search."""
+    """JSON API for concordance search.
+
+    With 'sample' returns that many hits drawn uniformly from all hits;
+    the 'seed' used is returned so the sample can be reproduced.
+    'total_matches' counts all hits ('count': exact, estimate or auto);
+    with 'count_only=true' only the count is returned. 'next_cursor' and
+    'prev_cursor' are passed back as 'cursor' to page through the hits.
+    """
     query = request.GET.get('q', '').strip()
     
     if not query:
@@ -326,23 +408,208 @@ def api_concordance(request):
     
     search_type = request.GET.get('type', 'form')
     regex = request.GET.get('regex', 'false') == 'true'
-    limit = min(int(request.GET.get('limit', 50)), 500)
+    count_mode = request.GET.get('count', 'auto')
+    if count_mode not in COUNT_MODES:
+        return JsonResponse({'error': f"count must be one of {', '.join(COUNT_MODES)}"}, status=400)
     
     engine = CorpusQueryEngine()
-    results = engine.concordance(
-        query=query,
-        query_type=search_type,
-        regex=regex,
+    counted = engine.count(query, search_type, regex, mode=count_mode)
+    if request.GET.get('count_only', 'false') == 'true':
+        return JsonResponse({
+            'query': query,
+            'total_matches': counted['count'],
+            'count_exact': counted['exact']
+        })
+    
+    limit = max(1, min(int(request.GET.get('limit', 50)), 500))
+    sample, seed = sample_params(request.GET)
+    if sample is not None:
+        limit = min(sample, MAX_CONCORDANCE_SAMPLE)
+    
+    try:
+        page = engine.concordance_page(
+            query=query,
+            query_type=search_type,
+            regex=regex,
+            limit=limit,
+            cursor=request.GET.get('cursor') or None,
+            sample=sample,
+            seed=seed
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    results = page['results']
+    
+    response = {
+        'query': query,
+        'total': len(results),
+        'total_matches': counted['count'],
+        'count_exact': counted['exact'],
+        'results': [dict(line) for line in results],
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor']
+    }
+    if sample is not None:
+        response.update(sample=sample, seed=seed)
+    return JsonResponse(response)
+
+
+@require_http_methods(['GET'])
+def api_facets(request):
+    """JSON API for metadata facets.
+
+    Without 'field' lists the facet names; with 'field' returns its values
+    with document and token counts ('order': value, documents or tokens).
+    """
+    facets = get_facet_index()
+    field = request.GET.get('field', '').strip()
+    if not field:
+        return JsonResponse({'fields': facets.fields(), 'documents': len(facets)})
+    
+    order = request.GET.get('order', 'value')
+    if order not in ('value', 'documents', 'tokens'):
+        return JsonResponse({'error': 'order must be value, documents or tokens'}, status=400)
+    limit = request.GET.get('limit')
+    values = facets.counts(field, order=order, limit=int(limit) if limit else None)
+    
+    return JsonResponse({
+        'field': field,
+        'total': len(facets.facet_values(field)),
+        'values': values
+    })
+
+
+@require_http_methods(['GET'])
+def api_dispersion(request):
+    """JSON API for dispersion statistics.
+
+    Returns frequency, range, Juilland's D, DP, DPnorm and ARF of the
+    words given in 'word' (repeatable or comma-separated), or of the
+    frequency list ('sort': frequency or a dispersion measure) of the
+    corpus or subcorpus.
+    """
+    sort = request.GET.get('sort', 'frequency')
+    if sort != 'frequency' and sort not in DISPERSION_MEASURES:
+        return JsonResponse({'error': f"sort must be frequency or one of {', '.join(DISPERSION_MEASURES)}"}, status=400)
+    words = [w.strip() for value in request.GET.getlist('word') for w in value.split(',') if w.strip()]
+    use_lemma = request.GET.get('use_lemma', 'true') == 'true'
+    limit = min(int(request.GET.get('limit', 100)), 10000)
+    
+    start_time = time.time()
+    engine = CorpusQueryEngine(documents=subcorpus_from_params(request.GET))
+    rows = engine.dispersion(
+        words=words or None,
+        use_lemma=use_lemma,
+        sort=sort,
+        min_frequency=int(request.GET.get('min_freq', 1)),
+        lowercase=request.GET.get('lowercase') == 'true',
         limit=limit
     )
     
     return JsonResponse({
-        'query': query,
-        'total': len(results),
-        'results': results
+        'attribute': 'lemma' if use_lemma else 'form',
+        'sort': sort,
+        'results': rows,
+        'execution_time_ms': int((time.time() - start_time) * 1000)
+    })
+
+
+@require_http_methods(['GET'])
+def api_similar_documents(request):
+    """JSON API for "more like this" document search.
+
+    Returns the 'k' documents most similar to 'document', or to the
+    subcorpus selected with the usual filters, by cosine similarity of
+    their TF-IDF ('weighting': tfidf or ppmi) lemma vectors.
+    """
+    weighting = request.GET.get('weighting', 'tfidf')
+    if weighting not in WEIGHTINGS:
+        return JsonResponse({'error': f"weighting must be one of {', '.join(WEIGHTINGS)}"}, status=400)
+    document = request.GET.get('document', '')
+    if document and not document.isdigit():
+        return JsonResponse({'error': 'document must be a document ID'}, status=400)
+    k = min(int(request.GET.get('k', 10)), 1000)
+    use_lemma = request.GET.get('use_lemma', 'true') == 'true'
+    
+    start_time = time.time()
+    engine = CorpusQueryEngine(documents=None if document else subcorpus_from_params(request.GET))
+    try:
+        similar = engine.similar_documents(
+            int(document) if document else None, k=k, use_lemma=use_lemma, weighting=weighting
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    names = dict(Document.objects.filter(id__in=[s['document_id'] for s in similar]).values_list('id', 'filename'))
+    for item in similar:
+        item['filename'] = names.get(item['document_id'], '')
+    
+    return JsonResponse({
+        'document': int(document) if document else None,
+        'weighting': weighting,
+        'results': similar,
+        'execution_time_ms': int((time.time() - start_time) * 1000)
     })
 
 
+@require_http_methods(['GET'])
+def api_compare_documents(request):
+    """JSON API for N-way document/subcorpus comparison.
+
+    Every 'document' and every 'collection' value (both repeatable or
+    comma-separated) is one compared item; returns the N x N cosine
+    similarity matrix of their TF-IDF ('weighting') vectors.
+    """
+    weighting = request.GET.get('weighting', 'tfidf')
+    if weighting not in WEIGHTINGS:
+        return JsonResponse({'error': f"weighting must be one of {', '.join(WEIGHTINGS)}"}, status=400)
+    
+    def ids(key):
+        return [int(v) for value in request.GET.getlist(key) for v in value.split(',') if v.strip().isdigit()]
+    
+    documents = ids('document')
+    collections = ids('collection')
+    if len(documents) + len(collections) < 2:
+        return JsonResponse({'error': 'Give at least two documents or collections'}, status=400)
+    if len(documents) + len(collections) > 500:
+        return JsonResponse({'error': 'At most 500 items can be compared'}, status=400)
+    
+    start_time = time.time()
+    names = dict(Document.objects.filter(id__in=documents).values_list('id', 'filename'))
+    collection_names = dict(CollectionService.objects.filter(id__in=collections).values_list('id', 'name'))
+    items = [{'type': 'document', 'id': d, 'label': names.get(d, str(d))} for d in documents]
+    items += [{'type': 'collection', 'id': c, 'label': collection_names.get(c, str(c))} for c in collections]
+    groups = [[d] for d in documents] + [build_subcorpus(collections=[c]) for c in collections]
+    
+    engine = CorpusQueryEngine()
+    matrix = engine.compare_documents(
+        groups, use_lemma=request.GET.get('use_lemma', 'true') == 'true', weighting=weighting
+    )
+    
+    return JsonResponse({
+        'weighting': weighting,
+        'items': items,
+        'matrix': matrix,
+        'execution_time_ms': int((time.time() - start_time) * 1000)
+    })
+
+
+@require_http_methods(['GET'])
+def api_overview(request):
+    """JSON API for the approximate corpus overview.
+
+    Merges the sketches stored at import: estimated type counts and the
+    'top' heaviest forms, lemmas, bigrams and trigrams (with their error
+    bounds) of the corpus or subcorpus, without reading the tokens.
+    """
+    top = min(int(request.GET.get('top', 20)), 200)
+    
+    start_time = time.time()
+    overview = corpus_overview(subcorpus_from_params(request.GET), top=top)
+    overview['execution_time_ms'] = int((time.time() - start_time) * 1000)
+    return JsonResponse(overview)
+
+
 # Export Views
 
 @login_required
@@ -359,37 +626,13 @@ def export_concordance_view(request):
     regex = request.GET.get('regex', 'false') == 'true'
     case_sensitive = request.GET.get('case', 'false') == 'true'
     context_size = int(request.GET.get('context', 5))
-    collection_id = request.GET.get('collection')
-    genre_filter = request.GET.get('genre')
-    author_filter = request.GET.get('author')
     limit = int(request.GET.get('limit', 500))
+    sample, seed = sample_params(request.GET)
+    if sample is not None:
+        limit = sample
     
-    # Filter by collection, genre, author
-    document_ids = None
-    from corpus.models import CorpusMetadata
-    
-    if collection_id:
-        try:
-            collection = CollectionService.objects.get(id=collection_id)
-            document_ids = list(collection.documents.values_list('id', flat=True))
-        except:
-            pass
-    
-    # Filter by genre/author
-    if genre_filter or author_filter:
-        meta_query = CorpusMetadata.objects.all()
-        if genre_filter:
-            meta_query = meta_query.filter(global_metadata__genre__icontains=genre_filter)
-        if author_filter:
-            meta_query = meta_query.filter(global_metadata__author__icontains=author_filter)
-        
-        meta_doc_ids = list(meta_query.values_list('document_id', flat=True))
-        
-        if document_ids:
-            # Intersection with collection
-            document_ids = list(set(document_ids) & set(meta_doc_ids))
-        else:
-            document_ids = meta_doc_ids
+    # Collection, genre, author and year filters (same as corpus_search_view)
+    document_ids = subcorpus_from_params(request.GET)
     
     # Execute search
     engine = CorpusQueryEngine(documents=document_ids)
@@ -399,7 +642,9 @@ def export_concordance_view(request):
         query_type=search_type,
         regex=regex,
         case_sensitive=case_sensitive,
-        limit=limit
+        limit=limit,
+        sample=sample,
+        seed=seed
     )
     
     # Export
@@ -419,23 +664,18 @@ def export_collocation_view(request):
     
     window_size = int(request.GET.get('window', 5))
     min_freq = int(request.GET.get('min_freq', 2))
-    collection_id = request.GET.get('collection')
     
     # Filter by collection
-    document_ids = None
-    if collection_id:
-        try:
-            collection = CollectionService.objects.get(id=collection_id)
-            document_ids = list(collection.documents.values_list('id', flat=True))
-        except:
-            pass
+    document_ids = subcorpus_from_params(request.GET)
     
     # Execute analysis
     engine = CorpusQueryEngine(documents=document_ids)
     collocates = engine.collocation(
         keyword=keyword,
         window_size=window_size,
-        min_frequency=min_freq
+        min_frequency=min_freq,
+        limit=100,
+        **collocation_options(request.GET)
     )
     
     return export_collocation_csv(collocates[:100], keyword, request.user)
@@ -447,17 +687,10 @@ def export_ngram_view(request):
     n = int(request.GET.get('n', 2))
     min_freq = int(request.GET.get('min_freq', 2))
     use_lemma = request.GET.get('use_lemma', 'true') == 'true'
-    collection_id = request.GET.get('collection')
     limit = int(request.GET.get('limit', 500))
     
     # Filter by collection
-    document_ids = None
-    if collection_id:
-        try:
-            collection = CollectionService.objects.get(id=collection_id)
-            document_ids = list(collection.documents.values_list('id', flat=True))
-        except:
-            pass
+    document_ids = subcorpus_from_params(request.GET)
     
     # Execute analysis
     engine = CorpusQueryEngine(documents=document_ids)
@@ -476,17 +709,10 @@ def export_frequency_view(request):
     """Export word frequency analysis results."""
     use_lemma = request.GET.get('use_lemma', 'true') == 'true'
     min_length = int(request.GET.get('min_length', 1))
-    collection_id = request.GET.get('collection')
     limit = int(request.GET.get('limit', 500))
     
     # Filter by collection
-    document_ids = None
-    if collection_id:
-        try:
-            collection = CollectionService.objects.get(id=collection_id)
-            document_ids = list(collection.documents.values_list('id', flat=True))
-        except:
-            pass
+    document_ids = subcorpus_from_params(request.GET)
     
     # Execute analysis
     engine = CorpusQueryEngine(documents=document_ids)
@@ -12,8 +12,8 @@ except ImportError as e:
     warnings.warn(f"CorpusService could not be imported: {e}")
     
     # Create a functional fallback CorpusService with basic methods
-    from collections import Counter
     from corpus.models import Token
+    from corpus.services.frequency_service import document_frequencies
     
     class CorpusService:
         """Fallback CorpusService when legacy module cannot be imported."""
@@ -24,19 +24,16 @@ except ImportError as e:
         def get_statistics(self, document):
             """Get statistics from Token model (new corpus platform)."""
             if Token.objects.filter(document=document).exists():
-                tokens = Token.objects.filter(document=document).select_related('sentence')
+                words = document_frequencies(document, exclude_pos=('PUNCT',))
+                tags = document_frequencies(document)
                 
-                forms = [t.form for t in tokens if t.form and t.upos != 'PUNCT']
-                lemmas = [t.lemma for t in tokens if t.lemma and t.upos != 'PUNCT']
-                pos_tags = [t.upos for t in tokens if t.upos]
-                
-                token_count = len(forms)
-                type_count = len(set(forms))
+                token_count = words.tokens - words.frequency('form', '')
+                type_count = words.type_count('form') - (1 if words.frequency('form', '') else 0)
                 ttr = type_count / token_count if token_count > 0 else 0.0
                 
-                word_freq = Counter(forms).most_common(50)
-                lemma_freq = Counter(lemmas).most_common(50)
-                pos_dist = Counter(pos_tags)
+                word_freq = [(w, c) for w, c in words.most_common('form', 51) if w][:50]
+                lemma_freq = [(l, c) for l, c in words.most_common('lemma', 51) if l][:50]
+                pos_dist = tags.distribution('upos')
                 
                 return {
                     'token_count': token_count,
@@ -44,7 +41,7 @@ except ImportError as e:
                     'ttr': round(ttr, 4),
                     'word_frequency': [{'word': w, 'count': c} for w, c in word_freq],
                     'lemma_frequency': [{'lemma': l, 'count': c} for l, c in lemma_freq],
-                    'pos_distribution': [{'pos': p, 'count': c} for p, c in pos_dist.items()],
+                    'pos_distribution': [{'pos': p, 'count': c} for p, c in pos_dist.items() if p],
                     'zipf': []
                 }
             return None
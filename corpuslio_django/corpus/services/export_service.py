@@ -254,7 +254,7 @@ class ExportService:
                 'query': self.query_text,
                 'total_results': len(results),
             },
-            'results': results
+            'results': [dict(result) for result in results]
         }
         
         if self.enable_watermark:
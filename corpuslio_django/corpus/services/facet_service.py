@@ -0,0 +1,290 @@
+"""Metadata facet index.
+
+Every facet value maps to the bitmap of its documents and to precomputed
+document and token counts, so dropdowns, facet counts and "tokens per
+value" are dictionary lookups instead of scans over CorpusMetadata:
+
+- Document fields (author, genre, language, text_type, region, ...)
+- the keys of CorpusMetadata.global_metadata (VRT ``<text>`` attributes,
+  CoNLL-U global comments); a non-empty header value takes precedence
+  over a Document field of the same name
+- ``year``: publication year, document date or a year in the metadata
+
+The index is held per process and kept in step with the Document table:
+a request that sees a changed document count or maximum ID (an import or
+a deletion) loads only the new documents and drops the deleted ones.
+Metadata edits are picked up by a full reload after FACET_CACHE_SECONDS.
+
+Example:
+    >>> facets = get_facet_index()
+    >>> facets.facet_values('genre')
+    ['anı', 'roman', 'öykü']
+    >>> facets.tokens('genre', 'roman')
+    1840213
+"""
+
+import logging
+import os
+import re
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.db.models import Count, Max
+
+# Add project root (parent of corpuslio_django) to path for corpuslio imports
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from corpuslio.index import Bitmap
+from corpus.models import CorpusMetadata, Document
+
+logger = logging.getLogger(__name__)
+
+# Facet index is fully re-read at the latest after this many seconds (metadata edits)
+FACET_CACHE_SECONDS = 300
+
+# Document fields indexed as facets
+DOCUMENT_FACETS = (
+    'author', 'genre', 'language', 'source', 'grade_level', 'subject', 'publisher',
+    'text_type', 'license', 'region', 'collection', 'format',
+)
+
+_YEAR = re.compile(r'\b(\d{4})\b')
+
+# Process-level cache
+_facet_cache: Dict[str, object] = {'version': None, 'loaded_at': 0.0, 'index': None}
+
+# (document_id, token_count, {field: [values]})
+FacetRow = Tuple[int, int, Dict[str, list]]
+
+
+class FacetIndex:
+    """Facet value -> document bitmap, document count and token count."""
+
+    def __init__(self, rows: Iterable[FacetRow] = ()):
+        """Build from (document_id, token_count, {field: values}) rows."""
+        self.all_documents = Bitmap()
+        # field -> {value: Bitmap}
+        self.values: Dict[str, Dict[object, Bitmap]] = {}
+        self.document_counts: Dict[str, Dict[object, int]] = {}
+        self.token_counts: Dict[str, Dict[object, int]] = {}
+        self._documents: Dict[int, Tuple[int, Dict[str, list]]] = {}
+        self._sorted: Dict[str, list] = {}
+        self.add(rows)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def __contains__(self, document_id: int) -> bool:
+        return document_id in self._documents
+
+    # -- Maintenance -----------------------------------------------------
+
+    def add(self, rows: Iterable[FacetRow]) -> None:
+        """Index documents (documents already indexed are replaced)."""
+        rows = list(rows)
+        self.remove([row[0] for row in rows if row[0] in self._documents])
+        groups: Dict[Tuple[str, object], List[int]] = {}
+        tokens: Dict[Tuple[str, object], int] = {}
+        for doc_id, token_count, facets in rows:
+            self._documents[doc_id] = (token_count or 0, facets)
+            for field, values in facets.items():
+                for value in values:
+                    groups.setdefault((field, value), []).append(doc_id)
+                    tokens[(field, value)] = tokens.get((field, value), 0) + (token_count or 0)
+        for (field, value), ids in groups.items():
+            bitmaps = self.values.setdefault(field, {})
+            added = Bitmap.from_ids(np.array(ids, dtype=np.int64))
+            bitmaps[value] = bitmaps[value] | added if value in bitmaps else added
+            documents = self.document_counts.setdefault(field, {})
+            documents[value] = documents.get(value, 0) + len(ids)
+            totals = self.token_counts.setdefault(field, {})
+            totals[value] = totals.get(value, 0) + tokens[(field, value)]
+            self._sorted.pop(field, None)
+        if rows:
+            self.all_documents = self.all_documents | Bitmap.from_ids(
+                np.array([row[0] for row in rows], dtype=np.int64)
+            )
+
+    def remove(self, document_ids: Iterable[int]) -> int:
+        """Drop documents from the index.
+
+        Returns:
+            Number of documents removed
+        """
+        groups: Dict[Tuple[str, object], List[int]] = {}
+        tokens: Dict[Tuple[str, object], int] = {}
+        removed = []
+        for doc_id in document_ids:
+            entry = self._documents.pop(doc_id, None)
+            if entry is None:
+                continue
+            removed.append(doc_id)
+            token_count, facets = entry
+            for field, values in facets.items():
+                for value in values:
+                    groups.setdefault((field, value), []).append(doc_id)
+                    tokens[(field, value)] = tokens.get((field, value), 0) + token_count
+        for (field, value), ids in groups.items():
+            documents = self.document_counts[field]
+            documents[value] -= len(ids)
+            if documents[value] <= 0:
+                del self.values[field][value]
+                del documents[value]
+                del self.token_counts[field][value]
+            else:
+                self.values[field][value] = self.values[field][value] - Bitmap.from_ids(np.array(ids, dtype=np.int64))
+                self.token_counts[field][value] -= tokens[(field, value)]
+            self._sorted.pop(field, None)
+        if removed:
+            self.all_documents = self.all_documents - Bitmap.from_ids(np.array(removed, dtype=np.int64))
+        return len(removed)
+
+    # -- Lookups ---------------------------------------------------------
+
+    def fields(self) -> List[str]:
+        """Names of all facets with at least one value."""
+        return sorted(field for field, values in self.values.items() if values)
+
+    def facet_values(self, field: str) -> list:
+        """Distinct values of a facet, sorted."""
+        values = self._sorted.get(field)
+        if values is None:
+            values = self._sorted[field] = sorted(self.values.get(field, {}), key=_sort_key)
+        return values
+
+    def documents(self, field: str, value) -> Bitmap:
+        """Documents with a facet value (empty if unknown)."""
+        return self.values.get(field, {}).get(value, Bitmap())
+
+    def document_count(self, field: str, value) -> int:
+        """Number of documents with a facet value."""
+        return self.document_counts.get(field, {}).get(value, 0)
+
+    def tokens(self, field: str, value) -> int:
+        """Number of tokens in the documents with a facet value."""
+        return self.token_counts.get(field, {}).get(value, 0)
+
+    def counts(self, field: str, order: str = 'value', limit: Optional[int] = None) -> List[dict]:
+        """Values of a facet with their document and token counts.
+
+        Args:
+            field: Facet name
+            order: 'value', 'documents' or 'tokens' (counts descending)
+            limit: Return at most this many values
+
+        Returns:
+            List of {'value', 'documents', 'tokens'} dicts
+        """
+        values = self.facet_values(field)
+        if order in ('documents', 'tokens'):
+            totals = self.document_counts if order == 'documents' else self.token_counts
+            values = sorted(values, key=totals.get(field, {}).get, reverse=True)
+        if limit is not None:
+            values = values[:limit]
+        return [
+            {'value': value, 'documents': self.document_count(field, value), 'tokens': self.tokens(field, value)}
+            for value in values
+        ]
+
+    # -- Subcorpus filters -----------------------------------------------
+
+    def union(self, field: str, values: Iterable) -> Bitmap:
+        """OR of the bitmaps of several values of a facet."""
+        result = Bitmap()
+        for value in values:
+            result = result | self.documents(field, value)
+        return result
+
+    def contains(self, field: str, text: str) -> Bitmap:
+        """Documents whose value contains text (case-insensitive), like icontains."""
+        needle = text.casefold()
+        return self.union(field, [value for value in self.facet_values(field) if needle in str(value).casefold()])
+
+    def years(self, spec: str) -> Bitmap:
+        """Documents dated in a year ('1990') or an inclusive range ('1990-2000')."""
+        first, _, last = spec.partition('-')
+        try:
+            first_year = int(first)
+            last_year = int(last) if last else first_year
+        except ValueError:
+            return Bitmap()
+        return self.union('year', [year for year in self.facet_values('year') if first_year <= year <= last_year])
+
+
+def _sort_key(value):
+    return (0, value, '') if isinstance(value, int) else (1, 0, str(value).casefold())
+
+
+def _document_year(publication_year, document_date, metadata) -> Optional[int]:
+    if publication_year:
+        return publication_year
+    if document_date:
+        return document_date.year
+    for key in ('year', 'date'):
+        match = _YEAR.search(str((metadata or {}).get(key) or ''))
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def _facet_values(value) -> list:
+    """Facet values of a field or header value (lists are multi-valued, objects skipped)."""
+    if isinstance(value, (list, tuple)):
+        return [v for item in value for v in _facet_values(item)]
+    if value is None or isinstance(value, dict):
+        return []
+    value = str(value).strip()
+    return [value] if value else []
+
+
+def load_facet_rows(document_ids: Optional[Iterable[int]] = None) -> List[FacetRow]:
+    """Read facet rows of documents (all when None) in two queries."""
+    documents = Document.objects.all()
+    metadata = CorpusMetadata.objects.all()
+    if document_ids is not None:
+        document_ids = list(document_ids)
+        documents = documents.filter(id__in=document_ids)
+        metadata = metadata.filter(document_id__in=document_ids)
+
+    headers = dict(metadata.values_list('document_id', 'global_metadata'))
+    rows = []
+    for doc_id, token_count, publication_year, document_date, *fields in documents.values_list(
+        'id', 'token_count', 'publication_year', 'document_date', *DOCUMENT_FACETS
+    ):
+        global_metadata = headers.get(doc_id) or {}
+        facets = {}
+        for field, value in zip(DOCUMENT_FACETS, fields):
+            values = _facet_values(value)
+            if values:
+                facets[field] = values
+        for key, value in global_metadata.items():
+            values = _facet_values(value)
+            if values and key != 'year':
+                facets[key] = values
+        year = _document_year(publication_year, document_date, global_metadata)
+        if year:
+            facets['year'] = [year]
+        rows.append((doc_id, token_count, facets))
+    return rows
+
+
+def get_facet_index() -> FacetIndex:
+    """Facet index for this process, synchronized with the Document table."""
+    version = tuple(Document.objects.aggregate(count=Count('id'), max_id=Max('id')).values())
+    now = time.time()
+    index = _facet_cache['index']
+    if index is None or now - _facet_cache['loaded_at'] > FACET_CACHE_SECONDS:
+        index = FacetIndex(load_facet_rows())
+        _facet_cache.update(version=version, loaded_at=now, index=index)
+    elif _facet_cache['version'] != version:
+        current = Bitmap.from_ids(np.fromiter(Document.objects.values_list('id', flat=True), dtype=np.int64))
+        removed = index.remove((index.all_documents - current).to_array().tolist())
+        added = (current - index.all_documents).to_array().tolist()
+        index.add(load_facet_rows(added) if added else ())
+        logger.debug(f"Facet index: {len(added)} documents added, {removed} removed")
+        _facet_cache['version'] = version
+    return index
@@ -0,0 +1,84 @@
+"""Frequency distributions of single documents.
+
+Document-level views (statistics, word cloud, frequency export) get
+their counts from the vectorized frequency engine
+(``corpuslio.index.frequency``) instead of building Counters over token
+dicts. The first available source is used:
+
+- the positional index, if the document is indexed (no database query)
+- the Token table, read as three columns in one query
+- the legacy Analysis data (``word``/``lemma``/``pos`` dicts)
+
+Tables always use the index attribute names 'form', 'lemma' and 'upos'.
+"""
+
+import logging
+import os
+import sys
+from typing import Dict, Iterable, Optional
+
+from django.db.models import Count
+
+# Add project root (parent of corpuslio_django) to path for corpuslio imports
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from corpuslio.index import FrequencyTable
+from corpus.models import Token
+from corpus.services.index_service import get_corpus_index, get_frequency_counter
+
+logger = logging.getLogger(__name__)
+
+ATTRIBUTES = ('form', 'lemma', 'upos')
+
+
+def document_frequencies(document, exclude_pos: Iterable[str] = ()) -> Optional[FrequencyTable]:
+    """Form, lemma and POS counts of a document.
+
+    Args:
+        document: Document model instance
+        exclude_pos: Skip tokens with these POS tags (e.g. ('PUNCT',))
+
+    Returns:
+        FrequencyTable (forms and lemmas with their dominant POS), or
+        None if the document has neither tokens nor analysis data
+    """
+    exclude_pos = tuple(exclude_pos)
+    index = get_corpus_index()
+    if index is not None and document.id in index.document_ids():
+        return get_frequency_counter(index).count(ATTRIBUTES, [document.id], exclude_pos)
+
+    rows = list(Token.objects.filter(document=document).values_list(*ATTRIBUTES))
+    if rows:
+        columns = {attribute: [value or '' for value in values] for attribute, values in zip(ATTRIBUTES, zip(*rows))}
+        return FrequencyTable.from_columns(columns, pos_attribute='upos', exclude_pos=exclude_pos)
+
+    analysis = document.analysis if hasattr(document, 'analysis') else None
+    data = [item for item in (analysis.data if analysis else None) or [] if isinstance(item, dict)]
+    if data:
+        columns = {
+            'form': [item.get('word', item.get('form', '')) or '' for item in data],
+            'lemma': [item.get('lemma', '') or '' for item in data],
+            'upos': [item.get('pos', '') or '' for item in data],
+        }
+        return FrequencyTable.from_columns(columns, pos_attribute='upos', exclude_pos=exclude_pos)
+    return None
+
+
+def form_lemmas(document, forms: Iterable[str]) -> Dict[str, str]:
+    """Most frequent lemma of each form in a document (one grouped query)."""
+    forms = list(forms)
+    lemmas: Dict[str, str] = {}
+    for form, lemma, _ in Token.objects.filter(document=document, form__in=forms).values_list(
+        'form', 'lemma'
+    ).annotate(count=Count('id')).order_by('form', '-count', 'lemma'):
+        lemmas.setdefault(form, lemma or '')
+    if lemmas or not hasattr(document, 'analysis'):
+        return lemmas
+
+    wanted = set(forms)
+    for item in document.analysis.data or []:
+        if isinstance(item, dict) and item.get('word') in wanted:
+            lemmas.setdefault(item['word'], item.get('lemma', ''))
+    return lemmas
@@ -0,0 +1,402 @@
+"""Positional corpus index service.
+
+Builds the ``corpuslio.index`` positional index from the Token table and
+keeps one opened index per process for CorpusQueryEngine.
+
+The index is segmented (see corpuslio/index/segments.py): a full build
+writes one segment, every import adds a small segment and the Celery
+beat task ``compact_corpus_index`` merges small segments in the
+background. Deleted documents are tombstoned (``remove_from_index``)
+and purged by compaction.
+
+Segments of at least 100k tokens get persisted n-gram tables (see
+corpuslio/index/ngrams.py), written by the full build and by the
+compaction task after every merge. Every segment carries its document x
+term count matrices for dispersion (corpuslio/index/dispersion.py).
+"""
+
+import logging
+import os
+import sys
+from itertools import groupby
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+# Add project root (parent of corpuslio_django) to path for corpuslio imports
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from corpuslio.index import (
+    DEFAULT_ATTRIBUTES, CollocationFinder, ConcordanceSorter, DispersionCounter, DocumentVectors, FrequencyCounter, NgramCounter, SegmentedIndex, SegmentStore,
+    ShardedExecutor, build_missing_ngram_tables,
+)
+from corpuslio.index.segments import MANIFEST
+from corpus.models import Document, Sentence, Token
+
+logger = logging.getLogger(__name__)
+
+# Process-level cache of the opened index, invalidated when the manifest changes
+_index_cache = {'path': None, 'mtime': None, 'index': None, 'sharded': None, 'frequency': None, 'ngram': None,
+               'collocation': None, 'dispersion': None, 'vectors': {}, 'sorter': None}
+
+
+def get_index_path() -> Path:
+    """Get configured index directory."""
+    return Path(getattr(settings, 'CORPUS_INDEX_DIR', Path(settings.BASE_DIR) / 'corpus_index'))
+
+
+def get_segment_store(path=None) -> SegmentStore:
+    """Get the segment store of the index directory."""
+    return SegmentStore(
+        Path(path) if path else get_index_path(),
+        merge_factor=getattr(settings, 'CORPUS_INDEX_MERGE_FACTOR', 4),
+    )
+
+
+def get_corpus_index() -> Optional[SegmentedIndex]:
+    """Get the corpus index for this process.
+
+    Segments still live since the last call are reused, so picking up a
+    new import only opens the new segment.
+
+    Returns:
+        Opened SegmentedIndex, or None if no (compatible) index has been built
+    """
+    path = get_index_path()
+    try:
+        mtime = (path / MANIFEST).stat().st_mtime_ns
+    except FileNotFoundError:
+        if (path / 'index.json').exists():
+            logger.warning(f"Corpus index at {path} predates segments; rebuild it")
+        return None
+
+    if _index_cache['path'] == path and _index_cache['mtime'] == mtime:
+        return _index_cache['index']
+
+    previous = _index_cache['index'] if _index_cache['path'] == path else None
+    try:
+        index = SegmentedIndex(path, previous=previous)
+        if index.size == 0:
+            index = None
+    except (ValueError, OSError, KeyError) as e:
+        logger.warning(f"Corpus index at {path} could not be opened: {e}")
+        index = None
+
+    _index_cache.update(
+        path=path, mtime=mtime, index=index, sharded=None, frequency=None, ngram=None, collocation=None, dispersion=None,
+        vectors={}, sorter=None
+    )
+    return index
+
+
+def get_sharded_executor(index: Optional[SegmentedIndex] = None) -> Optional[ShardedExecutor]:
+    """Get the shard fan-out executor for the process's corpus index.
+
+    Uses settings.CORPUS_QUERY_WORKERS worker processes (0 = one per CPU);
+    indexes with a single shard are queried in-process.
+
+    Returns:
+        ShardedExecutor, or None if no index has been built
+    """
+    index = index or get_corpus_index()
+    if index is None:
+        return None
+    sharded = _index_cache['sharded']
+    if sharded is None or sharded.index is not index:
+        sharded = ShardedExecutor(index, workers=getattr(settings, 'CORPUS_QUERY_WORKERS', 0))
+        if index is _index_cache['index']:
+            _index_cache['sharded'] = sharded
+    return sharded
+
+
+def get_frequency_counter(index: Optional[SegmentedIndex] = None) -> Optional[FrequencyCounter]:
+    """Get the frequency counter of the process's corpus index.
+
+    The counter keeps the merged lexicons of the index segments, so it is
+    cached with the index.
+
+    Returns:
+        FrequencyCounter, or None if no index has been built
+    """
+    index = index or get_corpus_index()
+    if index is None:
+        return None
+    counter = _index_cache['frequency']
+    if counter is None or counter.index is not index:
+        counter = FrequencyCounter(index)
+        if index is _index_cache['index']:
+            _index_cache['frequency'] = counter
+    return counter
+
+
+def get_concordance_sorter(index: Optional[SegmentedIndex] = None) -> Optional[ConcordanceSorter]:
+    """Get the concordance sorter of the process's corpus index.
+
+    Keeps the collated lexicon ranks between requests.
+
+    Returns:
+        ConcordanceSorter, or None if no index has been built
+    """
+    index = index or get_corpus_index()
+    if index is None:
+        return None
+    sorter = _index_cache['sorter']
+    if sorter is None or sorter.index is not index:
+        sorter = ConcordanceSorter(index, get_frequency_counter(index))
+        if index is _index_cache['index']:
+            _index_cache['sorter'] = sorter
+    return sorter
+
+
+def get_ngram_counter(index: Optional[SegmentedIndex] = None) -> Optional[NgramCounter]:
+    """Get the n-gram counter of the process's corpus index.
+
+    Shares the merged lexicons of get_frequency_counter and keeps the
+    case-folded ones, so it is cached with the index too.
+
+    Returns:
+        NgramCounter, or None if no index has been built
+    """
+    index = index or get_corpus_index()
+    if index is None:
+        return None
+    counter = _index_cache['ngram']
+    if counter is None or counter.index is not index:
+        counter = NgramCounter(index, get_frequency_counter(index))
+        if index is _index_cache['index']:
+            _index_cache['ngram'] = counter
+    return counter
+
+
+def get_collocation_finder(index: Optional[SegmentedIndex] = None) -> Optional[CollocationFinder]:
+    """Get the collocation finder of the process's corpus index.
+
+    Keeps the whole-corpus marginal frequencies between requests.
+
+    Returns:
+        CollocationFinder, or None if no index has been built
+    """
+    index = index or get_corpus_index()
+    if index is None:
+        return None
+    finder = _index_cache['collocation']
+    if finder is None or finder.counter.index is not index:
+        finder = CollocationFinder(get_ngram_counter(index))
+        if index is _index_cache['index']:
+            _index_cache['collocation'] = finder
+    return finder
+
+
+def get_dispersion_counter(index: Optional[SegmentedIndex] = None) -> Optional[DispersionCounter]:
+    """Get the dispersion counter of the process's corpus index.
+
+    Keeps the whole-corpus dispersion tables between requests.
+
+    Returns:
+        DispersionCounter, or None if no index has been built
+    """
+    index = index or get_corpus_index()
+    if index is None:
+        return None
+    counter = _index_cache['dispersion']
+    if counter is None or counter.counter.index is not index:
+        counter = DispersionCounter(get_ngram_counter(index))
+        if index is _index_cache['index']:
+            _index_cache['dispersion'] = counter
+    return counter
+
+
+def get_document_vectors(
+    attribute: str = 'lemma',
+    weighting: str = 'tfidf',
+    index: Optional[SegmentedIndex] = None
+) -> Optional[DocumentVectors]:
+    """Get the normalized document vectors of the process's corpus index.
+
+    IDF and PPMI weights depend on the whole corpus, so the vectors are
+    built from the per-segment count matrices once per index version.
+
+    Returns:
+        DocumentVectors, or None if no index has been built
+    """
+    index = index or get_corpus_index()
+    if index is None:
+        return None
+    if index is not _index_cache['index']:
+        return DocumentVectors.from_counter(get_dispersion_counter(index), attribute, weighting)
+    key = (attribute, weighting)
+    if key not in _index_cache['vectors']:
+        _index_cache['vectors'][key] = DocumentVectors.from_counter(get_dispersion_counter(index), attribute, weighting)
+    return _index_cache['vectors'][key]
+
+
+def sentence_structure(metadata: dict) -> dict:
+    """Reduce stored sentence metadata to what the index keeps.
+
+    CoNLL-U ``# sent_id = ...`` becomes the ``s_id`` region attribute;
+    ``# newpar`` / ``# newpar id = ...`` (VRT ``<p>`` is imported the
+    same way) starts a new paragraph.
+    """
+    result = {'sent_id': metadata.get('sent_id') or metadata.get('id')}
+    if 'newpar id' in metadata:
+        result['newpar'] = metadata['newpar id']
+    elif 'newpar' in metadata or metadata.get('comment') == 'newpar':
+        result['newpar'] = metadata.get('newpar') or ''
+    return result
+
+
+def iter_documents(
+    document_ids: Optional[Iterable[int]] = None,
+    attributes=DEFAULT_ATTRIBUTES,
+    chunk_size: int = 20000
+) -> Iterator[Tuple[int, dict, Iterator[Tuple[int, List[dict], dict]]]]:
+    """Stream tokens from the database grouped by document and sentence.
+
+    Tokens are read with a single ordered query; sentence IDs grow in
+    import order, so ordering by sentence_id preserves reading order
+    without joining the Sentence table. Sentence metadata is read with
+    one query per document.
+
+    Yields:
+        (document_id, metadata, sentences) where sentences yields
+        (sentence_id, tokens, sentence metadata)
+    """
+    tokens = Token.objects.all()
+    documents = Document.objects.all()
+    if document_ids is not None:
+        document_ids = list(document_ids)
+        tokens = tokens.filter(document_id__in=document_ids)
+        documents = documents.filter(id__in=document_ids)
+
+    doc_metadata = {
+        doc_id: {'filename': filename, 'author': author, 'genre': genre, 'date': date}
+        for doc_id, filename, author, genre, date in documents.values_list(
+            'id', 'filename', 'author', 'genre', 'document_date'
+        )
+    }
+
+    fields = ('document_id', 'sentence_id') + tuple(attributes)
+    rows = tokens.order_by('document_id', 'sentence_id', 'index').values_list(*fields).iterator(chunk_size=chunk_size)
+
+    def sentences(document_id, doc_rows):
+        sent_metadata = dict(Sentence.objects.filter(document_id=document_id).values_list('id', 'metadata'))
+        for sentence_id, sent_rows in groupby(doc_rows, key=lambda r: r[1]):
+            yield (
+                sentence_id,
+                [dict(zip(attributes, r[2:])) for r in sent_rows],
+                sentence_structure(sent_metadata.get(sentence_id) or {}),
+            )
+
+    for document_id, doc_rows in groupby(rows, key=lambda r: r[0]):
+        yield document_id, doc_metadata.get(document_id, {}), sentences(document_id, doc_rows)
+
+
+def build_corpus_index(path=None, document_ids=None, stdout=None, shards=None) -> SegmentedIndex:
+    """Build the positional index from the Token table.
+
+    All documents are written into one segment that replaces every
+    existing segment.
+
+    Args:
+        path: Target directory (default: settings.CORPUS_INDEX_DIR)
+        document_ids: Restrict to these documents (default: all)
+        stdout: Optional writable for progress messages
+        shards: Document-range shards (default: settings.CORPUS_INDEX_SHARDS, 0 = one per CPU)
+
+    Returns:
+        The newly opened SegmentedIndex
+    """
+    store = get_segment_store(path)
+    if shards is None:
+        shards = getattr(settings, 'CORPUS_INDEX_SHARDS', 0)
+
+    def documents():
+        doc_count = 0
+        for document in iter_documents(document_ids):
+            yield document
+            doc_count += 1
+            if stdout and doc_count % 100 == 0:
+                stdout.write(f'  {doc_count:,} documents')
+
+    store.replace_all(documents(), shards=shards)
+    index = SegmentedIndex(store.path)
+    build_ngram_tables(index)
+    return index
+
+
+def index_documents(document_ids: Iterable[int]) -> Optional[str]:
+    """Make newly imported documents searchable by adding an index segment.
+
+    Does nothing until an index has been built (the ORM backend is used
+    until then).
+
+    Returns:
+        Name of the new segment, or None
+    """
+    store = get_segment_store()
+    if not SegmentedIndex.exists(store.path):
+        return None
+    return store.add_segment(iter_documents(list(document_ids)), shards=getattr(settings, 'CORPUS_INDEX_SHARDS', 0))
+
+
+def remove_from_index(document_ids: Iterable[int]) -> int:
+    """Hide deleted documents from index queries immediately.
+
+    Sets the documents' bits in the tombstone bitmaps of their segments;
+    nothing is re-encoded (compaction drops the tokens later).
+
+    Returns:
+        Number of documents tombstoned
+    """
+    store = get_segment_store()
+    if not SegmentedIndex.exists(store.path):
+        return 0
+    return store.delete_documents(document_ids)
+
+
+def reindex_documents(document_ids: Iterable[int]) -> Optional[str]:
+    """Replace the indexed version of re-imported documents.
+
+    Returns:
+        Name of the new segment, or None
+    """
+    document_ids = list(document_ids)
+    remove_from_index(document_ids)
+    return index_documents(document_ids)
+
+
+def compact_corpus_index(max_merges: Optional[int] = None) -> List[str]:
+    """Merge small index segments (tiered policy, see SegmentStore.compact).
+
+    Returns:
+        Names of the merged segments written
+    """
+    store = get_segment_store()
+    if not SegmentedIndex.exists(store.path):
+        return []
+    merged = store.compact(max_merges=max_merges)
+    build_ngram_tables(SegmentedIndex(store.path))
+    return merged
+
+
+def build_ngram_tables(index: Optional[SegmentedIndex] = None) -> int:
+    """Write the n-gram tables of segments that have none yet.
+
+    Tables keep n-grams seen at least settings.CORPUS_NGRAM_MIN_FREQUENCY
+    times in a segment (1 = all, which keeps merged counts exact);
+    segments below the table size threshold are counted directly at
+    query time.
+
+    Returns:
+        Number of segments whose tables were written
+    """
+    if index is None:
+        path = get_index_path()
+        if not SegmentedIndex.exists(path):
+            return 0
+        index = SegmentedIndex(path)
+    written = build_missing_ngram_tables(index, min_frequency=getattr(settings, 'CORPUS_NGRAM_MIN_FREQUENCY', 1))
+    return len(written)
@@ -39,6 +39,36 @@ except ImportError as e:
 from corpus.models import Document, Content, Analysis
 
 
+def _token_statistics(words, tags):
+    """Statistics dict from frequency tables without and with punctuation."""
+    word_freq = [(word, count) for word, count in words.most_common('form', 51) if word][:50]
+    lemma_freq = [(lemma, count) for lemma, count in words.most_common('lemma', 51) if lemma][:50]
+    token_count = words.tokens - words.frequency('form', '')
+    type_count = words.type_count('form') - (1 if words.frequency('form', '') else 0)
+    ttr = type_count / token_count if token_count > 0 else 0.0
+    
+    # Zipf distribution (top 20)
+    zipf = []
+    for rank, (word, count) in enumerate(word_freq[:20], start=1):
+        expected = word_freq[0][1] / rank if word_freq else 0
+        zipf.append({
+            'rank': rank,
+            'word': word,
+            'count': count,
+            'expected': round(expected, 2)
+        })
+    
+    return {
+        'token_count': token_count,
+        'type_count': type_count,
+        'ttr': round(ttr, 4),
+        'word_frequency': [{'word': word, 'count': count} for word, count in word_freq],
+        'lemma_frequency': [{'lemma': lemma, 'count': count} for lemma, count in lemma_freq],
+        'pos_distribution': [{'pos': pos, 'count': count} for pos, count in tags.distribution('upos').items() if pos],
+        'zipf': zipf
+    }
+
+
 class CorpusService:
     """Service class for corpus operations."""
     
@@ -197,55 +227,15 @@ class CorpusService:
         Returns:
             Dictionary with statistics
         """
-        from collections import Counter
         from corpus.models import Token
+        from corpus.services.frequency_service import document_frequencies
         
-        # Try new corpus query platform first (Token-based)
+        # Try new corpus query platform first (Token-based, counted on the index when indexed)
         if Token.objects.filter(document=document).exists():
-            tokens = Token.objects.filter(document=document).select_related('sentence')
-            
-            # Build statistics from Token model
-            forms = [t.form for t in tokens if t.form and t.upos != 'PUNCT']
-            lemmas = [t.lemma for t in tokens if t.lemma and t.upos != 'PUNCT']
-            pos_tags = [t.upos for t in tokens if t.upos]
-            
-            token_count = len(forms)
-            type_count = len(set(forms))
-            ttr = type_count / token_count if token_count > 0 else 0.0
-            
-            # Word frequency (top 50)
-            word_freq = Counter(forms).most_common(50)
-            word_frequency = [{'word': word, 'count': count} for word, count in word_freq]
-            
-            # Lemma frequency (top 50)
-            lemma_freq = Counter(lemmas).most_common(50)
-            lemma_frequency = [{'lemma': lemma, 'count': count} for lemma, count in lemma_freq]
-            
-            # POS distribution
-            pos_dist = Counter(pos_tags)
-            pos_distribution = [{'pos': pos, 'count': count} for pos, count in pos_dist.items()]
-            
-            # Zipf distribution (top 20)
-            import math
-            zipf = []
-            for rank, (word, count) in enumerate(word_freq[:20], start=1):
-                expected = word_freq[0][1] / rank if word_freq else 0
-                zipf.append({
-                    'rank': rank,
-                    'word': word,
-                    'count': count,
-                    'expected': round(expected, 2)
-                })
-            
-            return {
-                'token_count': token_count,
-                'type_count': type_count,
-                'ttr': round(ttr, 4),
-                'word_frequency': word_frequency,
-                'lemma_frequency': lemma_frequency,
-                'pos_distribution': pos_distribution,
-                'zipf': zipf
-            }
+            return _token_statistics(
+                document_frequencies(document, exclude_pos=('PUNCT',)),
+                document_frequencies(document)
+            )
         
         # Fallback to legacy Analysis model
         if not hasattr(document, 'analysis') or not document.analysis.data:
@@ -253,26 +243,18 @@ class CorpusService:
         
         if not LEGACY_AVAILABLE:
             # Return basic stats without CorpusStatistics
-            analysis_data = document.analysis.data
-            words = [item.get('word', '') for item in analysis_data if isinstance(item, dict)]
-            lemmas = [item.get('lemma', '') for item in analysis_data if isinstance(item, dict)]
-            pos_tags = [item.get('pos', '') for item in analysis_data if isinstance(item, dict)]
-            
-            token_count = len(words)
-            type_count = len(set(words))
+            table = document_frequencies(document)
+            token_count = table.tokens
+            type_count = table.type_count('form')
             ttr = type_count / token_count if token_count > 0 else 0.0
             
-            word_freq = Counter(words).most_common(50)
-            lemma_freq = Counter(lemmas).most_common(50)
-            pos_dist = Counter(pos_tags)
-            
             return {
                 'token_count': token_count,
                 'type_count': type_count,
                 'ttr': round(ttr, 4),
-                'word_frequency': [{'word': w, 'count': c} for w, c in word_freq],
-                'lemma_frequency': [{'lemma': l, 'count': c} for l, c in lemma_freq],
-                'pos_distribution': [{'pos': p, 'count': c} for p, c in pos_dist.items()],
+                'word_frequency': [{'word': w, 'count': c} for w, c in table.most_common('form', 50)],
+                'lemma_frequency': [{'lemma': l, 'count': c} for l, c in table.most_common('lemma', 50)],
+                'pos_distribution': [{'pos': p, 'count': c} for p, c in table.distribution('upos').items()],
                 'zipf': []
             }
         
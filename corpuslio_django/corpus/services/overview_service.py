@@ -0,0 +1,126 @@
+"""Approximate corpus overviews from import-time sketches.
+
+CoNLL-U and VRT imports store a ``corpuslio.index.sketches.CorpusSketch``
+of each document in ``CorpusMetadata.sketches``: HyperLogLog type counts
+and Count-Min/Space-Saving counts of the heaviest forms, lemmas, bigrams
+and trigrams. Merging them gives an overview of the whole corpus (or any
+document set) right after import, without reading the Token table or
+waiting for the positional index.
+
+Documents imported before sketches existed have an empty field;
+``backfill_sketches`` computes theirs from the Token table.
+"""
+
+import logging
+import os
+import sys
+from typing import Optional
+
+from django.db.models import Count, Max, Q
+
+# Add project root (parent of corpuslio_django) to path for corpuslio imports
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from corpuslio.index import Bitmap
+from corpuslio.index.sketches import CorpusSketch
+from corpus.models import CorpusMetadata, Token
+from corpus.services.subcorpus_service import subcorpus_q
+
+logger = logging.getLogger(__name__)
+
+# Process-level cache of the merged whole-corpus sketch, keyed by metadata count,
+# last ID and number of documents without a sketch (changes when they are backfilled)
+_overview_cache = {'key': None, 'sketch': None, 'documents': 0, 'missing': 0}
+
+
+def document_sketch(document) -> CorpusSketch:
+    """Sketch of a document computed from its Token rows (one ordered query)."""
+    sketch = CorpusSketch()
+    rows = Token.objects.filter(document=document).order_by('sentence_id', 'index').values_list(
+        'sentence_id', 'form', 'lemma', 'upos'
+    )
+    current, forms, lemmas, tags = None, [], [], []
+    for sentence_id, form, lemma, upos in rows.iterator(chunk_size=10000):
+        if sentence_id != current and forms:
+            sketch.add_sentence(forms, lemmas, tags)
+            forms, lemmas, tags = [], [], []
+        current = sentence_id
+        forms.append(form or '')
+        lemmas.append(lemma or '')
+        tags.append(upos or '')
+    if forms:
+        sketch.add_sentence(forms, lemmas, tags)
+    sketch.flush()
+    return sketch
+
+
+def backfill_sketches(stdout=None) -> int:
+    """Write the sketches of imported documents that have none.
+
+    Returns:
+        Number of documents updated
+    """
+    updated = 0
+    for metadata in CorpusMetadata.objects.select_related('document').order_by('id'):
+        if metadata.sketches:
+            continue
+        metadata.sketches = document_sketch(metadata.document).to_dict()
+        metadata.save(update_fields=['sketches'])
+        updated += 1
+        _overview_cache['key'] = None
+        if stdout:
+            stdout.write(f'  {metadata.document.filename}: {metadata.sketches["tokens"]:,} tokens')
+    return updated
+
+
+def merged_sketch(documents: Optional[Bitmap] = None):
+    """Merge the stored sketches of a document set.
+
+    Args:
+        documents: Subcorpus to include (None = all imported documents)
+
+    Returns:
+        (CorpusSketch, documents merged, documents without a sketch)
+    """
+    queryset = CorpusMetadata.objects.all()
+    if documents is None:
+        stats = queryset.aggregate(
+            count=Count('id'), last=Max('id'),
+            missing=Count('id', filter=Q(sketches__isnull=True) | Q(sketches={}))
+        )
+        key = (stats['count'], stats['last'], stats['missing'])
+        if _overview_cache['key'] == key:
+            return _overview_cache['sketch'], _overview_cache['documents'], _overview_cache['missing']
+    else:
+        queryset = queryset.filter(subcorpus_q(documents))
+
+    sketches = list(queryset.values_list('sketches', flat=True))
+    present = [sketch for sketch in sketches if sketch]
+    sketch = CorpusSketch.merged(present)
+    missing = len(sketches) - len(present)
+    if documents is None:
+        _overview_cache.update(key=key, sketch=sketch, documents=len(present), missing=missing)
+    return sketch, len(present), missing
+
+
+def corpus_overview(documents: Optional[Bitmap] = None, top: int = 20) -> dict:
+    """Approximate overview of the corpus or a subcorpus.
+
+    Args:
+        documents: Subcorpus to include (None = all imported documents)
+        top: Number of heaviest forms, lemmas, bigrams and trigrams
+
+    Returns:
+        Dict with tokens, sentences, unique_forms, unique_lemmas, ttr,
+        top_forms/top_lemmas/top_bigrams/top_trigrams (value, frequency,
+        max_error), documents and documents_without_sketch
+    """
+    sketch, merged, missing = merged_sketch(documents)
+    overview = sketch.overview(top=top)
+    overview['ttr'] = round(overview['unique_forms'] / overview['tokens'] * 100, 2) if overview['tokens'] else 0
+    overview['documents'] = merged
+    overview['documents_without_sketch'] = missing
+    overview['approximate'] = True
+    return overview
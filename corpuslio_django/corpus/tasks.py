@@ -241,6 +241,16 @@ def cleanup_old_tasks():
     return f'Cleaned up {count} old tasks'
 
 
+@shared_task
+def compact_corpus_index():
+    """Periodic task to merge small corpus index segments written by imports
+    and write the n-gram tables of new large segments."""
+    from .services.index_service import compact_corpus_index as compact
+    
+    merged = compact()
+    return f'Merged {len(merged)} index segments'
+
+
 # ============================================================
 # GDPR/KVKK DATA RETENTION TASKS
 # ============================================================
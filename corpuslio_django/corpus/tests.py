@@ -1,3 +1,214 @@
-from django.test import TestCase
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from corpus.advanced_search_views import _indexed_search
+from corpus.models import Analysis, Document, Sentence, Token
+from corpus.query_engine import DOCUMENT_SORT, CorpusQueryEngine
+from corpus.services import index_service
+from corpuslio.query_parser import parse_cqp_query
+
+# (filename, sentences); filenames are out of corpus order so that the
+# document sort differs from it
+DOCUMENTS = [
+    ('c.conllu', ['Ev çok güzel', 'bu ev büyük bir ev', 'kitap ev', 'ev']),
+    ('a.conllu', ['büyük ev gördüm', 'Ev ve okul', 'okul ev ama ev Ev değil']),
+    ('b.conllu', ['ev', 'yeni bir ev aldık', 'EV sahibi geldi', 'kalem']),
+]
+
+
+def line_key(line) -> tuple:
+    return (line['document'], line['sentence_id'], line['keyword'], line['left'], line['right'])
+
+
+def r1_key(line) -> tuple:
+    """Sort key of a line by its first right-context word (no context first)."""
+    words = line['right'].split()
+    return (1, words[0].lower()) if words else (0, '')
+
+
+def create_documents():
+    """Documents of DOCUMENTS with their sentences and tokens."""
+    for filename, texts in DOCUMENTS:
+        document = Document.objects.create(filename=filename, file=filename, format='conllu', processed=True)
+        for i, text in enumerate(texts):
+            words = text.split()
+            sentence = Sentence.objects.create(
+                document=document, index=i, text=text, token_count=len(words), metadata={'sent_id': str(i)}
+            )
+            Token.objects.bulk_create([
+                Token(document=document, sentence=sentence, index=j + 1, form=word, lemma=word.lower(), upos='X')
+                for j, word in enumerate(words)
+            ])
+
+
+def use_temporary_index(test):
+    """Point CORPUS_INDEX_DIR at a directory removed after the test."""
+    index_dir = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, index_dir, ignore_errors=True)
+    settings_override = override_settings(CORPUS_INDEX_DIR=index_dir)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+
+
+class ConcordancePageTests(TestCase):
+    """Paging, sorting and sampling of concordance_page on both backends."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_documents()
+
+    def setUp(self):
+        use_temporary_index(self)
+        # One segment per document, as after a build and two imports
+        first, *imported = Document.objects.order_by('id').values_list('id', flat=True)
+        index_service.build_corpus_index(document_ids=[first], shards=1)
+        for document_id in imported:
+            index_service.index_documents([document_id])
+        self.engines = {backend: CorpusQueryEngine(backend=backend) for backend in ('orm', 'index')}
+        self.assertEqual(len(self.engines['index'].index.segments), 3)
+
+    def lines(self, engine, **kwargs):
+        """All lines of the 'ev' concordance."""
+        return [line_key(line) for line in engine.concordance('ev', limit=1000, **kwargs)]
+
+    def all_pages(self, engine, limit, **kwargs):
+        """Lines of every page, following next_cursor from the first page."""
+        pages = []
+        cursor = None
+        while True:
+            page = engine.concordance_page('ev', limit=limit, cursor=cursor, **kwargs)
+            pages.append([line_key(line) for line in page['results']])
+            cursor = page['next_cursor']
+            if cursor is None:
+                return pages
+
+    def test_corpus_order(self):
+        expected = None
+        for backend, engine in self.engines.items():
+            with self.subTest(backend=backend):
+                lines = self.lines(engine)
+                self.assertEqual(len(lines), 13)
+                self.assertEqual([line[0] for line in lines], ['c.conllu'] * 5 + ['a.conllu'] * 5 + ['b.conllu'] * 3)
+                if expected is None:
+                    expected = lines
+                self.assertEqual(lines, expected)
+
+                pages = self.all_pages(engine, limit=4)
+                self.assertEqual([len(page) for page in pages], [4, 4, 4, 1])
+                self.assertEqual(sum(pages, []), lines)
+
+    def test_prev_cursor(self):
+        for backend, engine in self.engines.items():
+            with self.subTest(backend=backend):
+                pages = self.all_pages(engine, limit=4)
+                page = engine.concordance_page('ev', limit=4)
+                self.assertIsNone(page['prev_cursor'])
+                while page['next_cursor']:
+                    page = engine.concordance_page('ev', limit=4, cursor=page['next_cursor'])
+                # Walk back from the last page
+                seen = [[line_key(line) for line in page['results']]]
+                while page['prev_cursor']:
+                    page = engine.concordance_page('ev', limit=4, cursor=page['prev_cursor'])
+                    seen.insert(0, [line_key(line) for line in page['results']])
+                self.assertEqual(seen, pages)
+
+    def test_sorted_pages(self):
+        for sort in ('R1', 'L1+R1', 'KWIC'):
+            results = {}
+            for backend, engine in self.engines.items():
+                with self.subTest(backend=backend, sort=sort):
+                    lines = self.lines(engine, sort=sort)
+                    self.assertEqual(sorted(lines), sorted(self.lines(engine)))
+                    self.assertEqual(sum(self.all_pages(engine, limit=4, sort=sort), []), lines)
+                    results[backend] = lines
+            self.assertEqual(results['orm'], results['index'])
+
+        for backend, engine in self.engines.items():
+            with self.subTest(backend=backend, sort='R1 order'):
+                unsorted = list(engine.concordance('ev', limit=1000))
+                # All hits are sorted (not each page), stably in corpus order
+                expected = [line_key(line) for line in sorted(unsorted, key=r1_key)]
+                self.assertEqual(self.lines(engine, sort='R1'), expected)
+                page = engine.concordance_page('ev', limit=5, sort='R1')
+                self.assertEqual([line_key(line) for line in page['results']], expected[:5])
+
+    def test_document_sort(self):
+        for backend, engine in self.engines.items():
+            with self.subTest(backend=backend):
+                lines = self.lines(engine, sort=DOCUMENT_SORT)
+                corpus_order = self.lines(engine)
+                self.assertEqual(lines, sorted(corpus_order, key=lambda line: line[0]))
+                self.assertEqual(sum(self.all_pages(engine, limit=4, sort=DOCUMENT_SORT), []), lines)
+
+    def test_sample(self):
+        samples = {}
+        for backend, engine in self.engines.items():
+            with self.subTest(backend=backend):
+                corpus_order = self.lines(engine)
+                lines = self.lines(engine, sample=7, seed=3)
+                self.assertEqual(len(lines), 7)
+                # A sample keeps corpus order and is repeatable for a seed
+                self.assertEqual(lines, [line for line in corpus_order if line in lines])
+                self.assertEqual(lines, self.lines(engine, sample=7, seed=3))
+                self.assertEqual(sum(self.all_pages(engine, limit=3, sample=7, seed=3), []), lines)
+                # Sampling, then sorting the sample
+                sorted_sample = self.lines(engine, sample=7, seed=3, sort='R1')
+                self.assertEqual(sorted(sorted_sample), sorted(lines))
+                # A sample larger than the hits is all hits
+                self.assertEqual(self.lines(engine, sample=50), corpus_order)
+                samples[backend] = lines
+        self.assertEqual(samples['orm'], samples['index'])
+
+    def test_invalid_requests(self):
+        for backend, engine in self.engines.items():
+            with self.subTest(backend=backend):
+                cursor = engine.concordance_page('ev', limit=2)['next_cursor']
+                with self.assertRaises(ValueError):
+                    engine.concordance_page('kitap', limit=2, cursor=cursor)
+                with self.assertRaises(ValueError):
+                    engine.concordance_page('ev', limit=2, cursor=cursor, sort='R1')
+                with self.assertRaises(ValueError):
+                    engine.concordance_page('ev', limit=2, cursor='not-a-cursor')
+                with self.assertRaises(ValueError):
+                    engine.concordance_page('ev', limit=2, sort='X1')
+
+
+class IndexedSearchTests(TestCase):
+    """Advanced search over the index and documents it does not hold."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_documents()
+        # A web upload: analysis JSON only, no Token rows
+        cls.upload = Document.objects.create(filename='upload.txt', file='upload.txt', format='txt', processed=True)
+        Analysis.objects.create(document=cls.upload, data=[
+            {'word': 'yeni', 'lemma': 'yeni', 'pos': 'ADJ'},
+            {'word': 'ev', 'lemma': 'ev', 'pos': 'NOUN'},
+        ])
+        # Neither indexed nor analysed
+        cls.empty = Document.objects.create(filename='empty.txt', file='empty.txt', format='txt', processed=True)
+
+    def setUp(self):
+        use_temporary_index(self)
+        indexed = Document.objects.exclude(id__in=[self.upload.id, self.empty.id]).values_list('id', flat=True)
+        self.index = index_service.build_corpus_index(document_ids=list(indexed), shards=1)
+
+    def search(self, document_ids):
+        query = '[word="ev"]'
+        return _indexed_search(self.index, query, parse_cqp_query(query), document_ids, context_size=2)
+
+    def test_unindexed_documents_are_searched(self):
+        document_ids = list(Document.objects.order_by('id').values_list('id', flat=True))
+        matches, total = self.search(document_ids)
+        self.assertEqual(total, 14)
+        self.assertEqual(len(matches), total)
+        # Index hits first, then the analysis matches
+        self.assertEqual(matches[-1]['document']['filename'], 'upload.txt')
+        self.assertEqual(matches[-1]['left_context'][-1]['word'], 'yeni')
+        self.assertEqual(sum(match['document']['filename'] == 'upload.txt' for match in matches), 1)
+
+        matches, total = self.search([self.upload.id, self.empty.id])
+        self.assertEqual(total, 1)
+        self.assertEqual(matches[0]['document']['id'], self.upload.id)
@@ -43,6 +43,7 @@ urlpatterns = [
     path('collocation/', search_views.collocation_view, name='collocation'),
     path('ngram-analysis/', search_views.ngram_view, name='ngram'),
     path('frequency/', search_views.frequency_view, name='frequency'),
+    path('keyness/', search_views.keyness_view, name='keyness'),
     
     # Corpus search exports
     path('export/concordance/', search_views.export_concordance_view, name='export_concordance'),
@@ -52,6 +53,11 @@ urlpatterns = [
     
     # API endpoints
     path('api/concordance/', search_views.api_concordance, name='api_concordance'),
+    path('api/facets/', search_views.api_facets, name='api_facets'),
+    path('api/dispersion/', search_views.api_dispersion, name='api_dispersion'),
+    path('api/similar/', search_views.api_similar_documents, name='api_similar_documents'),
+    path('api/compare/', search_views.api_compare_documents, name='api_compare_documents'),
+    path('api/overview/', search_views.api_overview, name='api_overview'),
     
     # Advanced search (Week 9)
     path('advanced-search/', advanced_search_views.advanced_search_view, name='advanced_search'),
@@ -163,7 +163,7 @@ class CQPQueryValidator:
     MAX_QUERY_LENGTH = 1000
     
     # Allowed CQP operators and characters
-    ALLOWED_PATTERN = r'^[\[\]\w\s\"\=\&\.\*\^\$\-\|\(\)]+$'
+    ALLOWED_PATTERN = r'^[\[\]\w\s\"\=\&\.\*\^\$\-\|\(\)\!\?\+\{\}\,]+$'
     
     # Dangerous patterns to block
     BLOCKED_PATTERNS = [
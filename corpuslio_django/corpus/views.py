@@ -16,10 +16,19 @@ from .models import Document, ProcessingTask, Analysis, Tag, Content, CorpusMeta
 from .services import CorpusService
 from .services import CorpusService
 from .collections import Collection
+from .services.facet_service import get_facet_index
+from .services.index_service import remove_from_index
+from .services.overview_service import corpus_overview
+from .services.subcorpus_service import build_subcorpus, subcorpus_q
 from .utils import check_password_strength, send_verification_email, log_login_attempt
 import os
+import re
 from django.contrib.auth.decorators import user_passes_test, login_required
 
+# analysis_view search types answered by the query engine for Token-based documents
+ANALYSIS_QUERY_TYPES = {'word': 'form', 'lemma': 'lemma', 'pos': 'upos'}
+
+
 def rate_limit_exceeded(request, exception=None):
     """Custom 429 error handler for rate limiting."""
     return render(request, 'corpus/429.html', status=429)
@@ -107,11 +116,10 @@ def library_view(request):
     search_query = request.GET.get('q')
     format_filter = request.GET.get('format')
     
-    if author_filter:
-        corpora = corpora.filter(global_metadata__author__icontains=author_filter)
-    
-    if genre_filter:
-        corpora = corpora.filter(global_metadata__genre__icontains=genre_filter)
+    # Author/genre filters resolved on the facet index
+    documents = build_subcorpus(genres=[genre_filter], authors=[author_filter])
+    if documents is not None:
+        corpora = corpora.filter(subcorpus_q(documents))
     
     if date_filter:
         corpora = corpora.filter(global_metadata__date__icontains=date_filter)
@@ -172,21 +180,14 @@ def library_view(request):
             'total_pages': paginator.num_pages
         })
     
-    # Get unique values for filter dropdowns
-    all_genres = set()
-    all_authors = set()
-    for corpus in CorpusMetadata.objects.only('global_metadata').all()[:500]:  # Limit for performance
-        if corpus.global_metadata:
-            if 'genre' in corpus.global_metadata:
-                all_genres.add(corpus.global_metadata['genre'])
-            if 'author' in corpus.global_metadata:
-                all_authors.add(corpus.global_metadata['author'])
+    # Filter dropdowns from the facet index (no metadata scan)
+    facets = get_facet_index()
     
     context = {
         'corpora': page_obj,  # Pass page_obj instead of full queryset
         'page_obj': page_obj,  # Explicit naming for template clarity
-        'all_genres': sorted(all_genres),
-        'all_authors': sorted(all_authors),
+        'all_genres': facets.facet_values('genre'),
+        'all_authors': facets.facet_values('author'),
         'format_choices': CorpusMetadata.FORMAT_CHOICES,
         'is_limited_public_view': is_limited_public_view,
         'active_tab': 'library'
@@ -222,6 +223,7 @@ def analysis_view(request, doc_id):
     
     # Handle search
     search_results = None
+    search_pages = None  # cursor pagination of Token-based searches
     if request.GET.get('query') or request.GET.get('search_type'):
         search_params = {
             'search_type': request.GET.get('search_type', 'word'),
@@ -236,19 +238,61 @@ def analysis_view(request, doc_id):
             'max_confidence': float(request.GET.get('max_confidence', 1.0)),
         }
         
-        search_results_list = service.search_in_document(document, search_params)
-    
-        # Pagination for Search Results
-        from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-        paginator = Paginator(search_results_list, 50)  # 50 KWIC lines per page
+        from .models import Token
+        query_type = ANALYSIS_QUERY_TYPES.get(search_params['search_type'])
+        if query_type and Token.objects.filter(document=document).exists():
+            # Token-based documents page through the query engine with cursors:
+            # only the 50 KWIC lines of the page are read, however deep it is
+            from .query_engine import CorpusQueryEngine
+            query, regex = search_params['keyword'], search_params['regex']
+            if query_type == 'upos':
+                query, regex = '^(?:' + '|'.join(re.escape(tag) for tag in search_params['pos_tags']) + ')$', True
+            engine = CorpusQueryEngine(documents=[document.id])
+            search = dict(
+                query=query,
+                context_size=search_params['context_size'],
+                query_type=query_type,
+                regex=regex,
+                case_sensitive=search_params['case_sensitive'],
+                limit=50
+            )
+            cursor = request.GET.get('cursor') or None
+            try:
+                concordance = engine.concordance_page(cursor=cursor, **search)
+            except ValueError:
+                cursor = None
+                concordance = engine.concordance_page(**search)
+            search_results = [
+                dict(line, left_context=line['left'], right_context=line['right'])
+                for line in concordance['results']
+            ]
+            params = request.GET.copy()
+            params.pop('cursor', None)
+            params.pop('page', None)
+            page = max(int(request.GET.get('page', 1)), 1) if cursor else 1
+            search_pages = {
+                'query': params.urlencode(),
+                'page': page,
+                'total': engine.count(query, query_type, regex, search_params['case_sensitive'])['count'],
+                'previous_page': max(page - 1, 1) if concordance['prev_cursor'] else None,
+                'next_page': page + 1 if concordance['next_cursor'] else None,
+                'prev_cursor': concordance['prev_cursor'],
+                'next_cursor': concordance['next_cursor'],
+            }
+        else:
+            search_results_list = service.search_in_document(document, search_params)
         
-        page_number = request.GET.get('page')
-        try:
-            search_results = paginator.get_page(page_number)
-        except PageNotAnInteger:
-            search_results = paginator.page(1)
-        except EmptyPage:
-            search_results = paginator.page(paginator.num_pages)
+            # Pagination for Search Results
+            from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+            paginator = Paginator(search_results_list, 50)  # 50 KWIC lines per page
+            
+            page_number = request.GET.get('page')
+            try:
+                search_results = paginator.get_page(page_number)
+            except PageNotAnInteger:
+                search_results = paginator.page(1)
+            except EmptyPage:
+                search_results = paginator.page(paginator.num_pages)
             
     # Get POS tags for filters
     pos_tags = []
@@ -274,7 +318,8 @@ def analysis_view(request, doc_id):
     context = {
         'document': document,
         'stats': stats,
-        'search_results': search_results, # Now this is a Page object
+        'search_results': search_results, # Page object, or a list with search_pages
+        'search_pages': search_pages,
         'pos_tags': pos_tags,
         'active_tab': 'analysis',
         'preview_text': preview_text,
@@ -299,11 +344,17 @@ def statistics_view(request):
         count=Count('id')
     ).order_by('-count')[:15]
     
-    # Lemma diversity (unique lemmas)
-    unique_lemmas = Token.objects.values('lemma').distinct().count()
-    
-    # Type-Token Ratio (TTR)
-    unique_forms = Token.objects.values('form').distinct().count()
+    # Lemma diversity and Type-Token Ratio (TTR): estimated from the import
+    # sketches (case-folded, marked as approximate) when every document has
+    # one, else counted exactly in the Token table
+    overview = corpus_overview(top=20)
+    types_approximate = bool(total_documents and not overview['documents_without_sketch'])
+    if types_approximate:
+        unique_lemmas = overview['unique_lemmas']
+        unique_forms = overview['unique_forms']
+    else:
+        unique_lemmas = Token.objects.values('lemma').distinct().count()
+        unique_forms = Token.objects.values('form').distinct().count()
     ttr = round(unique_forms / total_tokens * 100, 2) if total_tokens > 0 else 0
     
     # Average sentence length
@@ -321,9 +372,14 @@ def statistics_view(request):
         'unique_lemmas': unique_lemmas,
         'unique_forms': unique_forms,
         'ttr': ttr,
+        'types_approximate': types_approximate,
         'avg_sentence_length': avg_sentence_length,
         'pos_distribution': pos_counts,
         'frequent_tokens': frequent_tokens,
+        'frequent_ngrams': [
+            ('En Sık İkililer (Bigram)', overview['top_bigrams']),
+            ('En Sık Üçlüler (Trigram)', overview['top_trigrams']),
+        ],
         'active_tab': 'statistics'
     }
     return render(request, 'corpus/corpus_statistics.html', context)
@@ -337,6 +393,7 @@ def delete_document(request, doc_id):
     document = get_object_or_404(Document, id=doc_id)
     filename = document.filename
     document.delete()
+    remove_from_index([doc_id])
     
     messages.success(request, f'✅ {filename} silindi.')
     return redirect('corpus:library')
@@ -224,6 +224,26 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'corpus.tasks.cleanup_old_tasks',
         'schedule': 86400.0,  # Daily
     },
+    'compact-corpus-index': {
+        'task': 'corpus.tasks.compact_corpus_index',
+        'schedule': 600.0,  # Every 10 minutes
+    },
 }
 
+# Positional Corpus Index (corpuslio.index)
+# ==========================================
+# Built with: python manage.py build_corpus_index
+CORPUS_INDEX_DIR = os.getenv('CORPUS_INDEX_DIR', str(BASE_DIR / 'corpus_index'))
+# Query backend for CorpusQueryEngine: 'auto' (index when built), 'index' or 'orm'
+CORPUS_QUERY_BACKEND = os.getenv('CORPUS_QUERY_BACKEND', 'auto')
+# Document-range shards written at build time (0 = one per CPU, min. 1M tokens each)
+CORPUS_INDEX_SHARDS = int(os.getenv('CORPUS_INDEX_SHARDS', '0'))
+# Worker processes for shard fan-out (0 = one per CPU, 1 = no fan-out)
+CORPUS_QUERY_WORKERS = int(os.getenv('CORPUS_QUERY_WORKERS', '0'))
+# Imports add small index segments; compaction merges this many same-size segments
+CORPUS_INDEX_MERGE_FACTOR = int(os.getenv('CORPUS_INDEX_MERGE_FACTOR', '4'))
+# N-grams seen less often in a segment are pruned from its persisted n-gram tables
+# (above 1 the tables are only used while the index has a single segment)
+CORPUS_NGRAM_MIN_FREQUENCY = int(os.getenv('CORPUS_NGRAM_MIN_FREQUENCY', '1'))
+
 # (Remaining settings unchanged - project-local settings preserved)
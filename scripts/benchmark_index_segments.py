@@ -0,0 +1,131 @@
+"""Benchmark query latency against the number of index segments.
+
+Usage:
+  python scripts/benchmark_index_segments.py [--tokens 2000000] [--repeat 3]
+
+Builds the same synthetic corpus as 1, 2, 4, ... 32 segments (as after
+that many imports without compaction), times a few queries on each, then
+compacts the most fragmented index and times it again. Indexes are
+written to a temporary directory that is removed afterwards.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+# Ensure repo root on path when invoked from workspace root
+import sys
+from pathlib import Path as _P
+ROOT = _P(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+from corpuslio.index import SegmentedIndex, SegmentStore, ShardedExecutor
+
+SEGMENT_COUNTS = (1, 2, 4, 8, 16, 32)
+SENTENCE_LENGTH = 15
+SENTENCES_PER_DOCUMENT = 200
+VOCABULARY = 20000
+POS_TAGS = ('NOUN', 'VERB', 'ADJ', 'DET', 'PUNCT', 'ADP')
+
+QUERIES = (
+    '[word="w12"]',
+    '[pos="ADJ"] [pos="NOUN"]',
+    '[word="w1.*"] [pos="VERB"]',
+    '[pos="ADJ"]+ [pos="NOUN"]',
+)
+
+
+def synthetic_documents(tokens: int, seed: int = 1):
+    """Zipf-distributed documents as (document_id, metadata, sentences)."""
+    rng = np.random.default_rng(seed)
+    words = [f'w{i}' for i in range(VOCABULARY)]
+    document_tokens = SENTENCE_LENGTH * SENTENCES_PER_DOCUMENT
+    documents = []
+    for document_id in range(1, tokens // document_tokens + 1):
+        word_ids = np.minimum(rng.zipf(1.3, size=document_tokens), VOCABULARY) - 1
+        pos_ids = rng.integers(0, len(POS_TAGS), size=document_tokens)
+        sentences = []
+        for s in range(SENTENCES_PER_DOCUMENT):
+            sentence = range(s * SENTENCE_LENGTH, (s + 1) * SENTENCE_LENGTH)
+            sentences.append((
+                document_id * SENTENCES_PER_DOCUMENT + s,
+                [
+                    {'form': words[word_ids[i]], 'lemma': words[word_ids[i]][:3], 'upos': POS_TAGS[pos_ids[i]]}
+                    for i in sentence
+                ],
+                {'sent_id': f's{s}'},
+            ))
+        documents.append((document_id, {'filename': f'doc{document_id}'}, sentences))
+    return documents
+
+
+def build(path, documents, segment_count: int) -> SegmentStore:
+    """Write documents as segment_count segments of equal size."""
+    store = SegmentStore(path)
+    for chunk in np.array_split(np.arange(len(documents)), segment_count):
+        store.add_segment([documents[i] for i in chunk.tolist()], shards=1)
+    return store
+
+
+def time_queries(index, repeat: int):
+    """Best-of-repeat milliseconds per query, in-process (no fan-out)."""
+    executor = ShardedExecutor(index, workers=1)
+    timings = []
+    for query in QUERIES:
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            starts, _ = executor.find(query)
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append((best, len(starts)))
+    return timings
+
+
+def print_row(label, timings):
+    print(f'{label:>12} ' + ' '.join(f'{ms:>10.1f}' for ms, _ in timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tokens', type=int, default=2_000_000, help='Corpus size')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per query (best is reported)')
+    args = parser.parse_args()
+
+    documents = synthetic_documents(args.tokens)
+    workdir = _P(tempfile.mkdtemp(prefix='segment-bench-'))
+    try:
+        print(f'{len(documents)} documents, {len(documents) * SENTENCE_LENGTH * SENTENCES_PER_DOCUMENT:,} tokens')
+        print('Query latency in ms (best of {})'.format(args.repeat))
+        for n, query in enumerate(QUERIES, 1):
+            print(f'  q{n}: {query}')
+        print(f'{"segments":>12} ' + ' '.join(f'{"q" + str(n):>10}' for n in range(1, len(QUERIES) + 1)))
+
+        reference = None
+        store = None
+        for segment_count in SEGMENT_COUNTS:
+            store = build(workdir / str(segment_count), documents, segment_count)
+            timings = time_queries(SegmentedIndex(store.path), args.repeat)
+            counts = [count for _, count in timings]
+            if reference is None:
+                reference = counts
+            elif counts != reference:
+                print(f'  result counts differ from 1 segment: {counts} != {reference}')
+            print_row(segment_count, timings)
+
+        # Compact the most fragmented index with a small lowest tier so it merges
+        store.min_segment_tokens = args.tokens // SEGMENT_COUNTS[-1]
+        started = time.perf_counter()
+        merged = store.compact()
+        elapsed = time.perf_counter() - started
+        index = SegmentedIndex(store.path)
+        print(f'Compaction: {len(merged)} merges in {elapsed:.1f}s, {len(index.segments)} segments left')
+        print_row('compacted', time_queries(index, args.repeat))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Shared fixtures: a small deterministic corpus indexed as several segments."""
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pytest
+
+from corpuslio.index import SegmentedIndex, SegmentStore
+
+WORDS = ('ev', 'Ev', 'kitap', 'Kitap', 'okul', 'güzel', 'büyük', 'bir', 've', 'gel', 'git', 'yaz', 'oku', 'kalem')
+POS_TAGS = (
+    'NOUN', 'NOUN', 'NOUN', 'NOUN', 'NOUN', 'ADJ', 'ADJ', 'DET', 'CCONJ', 'VERB', 'VERB', 'VERB', 'VERB', 'NOUN'
+)
+SEGMENTS = 3
+
+
+@dataclass
+class Corpus:
+    """Documents of the test corpus with their flat token view."""
+    documents: List[Tuple[int, dict, list]]
+    # One dict per corpus position: form, lemma, upos, document, sentence
+    tokens: List[Dict]
+    # (start, end) of every sentence in corpus positions
+    sentences: List[Tuple[int, int]]
+
+    def column(self, attribute: str) -> List[str]:
+        return [token[attribute] for token in self.tokens]
+
+
+def make_documents(count: int = 12, seed: int = 7) -> List[Tuple[int, dict, list]]:
+    """Documents as (document_id, metadata, sentences), see IndexBuilder.add_document."""
+    rng = np.random.default_rng(seed)
+    documents = []
+    sentence_id = 0
+    for document_id in range(1, count + 1):
+        sentences = []
+        for s in range(int(rng.integers(2, 6))):
+            length = int(rng.integers(2, 9))
+            word_ids = rng.zipf(1.5, size=length) % len(WORDS)
+            tokens = [
+                {'form': WORDS[w], 'lemma': WORDS[w].lower(), 'upos': POS_TAGS[w]}
+                for w in word_ids
+            ]
+            # Some forms with a second POS, so the dominant POS is a majority vote
+            for token in tokens:
+                if token['lemma'] in ('yaz', 'güzel') and rng.random() < 0.3:
+                    token['upos'] = 'NOUN' if token['lemma'] == 'yaz' else 'ADV'
+            if rng.random() < 0.7:
+                tokens.append({'form': '.', 'lemma': '.', 'upos': 'PUNCT'})
+            sentence_id += 1
+            sentences.append((sentence_id, tokens, {'sent_id': f'{document_id}-{s}'}))
+        documents.append((document_id * 10, {'filename': f'doc{document_id:02d}.conllu'}, sentences))
+    return documents
+
+
+def flatten(documents) -> Corpus:
+    """Token dicts in corpus order (documents in the order they were indexed)."""
+    tokens = []
+    sentences = []
+    for document_id, _, document_sentences in documents:
+        for sentence_id, sentence_tokens, _ in document_sentences:
+            start = len(tokens)
+            for token in sentence_tokens:
+                tokens.append(dict(token, document=document_id, sentence=sentence_id))
+            sentences.append((start, len(tokens)))
+    return Corpus(documents, tokens, sentences)
+
+
+def write_segments(path, documents, segments: int = SEGMENTS) -> SegmentStore:
+    """Index documents as ``segments`` segments of about equal size."""
+    store = SegmentStore(path)
+    for chunk in np.array_split(np.arange(len(documents)), segments):
+        store.add_segment([documents[i] for i in chunk.tolist()], shards=1)
+    return store
+
+
+@pytest.fixture(scope='session')
+def corpus() -> Corpus:
+    return flatten(make_documents())
+
+
+@pytest.fixture(scope='session')
+def index(corpus, tmp_path_factory) -> SegmentedIndex:
+    """Read-only multi-segment index of the test corpus."""
+    store = write_segments(tmp_path_factory.mktemp('index'), corpus.documents)
+    return SegmentedIndex(store.path)
@@ -0,0 +1,78 @@
+"""Bitmap set operations against Python sets, on sparse and dense chunks."""
+import numpy as np
+import pytest
+
+from corpuslio.index import Bitmap
+
+
+def random_sets(seed: int):
+    rng = np.random.default_rng(seed)
+    sparse = rng.integers(0, 400_000, size=3000)
+    # Dense chunks (more than 4096 values per 65536) next to sparse ones
+    dense = np.concatenate([np.arange(60_000, 140_000), rng.integers(200_000, 210_000, size=6000)])
+    mixed = np.concatenate([rng.integers(0, 400_000, size=500), np.arange(100_000, 131_072, 2)])
+    return [set(values.tolist()) for values in (sparse, dense, mixed)]
+
+
+@pytest.fixture(params=[1, 2])
+def sets(request):
+    return random_sets(request.param)
+
+
+def check(bitmap: Bitmap, expected: set):
+    assert len(bitmap) == len(expected)
+    assert bitmap.to_array().tolist() == sorted(expected)
+    assert bool(bitmap) == bool(expected)
+
+
+def test_from_ids(sets):
+    for values in sets:
+        check(Bitmap.from_ids(values), values)
+        check(Bitmap.from_ids(np.array(sorted(values))[::-1]), values)
+    check(Bitmap.from_ids([]), set())
+    assert Bitmap.from_ids([5, 5, 3]).to_array().tolist() == [3, 5]
+
+
+def test_set_operations(sets):
+    bitmaps = [Bitmap.from_ids(values) for values in sets]
+    for a, set_a in zip(bitmaps, sets):
+        for b, set_b in zip(bitmaps, sets):
+            check(a & b, set_a & set_b)
+            check(a | b, set_a | set_b)
+            check(a - b, set_a - set_b)
+            assert (a & b) == (b & a)
+            assert (a | b) == (b | a)
+    a, b, c = bitmaps
+    check((a | b) - c, (sets[0] | sets[1]) - sets[2])
+    check(a & Bitmap(), set())
+
+
+def test_complement(sets):
+    universe = Bitmap.from_ranges([0], [400_000])
+    for values in sets:
+        check(Bitmap.from_ids(values).complement(universe), set(range(400_000)) - values)
+    check(Bitmap.from_ids(sets[0]).complement(Bitmap.from_ids(sets[1])), sets[1] - sets[0])
+
+
+def test_contains(sets):
+    probe = np.random.default_rng(5).integers(0, 450_000, size=20_000)
+    for values in sets:
+        bitmap = Bitmap.from_ids(values)
+        np.testing.assert_array_equal(bitmap.contains(probe), [int(v) in values for v in probe])
+        sample = sorted(values)[:50]
+        assert all(v in bitmap for v in sample)
+    assert not Bitmap().contains(probe).any()
+
+
+def test_from_ranges_and_runs():
+    starts, ends = [3, 10, 70_000, 65_530, 200_000], [7, 10, 70_100, 65_540, 200_001]
+    bitmap = Bitmap.from_ranges(starts, ends)
+    expected = set()
+    for start, end in zip(starts, ends):
+        expected.update(range(start, end))
+    check(bitmap, expected)
+    run_starts, run_ends = bitmap.runs()
+    assert list(zip(run_starts.tolist(), run_ends.tolist())) == [
+        (3, 7), (65_530, 65_540), (70_000, 70_100), (200_000, 200_001)
+    ]
+    assert Bitmap.from_ranges(run_starts, run_ends) == bitmap
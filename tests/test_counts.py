@@ -0,0 +1,198 @@
+"""Frequency, n-gram, collocation and dispersion counts against naive counts over several segments."""
+import shutil
+from collections import Counter, defaultdict
+
+import numpy as np
+import pytest
+
+from corpuslio.index import (
+    CollocationFinder, DispersionCounter, FrequencyCounter, NgramCounter, SegmentedIndex, build_ngram_tables
+)
+
+from conftest import write_segments
+
+SUBCORPUS = [20, 30, 60, 90, 120]
+
+
+def as_dict(values, counts) -> dict:
+    return dict(zip(np.asarray(values).tolist(), np.asarray(counts).tolist()))
+
+
+def naive_ngrams(corpus, n, attribute='form', lowercase=False, documents=None) -> Counter:
+    """N-grams within sentences, skipping those with a PUNCT token."""
+    counts = Counter()
+    for start, end in corpus.sentences:
+        tokens = corpus.tokens[start:end]
+        if documents is not None and tokens[0]['document'] not in documents:
+            continue
+        for i in range(len(tokens) - n + 1):
+            window = tokens[i:i + n]
+            if any(t['upos'] == 'PUNCT' for t in window):
+                continue
+            counts[tuple(t[attribute].lower() if lowercase else t[attribute] for t in window)] += 1
+    return counts
+
+
+def test_index_has_several_segments(index, corpus):
+    assert len(index.segments) == 3
+    assert index.size == len(corpus.tokens)
+
+
+def test_frequencies(index, corpus):
+    table = FrequencyCounter(index).count(('form', 'lemma', 'upos'))
+    assert table.tokens == len(corpus.tokens)
+    for attribute in ('form', 'lemma', 'upos'):
+        assert as_dict(*table.counts[attribute]) == Counter(corpus.column(attribute))
+
+    pos_by_form = defaultdict(Counter)
+    for token in corpus.tokens:
+        pos_by_form[token['form']][token['upos']] += 1
+    ambiguous = [form for form, tags in pos_by_form.items() if len(tags) > 1]
+    assert ambiguous
+    for form, tags in pos_by_form.items():
+        assert table.dominant_pos('form', form) == tags.most_common(1)[0][0]
+
+
+def test_frequencies_subcorpus_and_excluded_pos(index, corpus):
+    table = FrequencyCounter(index).count(('lemma',), document_ids=SUBCORPUS, exclude_pos=('PUNCT', 'VERB'))
+    kept = [t for t in corpus.tokens if t['document'] in SUBCORPUS and t['upos'] not in ('PUNCT', 'VERB')]
+    assert table.tokens == len(kept)
+    assert as_dict(*table.counts['lemma']) == Counter(t['lemma'] for t in kept)
+
+
+@pytest.mark.parametrize('n', [1, 2, 3])
+@pytest.mark.parametrize('lowercase', [False, True])
+def test_ngrams(index, corpus, n, lowercase):
+    counter = NgramCounter(index)
+    table = counter.count(n, 'form', lowercase=lowercase)
+    assert dict(table.top()) == naive_ngrams(corpus, n, lowercase=lowercase)
+    assert table.total == sum(naive_ngrams(corpus, n, lowercase=lowercase).values())
+
+    table = counter.count(n, 'form', document_ids=SUBCORPUS, lowercase=lowercase)
+    assert dict(table.top()) == naive_ngrams(corpus, n, lowercase=lowercase, documents=SUBCORPUS)
+
+
+def test_mixed_ngrams(index, corpus):
+    table = NgramCounter(index).count(2, ('lemma', 'upos'))
+    expected = Counter()
+    for start, end in corpus.sentences:
+        tokens = corpus.tokens[start:end]
+        for a, b in zip(tokens, tokens[1:]):
+            if 'PUNCT' not in (a['upos'], b['upos']):
+                expected[(a['lemma'], b['upos'])] += 1
+    assert dict(table.top()) == expected
+
+
+@pytest.fixture
+def tabled_index(index, tmp_path):
+    """Copy of the test index with n-gram tables built per segment."""
+    shutil.copytree(index.path, tmp_path / 'index')
+    index = SegmentedIndex(tmp_path / 'index')
+    for segment in index.segments:
+        build_ngram_tables(segment, attributes=('form',), sizes=(2, 3))
+    return SegmentedIndex(tmp_path / 'index')
+
+
+@pytest.mark.parametrize('n', [2, 3])
+def test_stored_ngrams_are_exact(tabled_index, corpus, n):
+    counter = NgramCounter(tabled_index)
+    stored = counter.stored(n, 'form')
+    assert stored is not None
+    assert dict(stored.top()) == naive_ngrams(corpus, n, lowercase=True)
+    assert dict(stored.top()) == dict(counter.count(n, 'form', lowercase=True).top())
+    # Sorted by frequency
+    counts = [count for _, count in stored.top()]
+    assert counts == sorted(counts, reverse=True)
+
+    subcorpus = counter.stored(n, 'form', document_ids=SUBCORPUS)
+    assert dict(subcorpus.top()) == naive_ngrams(corpus, n, lowercase=True, documents=SUBCORPUS)
+    assert counter.stored(4, 'form') is None
+
+
+def test_pruned_tables_not_merged(index, tmp_path):
+    shutil.copytree(index.path, tmp_path / 'index')
+    for segment in SegmentedIndex(tmp_path / 'index').segments:
+        build_ngram_tables(segment, attributes=('form',), sizes=(2,), min_frequency=2)
+    # Counts pruned per segment cannot be added up exactly
+    assert NgramCounter(SegmentedIndex(tmp_path / 'index')).stored(2, 'form') is None
+
+
+def test_stored_single_segment_pruned(corpus, tmp_path):
+    store = write_segments(tmp_path, corpus.documents, segments=1)
+    index = SegmentedIndex(store.path)
+    build_ngram_tables(index.segments[0], attributes=('form',), sizes=(2,), min_frequency=2)
+    stored = NgramCounter(SegmentedIndex(store.path)).stored(2, 'form', min_frequency=2)
+    expected = {key: count for key, count in naive_ngrams(corpus, 2, lowercase=True).items() if count >= 2}
+    assert dict(stored.top()) == expected
+    assert NgramCounter(index).stored(2, 'form', min_frequency=1) is None
+
+
+def naive_collocates(corpus, node, attribute, left, right, documents=None, pos=None):
+    """Case-folded collocates within the node's sentence, PUNCT skipped: (observed, left, nodes)."""
+    observed, on_left = Counter(), Counter()
+    nodes = 0
+    for start, end in corpus.sentences:
+        if documents is not None and corpus.tokens[start]['document'] not in documents:
+            continue
+        for i in range(start, end):
+            if corpus.tokens[i]['lemma'].lower() != node:
+                continue
+            nodes += 1
+            for j in range(max(start, i - left), min(end, i + right + 1)):
+                token = corpus.tokens[j]
+                if j == i or token['upos'] == 'PUNCT' or (pos and token['upos'] not in pos):
+                    continue
+                observed[token[attribute].lower()] += 1
+                if j < i:
+                    on_left[token[attribute].lower()] += 1
+    return observed, on_left, nodes
+
+
+@pytest.mark.parametrize('attribute', ['form', 'lemma'])
+@pytest.mark.parametrize('documents', [None, SUBCORPUS])
+def test_collocations(index, corpus, attribute, documents):
+    table = CollocationFinder(NgramCounter(index)).find(
+        'EV', node_attribute='lemma', attribute=attribute, left=2, right=3, document_ids=documents
+    )
+    observed, on_left, nodes = naive_collocates(corpus, 'ev', attribute, 2, 3, documents)
+    assert table.node_frequency == nodes
+    assert as_dict(table.values, table.observed) == observed
+    assert as_dict(table.values, table.left) == {value: on_left[value] for value in observed}
+    assert '.' not in table.values
+
+
+def test_collocation_pos_filter(index, corpus):
+    finder = CollocationFinder(NgramCounter(index))
+    table = finder.find('ev', attribute='lemma', left=3, right=3, collocate_pos=['VERB'])
+    observed, _, _ = naive_collocates(corpus, 'ev', 'lemma', 3, 3, pos=['VERB'])
+    assert as_dict(table.values, table.observed) == observed
+    # 'yaz' is sometimes tagged NOUN; only its VERB occurrences count
+    assert set(table.pos.tolist()) == {'VERB'}
+
+
+def test_dispersion(index, corpus):
+    table = DispersionCounter(NgramCounter(index)).table('form')
+    content = [t for t in corpus.tokens if t['upos'] != 'PUNCT']
+    frequencies = Counter(t['form'] for t in content)
+    documents = defaultdict(Counter)
+    for token in content:
+        documents[token['document']][token['form']] += 1
+    sizes = {document: sum(counts.values()) for document, counts in documents.items()}
+    total = sum(sizes.values())
+
+    assert table.documents == len(corpus.documents)
+    assert table.tokens == total
+    assert as_dict(table.values, table.scores['frequency']) == frequencies
+    assert as_dict(table.values, table.scores['range']) == {
+        form: sum(form in counts for counts in documents.values()) for form in frequencies
+    }
+    for form, frequency in frequencies.items():
+        dp = 0.5 * sum(abs(documents[d][form] / frequency - sizes[d] / total) for d in sizes)
+        assert table.scores['dp'][table.values.tolist().index(form)] == pytest.approx(dp)
+
+
+def test_dispersion_subcorpus(index, corpus):
+    table = DispersionCounter(NgramCounter(index)).table('lemma', document_ids=SUBCORPUS, lowercase=True)
+    content = [t for t in corpus.tokens if t['upos'] != 'PUNCT' and t['document'] in SUBCORPUS]
+    assert table.documents == len(SUBCORPUS)
+    assert as_dict(table.values, table.scores['frequency']) == Counter(t['lemma'].lower() for t in content)
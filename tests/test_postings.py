@@ -0,0 +1,101 @@
+"""Block-compressed posting lists: round trips, next_geq and intersection."""
+import numpy as np
+import pytest
+
+from corpuslio.index import BLOCK_SIZE, PostingList, decode_blocks, encode_postings, intersect
+
+
+def grouped_postings(size: int, ids: int, seed: int):
+    """Random lexicon ID per position, grouped into (positions, offsets, per-ID lists)."""
+    rng = np.random.default_rng(seed)
+    # Skewed even IDs give lists of one block and of many blocks; odd IDs are empty
+    lexicon_ids = (np.minimum(rng.zipf(1.3, size=size), ids // 2) - 1) * 2
+    positions = np.argsort(lexicon_ids, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(lexicon_ids, minlength=ids))])
+    expected = [np.flatnonzero(lexicon_ids == i) for i in range(ids)]
+    return positions, offsets, expected
+
+
+@pytest.fixture
+def postings():
+    positions, offsets, expected = grouped_postings(5000, 40, seed=3)
+    data, blocks, block_index = encode_postings(positions, offsets)
+    lists = [PostingList(data, blocks, block_index[i], block_index[i + 1]) for i in range(len(expected))]
+    return data, blocks, block_index, lists, expected
+
+
+def test_round_trip(postings):
+    data, blocks, block_index, lists, expected = postings
+    assert any(len(e) > 3 * BLOCK_SIZE for e in expected)
+    assert any(len(e) == 0 for e in expected)
+    for i, (posting_list, positions) in enumerate(zip(lists, expected)):
+        assert len(posting_list) == len(positions)
+        np.testing.assert_array_equal(posting_list.to_array(), positions)
+        decoded = decode_blocks(data, blocks, np.arange(block_index[i], block_index[i + 1]))
+        np.testing.assert_array_equal(decoded, positions)
+
+
+def test_round_trip_large_gaps():
+    positions = np.array([0, 1, 2, 1000, 70000, 70001, 5_000_000, 3, 9, 2**31 - 1])
+    offsets = np.array([0, 7, 7, 10])
+    data, blocks, block_index = encode_postings(positions, offsets)
+    assert block_index.tolist() == [0, 1, 1, 2]
+    np.testing.assert_array_equal(decode_blocks(data, blocks, [0]), positions[:7])
+    np.testing.assert_array_equal(decode_blocks(data, blocks, [1]), positions[7:])
+
+
+def test_empty():
+    data, blocks, block_index = encode_postings(np.zeros(0, dtype=np.int64), np.zeros(3, dtype=np.int64))
+    assert len(blocks) == 0 and block_index.tolist() == [0, 0, 0]
+    posting_list = PostingList(data, blocks, 0, 0)
+    assert len(posting_list) == 0
+    assert posting_list.next_geq(0) == -1
+    assert intersect([posting_list]).tolist() == []
+
+
+def test_next_geq_matches_searchsorted(postings):
+    *_, lists, expected = postings
+    rng = np.random.default_rng(11)
+    for posting_list, positions in zip(lists, expected):
+        targets = np.sort(rng.integers(0, 5100, size=60))
+        for target in targets:
+            i = np.searchsorted(positions, target)
+            assert posting_list.next_geq(int(target)) == (int(positions[i]) if i < len(positions) else -1)
+
+
+def test_next_geq_exhaustion_and_reset(postings):
+    *_, lists, expected = postings
+    posting_list, positions = max(zip(lists, expected), key=lambda pair: len(pair[1]))
+    assert posting_list.next_geq(int(positions[-1])) == positions[-1]
+    assert posting_list.next_geq(int(positions[-1]) + 1) == -1
+    assert posting_list.next_geq(int(positions[-1]) + 2) == -1
+    posting_list.reset()
+    assert posting_list.next_geq(0) == positions[0]
+    # Walking every element in turn visits the list in order
+    posting_list.reset()
+    walked = []
+    target = 0
+    while (found := posting_list.next_geq(target)) >= 0:
+        walked.append(found)
+        target = found + 1
+    assert walked == positions.tolist()
+
+
+def test_contains_and_intersect(postings):
+    *_, lists, expected = postings
+    probe = np.arange(0, 5000, 3)
+    for posting_list, positions in zip(lists[:10], expected[:10]):
+        np.testing.assert_array_equal(posting_list.contains(probe), np.isin(probe, positions))
+
+    # Lists of distinct IDs are disjoint; a list intersected with itself is itself
+    assert len(intersect([lists[0], lists[2]])) == 0
+    np.testing.assert_array_equal(intersect([lists[4], lists[4]]), expected[4])
+
+    # Posting lists of overlapping position sets
+    a = np.arange(0, 3000, 2)
+    b = np.arange(0, 3000, 3)
+    c = np.arange(0, 3000, 5)
+    data, blocks, block_index = encode_postings(np.concatenate([a, b, c]), np.cumsum([0, len(a), len(b), len(c)]))
+    lists = [PostingList(data, blocks, block_index[i], block_index[i + 1]) for i in range(3)]
+    np.testing.assert_array_equal(intersect(lists), np.arange(0, 3000, 30))
+    np.testing.assert_array_equal(intersect(lists[:2]), np.intersect1d(a, b))
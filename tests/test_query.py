@@ -0,0 +1,164 @@
+"""CQP parsing and matching against a naive backtracking matcher."""
+from typing import List, Set
+
+import numpy as np
+import pytest
+
+from corpuslio.index import ShardedExecutor
+from corpuslio.query_automaton import PatternAutomaton
+from corpuslio.query_parser import (
+    AlternationNode, CQPQueryParser, PatternMatcher, RepeatNode, SequenceNode, TokenNode, parse_cqp_query
+)
+
+QUERIES = (
+    '[word="kitap"]',
+    '[word="Ev"]',
+    '[word="ev|kitap"] [pos="VERB"]',
+    '[pos="ADJ"] [pos="NOUN"]',
+    '[pos="ADJ"]? [pos="NOUN"]',
+    '[pos="ADJ"]* [pos="NOUN"]+',
+    '[pos="NOUN"]{2,}',
+    '[pos!="PUNCT|NOUN" & word!="bir"]{2,3}',
+    '[lemma="ev"] []{0,2} [pos="VERB"]',
+    '([pos="ADJ"] | [pos="DET"]) [word="kitap"]',
+    '([pos="ADJ"] [pos="NOUN"] | [pos="VERB"])+',
+    '[] [word="ve"] []',
+    '[word="k.*" & pos="NOUN"] [pos!="VERB"]',
+)
+
+
+def naive_ends(node, tokens: List[dict], start: int) -> Set[int]:
+    """All ends of matches of an AST node starting at ``start`` (backtracking)."""
+    if isinstance(node, TokenNode):
+        return {start + 1} if start < len(tokens) and node.constraint.matches(tokens[start]) else set()
+    if isinstance(node, SequenceNode):
+        positions = {start}
+        for item in node.items:
+            positions = {end for p in positions for end in naive_ends(item, tokens, p)}
+        return positions
+    if isinstance(node, AlternationNode):
+        return {end for option in node.options for end in naive_ends(option, tokens, start)}
+    if isinstance(node, RepeatNode):
+        reached = {start} if node.min_count == 0 else set()
+        frontier = {start}
+        count = 0
+        while frontier and (node.max_count is None or count < node.max_count) and count <= len(tokens):
+            frontier = {end for p in frontier for end in naive_ends(node.item, tokens, p)}
+            count += 1
+            if count >= node.min_count:
+                reached |= frontier
+        return reached
+    raise TypeError(node)
+
+
+def naive_spans(pattern, tokens: List[dict]):
+    """Longest non-empty match per start position."""
+    root = pattern.ast or SequenceNode([TokenNode(c) for c in pattern.constraints])
+    spans = []
+    for start in range(len(tokens)):
+        ends = [end for end in naive_ends(root, tokens, start) if end > start]
+        if ends:
+            spans.append((start, max(ends)))
+    return spans
+
+
+def sentence_tokens(corpus):
+    """Per sentence: (start position, token dicts with word/lemma/pos)."""
+    for start, end in corpus.sentences:
+        yield start, [
+            {'word': t['form'], 'lemma': t['lemma'], 'pos': t['upos']} for t in corpus.tokens[start:end]
+        ]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_parse(query):
+    pattern = parse_cqp_query(query)
+    assert pattern is not None
+    assert len(pattern.constraints) >= 1
+
+
+@pytest.mark.parametrize('query', [
+    '[word="ev"', '[foo="x"]', '[word="a"]{3,1}', '[word="a"] within q', '()',
+    '[word="a" lemma="b"]', '[word="a" & word="b"]', '[& word="a"]', '[word="a" &]',
+])
+def test_parse_errors(query):
+    parser = CQPQueryParser()
+    assert parser.parse(query) is None
+    assert parser.last_error
+    assert parser.validate_query(query)[0] is False
+
+
+def test_parse_structure():
+    pattern = parse_cqp_query('[lemma="ev"] []{0,3} [pos="VERB"] within text')
+    assert pattern.within == 'text'
+    assert not pattern.is_fixed_length
+    gap = pattern.ast.items[1]
+    assert isinstance(gap, RepeatNode) and (gap.min_count, gap.max_count) == (0, 3)
+    assert parse_cqp_query('[pos="ADJ"] [pos="NOUN"]').is_fixed_length
+    constraint = parse_cqp_query('[word="ev" & pos!="VERB"]').constraints[0]
+    assert constraint.matches({'word': 'EV', 'lemma': 'ev', 'pos': 'NOUN'})
+    assert not constraint.matches({'word': 'ev', 'lemma': 'ev', 'pos': 'VERB'})
+    assert not constraint.matches({'word': 'okul', 'lemma': 'okul', 'pos': 'NOUN'})
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_automaton_matches_naive(corpus, query):
+    pattern = parse_cqp_query(query)
+    matcher = PatternMatcher()
+    automaton = PatternAutomaton(pattern)
+    found = 0
+    for _, tokens in sentence_tokens(corpus):
+        expected = naive_spans(pattern, tokens)
+        assert matcher.match_spans(pattern, tokens) == expected
+        masks = automaton.token_masks(tokens)
+        for start, end in expected:
+            assert automaton.longest_match(masks, start, len(tokens)) == end
+        if pattern.is_fixed_length:
+            assert matcher.match_positions(pattern, tokens) == [start for start, _ in expected]
+        found += len(expected)
+    assert found > 0, 'query should match the test corpus'
+
+
+def test_longest_match_respects_end():
+    pattern = parse_cqp_query('[pos="NOUN"]+')
+    automaton = PatternAutomaton(pattern)
+    tokens = [{'word': 'ev', 'lemma': 'ev', 'pos': 'NOUN'}] * 5
+    masks = automaton.token_masks(tokens)
+    assert automaton.longest_match(masks, 0, 5) == 5
+    assert automaton.longest_match(masks, 1, 3) == 3
+    assert automaton.longest_match(masks, 2, 2) == -1
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_index_matches_naive(corpus, index, query):
+    """Index search (join or automaton, over segments) finds the naive matches within sentences."""
+    pattern = parse_cqp_query(query)
+    expected = [
+        (base + start, base + end)
+        for base, tokens in sentence_tokens(corpus)
+        for start, end in naive_spans(pattern, tokens)
+    ]
+    starts, ends = ShardedExecutor(index, workers=1).find(query)
+    assert list(zip(starts.tolist(), ends.tolist())) == expected
+
+    documents = [10, 40, 110]
+    in_documents = {i for i, t in enumerate(corpus.tokens) if t['document'] in documents}
+    starts, ends = ShardedExecutor(index, workers=1).find(query, document_ids=documents)
+    assert list(zip(starts.tolist(), ends.tolist())) == [span for span in expected if span[0] in in_documents]
+
+
+def test_index_positions(corpus, index):
+    forms = np.array([t['form'] for t in corpus.tokens])
+    executor = ShardedExecutor(index, workers=1)
+    np.testing.assert_array_equal(executor.positions('form', 'ev'), np.flatnonzero(forms == 'ev'))
+    np.testing.assert_array_equal(
+        executor.positions('form', 'ev', case_sensitive=False), np.flatnonzero(np.char.lower(forms) == 'ev')
+    )
+    expected = np.flatnonzero(np.char.startswith(forms, 'k'))
+    np.testing.assert_array_equal(executor.positions('form', '^k', regex=True, case_sensitive=True), expected)
+    np.testing.assert_array_equal(
+        executor.positions('form', '^k', regex=True, case_sensitive=True, limit=3), expected[:3]
+    )
+    np.testing.assert_array_equal(
+        executor.positions('form', '^k', regex=True, case_sensitive=True, limit=3, reverse=True), expected[-3:]
+    )
@@ -0,0 +1,118 @@
+"""Segment store: adding segments, tombstoning documents and compaction."""
+import numpy as np
+import pytest
+
+from corpuslio.index import FrequencyCounter, SegmentedIndex, SegmentStore, ShardedExecutor
+
+from conftest import flatten, make_documents, write_segments
+
+
+def forms(index: SegmentedIndex, live_only: bool = True) -> list:
+    """Forms in corpus order, skipping tombstoned documents."""
+    result = []
+    for segment in index.segments:
+        attribute = segment.attribute('form')
+        values = np.asarray(attribute.lexicon.values)[np.asarray(attribute.stream)]
+        if live_only and segment.deleted_count:
+            starts, ends = segment.document_ranges()
+            values = np.concatenate([values[s:e] for s, e in zip(starts, ends)] or [values[:0]])
+        result.extend(values.tolist())
+    return result
+
+
+def live_forms(documents, deleted=()) -> list:
+    return [t['form'] for t in flatten([d for d in documents if d[0] not in deleted]).tokens]
+
+
+@pytest.fixture
+def documents():
+    return make_documents(count=16, seed=3)
+
+
+def test_add_segment(tmp_path, documents):
+    store = SegmentStore(tmp_path)
+    assert not SegmentedIndex.exists(tmp_path)
+    assert store.add_segment([]) is None
+
+    names = [store.add_segment(documents[:5], shards=1), store.add_segment(documents[5:], shards=2)]
+    assert [entry['name'] for entry in store.segments()] == names
+    index = SegmentedIndex(tmp_path)
+    assert len(index.segments) == 2
+    assert index.size == len(flatten(documents).tokens)
+    assert index.bases.tolist() == [0, index.segments[0].size, index.size]
+    assert index.document_ids().tolist() == [d[0] for d in documents]
+    assert forms(index) == live_forms(documents)
+
+    # Reopening reuses live segments
+    assert SegmentedIndex(tmp_path, previous=index).segments[0] is index.segments[0]
+
+
+def test_delete_documents(tmp_path, documents):
+    store = write_segments(tmp_path, documents)
+    deleted = {documents[1][0], documents[9][0], documents[10][0]}
+    assert store.delete_documents(deleted | {99999}) == 3
+    assert store.delete_documents([documents[1][0]]) == 0
+    assert sum(entry.get('deleted', 0) for entry in store.segments()) == 3
+
+    index = SegmentedIndex(tmp_path)
+    corpus = flatten(documents)
+    assert index.document_ids().tolist() == [d[0] for d in documents if d[0] not in deleted]
+    assert sum(segment.deleted_count for segment in index.segments) == 3
+    # Tombstoned tokens stay in the streams until the segment is merged
+    assert index.size == len(corpus.tokens)
+    assert forms(index) == live_forms(documents, deleted)
+
+    live = [t for t in corpus.tokens if t['document'] not in deleted]
+    table = FrequencyCounter(index).count(('form',))
+    values, counts = table.counts['form']
+    assert dict(zip(values.tolist(), counts.tolist())) == {
+        form: sum(t['form'] == form for t in live) for form in {t['form'] for t in live}
+    }
+    assert table.tokens == len(live)
+
+    starts, _ = ShardedExecutor(index, workers=1).find('[pos="NOUN"]')
+    expected = [i for i, t in enumerate(corpus.tokens) if t['upos'] == 'NOUN' and t['document'] not in deleted]
+    assert starts.tolist() == expected
+
+
+def test_compact(tmp_path, documents):
+    store = write_segments(tmp_path, documents, segments=4)
+    store.merge_factor = 2
+    store.min_segment_tokens = 10 ** 6
+    deleted = {documents[0][0], documents[7][0]}
+    store.delete_documents(deleted)
+
+    merged = store.compact()
+    # All segments stay in the lowest tier, so merging goes on until one is left
+    assert len(merged) == 3
+    assert [entry['name'] for entry in store.segments()] == merged[-1:]
+    assert store.compact() == []
+
+    index = SegmentedIndex(tmp_path)
+    assert len(index.segments) == 1
+    assert index.segments[0].deleted_count == 0
+    assert index.document_ids().tolist() == [d[0] for d in documents if d[0] not in deleted]
+    assert index.size == len(live_forms(documents, deleted))
+    assert forms(index, live_only=False) == live_forms(documents, deleted)
+
+    # Merged segments can be tombstoned again, and dropped when fully deleted
+    assert store.delete_documents([d[0] for d in documents]) == len(documents) - 2
+    store.compact()
+    assert store.segments() == []
+
+
+def test_compact_purges_deleted_tokens(tmp_path, documents):
+    store = write_segments(tmp_path, documents, segments=2)
+    first, second = store.segments()
+    in_first = [d[0] for d in documents[:len(documents) // 2]]
+    store.delete_documents(in_first[:-1])
+    assert store.segments()[0]['deleted_tokens'] >= first['size'] // 2
+
+    # A segment with mostly deleted tokens is rewritten on its own
+    merged = store.compact(max_merges=1)
+    assert len(merged) == 1
+    entries = store.segments()
+    assert entries[0]['name'] == merged[0] and entries[0]['documents'] == 1
+    assert entries[1]['name'] == second['name']
+    index = SegmentedIndex(tmp_path)
+    assert index.document_ids().tolist() == [in_first[-1]] + [d[0] for d in documents[len(documents) // 2:]]